@@ -13,6 +13,7 @@ try:
         os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'litpath_backend.settings')
         import django
         django.setup()
+        from rag_api.material_catalog import material_catalog
         from rag_api.models import Material
         DJANGO_AVAILABLE = True
         print("✅ Django integration enabled – database will be updated.")
@@ -38,8 +39,6 @@ def main():
     print(f"📄 Found {len(txt_files)} thesis files.")
 
     all_metadata = {}
-    created_count = 0
-    updated_count = 0
 
     for filename in txt_files:
         fpath = os.path.join(theses_dir, filename)
@@ -60,45 +59,16 @@ def main():
         meta["file"] = filename
         all_metadata[filename] = meta
 
-        # --- Update Django database (only if available) ---
-        if DJANGO_AVAILABLE:
-            # Prepare fields
-            title = meta.get('title', '').strip()
-            author = meta.get('author', '').strip()
-            year = meta.get('year')
-            if year and isinstance(year, str) and year.isdigit():
-                year = int(year)
-            elif not isinstance(year, int):
-                year = None
-
-            # 🔧 Use only the filename – matches your existing DB format
-            file_rel_path = filename
-
-            # Update or create
-            obj, created = Material.objects.update_or_create(
-                file=file_rel_path,
-                defaults={
-                    'title': title or 'Unknown Title',
-                    'author': author or 'Unknown Author',
-                    'year': year,
-                    'subjects': meta.get('subjects', []),
-                    'degree': meta.get('degree', 'Thesis'),
-                    'school': meta.get('school', 'Unknown'),
-                    'abstract': meta.get('abstract', ''),
-                }
-            )
-            if created:
-                created_count += 1
-            else:
-                updated_count += 1
-
     # --- Save JSON (exactly as before) ---
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(all_metadata, f, indent=2, ensure_ascii=False)
 
     print(f"\n📁 JSON saved: {out_path} ({len(all_metadata)} files)")
     if DJANGO_AVAILABLE:
-        print(f"📊 Database: Created {created_count}, Updated {updated_count}")
+        # One bulk sync instead of a save per thesis. Removed theses are left to
+        # `python manage.py sync_catalog`, which also sees the index.
+        counts = material_catalog.sync(material_catalog.from_metadata_file(out_path), remove=False)
+        print(f"📊 Database: Created {counts['created']}, Updated {counts['updated']}")
         print(f"📊 Total materials in DB: {Material.objects.count()}")
     else:
         print("📊 Database: skipped (Django not available)")
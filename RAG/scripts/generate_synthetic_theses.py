@@ -0,0 +1,279 @@
+"""
+Synthetic thesis corpus generator for scale testing.
+
+Writes realistic-looking thesis TXT files whose front matter is parseable by
+extract_thesis_metadata (title, author, university, degree, year, abstract,
+keywords), with controllable document length and subject/year distribution.
+Subject-specific vocabulary keeps documents of the same subject close to each
+other under the hashing embedder, so retrieval benchmarks stay meaningful.
+
+A manifest (synthetic_manifest.json) with the intended metadata of every
+document is written alongside the TXT files.
+
+Usage:
+    python generate_synthetic_theses.py --out ../theses_synthetic --docs 1000
+    python generate_synthetic_theses.py --out /data/theses_1m --target-chunks 1000000
+    python generate_synthetic_theses.py --out ../theses_synthetic --docs 500 \
+        --median-words 4000 --year-start 2000 --recent-bias 0.1 --subject-skew 1.3
+"""
+
+import os
+import json
+import math
+import random
+import argparse
+
+
+# Words per chunk step of RAGService.sentence_chunking (500 words, 20% overlap),
+# plus the short tail chunks it emits at the end of every document
+CHUNK_STEP_WORDS = 400
+TAIL_CHUNKS = 6
+
+# Subject -> (degree field, topic vocabulary). The first keyword written for a
+# document is the subject itself, so extract_thesis_metadata maps it back.
+SUBJECT_VOCABULARY = {
+    "Agriculture": ("Agronomy", [
+        "rice", "maize", "crop yield", "irrigation", "fertilizer", "soil fertility", "cultivar",
+        "pest incidence", "seedling vigor", "harvest index", "intercropping", "upland farms",
+    ]),
+    "Biology": ("Biology", [
+        "cell culture", "protein expression", "enzyme activity", "microbial diversity", "gene regulation",
+        "bacterial isolates", "phylogeny", "morphology", "tissue samples", "metabolic pathway",
+    ]),
+    "Chemistry": ("Chemistry", [
+        "synthesis", "catalyst", "spectroscopy", "adsorption", "reaction kinetics", "chromatography",
+        "nanoparticles", "polymer", "titration", "functional groups", "solvent extraction",
+    ]),
+    "Computer Science": ("Computer Science", [
+        "neural network", "classification", "dataset", "algorithm", "feature extraction",
+        "image recognition", "training accuracy", "database", "mobile application", "clustering",
+    ]),
+    "Education": ("Education", [
+        "learners", "curriculum", "teaching strategies", "academic performance", "classroom",
+        "assessment", "module", "public schools", "reading comprehension", "teacher training",
+    ]),
+    "Engineering": ("Engineering", [
+        "structural design", "load capacity", "prototype", "concrete mix", "power consumption",
+        "sensor", "control system", "tensile strength", "hydraulic model", "fabrication",
+    ]),
+    "Environmental Science": ("Environmental Science", [
+        "water quality", "air pollution", "watershed", "land use", "biodiversity", "heavy metals",
+        "climate change", "solid waste", "carbon stock", "ecosystem services",
+    ]),
+    "Fisheries": ("Fisheries", [
+        "tilapia", "milkfish", "aquaculture", "feed formulation", "fish growth", "hatchery",
+        "stocking density", "fishpond", "larval survival", "catch per unit effort",
+    ]),
+    "Food Science and Technology": ("Food Science", [
+        "shelf life", "sensory evaluation", "proximate composition", "food product", "fermentation",
+        "packaging", "microbial load", "nutritional value", "drying", "consumer acceptability",
+    ]),
+    "Forestry": ("Forestry", [
+        "reforestation", "timber", "seedlings", "forest cover", "tree species", "dipterocarp",
+        "agroforestry", "canopy", "forest management", "wood density",
+    ]),
+    "Marine Science": ("Marine Science", [
+        "coral reef", "seagrass", "mangrove", "plankton", "coastal waters", "sea surface temperature",
+        "marine protected area", "benthic community", "reef fish", "salinity gradient",
+    ]),
+    "Mathematics": ("Mathematics", [
+        "boundary value problem", "graph", "theorem", "convergence", "operator", "lemma",
+        "optimization", "eigenvalues", "topology", "differential equation",
+    ]),
+    "Medicine": ("Medicine", [
+        "patients", "clinical outcomes", "prevalence", "hospital", "treatment", "diagnosis",
+        "risk factors", "mortality", "infection", "randomized trial",
+    ]),
+    "Physics": ("Physics", [
+        "thin films", "band gap", "laser", "magnetic field", "simulation", "semiconductor",
+        "optical properties", "crystal structure", "plasma", "particle detector",
+    ]),
+    "Social Sciences": ("Social Science", [
+        "households", "livelihood", "community", "survey respondents", "migration", "poverty",
+        "local government", "gender roles", "income", "social networks",
+    ]),
+    "Statistics": ("Statistics", [
+        "regression model", "time series", "estimator", "sampling design", "variance",
+        "bootstrap", "forecasting", "hypothesis test", "bayesian inference", "outliers",
+    ]),
+}
+
+METHODS = [
+    "Assessment", "Evaluation", "Characterization", "Analysis", "Development", "Modeling",
+    "Comparative Study", "Optimization", "Determinants", "Effects",
+]
+CONTEXTS = [
+    "in Selected Provinces of the Philippines", "in Laguna", "in Central Luzon", "in Mindanao",
+    "in the Visayas", "under Field Conditions", "in Coastal Communities", "in Metro Manila",
+    "in Upland Areas", "under Controlled Conditions",
+]
+FIRST_NAMES = [
+    "Maria", "Jose", "Ana", "Juan", "Kristine", "Mark", "Angelica", "John Paul", "Rowena",
+    "Carlo", "Jasmine", "Miguel", "Patricia", "Ramon", "Liza", "Paolo", "Grace", "Adrian",
+]
+MIDDLE_NAMES = ["Santos", "Reyes", "Cruz", "Bautista", "Garcia", "Mendoza", "Torres", "Flores"]
+LAST_NAMES = [
+    "Dela Cruz", "Villanueva", "Aquino", "Ramos", "Castillo", "Navarro", "Gonzales", "Pascual",
+    "Manalo", "Soriano", "Domingo", "Salazar", "Fernandez", "Mercado", "Tolentino", "Aguilar",
+]
+UNIVERSITIES = [
+    "University of the Philippines Los Banos", "University of the Philippines Diliman",
+    "Central Luzon State University", "Visayas State University", "Mindanao State University",
+    "University of Santo Tomas", "Benguet State University", "Xavier University",
+]
+MONTHS = [
+    "January", "February", "March", "April", "May", "June", "July", "August",
+    "September", "October", "November", "December",
+]
+FILLER = [
+    "The results indicate that {a} was significantly associated with {b}",
+    "Data on {a} were gathered and analyzed together with {b}",
+    "This study examined the relationship between {a} and {b}",
+    "Previous studies reported that {a} influences {b} under local conditions",
+    "A significant difference in {a} was observed across treatments involving {b}",
+    "The findings suggest that improving {a} may enhance {b}",
+    "Respondents and samples were selected to represent variation in {a} and {b}",
+    "Further research on {a} is recommended to clarify its effect on {b}",
+]
+CHAPTERS = ["Introduction", "Review of Related Literature", "Methodology", "Results and Discussion", "Summary and Conclusion"]
+
+
+def _weighted_choice(rng, items, weights):
+    return rng.choices(items, weights=weights, k=1)[0]
+
+
+def _sentence(rng, vocab):
+    a, b = rng.sample(vocab, 2)
+    return rng.choice(FILLER).format(a=a, b=b) + "."
+
+
+def _paragraph(rng, vocab, n_sentences):
+    return " ".join(_sentence(rng, vocab) for _ in range(n_sentences))
+
+
+def estimated_chunks(words):
+    """Approximate number of chunks RAGService.sentence_chunking produces"""
+    return math.ceil(words / CHUNK_STEP_WORDS) + TAIL_CHUNKS
+
+
+def generate_thesis(rng, index, subject, year, words):
+    """Return (filename, text, manifest_entry) for one synthetic thesis"""
+    field, vocab = SUBJECT_VOCABULARY[subject]
+    topic = rng.choice(vocab)
+    title = f"{rng.choice(METHODS)} of {topic.title()} and {rng.choice(vocab).title()} {rng.choice(CONTEXTS)}"
+    author = f"{rng.choice(FIRST_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(LAST_NAMES)}"
+    university = rng.choice(UNIVERSITIES)
+    degree = f"Master of Science in {field}"
+    keywords = [subject] + rng.sample(vocab, 3)
+
+    abstract = _paragraph(rng, vocab, 5)
+    lines = [
+        title, "", author, "", university, "", degree, "",
+        f"{rng.choice(MONTHS)} {year}", "",
+        "Abstract", abstract, "",
+        f"Keywords: {', '.join(keywords)}", "",
+    ]
+    body_words = len(abstract.split())
+    chapter = 0
+    while body_words < words:
+        if chapter < len(CHAPTERS) and body_words >= chapter * words / len(CHAPTERS):
+            lines += [f"Chapter {chapter + 1}", "", CHAPTERS[chapter], ""]
+            chapter += 1
+        paragraph = _paragraph(rng, vocab, rng.randint(4, 9))
+        lines += [paragraph, ""]
+        body_words += len(paragraph.split())
+
+    pages = max(20, body_words // 250)
+    safe_title = "".join(c for c in title if c.isalnum() or c == " ")[:80].strip()
+    filename = f"SYN-T-{index:07d} {safe_title} ({pages}) {year}.txt"
+    entry = {
+        "file": filename,
+        "title": title,
+        "author": author,
+        "university": university,
+        "degree": degree,
+        "publication_year": str(year),
+        "subject": subject,
+        "keywords": keywords,
+        "words": body_words,
+    }
+    return filename, "\n".join(lines) + "\n", entry
+
+
+def generate_corpus(out_dir, docs=None, target_chunks=None, seed=42, median_words=6000,
+                    length_sigma=0.6, min_words=800, max_words=40000, year_start=1990,
+                    year_end=2025, recent_bias=0.08, subject_skew=1.1, subjects=None):
+    """Write a synthetic corpus to out_dir and return its manifest.
+
+    Exactly one of `docs` (number of theses) or `target_chunks` (approximate
+    number of index chunks) must be given. Document length is log-normal
+    around `median_words`; years are weighted exponentially towards recent
+    ones (`recent_bias`) and subjects follow a Zipf distribution
+    (`subject_skew`), like the real collection.
+    """
+    if (docs is None) == (target_chunks is None):
+        raise ValueError("Pass exactly one of docs or target_chunks")
+    rng = random.Random(seed)
+    subjects = subjects or list(SUBJECT_VOCABULARY)
+    subject_weights = [1.0 / (rank + 1) ** subject_skew for rank in range(len(subjects))]
+    years = list(range(year_start, year_end + 1))
+    year_weights = [math.exp(recent_bias * (y - year_start)) for y in years]
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = []
+    total_chunks = 0
+    index = 0
+    while (docs is not None and index < docs) or (target_chunks is not None and total_chunks < target_chunks):
+        words = int(min(max_words, max(min_words, rng.lognormvariate(math.log(median_words), length_sigma))))
+        subject = _weighted_choice(rng, subjects, subject_weights)
+        year = _weighted_choice(rng, years, year_weights)
+        filename, text, entry = generate_thesis(rng, index, subject, year, words)
+        with open(os.path.join(out_dir, filename), "w", encoding="utf-8") as f:
+            f.write(text)
+        entry["estimated_chunks"] = estimated_chunks(entry["words"])
+        total_chunks += entry["estimated_chunks"]
+        manifest.append(entry)
+        index += 1
+        if index % 1000 == 0:
+            print(f"📄 Generated {index} theses (~{total_chunks} chunks)")
+
+    summary = {
+        "seed": seed,
+        "documents": len(manifest),
+        "estimated_chunks": total_chunks,
+        "theses": manifest,
+    }
+    with open(os.path.join(out_dir, "synthetic_manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic thesis corpus for scale testing")
+    parser.add_argument("--out", required=True, help="Output folder for the TXT files")
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument("--docs", type=int, help="Number of theses to generate")
+    size.add_argument("--target-chunks", type=int, help="Generate theses until ~N index chunks")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--median-words", type=int, default=6000, help="Median thesis length in words")
+    parser.add_argument("--length-sigma", type=float, default=0.6, help="Log-normal spread of thesis length")
+    parser.add_argument("--min-words", type=int, default=800)
+    parser.add_argument("--max-words", type=int, default=40000)
+    parser.add_argument("--year-start", type=int, default=1990)
+    parser.add_argument("--year-end", type=int, default=2025)
+    parser.add_argument("--recent-bias", type=float, default=0.08, help="0 = uniform years, higher = more recent theses")
+    parser.add_argument("--subject-skew", type=float, default=1.1, help="Zipf exponent of the subject distribution (0 = uniform)")
+    args = parser.parse_args()
+
+    summary = generate_corpus(
+        args.out, docs=args.docs, target_chunks=args.target_chunks, seed=args.seed,
+        median_words=args.median_words, length_sigma=args.length_sigma,
+        min_words=args.min_words, max_words=args.max_words,
+        year_start=args.year_start, year_end=args.year_end,
+        recent_bias=args.recent_bias, subject_skew=args.subject_skew,
+    )
+    print(f"✅ Wrote {summary['documents']} theses (~{summary['estimated_chunks']} chunks) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -102,8 +102,8 @@ if DATABASE_URL:
     DATABASES = {
         'default': dj_database_url.config(
             default=DATABASE_URL,
-            conn_max_age=0,  # Close connections immediately after request
-            conn_health_checks=False,  # Disable health checks to reduce connection overhead
+            conn_max_age=0,  # Release the connection (to the pool, see below) at the end of each request
+            conn_health_checks=False,  # The pool health-checks connections on checkout
         )
     }
     # Add connection settings to handle timeouts and pooling
@@ -111,7 +111,7 @@ if DATABASE_URL:
         'connect_timeout': 30,  # Increased timeout
         'options': '-c statement_timeout=30000',  # 30 second query timeout
     }
-    DATABASES['default']['CONN_MAX_AGE'] = 0  # Don't keep connections open
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # Pooled: returned to the pool, not closed
     DATABASES['default']['ATOMIC_REQUESTS'] = False  # Don't wrap in transactions
     DATABASES['default']['AUTOCOMMIT'] = True
 else:
@@ -132,6 +132,39 @@ else:
         }
     }
 
+# Database connection pool (see rag_api/db_pool.py): Postgres connections stay open and
+# each request borrows one instead of paying TCP + TLS + auth. Idle connections are
+# pinged after DB_POOL_CHECK_SECONDS (0 = on every checkout) and closed after
+# DB_POOL_MAX_IDLE_SECONDS (down to DB_POOL_MIN_SIZE); every connection is replaced after
+# DB_POOL_MAX_LIFETIME_SECONDS. A checkout waits up to DB_POOL_TIMEOUT_SECONDS when all
+# DB_POOL_MAX_SIZE connections are in use.
+# DB_POOL_MODE=transaction when DATABASE_URL points at a transaction-mode pooler (Supabase
+# port 6543 / PgBouncer): server-side cursors and startup options (statement_timeout) are
+# turned off, as such poolers don't support them.
+DB_POOL = os.environ.get('DB_POOL', 'True') == 'True'
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'session')  # session | transaction
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))  # per process
+DB_POOL_TIMEOUT_SECONDS = float(os.environ.get('DB_POOL_TIMEOUT_SECONDS', '10'))
+DB_POOL_CHECK_SECONDS = float(os.environ.get('DB_POOL_CHECK_SECONDS', '5'))
+DB_POOL_MAX_IDLE_SECONDS = float(os.environ.get('DB_POOL_MAX_IDLE_SECONDS', '300'))
+DB_POOL_MAX_LIFETIME_SECONDS = float(os.environ.get('DB_POOL_MAX_LIFETIME_SECONDS', '1800'))
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    if DB_POOL_MODE == 'transaction':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+        DATABASES['default'].setdefault('OPTIONS', {}).pop('options', None)
+    if DB_POOL:
+        DATABASES['default']['ENGINE'] = 'rag_api.pooled_postgresql'
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT_SECONDS,
+            'check_after': DB_POOL_CHECK_SECONDS,
+            'max_idle': DB_POOL_MAX_IDLE_SECONDS,
+            'max_lifetime': DB_POOL_MAX_LIFETIME_SECONDS,
+        }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -211,6 +244,130 @@ REST_FRAMEWORK = {
 
 # RAG System settings
 RAG_THESES_FOLDER = os.environ.get('RAG_THESES_FOLDER', os.path.join(BASE_DIR.parent, 'RAG', 'theses'))
+# Rows per bulk_create / bulk_update / delete of the material catalog sync (see rag_api/material_catalog.py)
+CATALOG_SYNC_CHUNK_SIZE = int(os.environ.get('CATALOG_SYNC_CHUNK_SIZE', '500'))
 RAG_CHROMADB_PATH = os.environ.get('RAG_CHROMADB_PATH', os.path.join(BASE_DIR.parent, 'RAG', 'chromadb_data'))
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 HF_TOKEN = os.environ.get('HF_TOKEN', '')  # Hugging Face token for Inference API
+# 'hf' (default) or 'hash' - deterministic local embedder for offline scale testing
+RAG_EMBEDDER = os.environ.get('RAG_EMBEDDER', 'hf')
+# Vector index backend: 'chroma' (default) or 'numpy' (exact search on a memory-mapped matrix)
+RAG_VECTOR_BACKEND = os.environ.get('RAG_VECTOR_BACKEND', 'chroma')
+RAG_VECTOR_STORE_PATH = os.environ.get('RAG_VECTOR_STORE_PATH', os.path.join(BASE_DIR.parent, 'RAG', 'vector_store'))
+RAG_VECTOR_DTYPE = os.environ.get('RAG_VECTOR_DTYPE', 'float32')  # or 'float16' (half the memory)
+# Optional compressed first stage for the numpy backend (see rag_api/vector_compression.py):
+# rank on PCA-reduced and/or int8 codes, then re-score the shortlist on the float vectors
+RAG_VECTOR_QUANTIZATION = os.environ.get('RAG_VECTOR_QUANTIZATION', 'none')  # or 'int8'
+RAG_VECTOR_REDUCED_DIMS = int(os.environ.get('RAG_VECTOR_REDUCED_DIMS', '0'))  # 0 = keep all dimensions
+RAG_VECTOR_RESCORE_FACTOR = int(os.environ.get('RAG_VECTOR_RESCORE_FACTOR', '4'))  # shortlist = factor x n_results
+# Retrieval mode for search(): 'vector' (default) or 'binary' - sign-bit Hamming prefilter
+# + exact re-rank of RAG_BINARY_SHORTLIST candidates (numpy backend only)
+RAG_RETRIEVAL_MODE = os.environ.get('RAG_RETRIEVAL_MODE', 'vector')
+RAG_BINARY_SHORTLIST = int(os.environ.get('RAG_BINARY_SHORTLIST', '300'))
+RAG_BINARY_QUERY_BITS = int(os.environ.get('RAG_BINARY_QUERY_BITS', '4'))  # 0: plain Hamming; >0: query bit-planes
+# Document-first retrieval: query one vector per thesis (title/abstract + chunk centroid),
+# then search chunks only within the top RAG_DOCUMENT_TOP_K theses
+RAG_DOCUMENT_FIRST = os.environ.get('RAG_DOCUMENT_FIRST', 'True') == 'True'
+RAG_DOCUMENT_TOP_K = int(os.environ.get('RAG_DOCUMENT_TOP_K', '20'))
+RAG_CHUNKS_PER_DOCUMENT = int(os.environ.get('RAG_CHUNKS_PER_DOCUMENT', '2'))  # rerank candidates per thesis
+RAG_DOCUMENT_TITLE_WEIGHT = float(os.environ.get('RAG_DOCUMENT_TITLE_WEIGHT', '0.5'))  # vs chunk centroid
+# Maximal marginal relevance over the candidate chunks before the rerank cut
+RAG_MMR_ENABLED = os.environ.get('RAG_MMR_ENABLED', 'False') == 'True'
+RAG_MMR_K = int(os.environ.get('RAG_MMR_K', '10'))  # candidates sent to the reranker
+RAG_MMR_LAMBDA = float(os.environ.get('RAG_MMR_LAMBDA', '0.7'))  # 1.0 = relevance only
+# Gemini rerank is used only if it answers within this budget; otherwise the local
+# (BM25 / title / subject / vector) ranking that always runs is used
+RAG_RERANK_DEADLINE_MS = float(os.environ.get('RAG_RERANK_DEADLINE_MS', '3000'))
+
+# LLM / embedding transport (see rag_api/llm_transport.py)
+# live   - call Gemini / HF Inference API directly
+# record - call them and save every response to a cassette
+# replay - serve responses from cassettes only (offline, deterministic)
+# stub   - synthetic responses with realistic latency (load testing)
+LLM_TRANSPORT_MODE = os.environ.get('LLM_TRANSPORT_MODE', 'live')
+LLM_CASSETTE_DIR = os.environ.get('LLM_CASSETTE_DIR', os.path.join(BASE_DIR, 'rag_api', 'cassettes'))
+LLM_REPLAY_LATENCY_MS = float(os.environ.get('LLM_REPLAY_LATENCY_MS', '0'))
+LLM_REPLAY_LATENCY_JITTER_MS = float(os.environ.get('LLM_REPLAY_LATENCY_JITTER_MS', '0'))
+LLM_REPLAY_STREAM_CHUNK_MS = float(os.environ.get('LLM_REPLAY_STREAM_CHUNK_MS', '0'))
+LLM_REPLAY_ERROR_RATE = float(os.environ.get('LLM_REPLAY_ERROR_RATE', '0'))
+LLM_REPLAY_SEED = int(os.environ.get('LLM_REPLAY_SEED', '0'))
+LLM_STUB_LATENCY_SCALE = float(os.environ.get('LLM_STUB_LATENCY_SCALE', '1.0'))
+
+# Shared LLM call wrapper (see rag_api/llm_client.py): every Gemini call gets a
+# deadline, a jittered retry drawn from a shared budget, and - for the short
+# rewrite / rerank calls - an optional hedge fired after the model's observed p95
+LLM_HTTP_TIMEOUT_MS = int(os.environ.get('LLM_HTTP_TIMEOUT_MS', '60000'))  # per HTTP request, on the pooled client
+LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', '32'))  # pooled connections per API key
+LLM_REWRITE_DEADLINE_MS = float(os.environ.get('LLM_REWRITE_DEADLINE_MS', '2000'))
+LLM_GENERATION_DEADLINE_MS = float(os.environ.get('LLM_GENERATION_DEADLINE_MS', '45000'))
+LLM_FIRST_TOKEN_DEADLINE_MS = float(os.environ.get('LLM_FIRST_TOKEN_DEADLINE_MS', '15000'))  # streamed overview
+LLM_JUDGE_DEADLINE_MS = float(os.environ.get('LLM_JUDGE_DEADLINE_MS', '60000'))  # rag_evaluator LLM judge
+LLM_HEDGE_ENABLED = os.environ.get('LLM_HEDGE_ENABLED', 'True') == 'True'
+LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', '95'))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', '20'))  # no hedging until p95 is known
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))  # per call, within its deadline
+LLM_RETRY_BUDGET_RATIO = float(os.environ.get('LLM_RETRY_BUDGET_RATIO', '0.2'))  # retries + hedges per call
+LLM_RETRY_BACKOFF_MS = float(os.environ.get('LLM_RETRY_BACKOFF_MS', '200'))  # base of the jittered backoff
+
+# Overview model tiering (see rag_api/model_router.py): a local complexity score
+# (question length, comparison wording, sub-questions, distinct sources, conversation
+# depth) picks fast / standard / deep; decisions and outcomes go to model_routing_decisions
+LLM_ROUTER_ENABLED = os.environ.get('LLM_ROUTER_ENABLED', 'True') == 'True'  # False: always 'deep'
+LLM_ROUTER_STANDARD_SCORE = int(os.environ.get('LLM_ROUTER_STANDARD_SCORE', '2'))
+LLM_ROUTER_DEEP_SCORE = int(os.environ.get('LLM_ROUTER_DEEP_SCORE', '4'))
+LLM_ROUTER_FAST_MODEL = os.environ.get('LLM_ROUTER_FAST_MODEL', 'gemini-2.5-flash-lite')
+LLM_ROUTER_FAST_MAX_TOKENS = int(os.environ.get('LLM_ROUTER_FAST_MAX_TOKENS', '768'))
+LLM_ROUTER_STANDARD_MODEL = os.environ.get('LLM_ROUTER_STANDARD_MODEL', 'gemini-2.5-flash')
+LLM_ROUTER_STANDARD_MAX_TOKENS = int(os.environ.get('LLM_ROUTER_STANDARD_MAX_TOKENS', '1536'))
+LLM_ROUTER_DEEP_MODEL = os.environ.get('LLM_ROUTER_DEEP_MODEL', 'gemini-3-flash-preview')
+LLM_ROUTER_DEEP_MAX_TOKENS = int(os.environ.get('LLM_ROUTER_DEEP_MAX_TOKENS', '2048'))
+
+# Generation prompt packing (see rag_api/prompt_builder.py): query-ranked, de-duplicated
+# source sentences under a fixed token budget, plus a separate reservation for history.
+# The default matches the previous prompt (10 sources x 1500 characters); lower it only
+# with run_accuracy_benchmark.py results for the smaller budget
+LLM_PROMPT_CONTEXT_TOKENS = int(os.environ.get('LLM_PROMPT_CONTEXT_TOKENS', '3750'))
+LLM_PROMPT_HISTORY_TOKENS = int(os.environ.get('LLM_PROMPT_HISTORY_TOKENS', '300'))
+LLM_PROMPT_DEDUP_THRESHOLD = float(os.environ.get('LLM_PROMPT_DEDUP_THRESHOLD', '0.8'))  # token-set Jaccard
+
+# Extractive overview (see rag_api/extractive_summary.py): NumPy centroid sentence
+# scoring, returned with search results as an instant preview and served as the
+# overview when Gemini is rate-limited or times out
+RAG_EXTRACTIVE_PREVIEW = os.environ.get('RAG_EXTRACTIVE_PREVIEW', 'True') == 'True'
+RAG_PREVIEW_SENTENCES = int(os.environ.get('RAG_PREVIEW_SENTENCES', '4'))
+
+# Daily usage rollups for the dashboard (see rag_api/usage_rollups.py). Finished days
+# are compacted in the background after a view / citation copy, or by
+# `python manage.py rollup_usage_stats` (run once with --backfill)
+ROLLUP_AUTO_COMPACT = os.environ.get('ROLLUP_AUTO_COMPACT', 'True') == 'True'
+ROLLUP_SETTLE_MINUTES = int(os.environ.get('ROLLUP_SETTLE_MINUTES', '10'))  # margin for in-flight writes
+
+# Dashboard bundle endpoint (see rag_api/dashboard_bundle.py): widgets computed
+# concurrently on worker threads that keep their DB connections, responses cached
+# under an ETag of (widgets, range, data version) for at most the TTL
+DASHBOARD_BUNDLE_TTL_SECONDS = float(os.environ.get('DASHBOARD_BUNDLE_TTL_SECONDS', '30'))
+DASHBOARD_BUNDLE_WORKERS = int(os.environ.get('DASHBOARD_BUNDLE_WORKERS', '6'))  # 0 = compute in the request thread
+
+# Write-behind view / citation-copy tracking (see rag_api/event_ingest.py): events are
+# appended to a local spool and written in batches of INGEST_BATCH_SIZE or every
+# INGEST_FLUSH_INTERVAL_MS. INGEST_SPOOL_FSYNC=True makes each event survive power loss.
+INGEST_WRITE_BEHIND = os.environ.get('INGEST_WRITE_BEHIND', 'True') == 'True'  # False = write each event in the request
+INGEST_SPOOL_DIR = os.environ.get('INGEST_SPOOL_DIR', os.path.join(BASE_DIR.parent, 'RAG', 'ingest_spool'))
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '500'))
+INGEST_FLUSH_INTERVAL_MS = float(os.environ.get('INGEST_FLUSH_INTERVAL_MS', '1000'))
+INGEST_SPOOL_FSYNC = os.environ.get('INGEST_SPOOL_FSYNC', 'False') == 'True'
+
+# Outbox for secondary writes (see rag_api/outbox.py): CSM feedback is copied to the
+# Supabase general_feedback table by a background dispatcher, in batches, retried with
+# exponential backoff from OUTBOX_RETRY_BASE_SECONDS up to OUTBOX_RETRY_MAX_SECONDS
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.environ.get('OUTBOX_POLL_INTERVAL_SECONDS', '5'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '10'))  # then the message is marked failed
+OUTBOX_RETRY_BASE_SECONDS = float(os.environ.get('OUTBOX_RETRY_BASE_SECONDS', '5'))
+OUTBOX_RETRY_MAX_SECONDS = float(os.environ.get('OUTBOX_RETRY_MAX_SECONDS', '3600'))
+# The general_feedback database; defaults to the server of the default database
+SUPABASE_URL = os.environ.get('SUPABASE_URL') or DATABASES['default'].get('HOST')
+SUPABASE_DB = os.environ.get('SUPABASE_DB') or DATABASES['default'].get('NAME')
+SUPABASE_USER = os.environ.get('SUPABASE_USER') or DATABASES['default'].get('USER')
+SUPABASE_PASSWORD = os.environ.get('SUPABASE_PASSWORD') or DATABASES['default'].get('PASSWORD')
+SUPABASE_PORT = os.environ.get('SUPABASE_PORT') or DATABASES['default'].get('PORT') or '5432'
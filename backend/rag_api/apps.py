@@ -14,6 +14,12 @@ class RagApiConfig(AppConfig):
         Railway because --preload duplicated ChromaDB memory across master
         and worker.  Now RAG initializes on the first search request.
         """
+        # Outbox messages left from before a restart are delivered once this
+        # process serves its first request
+        from django.core.signals import request_started
+        from .outbox import start_on_first_request
+        request_started.connect(start_on_first_request, dispatch_uid='outbox-start')
+
         # For local dev convenience, still auto-init when using runserver
         if 'runserver' in sys.argv and os.environ.get('RUN_MAIN') == 'true':
             from .rag_service import RAGService
@@ -1,9 +1,21 @@
 """
 Conversation utilities for LitPath AI RAG system.
 Handles entity extraction, pronoun resolution, and conversation context management.
+
+The client resends the whole conversation_history with every follow-up.
+ConversationStateCache keeps, per session, the state derived from it -
+entities per turn, the last turns trimmed for the prompt and a rolling
+summary of older turns - and folds in only the turns it has not seen, so
+each turn is parsed once and prompt length stays flat as a conversation
+grows. A cache miss (new process, evicted or unknown session) rebuilds the
+state from the history, so the cache never changes results.
 """
 
 import re
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
 from typing import List, Dict, Set, Optional
 
 
@@ -134,7 +146,14 @@ class ConversationManager:
         
         return False
     
-    def resolve_pronouns(self, current_query: str, conversation_history: List[Dict]) -> str:
+    def turn_entities(self, turn: Dict) -> List[str]:
+        """Entities of one turn: its query, then the start of its answer"""
+        response_text = turn.get('overview', turn.get('response', '')) or ''
+        # Response: first 1000 chars to avoid noise
+        return self.extract_entities(turn.get('query', '') or '') + self.extract_entities(response_text[:1000])
+    
+    def resolve_pronouns(self, current_query: str, conversation_history: List[Dict],
+                         state: Optional['ConversationState'] = None) -> str:
         """
         Enhance query by resolving pronouns using conversation history.
         Appends relevant entities from previous turns to improve search.
@@ -142,28 +161,27 @@ class ConversationManager:
         Args:
             current_query: Current user query
             conversation_history: List of previous conversation turns
+            state: Cached conversation state (entities already extracted);
+                   if None, the last 2 turns are parsed from the history
             
         Returns:
             Enhanced query with entities appended (if pronouns detected)
         """
-        if not conversation_history:
+        if not conversation_history and not (state and state.turns):
             return current_query
         
         # Check if query needs pronoun resolution
         if not self.has_pronoun_reference(current_query):
             return current_query
         
-        # Extract entities from last 2 turns (both query and response)
+        # Entities from last 2 turns (both query and response)
         all_entities = []
-        for turn in conversation_history[-2:]:
-            query_text = turn.get('query', '')
-            response_text = turn.get('overview', turn.get('response', ''))
-            
-            # Extract from query
-            all_entities.extend(self.extract_entities(query_text))
-            
-            # Extract from response (first 1000 chars to avoid noise)
-            all_entities.extend(self.extract_entities(response_text[:1000]))
+        if state is not None:
+            for turn in list(state.recent)[-2:]:
+                all_entities.extend(turn['entities'])
+        else:
+            for turn in conversation_history[-2:]:
+                all_entities.extend(self.turn_entities(turn))
         
         # Deduplicate while preserving order
         seen = set()
@@ -224,3 +242,117 @@ class ConversationManager:
 
 # Singleton instance for use across the application
 conversation_manager = ConversationManager()
+
+
+RECENT_TURNS = 3            # turns kept verbatim (trimmed) for the prompt
+ANSWER_CHARS = 500          # per recent answer, as in get_conversation_context
+SUMMARY_MAX_CHARS = 400     # rolling summary of turns older than RECENT_TURNS
+
+
+def turn_fingerprint(turn: Dict) -> str:
+    text = f"{turn.get('query', '')}\x00{(turn.get('overview', turn.get('response', '')) or '')[:200]}"
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+class ConversationState:
+    """Incrementally maintained view of one session's conversation"""
+    
+    def __init__(self):
+        self.turns = 0
+        self.last_fingerprint = None
+        self.recent = deque(maxlen=RECENT_TURNS)  # {'query', 'overview', 'entities'}
+        self.summary_lines = deque()
+        self.updated_at = time.time()
+    
+    @property
+    def summary(self) -> str:
+        return "\n".join(self.summary_lines)
+    
+    @property
+    def entities(self) -> List[str]:
+        """Entities of the recent turns, newest first, deduplicated"""
+        seen, result = set(), []
+        for turn in reversed(self.recent):
+            for entity in turn['entities']:
+                if entity.lower() not in seen:
+                    seen.add(entity.lower())
+                    result.append(entity)
+        return result
+    
+    def fold(self, turn: Dict, manager: ConversationManager = conversation_manager):
+        """Add one turn; the turn that leaves the recent window goes into the summary"""
+        overview = turn.get('overview', turn.get('response', '')) or ''
+        if len(self.recent) == RECENT_TURNS:
+            self._summarize(self.recent[0])
+        self.recent.append({
+            'query': turn.get('query', '') or '',
+            'overview': overview[:ANSWER_CHARS] + ("..." if len(overview) > ANSWER_CHARS else ""),
+            'entities': manager.turn_entities(turn),
+        })
+        self.turns += 1
+        self.last_fingerprint = turn_fingerprint(turn)
+        self.updated_at = time.time()
+    
+    def _summarize(self, turn: Dict):
+        line = f"- {turn['query'][:120]}"
+        if turn['entities']:
+            line += f" ({', '.join(turn['entities'][:4])})"
+        self.summary_lines.append(line)
+        # Rolling: the oldest lines go first once the cap is reached
+        while len(self.summary_lines) > 1 and sum(len(l) + 1 for l in self.summary_lines) > SUMMARY_MAX_CHARS:
+            self.summary_lines.popleft()
+
+
+class ConversationStateCache:
+    """LRU of ConversationState per session_id, synced from the resent history"""
+    
+    def __init__(self, max_sessions: int = 2000, ttl_seconds: float = 6 * 3600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._states: 'OrderedDict[str, ConversationState]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def build(history: List[Dict]) -> ConversationState:
+        state = ConversationState()
+        for turn in history or []:
+            state.fold(turn)
+        return state
+    
+    def sync(self, session_id: Optional[str], history: List[Dict]) -> ConversationState:
+        """State for `history`, folding in only the turns added since the last call"""
+        history = history or []
+        if not session_id:
+            return self.build(history)
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is not None and time.time() - state.updated_at > self.ttl_seconds:
+                state = None
+            new_turns = None
+            if state is not None:
+                # The last turn we folded is usually history[-2] (one new turn) or
+                # history[-1] (a repeat); scan back in case the client trims history
+                for i in range(len(history) - 1, -1, -1):
+                    if turn_fingerprint(history[i]) == state.last_fingerprint:
+                        new_turns = history[i + 1:]
+                        break
+                if state.turns == 0 and not history:
+                    new_turns = []
+            if new_turns is None:
+                self.misses += 1
+                state = self.build(history)
+            else:
+                self.hits += 1
+                for turn in new_turns:
+                    state.fold(turn)
+            self._states[session_id] = state
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+            return state
+
+
+# Singleton instance for use across the application
+conversation_cache = ConversationStateCache()
@@ -0,0 +1,164 @@
+"""
+Dashboard bundle for the LitPath AI admin dashboard
+
+The dashboard loads 15+ widgets (kpi, trends, citation stats, ...), each a
+separate GET with its own connection setup and queries. GET
+/api/dashboard/bundle/?widgets=kpi,daily-trends&from=...&to=... answers any
+subset of them in one round trip:
+
+- widgets are computed concurrently on a small pool of long-lived worker
+  threads. Django connections are per thread, so each worker keeps its own
+  connection open between bundles (checked before every task) instead of
+  connecting per request. With the pooled engine (DB_POOL) a worker hands
+  its connection back to the pool after each task instead
+- every widget is the existing endpoint's view, called with the bundle's
+  range, so a bundled widget returns exactly what its endpoint returns
+- the response is cached per (widgets, range, widget params) under an ETag
+  that also covers a data version - the newest event ids / timestamps of
+  the tables the widgets read, fetched in one query. A new view, citation
+  copy, search or feedback changes the version, which invalidates the entry.
+  Edits and deletes are not in the version, so the ETag also rolls over
+  every `ttl_seconds`
+- If-None-Match with the current ETag returns 304 without computing
+  anything, so reloading an unchanged dashboard only costs the version query
+- a bundle with a failed widget is neither cached nor given an ETag (the
+  view sends Cache-Control: no-store), so the next load recomputes it
+
+Configured via Django settings (see settings.py):
+    DASHBOARD_BUNDLE_TTL_SECONDS, DASHBOARD_BUNDLE_WORKERS
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, DatabaseError
+
+
+
+def data_version() -> Tuple:
+    """Newest row of every table the dashboard widgets read (one round trip)"""
+    from .models import (
+        CitationCopy, CSMFeedback, Feedback, Material, MaterialView, ResearchHistory, SearchStageTiming,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT
+                (SELECT MAX(id) FROM {MaterialView._meta.db_table}),
+                (SELECT MAX(id) FROM {CitationCopy._meta.db_table}),
+                (SELECT COUNT(*) FROM {Material._meta.db_table}),
+                (SELECT MAX(id) FROM {Material._meta.db_table}),
+                (SELECT MAX(created_at) FROM {ResearchHistory._meta.db_table}),
+                (SELECT MAX(created_at) FROM {CSMFeedback._meta.db_table}),
+                (SELECT MAX(created_at) FROM {Feedback._meta.db_table}),
+                (SELECT MAX(id) FROM {SearchStageTiming._meta.db_table})
+        """)
+        return tuple(str(v) for v in cursor.fetchone())
+
+
+class DashboardBundler:
+    """Concurrent widget computation with an ETag-keyed response cache"""
+
+    def __init__(self, ttl_seconds: float = 30, workers: int = 6, max_entries: int = 64):
+        self.ttl_seconds = ttl_seconds
+        self.workers = workers
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[float, Dict]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def etag(self, key: Dict, version: Tuple) -> str:
+        window = int(time.time() // self.ttl_seconds) if self.ttl_seconds > 0 else 0
+        raw = json.dumps([key, list(version), window], sort_keys=True, default=str)
+        return '"' + hashlib.sha1(raw.encode('utf-8')).hexdigest() + '"'
+
+    # ---------- cache ----------
+
+    def get(self, etag: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(etag)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, etag: str, payload: Dict):
+        with self._lock:
+            self._entries[etag] = (time.time(), payload)
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ---------- computation ----------
+
+    @staticmethod
+    def _run(task: Callable[[], Any]):
+        """Run one widget on a worker thread, reusing the thread's connection while it is healthy"""
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+        try:
+            return task()
+        except DatabaseError:
+            connection.close()  # reconnect on the next task
+            raise
+        finally:
+            if getattr(connection, 'pooled', False):
+                connection.close()  # back to the pool: idle workers must not hold pool slots
+
+    def compute(self, tasks: Dict[str, Callable[[], Any]]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """Run the widget tasks concurrently; returns ({widget: data}, {widget: error})"""
+        results, errors = {}, {}
+        if self.workers <= 0 or len(tasks) <= 1:
+            futures = None
+        else:
+            if self._executor is None:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                            thread_name_prefix='dashboard-bundle')
+            futures = {name: self._executor.submit(self._run, task) for name, task in tasks.items()}
+        for name, task in tasks.items():
+            try:
+                results[name] = futures[name].result() if futures else task()
+            except Exception as e:
+                print(f"[DASHBOARD] Widget {name} failed: {e}")
+                errors[name] = str(e)
+        return results, errors
+
+    def bundle(self, key: Dict, version: Tuple, tasks: Dict[str, Callable[[], Any]],
+               if_none_match: Optional[str] = None) -> Tuple[str, Optional[Dict]]:
+        """(etag, payload); payload is None when the client's copy is current (304), etag is
+        None when a widget failed (the partial payload must not be revalidated as current)"""
+        etag = self.etag(key, version)
+        if if_none_match and etag in [t.strip() for t in if_none_match.split(',')]:
+            self.not_modified += 1
+            return etag, None
+        payload = self.get(etag)
+        if payload is None:
+            widgets, errors = self.compute(tasks)
+            payload = {'widgets': widgets, 'errors': errors}
+            if errors:
+                return None, payload
+            self.put(etag, payload)
+        return etag, payload
+
+
+# Singleton instance for use across the application
+dashboard_bundler = DashboardBundler(
+    ttl_seconds=getattr(settings, 'DASHBOARD_BUNDLE_TTL_SECONDS', 30),
+    workers=getattr(settings, 'DASHBOARD_BUNDLE_WORKERS', 6),
+)
@@ -0,0 +1,337 @@
+"""
+Pooled database connections for LitPath AI
+
+With CONN_MAX_AGE=0 every request used to open its own Postgres connection
+(TCP + TLS + auth to Supabase, 50-150 ms) and close it at the end. The
+`rag_api.pooled_postgresql` engine keeps a process-wide ConnectionPool
+instead: Django still "closes" the connection at the end of each request,
+which hands it back to the pool, and the next request (on any thread)
+checks it out again.
+
+- Size: at most `max_size` connections are open (in use + idle); a checkout
+  beyond that waits up to `timeout` seconds for one to come back, then
+  fails. A maintenance thread keeps at least `min_size` open.
+- Health checks: a connection that sat idle for `check_after` seconds or more is
+  pinged before it is handed out (0 = always); a dead one is replaced.
+  A connection returned mid-transaction is rolled back first.
+- Recycling: idle connections beyond `min_size` are closed after
+  `max_idle` seconds, and every connection after `max_lifetime` seconds.
+- Metrics: checkout wait times and utilization, see `stats()` (on
+  GET /api/health/) and litpath_db_pool_wait_seconds on GET /api/metrics/.
+
+The pool itself knows nothing about Postgres: the engine passes in
+connect / check / reset / close callables.
+
+Configured via Django settings (see settings.py):
+    DB_POOL, DB_POOL_MODE, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT_SECONDS, DB_POOL_CHECK_SECONDS,
+    DB_POOL_MAX_IDLE_SECONDS, DB_POOL_MAX_LIFETIME_SECONDS
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from .latency_metrics import LatencyTracker
+
+
+# Checkout waits kept for the percentiles on the health endpoint
+WAIT_WINDOW = 1000
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the pool timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections with health checks and recycling"""
+
+    def __init__(self, connect: Callable[[], Any], check: Callable[[Any], bool],
+                 reset: Callable[[Any], bool], close: Callable[[Any], None], name: str = 'default',
+                 min_size: int = 2, max_size: int = 10, timeout: float = 10.0, check_after: float = 5.0,
+                 max_idle: float = 300.0, max_lifetime: float = 1800.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self._connect = connect
+        self._check = check
+        self._reset = reset
+        self._close = close
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._cond = threading.Condition()
+        self._idle = deque()      # [conn, opened_at, returned_at], oldest return on the left
+        self._in_use: Dict[int, float] = {}  # id(conn) -> opened_at
+        self._size = 0            # open + being opened
+        self._waiting = 0
+        self._thread = None
+        self._closed = False
+        self._waits = deque(maxlen=WAIT_WINDOW)
+        self.peak_in_use = 0
+        self.counters = {'checkouts': 0, 'waits': 0, 'timeouts': 0, 'opened': 0, 'closed': 0,
+                         'recycled': 0, 'health_check_failures': 0, 'connect_ms_total': 0.0}
+
+    # ---------- checkout / return ----------
+
+    def getconn(self):
+        """Check out a healthy connection, opening one if the pool has room"""
+        if self._thread is None:
+            self._start()
+        start = time.monotonic()
+        while True:
+            entry = self._reserve(start)
+            if entry is None:
+                conn = self._open()
+                opened_at = time.monotonic()
+            else:
+                conn, opened_at, returned_at = entry
+                now = time.monotonic()
+                if self.max_lifetime and now - opened_at >= self.max_lifetime:
+                    self._discard(conn, 'recycled')
+                    continue
+                if now - returned_at >= self.check_after and not self._healthy(conn):
+                    self._discard(conn, 'health_check_failures')
+                    continue
+            with self._cond:
+                self._in_use[id(conn)] = opened_at
+                self.peak_in_use = max(self.peak_in_use, len(self._in_use))
+                self.counters['checkouts'] += 1
+            return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a checked-out connection; it is closed instead if it is broken or expired"""
+        with self._cond:
+            opened_at = self._in_use.pop(id(conn), None)
+        if opened_at is None:
+            self._close_quietly(conn)  # not ours (pool was reset); just close it
+            return
+        if discard or self._closed or not self._reusable(conn):
+            self._discard(conn, 'closed')
+        elif self.max_lifetime and time.monotonic() - opened_at >= self.max_lifetime:
+            self._discard(conn, 'recycled')
+        else:
+            with self._cond:
+                self._idle.append([conn, opened_at, time.monotonic()])
+                self._cond.notify()
+
+    def _reserve(self, start: float) -> Optional[list]:
+        """Take an idle connection, or a slot to open one (returns None); waits while the pool is full"""
+        expired = []
+        try:
+            with self._cond:
+                waited = False
+                while True:
+                    expired.extend(self._expired_idle(time.monotonic()))
+                    if self._idle:
+                        entry = self._idle.pop()  # most recently used: warm and least likely to be stale
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        entry = None
+                        break
+                    remaining = start + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No database connection available in pool '{self.name}' after {self.timeout:g}s "
+                            f"({self.max_size} in use)")
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                wait_ms = (time.monotonic() - start) * 1000
+                self._waits.append(wait_ms)
+                if waited:
+                    self.counters['waits'] += 1
+            pool_wait_tracker.record(self.name, wait_ms)
+            return entry
+        finally:
+            for conn in expired:
+                self._close_quietly(conn)
+
+    def _open(self):
+        """Open a connection for a reserved slot"""
+        start = time.monotonic()
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.counters['opened'] += 1
+            self.counters['connect_ms_total'] += (time.monotonic() - start) * 1000
+        return conn
+
+    def _healthy(self, conn) -> bool:
+        try:
+            return bool(self._check(conn))
+        except Exception:
+            return False
+
+    def _reusable(self, conn) -> bool:
+        try:
+            return bool(self._reset(conn))
+        except Exception:
+            return False
+
+    def _discard(self, conn, counter: str):
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self.counters[counter] += 1
+            if counter != 'closed':
+                self.counters['closed'] += 1
+            self._cond.notify()
+
+    def _close_quietly(self, conn):
+        try:
+            self._close(conn)
+        except Exception:
+            pass
+
+    # ---------- maintenance ----------
+
+    def _expired_idle(self, now: float) -> List[Any]:
+        """Pop idle connections past max_idle (beyond min_size) or max_lifetime; call with the lock held"""
+        expired = []
+        for entry in list(self._idle):
+            conn, opened_at, returned_at = entry
+            too_old = self.max_lifetime and now - opened_at >= self.max_lifetime
+            too_idle = (self.max_idle and now - returned_at >= self.max_idle
+                        and self._size - len(expired) > self.min_size)
+            if too_old or too_idle:
+                self._idle.remove(entry)
+                expired.append(conn)
+        if expired:
+            self._size -= len(expired)
+            self.counters['recycled'] += len(expired)
+            self.counters['closed'] += len(expired)
+        return expired
+
+    def maintain(self):
+        """Close expired idle connections, then open connections up to min_size"""
+        with self._cond:
+            expired = self._expired_idle(time.monotonic())
+            missing = 0 if self._closed else max(0, self.min_size - self._size)
+            self._size += missing
+        for conn in expired:
+            self._close_quietly(conn)
+        for _ in range(missing):
+            try:
+                conn = self._open()
+            except Exception as e:
+                print(f"[DBPOOL] Could not open a connection for pool '{self.name}': {e}")
+                continue
+            self._add_idle(conn)
+
+    def _add_idle(self, conn):
+        """Add a freshly opened connection (its slot already reserved) to the idle set"""
+        now = time.monotonic()
+        with self._cond:
+            self._idle.appendleft([conn, now, now])
+            self._cond.notify()
+
+    def _start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f'db-pool-{self.name}', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = max(1.0, min(self.max_idle or 60.0, 60.0) / 2)
+        while not self._closed:
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f"[DBPOOL] Maintenance of pool '{self.name}' failed: {e}")
+            time.sleep(interval)
+
+    def close(self):
+        """Close idle connections and stop pooling; checked-out ones are closed when returned"""
+        with self._cond:
+            self._closed = True
+            idle = [entry[0] for entry in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self.counters['closed'] += len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    # ---------- metrics ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            in_use = len(self._in_use)
+            waits = sorted(self._waits)
+            counters = dict(self.counters)
+            idle, size, waiting = len(self._idle), self._size, self._waiting
+
+        def percentile(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 3) if waits else 0.0
+
+        connect_ms_total = counters.pop('connect_ms_total')
+        return {
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'size': size,
+            'in_use': in_use,
+            'idle': idle,
+            'waiting': waiting,
+            'utilization': round(in_use / self.max_size, 3),
+            'peak_in_use': self.peak_in_use,
+            'peak_utilization': round(self.peak_in_use / self.max_size, 3),
+            'wait_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99),
+                        'max': round(waits[-1], 3) if waits else 0.0},
+            'connect_ms_avg': round(connect_ms_total / counters['opened'], 3) if counters['opened'] else 0.0,
+            **counters,
+        }
+
+
+# Checkout wait per pool, exported on GET /api/metrics/
+pool_wait_tracker = LatencyTracker(
+    metric_name='litpath_db_pool_wait_seconds',
+    label='pool',
+    description='Time spent waiting to check a connection out of the database pool in seconds.',
+)
+
+# Pools of this process, keyed by (alias, database name): the test runner points an
+# alias at a different database, which must not get the other database's connections
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key: tuple, factory: Callable[[], ConnectionPool]) -> ConnectionPool:
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = factory()
+    return pool
+
+
+def close_pools(database: Optional[str] = None):
+    """Close the pools (of one database name, or all) - e.g. before dropping a test database"""
+    with _pools_lock:
+        keys = [key for key in _pools if database is None or key[1] == database]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats of every pool in this process, by alias"""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {key[0]: pool.stats() for key, pool in pools}
@@ -0,0 +1,231 @@
+"""
+Per-document engagement stats for LitPath AI
+
+Search results, the sources stats endpoint, most-browsed and the source
+ratings page all show the same per-file numbers - views and ratings - and
+each used to recompute them with GROUP BY queries over material_views and
+feedback (most-browsed and source ratings through a views x feedback join
+that fanned out before COUNT DISTINCT). They now read one row per file from
+document_stats:
+
+    view_count, last_viewed_at,
+    rating_count, rating_sum, rating_sq_sum, rating_min, rating_max
+
+Counters are maintained incrementally in the transaction that records the
+event:
+- a view adds 1 to view_count (record_view), a batch of spooled views
+  (event_ingest.py) adds its per-file counts (record_views)
+- a new rating adds to count / sum / squares and widens min / max
+  (record_rating)
+- an edited or deleted rating recomputes that file's rating columns from
+  feedback (refresh_ratings) - min / max cannot be narrowed incrementally,
+  and admins rarely edit ratings
+
+Only ratings that are set count, so avg_rating = rating_sum / rating_count.
+Reads are a single primary-key batch (lookup / summary).
+
+Migration 0025 fills the table from the raw rows on deploy.
+`python manage.py rebuild_document_stats` reconciles it again (after bulk
+imports / deletes that bypass the API) and reports how many files had
+drifted.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection, IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+
+RATING_FIELDS = ('rating_count', 'rating_sum', 'rating_sq_sum', 'rating_min', 'rating_max')
+COUNTER_FIELDS = ('view_count', 'last_viewed_at') + RATING_FIELDS
+NO_RATINGS = {'rating_count': 0, 'rating_sum': 0, 'rating_sq_sum': 0, 'rating_min': None, 'rating_max': None}
+
+
+def _model(name: str, apps=None):
+    """A rag_api model - from the historical app registry when called from a migration"""
+    if apps is not None:
+        return apps.get_model('rag_api', name)
+    from . import models
+    return getattr(models, name)
+
+
+def _stddev(count: int, total: int, squares: int) -> float:
+    """Sample standard deviation from the running sums (matches Postgres STDDEV)"""
+    if count < 2:
+        return 0.0
+    variance = (squares - total * total / count) / (count - 1)
+    return max(variance, 0.0) ** 0.5
+
+
+class DocumentStatsStore:
+    """Maintains and reads the document_stats table"""
+
+    # ---------- incremental updates ----------
+
+    def _upsert(self, file: str, updates: Dict, initial: Dict):
+        """Apply F() updates to the file's row, creating it with `initial` if missing"""
+        from .models import DocumentStats
+        if DocumentStats.objects.filter(file=file).update(**updates):
+            return
+        try:
+            with transaction.atomic():
+                DocumentStats.objects.create(file=file, **initial)
+        except IntegrityError:
+            # Created concurrently - apply the increment to that row instead
+            DocumentStats.objects.filter(file=file).update(**updates)
+
+    def record_view(self, file: str, viewed_at=None):
+        viewed_at = viewed_at or timezone.now()
+        self._upsert(
+            file,
+            {'view_count': F('view_count') + 1, 'last_viewed_at': viewed_at},
+            {'view_count': 1, 'last_viewed_at': viewed_at},
+        )
+
+    def record_views(self, views: Dict[str, Tuple[int, object]]):
+        """Add a batch of views ({file: (count, last viewed_at)}, from the event ingester)"""
+        from .models import DocumentStats
+        if not views:
+            return
+        with transaction.atomic():
+            # Locked in file order, so concurrent batches cannot deadlock
+            rows = list(DocumentStats.objects.select_for_update().filter(file__in=list(views)).order_by('file'))
+            for row in rows:
+                count, viewed_at = views[row.file]
+                row.view_count += count
+                row.last_viewed_at = max(row.last_viewed_at, viewed_at) if row.last_viewed_at else viewed_at
+            DocumentStats.objects.bulk_update(rows, ['view_count', 'last_viewed_at'], batch_size=500)
+            found = {row.file for row in rows}
+            for file, (count, viewed_at) in views.items():
+                if file not in found:
+                    self._upsert(
+                        file,
+                        {'view_count': F('view_count') + count,
+                         'last_viewed_at': Greatest(Coalesce(F('last_viewed_at'), Value(viewed_at)), Value(viewed_at))},
+                        {'view_count': count, 'last_viewed_at': viewed_at},
+                    )
+
+    def record_rating(self, file: Optional[str], rating: Optional[int]):
+        """Count a newly created rating"""
+        if not file or rating is None:
+            return
+        rating = int(rating)
+        self._upsert(
+            file,
+            {
+                'rating_count': F('rating_count') + 1,
+                'rating_sum': F('rating_sum') + rating,
+                'rating_sq_sum': F('rating_sq_sum') + rating * rating,
+                'rating_min': Least(Coalesce(F('rating_min'), Value(rating)), Value(rating)),
+                'rating_max': Greatest(Coalesce(F('rating_max'), Value(rating)), Value(rating)),
+            },
+            {'rating_count': 1, 'rating_sum': rating, 'rating_sq_sum': rating * rating,
+             'rating_min': rating, 'rating_max': rating},
+        )
+
+    def refresh_ratings(self, files: Iterable[Optional[str]]):
+        """Recompute the rating columns of `files` from feedback (after an edit or delete)"""
+        from .models import DocumentStats
+        files = sorted({f for f in files if f})
+        if not files:
+            return
+        ratings = self._raw_ratings(files)
+        for file in files:
+            values = ratings.get(file, NO_RATINGS)
+            if not DocumentStats.objects.filter(file=file).update(**values):
+                DocumentStats.objects.get_or_create(file=file, defaults=values)
+
+    # ---------- reads ----------
+
+    def lookup(self, files: Iterable[str]) -> Dict:
+        """DocumentStats rows for `files` in one primary-key batch (missing files are left out)"""
+        from .models import DocumentStats
+        files = list({f for f in files if f})
+        if not files:
+            return {}
+        return DocumentStats.objects.in_bulk(files)
+
+    def summary(self, files: List[str]) -> Dict[str, Dict]:
+        """{file: {'view_count', 'avg_rating'}} for the search results and sources stats"""
+        rows = self.lookup(files)
+        stats = {}
+        for f in files:
+            row = rows.get(f)
+            stats[f] = {
+                'view_count': row.view_count if row else 0,
+                'avg_rating': round(row.avg_rating, 2) if row else 0.0,
+            }
+        return stats
+
+    @staticmethod
+    def rating_summary(row) -> Dict:
+        """Rating fields of a row as served by the source ratings endpoint"""
+        if row is None or not row.rating_count:
+            return {'rating_count': 0, 'avg_rating': 0.0, 'min_rating': 0, 'max_rating': 0, 'stddev_rating': 0.0}
+        return {
+            'rating_count': row.rating_count,
+            'avg_rating': round(row.avg_rating, 2),
+            'min_rating': row.rating_min or 0,
+            'max_rating': row.rating_max or 0,
+            'stddev_rating': round(_stddev(row.rating_count, row.rating_sum, row.rating_sq_sum), 2),
+        }
+
+    # ---------- reconciliation ----------
+
+    @staticmethod
+    def _raw_ratings(files: Optional[List[str]] = None, apps=None) -> Dict[str, Dict]:
+        Feedback = _model('Feedback', apps)
+        rows = Feedback.objects.filter(rating__isnull=False, document_file__isnull=False)
+        if files is not None:
+            rows = rows.filter(document_file__in=files)
+        rows = (rows.values('document_file')
+                .annotate(rating_count=Count('id'), rating_sum=Sum('rating'),
+                          rating_sq_sum=Sum(F('rating') * F('rating')),
+                          rating_min=Min('rating'), rating_max=Max('rating'))
+                .order_by())
+        return {r.pop('document_file'): r for r in rows}
+
+    def _raw_stats(self, apps=None) -> Dict[str, Dict]:
+        """What every row should hold, recomputed from material_views and feedback"""
+        MaterialView = _model('MaterialView', apps)
+        stats = {}
+        views = (MaterialView.objects.values('file')
+                 .annotate(view_count=Count('id'), last_viewed_at=Max('viewed_at')).order_by())
+        for row in views:
+            stats[row['file']] = {'view_count': row['view_count'], 'last_viewed_at': row['last_viewed_at'],
+                                  **NO_RATINGS}
+        for file, ratings in self._raw_ratings(apps=apps).items():
+            stats.setdefault(file, {'view_count': 0, 'last_viewed_at': None, **NO_RATINGS}).update(ratings)
+        return stats
+
+    def rebuild(self, apps=None) -> Tuple[int, int]:
+        """Replace document_stats with counters recomputed from the raw tables.
+
+        Returns (rows written, rows that had drifted - changed, missing or stale).
+        On PostgreSQL the table is locked first, so views / ratings recorded
+        meanwhile wait and are applied on top of the rebuilt rows. Migrations
+        pass their `apps` registry (migration 0025 backfills the table).
+        """
+        DocumentStats = _model('DocumentStats', apps)
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LOCK TABLE {DocumentStats._meta.db_table} IN EXCLUSIVE MODE")
+            fresh = self._raw_stats(apps)
+            current = {row['file']: row for row in DocumentStats.objects.values('file', *COUNTER_FIELDS)}
+            drifted = sum(
+                1 for file in fresh.keys() | current.keys()
+                if file not in fresh or file not in current
+                or any(fresh[file][k] != current[file][k] for k in COUNTER_FIELDS)
+            )
+            DocumentStats.objects.all().delete()
+            DocumentStats.objects.bulk_create(
+                [DocumentStats(file=file, **values) for file, values in fresh.items()], batch_size=1000)
+        print(f"[STATS] Rebuilt document_stats: {len(fresh)} files, {drifted} drifted")
+        return len(fresh), drifted
+
+
+# Singleton instance for use across the application
+document_stats = DocumentStatsStore()
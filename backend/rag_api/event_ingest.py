@@ -0,0 +1,274 @@
+"""
+Write-behind ingestion of material views and citation copies for LitPath AI
+
+track_material_view / track_citation_copy used to do a Material lookup or
+get_or_create plus an INSERT per click, each on a fresh Postgres connection.
+They now hand the event to `event_ingest.accept()`, which appends one JSON
+line to a local spool file and returns (tens of microseconds). A flusher
+thread writes the spooled events in batches - when `batch_size` events are
+pending or every `flush_interval_ms` - in one transaction:
+
+- material_views / citation copies, with the time the event was accepted
+  (executemany; bulk_create would overwrite it through auto_now_add)
+- the per-file view counters of document_stats, one update per file
+- the daily rollups (usage_rollups.record_events): subject_view_daily for
+  every view, and every rollup for events of days that compaction already
+  rolled up; other counts of later days - normally just today - are read
+  from the raw rows written here, so dashboards don't lag
+- a row in ingest_spool_segments naming the spool segment
+
+Spool segments move through <dir>/<pid>-<started>-<seq>.active (being
+appended to) -> .sealed (full, waiting) -> .claimed.<pid> (being flushed)
+and are deleted once their transaction has committed. A segment whose
+process died is picked up by the next flush of any process sharing the
+directory, and the ingest_spool_segments row makes replaying a segment
+that had already committed a no-op, so every event is written exactly
+once. Lines are flushed to the OS on write: they survive a process crash;
+set INGEST_SPOOL_FSYNC=True to also survive power loss, at the cost of an
+fsync per event.
+
+track_citation_copy answers 404 for files missing from `materials` (or
+removed from the catalog) before accepting a copy; removed materials keep
+their rows, so an accepted copy is always written. Views never create materials:
+`materials` is synced from the index by material_catalog.
+
+Configured via Django settings (see settings.py):
+    INGEST_WRITE_BEHIND, INGEST_SPOOL_DIR, INGEST_BATCH_SIZE,
+    INGEST_FLUSH_INTERVAL_MS, INGEST_SPOOL_FSYNC
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .usage_rollups import usage_rollups
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class EventIngestBuffer:
+    """Durable spool + batched flusher for view and citation-copy events"""
+
+    def __init__(self, spool_dir: str, batch_size: int = 500, flush_interval_ms: float = 1000,
+                 enabled: bool = True, fsync: bool = False):
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.enabled = enabled
+        self.fsync = fsync
+        self._lock = threading.Lock()          # guards the active segment
+        self._flush_lock = threading.Lock()    # one flush at a time per process
+        self._wakeup = threading.Event()
+        self._file = None
+        self._path = None
+        self._pending = 0
+        self._seq = 0
+        self._started = None
+        self._thread = None
+        self._pruned_at = 0.0
+        self.flushed_events = 0
+        self.dropped_events = 0
+
+    # ---------- accept (request path) ----------
+
+    def accept(self, kind: str, **event):
+        """Spool one event ('view' or 'copy'); it is written to the database by the flusher"""
+        event['k'] = kind
+        event.setdefault('at', timezone.now().isoformat())
+        line = json.dumps(event, default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._pending += 1
+            pending = self._pending
+        if self._thread is None:
+            self._start()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def _open_segment(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        if self._started is None:
+            self._started = int(time.time() * 1000)
+        self._seq += 1
+        self._path = os.path.join(self.spool_dir, f"{os.getpid()}-{self._started}-{self._seq:06d}.active")
+        self._file = open(self._path, 'a', encoding='utf-8')
+
+    def _seal(self):
+        """Close the active segment so the flusher can take it"""
+        with self._lock:
+            if self._file is None or not self._pending:
+                return
+            self._file.close()
+            os.rename(self._path, self._path[:-len('.active')] + '.sealed')
+            self._file, self._path, self._pending = None, None, 0
+
+    # ---------- flusher ----------
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='event-ingest', daemon=True)
+            self._thread.start()
+        atexit.register(self._flush_at_exit)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval_ms / 1000.0)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[INGEST] Flush failed, events stay spooled: {e}")
+            finally:
+                connections.close_all()
+
+    @staticmethod
+    def _orphaned(pid: int) -> bool:
+        """A segment owned by `pid` is abandoned: the process is gone, or it is us
+        (a previous process with our pid, or a flush of ours that failed)"""
+        return pid == os.getpid() or not _pid_alive(pid)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[INGEST] Flush at exit failed, events stay spooled: {e}")
+
+    def _claimable(self) -> List[str]:
+        """Sealed segments, plus active / claimed ones left behind by dead processes"""
+        paths = sorted(glob.glob(os.path.join(self.spool_dir, '*.sealed')))
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, '*.active'))):
+            if path != self._path and self._orphaned(int(os.path.basename(path).split('-')[0])):
+                paths.append(path)
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, '*.claimed.*'))):
+            if self._orphaned(int(path.rsplit('.', 1)[1])):
+                paths.append(path)
+        return paths
+
+    def flush(self) -> int:
+        """Seal the active segment and write every claimable segment; returns events written"""
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        written = 0
+        with self._flush_lock:
+            self._seal()
+            for path in self._claimable():
+                segment = os.path.basename(path).split('.')[0]
+                claimed = os.path.join(self.spool_dir, f"{segment}.claimed.{os.getpid()}")
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue  # another process claimed it first
+                written += self._write_segment(segment, claimed)
+                os.remove(claimed)
+            if written and time.time() - self._pruned_at > 3600:
+                self._prune()
+        if written:
+            usage_rollups.maybe_compact()
+        return written
+
+    def _prune(self):
+        """Forget committed segment names after a day - replays only happen right after a crash"""
+        from datetime import timedelta
+        from .models import IngestSpoolSegment
+        IngestSpoolSegment.objects.filter(committed_at__lt=timezone.now() - timedelta(days=1)).delete()
+        self._pruned_at = time.time()
+
+    @staticmethod
+    def _read(path: str) -> List[Dict]:
+        events = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass  # last line cut short by a crash
+        return events
+
+    def _write_segment(self, segment: str, path: str) -> int:
+        from .models import IngestSpoolSegment
+        events = self._read(path)
+        with transaction.atomic():
+            _, created = IngestSpoolSegment.objects.get_or_create(name=segment, defaults={'events': len(events)})
+            if not created:
+                return 0  # committed before a crash, only the file was left behind
+            written = self.write_batch(events)
+        self.flushed_events += written
+        return written
+
+    # ---------- batch write ----------
+
+    def write_batch(self, events: List[Dict]) -> int:
+        """Insert a batch of events (call inside a transaction); returns rows written"""
+        from .document_stats import document_stats
+        from .models import Material, MaterialView, CitationCopy
+
+        views = [e for e in events if e['k'] == 'view']
+        copies = [e for e in events if e['k'] == 'copy']
+        for e in events:
+            e['at'] = parse_datetime(e['at'])
+
+        with connection.cursor() as cursor:
+            if views:
+                cursor.executemany(
+                    f"INSERT INTO {MaterialView._meta.db_table} (file, user_id, session_id, viewed_at) "
+                    "VALUES (%s, %s, %s, %s)",
+                    [(e['file'], e.get('user_id'), e.get('session_id'), e['at']) for e in views])
+            if copies:
+                ids = dict(Material.objects.filter(file__in={e['file'] for e in copies}).values_list('file', 'id'))
+                rows = [(ids[e['file']], e.get('user_id'), e.get('session_id'), e['style'], e['at'])
+                        for e in copies if e['file'] in ids]
+                self.dropped_events += len(copies) - len(rows)
+                if len(rows) < len(copies):
+                    print(f"[INGEST] Dropped {len(copies) - len(rows)} citation copies of unknown materials")
+                copies = rows
+                if rows:
+                    cursor.executemany(
+                        f"INSERT INTO {CitationCopy._meta.db_table} "
+                        "(document_id, user_id, session_id, citation_style, copied_at) VALUES (%s, %s, %s, %s, %s)",
+                        rows)
+
+        per_file = defaultdict(lambda: [0, None])
+        for e in views:
+            counts = per_file[e['file']]
+            counts[0] += 1
+            counts[1] = max(counts[1], e['at']) if counts[1] else e['at']
+        document_stats.record_views({f: tuple(c) for f, c in per_file.items()})
+        usage_rollups.record_events(
+            [(e['at'], e['file'], e.get('user_id'), e.get('session_id')) for e in views],
+            [(row[4], row[0]) for row in copies])
+        return len(views) + len(copies)
+
+
+# Singleton instance for use across the application
+event_ingest = EventIngestBuffer(
+    spool_dir=getattr(settings, 'INGEST_SPOOL_DIR', os.path.join('RAG', 'ingest_spool')),
+    batch_size=getattr(settings, 'INGEST_BATCH_SIZE', 500),
+    flush_interval_ms=getattr(settings, 'INGEST_FLUSH_INTERVAL_MS', 1000),
+    enabled=getattr(settings, 'INGEST_WRITE_BEHIND', True),
+    fsync=getattr(settings, 'INGEST_SPOOL_FSYNC', False),
+)
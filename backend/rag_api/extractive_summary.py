@@ -0,0 +1,123 @@
+"""
+Extractive overview for LitPath AI
+
+Picks the most central sentences of the selected chunks with NumPy only -
+no LLM call, a few milliseconds - and cites them with the same [n] source
+numbers the Gemini overview uses. Two uses:
+
+- instant preview: SearchView returns it with the search results, so the
+  overview panel has content before Gemini's first token
+- degraded mode: the overview falls back to it when Gemini is rate-limited
+  or misses its deadline
+
+Scoring is centroid-based: sentences become L2-normalised TF-IDF rows over
+the candidate set's own vocabulary; a sentence's score blends its cosine to
+the centroid of all sentences (what the sources collectively say) with its
+cosine to the query. Sentences are taken greedily, skipping any too similar
+to one already chosen, and grouped into one paragraph per source.
+
+Configured via Django settings (see settings.py):
+    RAG_EXTRACTIVE_PREVIEW, RAG_PREVIEW_SENTENCES
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+from .local_reranker import tokenize
+from .prompt_builder import PromptBuilder, split_sentences, source_id
+
+
+MIN_SENTENCE_CHARS = 40
+MAX_SENTENCE_CHARS = 400
+
+
+class ExtractiveSummarizer:
+    """Centroid + query sentence scoring with redundancy removal"""
+
+    def __init__(self, max_sentences: int = 4, query_weight: float = 0.4, redundancy: float = 0.6,
+                 max_chunks: int = 10):
+        self.max_sentences = max_sentences
+        self.query_weight = query_weight
+        self.redundancy = redundancy
+        self.max_chunks = max_chunks
+
+    @staticmethod
+    def tfidf(token_lists: List[List[str]]):
+        """Row-normalised TF-IDF matrix and vocabulary for the given sentences"""
+        vocab = {}
+        rows, cols = [], []
+        for i, tokens in enumerate(token_lists):
+            for t in tokens:
+                rows.append(i)
+                cols.append(vocab.setdefault(t, len(vocab)))
+        matrix = np.zeros((len(token_lists), max(1, len(vocab))), dtype=np.float32)
+        if rows:
+            np.add.at(matrix, (np.array(rows), np.array(cols)), 1.0)
+        df = (matrix > 0).sum(axis=0)
+        matrix *= np.log(1.0 + len(token_lists) / np.maximum(df, 1)).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12), vocab
+
+    def select(self, sentences: List[str], question: str) -> List[int]:
+        """Indices of the chosen sentences, best first"""
+        token_lists = [tokenize(s) for s in sentences]
+        matrix, vocab = self.tfidf(token_lists)
+        centroid = matrix.mean(axis=0)
+        centroid /= max(float(np.linalg.norm(centroid)), 1e-12)
+        query = np.zeros(matrix.shape[1], dtype=np.float32)
+        for t in tokenize(question):
+            if t in vocab:
+                query[vocab[t]] = 1.0
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = (1.0 - self.query_weight) * (matrix @ centroid) + self.query_weight * (matrix @ query)
+
+        chosen = []
+        for i in np.argsort(-scores, kind="stable"):
+            if not token_lists[i]:
+                continue
+            if chosen and float((matrix[chosen] @ matrix[i]).max()) > self.redundancy:
+                continue
+            chosen.append(int(i))
+            if len(chosen) >= self.max_sentences:
+                break
+        return chosen
+
+    def summarize(self, chunks: List[Dict], question: str) -> Optional[Dict]:
+        """Raw cited summary ({'text', 'seen_pdfs', 'sentences'}) or None"""
+        _, seen_pdfs, pdf_to_number = PromptBuilder.number_sources(chunks)
+        sentences, numbers, seen = [], [], set()
+        for c in chunks[:self.max_chunks]:
+            number = pdf_to_number.get(source_id(c['meta']))
+            if number is None:
+                continue
+            for sentence in split_sentences(c['chunk']):
+                if MIN_SENTENCE_CHARS <= len(sentence) <= MAX_SENTENCE_CHARS and sentence not in seen:
+                    seen.add(sentence)
+                    sentences.append(sentence)
+                    numbers.append(number)
+        if not sentences:
+            return None
+
+        chosen = self.select(sentences, question)
+        # One paragraph per source, sources in order of their best sentence,
+        # sentences in their original order
+        paragraphs = {}
+        for i in chosen:
+            paragraphs.setdefault(numbers[i], []).append(i)
+        text = "\n\n".join(
+            " ".join(sentences[i] for i in sorted(indices)) + f" [{number}]"
+            for number, indices in paragraphs.items()
+        )
+        return {
+            'text': text,
+            'seen_pdfs': seen_pdfs,
+            'sentences': [{'text': sentences[i], 'source': numbers[i]} for i in chosen],
+        }
+
+
+# Singleton instance for use across the application
+extractive_summarizer = ExtractiveSummarizer(
+    max_sentences=getattr(settings, 'RAG_PREVIEW_SENTENCES', 4),
+)
@@ -0,0 +1,91 @@
+"""
+HyperLogLog distinct counting for LitPath AI usage statistics
+
+A sketch is 2^p one-byte registers. Each item is hashed to 64 bits: the top
+p bits pick a register, which keeps the maximum "rank" (position of the
+first 1-bit) of the remaining bits seen. The count estimate is the
+harmonic mean of 2^register over all registers, with linear counting for
+small cardinalities (Flajolet et al. 2007, 64-bit hash so no large-range
+correction).
+
+Sketches of the same precision merge losslessly by taking the element-wise
+maximum, so per-day sketches answer any range of days: the merged sketch is
+the sketch of the union.
+
+Error: relative standard error 1.04 / sqrt(2^p) - 1.6% at the default
+p = 12 (4096 registers), so about 95% of estimates fall within +/-3.3% and
+99.7% within +/-4.9% of the exact count. Small counts (well below 2^p) are
+near exact thanks to linear counting.
+
+Sketches are stored zlib-compressed: a quiet day's registers are mostly
+zero and shrink to a few dozen bytes; a full one is under 4 KB.
+"""
+
+import hashlib
+import math
+import zlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+DEFAULT_PRECISION = 12
+
+
+def hash64(value: str) -> int:
+    """Stable 64-bit hash (the same across processes and restarts, unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch"""
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[np.ndarray] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"HyperLogLog precision must be in [4, 16], got {precision}")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    @staticmethod
+    def relative_error(precision: int = DEFAULT_PRECISION) -> float:
+        """Relative standard error of the estimate"""
+        return 1.04 / math.sqrt(1 << precision)
+
+    def add_hashes(self, hashes: np.ndarray):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not hashes.size:
+            return
+        tail_bits = 64 - self.precision
+        index = (hashes >> np.uint64(tail_bits)).astype(np.int64)
+        tail = hashes & np.uint64((1 << tail_bits) - 1)
+        # rank = leading zeros of the tail_bits-wide tail + 1; frexp's exponent is the bit
+        # length (float64 rounding only matters within 2^-52 of a power of two)
+        bit_length = np.frexp(tail.astype(np.float64))[1]
+        rank = (tail_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, values: Iterable[str]):
+        self.add_hashes(np.fromiter((hash64(v) for v in values), dtype=np.uint64))
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(self.registers.tobytes(), 6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        registers = np.frombuffer(zlib.decompress(bytes(data)), dtype=np.uint8).copy()
+        return cls(precision=int(registers.size).bit_length() - 1, registers=registers)
@@ -0,0 +1,169 @@
+"""
+Latency instrumentation for the LitPath AI search pipeline.
+
+Every stage of a search (query parse, rewrite, embed, document query, Chroma
+query, local rerank, LLM rerank, doc stats, generation) is timed as a span
+tagged with the request_id that the views / RAGService.search already
+create. Spans are:
+1. Aggregated into in-process histograms, exported in Prometheus text format
+   on GET /api/metrics/
+2. Buffered per request so the views can persist a per-request breakdown to
+   the search_stage_timings table (used for p50/p95/p99 on the dashboard)
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+# Pipeline stages, in the order they run
+STAGES = [
+    'query_parse',
+    'rewrite',
+    'embed',
+    'document_query',
+    'chroma_query',
+    'local_rerank',
+    'rerank',
+    'doc_stats',
+    'extractive_preview',
+    'generation_first_token',
+    'generation_total',
+]
+
+# Histogram bucket upper bounds in seconds (Prometheus convention)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Max number of requests kept in the pending buffer (protects against leaks
+# when a request never reaches the persist step, e.g. an aborted stream)
+MAX_PENDING_REQUESTS = 1000
+
+
+class Histogram:
+    """Cumulative-bucket histogram compatible with the Prometheus text format"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+
+
+class LatencyTracker:
+    """Thread-safe collector for per-stage timing spans"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, metric_name='litpath_search_stage_duration_seconds',
+                 label='stage', description='Duration of each search pipeline stage in seconds.'):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.metric_name = metric_name
+        self.label = label
+        self.description = description
+        self._histograms: Dict[str, Histogram] = {}
+        self._pending: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def span(self, stage: str, request_id: Optional[str] = None):
+        """Time the wrapped block and record it under `stage`.
+
+        The span is recorded even if the block raises, so failed stages
+        still show up in the latency distribution.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000, request_id)
+
+    def record(self, stage: str, duration_ms: float, request_id: Optional[str] = None):
+        """Record a single stage duration (milliseconds)"""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self._buckets)
+            histogram.observe(duration_ms / 1000.0)
+
+            if request_id:
+                if request_id not in self._pending and len(self._pending) >= MAX_PENDING_REQUESTS:
+                    # Drop the oldest request (dicts keep insertion order)
+                    del self._pending[next(iter(self._pending))]
+                stages = self._pending.setdefault(request_id, {})
+                # A stage can run more than once per request (e.g. retries) - accumulate
+                stages[stage] = stages.get(stage, 0.0) + duration_ms
+
+    def get_request(self, request_id: str) -> Dict[str, float]:
+        """Return the stage breakdown recorded so far for a request"""
+        with self._lock:
+            return dict(self._pending.get(request_id, {}))
+
+    def pop_request(self, request_id: str) -> Dict[str, float]:
+        """Remove and return the stage breakdown for a request"""
+        with self._lock:
+            return self._pending.pop(request_id, {})
+
+    def persist(self, request_id: str):
+        """Write the request's stage breakdown to the database.
+
+        Never raises - instrumentation must not break a search.
+        """
+        stages = self.pop_request(request_id)
+        if not stages:
+            return 0
+        try:
+            from .models import SearchStageTiming
+            SearchStageTiming.objects.bulk_create([
+                SearchStageTiming(request_id=request_id, stage=stage, duration_ms=round(ms, 3))
+                for stage, ms in stages.items()
+            ])
+            return len(stages)
+        except Exception as e:
+            print(f"[METRICS] Failed to persist stage timings for {request_id}: {e}")
+            return 0
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Return a copy of the histograms (for debugging / health checks)"""
+        with self._lock:
+            return {
+                stage: {'count': h.count, 'sum_seconds': round(h.sum, 6)}
+                for stage, h in self._histograms.items()
+            }
+
+    def render_prometheus(self) -> str:
+        """Render all histograms in the Prometheus text exposition format"""
+        name, label = self.metric_name, self.label
+        lines = [
+            f'# HELP {name} {self.description}',
+            f'# TYPE {name} histogram',
+        ]
+        with self._lock:
+            ordered = sorted(
+                self._histograms.items(),
+                key=lambda item: (STAGES.index(item[0]) if item[0] in STAGES else len(STAGES), item[0])
+            )
+            for stage, h in ordered:
+                for upper, count in zip(h.buckets, h.counts):
+                    lines.append(f'{name}_bucket{{{label}="{stage}",le="{upper:g}"}} {count}')
+                lines.append(f'{name}_bucket{{{label}="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{name}_sum{{{label}="{stage}"}} {h.sum:.6f}')
+                lines.append(f'{name}_count{{{label}="{stage}"}} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Singleton instance for use across the application
+latency_tracker = LatencyTracker()
+
+# Per-model latency of every individual LLM request (hedges and retries included),
+# recorded by rag_api/llm_client.py
+llm_latency_tracker = LatencyTracker(
+    metric_name='litpath_llm_call_duration_seconds',
+    label='model',
+    description='Duration of each upstream LLM request in seconds, per model.',
+)
@@ -0,0 +1,298 @@
+"""
+Shared LLM call wrapper for LitPath AI
+
+Every Gemini call RAGService and the RAG evaluator make goes through
+LLMClient, on top of the transport (rag_api/llm_transport.py), which keeps
+one pooled genai.Client per API key. The wrapper adds:
+
+- Deadlines: each call has a wall-clock budget; past it the caller gets
+  LLMDeadlineExceeded (a TimeoutError) and the in-flight request is left
+  to finish in the background instead of blocking the search.
+- Hedging (optional, per call): if the first request has not answered by
+  the model's observed p95 latency, an identical second request is sent
+  and whichever answers first wins. Only worth it for short, idempotent
+  calls (rewrite, rerank).
+- Retries: full-jitter exponential backoff, bounded by the deadline and
+  by a shared retry budget - each call earns a fraction of a token, each
+  retry or hedge spends one - so an upstream outage cannot multiply load.
+- Latency per model: every individual request is recorded in
+  llm_latency_tracker (Prometheus, GET /api/metrics/) and in a rolling
+  window that the hedge delay is computed from.
+
+Configured via Django settings (see settings.py):
+    LLM_HEDGE_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES,
+    LLM_MAX_RETRIES, LLM_RETRY_BUDGET_RATIO, LLM_RETRY_BACKOFF_MS
+"""
+
+import time
+import random
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+from django.conf import settings
+
+from .latency_metrics import llm_latency_tracker
+from .llm_transport import CassetteMissError, get_transport
+
+
+# Errors that a second identical request cannot fix
+NON_RETRYABLE = (CassetteMissError, ValueError, TypeError)
+
+# Requests kept per model for the hedge percentile
+LATENCY_WINDOW = 500
+
+_STREAM_END = object()
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised when an LLM call does not answer within its deadline"""
+
+
+class RetryBudget:
+    """Token bucket shared by all calls: retries and hedges are capped at
+    roughly `ratio` extra requests per call"""
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+
+class LLMClient:
+    """Deadline, hedge and retry policy around LLMTransport"""
+
+    def __init__(
+        self,
+        transport=None,
+        hedge_enabled: bool = True,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20,
+        max_retries: int = 2,
+        retry_budget_ratio: float = 0.2,
+        backoff_ms: float = 200.0,
+        max_workers: int = 32,
+    ):
+        # None = whatever get_transport() returns at call time, so
+        # configure_transport() in benchmarks and tests still applies
+        self._transport = transport
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_retries = max_retries
+        self.backoff_ms = backoff_ms
+        self.budget = RetryBudget(retry_budget_ratio)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._counters = defaultdict(lambda: defaultdict(int))
+        self._random = random.Random()
+
+    @property
+    def transport(self):
+        return self._transport or get_transport()
+
+    # ---------- bookkeeping ----------
+
+    def _count(self, model: str, name: str):
+        with self._lock:
+            self._counters[model][name] += 1
+
+    def _observe(self, model: str, duration_ms: float):
+        with self._lock:
+            self._latencies[model].append(duration_ms)
+        llm_latency_tracker.record(model, duration_ms)
+
+    def latency_percentile(self, model: str, percentile: float) -> Optional[float]:
+        """Observed latency percentile (ms) for a model, None until enough samples"""
+        with self._lock:
+            samples = list(self._latencies.get(model, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return float(np.percentile(samples, percentile))
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-model request counters and latency percentiles"""
+        with self._lock:
+            models = set(self._latencies) | set(self._counters)
+            snapshot = {m: (list(self._latencies.get(m, ())), dict(self._counters.get(m, {}))) for m in models}
+        result = {}
+        for model, (samples, counters) in snapshot.items():
+            entry = dict(counters)
+            if samples:
+                entry['p50_ms'] = round(float(np.percentile(samples, 50)), 1)
+                entry['p95_ms'] = round(float(np.percentile(samples, 95)), 1)
+            result[model] = entry
+        return result
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def _deadline_error(self, model: str, deadline_s: float) -> LLMDeadlineExceeded:
+        self._count(model, 'timeouts')
+        return LLMDeadlineExceeded(f"LLM call to {model} timed out after {deadline_s * 1000:.0f} ms (deadline)")
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: uniform(0, base * 2^attempt) seconds"""
+        return self._random.uniform(0, self.backoff_ms * (2 ** attempt)) / 1000.0
+
+    # ---------- single request ----------
+
+    def _request(self, api_key, model, contents, config):
+        start = time.perf_counter()
+        try:
+            response = self.transport.generate_content(api_key, model=model, contents=contents, config=config)
+        except Exception:
+            self._count(model, 'errors')
+            raise
+        self._observe(model, (time.perf_counter() - start) * 1000)
+        return response
+
+    def _attempt(self, api_key, model, contents, config, deadline, deadline_s, hedge):
+        """One (possibly hedged) attempt: the first successful response wins"""
+        start = time.monotonic()
+        pending = {self._executor.submit(self._request, api_key, model, contents, config)}
+        hedge_delay = None
+        if hedge and self.hedge_enabled:
+            p = self.latency_percentile(model, self.hedge_percentile)
+            hedge_delay = p / 1000.0 if p is not None else None
+        error = None
+
+        while pending:
+            timeout = self._remaining(deadline)
+            if hedge_delay is not None:
+                until_hedge = max(0.0, start + hedge_delay - time.monotonic())
+                timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = error or future.exception()
+
+            if hedge_delay is not None and pending and time.monotonic() - start >= hedge_delay:
+                # Fire the hedge once; if the budget is spent, just keep waiting
+                hedge_delay = None
+                if self.budget.withdraw():
+                    self._count(model, 'hedges')
+                    pending.add(self._executor.submit(self._request, api_key, model, contents, config))
+                continue
+            if pending and deadline is not None and time.monotonic() >= deadline:
+                raise self._deadline_error(model, deadline_s)
+        raise error
+
+    # ---------- public API ----------
+
+    def generate_content(self, api_key: str, model: str, contents, config: Dict = None,
+                         deadline_ms: float = None, hedge: bool = False, max_retries: int = None):
+        """generate_content with a deadline, optional hedging and budgeted retries"""
+        deadline_s = deadline_ms / 1000.0 if deadline_ms else None
+        deadline = time.monotonic() + deadline_s if deadline_s else None
+        retries = self.max_retries if max_retries is None else max_retries
+        self._count(model, 'calls')
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(api_key, model, contents, config, deadline, deadline_s, hedge)
+            except (LLMDeadlineExceeded, *NON_RETRYABLE):
+                raise
+            except Exception as e:
+                delay = self._backoff(attempt)
+                remaining = self._remaining(deadline)
+                if attempt >= retries or (remaining is not None and delay >= remaining) or not self.budget.withdraw():
+                    raise
+                attempt += 1
+                self._count(model, 'retries')
+                print(f"[LLM] {model} attempt {attempt} failed ({str(e)[:80]}), retrying in {delay * 1000:.0f}ms")
+                time.sleep(delay)
+
+    def generate_content_stream(self, api_key: str, model: str, contents, config: Dict = None,
+                                first_token_deadline_ms: float = None, deadline_ms: float = None,
+                                max_retries: int = None) -> Iterator:
+        """generate_content_stream with a time-to-first-chunk and a total deadline.
+
+        Requests that fail before the first chunk are retried like
+        generate_content; once text has been yielded there is no retry.
+        """
+        start = time.monotonic()
+        deadline_s = deadline_ms / 1000.0 if deadline_ms else None
+        deadline = start + deadline_s if deadline_s else None
+        retries = self.max_retries if max_retries is None else max_retries
+        self._count(model, 'calls')
+        self.budget.deposit()
+
+        attempt = 0
+        stream, first = None, None
+        while first is None:
+            attempt_start = time.monotonic()
+            stream = iter(self.transport.generate_content_stream(api_key, model=model, contents=contents, config=config))
+            limit_s = first_token_deadline_ms / 1000.0 if first_token_deadline_ms else deadline_s
+            limits = [t for t in (self._remaining(deadline),
+                                  attempt_start + limit_s - time.monotonic() if limit_s else None) if t is not None]
+            try:
+                first = self._executor.submit(next, stream, _STREAM_END).result(timeout=max(0.0, min(limits)) if limits else None)
+            except FutureTimeout:
+                raise self._deadline_error(model, limit_s)
+            except NON_RETRYABLE:
+                raise
+            except Exception as e:
+                self._count(model, 'errors')
+                delay = self._backoff(attempt)
+                remaining = self._remaining(deadline)
+                if attempt >= retries or (remaining is not None and delay >= remaining) or not self.budget.withdraw():
+                    raise
+                attempt += 1
+                self._count(model, 'retries')
+                print(f"[LLM] {model} stream attempt {attempt} failed ({str(e)[:80]}), retrying in {delay * 1000:.0f}ms")
+                time.sleep(delay)
+        self._observe(f"{model}:first_token", (time.monotonic() - attempt_start) * 1000)
+
+        chunk = first
+        while chunk is not _STREAM_END:
+            yield chunk
+            try:
+                chunk = self._executor.submit(next, stream, _STREAM_END).result(timeout=self._remaining(deadline))
+            except FutureTimeout:
+                raise self._deadline_error(model, deadline_s)
+        self._observe(model, (time.monotonic() - attempt_start) * 1000)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Get or create the LLM client singleton from Django settings"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(
+                    hedge_enabled=getattr(settings, 'LLM_HEDGE_ENABLED', True),
+                    hedge_percentile=getattr(settings, 'LLM_HEDGE_PERCENTILE', 95),
+                    hedge_min_samples=getattr(settings, 'LLM_HEDGE_MIN_SAMPLES', 20),
+                    max_retries=getattr(settings, 'LLM_MAX_RETRIES', 2),
+                    retry_budget_ratio=getattr(settings, 'LLM_RETRY_BUDGET_RATIO', 0.2),
+                    backoff_ms=getattr(settings, 'LLM_RETRY_BACKOFF_MS', 200),
+                )
+    return _client
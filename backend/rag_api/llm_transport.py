@@ -0,0 +1,405 @@
+"""
+LLM / embedding transport for LitPath AI
+
+Every call RAGService and the RAG evaluator make to Gemini (genai.Client) and
+to the Hugging Face Inference API goes through this transport, so the calls
+can be recorded once and replayed offline:
+
+- live:   call the real services (default)
+- record: call the real services and store each response in a cassette
+- replay: serve responses from cassettes only - no network, no quota -
+          optionally with simulated latency and error rates
+- stub:   no cassettes needed - deterministic synthetic responses with
+          realistic per-model latency (used by the load-test suite)
+
+Cassettes are JSON files keyed by a hash of the request (kind, model,
+contents, config), so the same prompt always maps to the same recording.
+
+Configured via Django settings (see settings.py):
+    LLM_TRANSPORT_MODE, LLM_CASSETTE_DIR, LLM_REPLAY_LATENCY_MS,
+    LLM_REPLAY_LATENCY_JITTER_MS, LLM_REPLAY_STREAM_CHUNK_MS,
+    LLM_REPLAY_ERROR_RATE, LLM_REPLAY_SEED
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+MODES = ('live', 'record', 'replay', 'stub')
+
+# Typical upstream latencies observed in production (milliseconds), used by
+# stub mode when no explicit latency is configured. Streaming models get a
+# time-to-first-token plus a per-chunk delay.
+STUB_MODEL_LATENCY_MS = {
+    'gemini-2.5-flash-lite': 350.0,
+    'gemini-2.5-flash': 700.0,
+    'gemini-3-flash-preview': 2500.0,
+    'embed': 80.0,
+}
+STUB_DEFAULT_LATENCY_MS = 800.0
+STUB_FIRST_TOKEN_MS = 900.0
+STUB_STREAM_CHUNK_MS = 60.0
+STUB_EMBEDDING_DIM = 768
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class CassetteMissError(RuntimeError):
+    """Raised in replay mode when no recording exists for a request"""
+
+
+class SimulatedUpstreamError(RuntimeError):
+    """Raised in replay mode to simulate an upstream failure"""
+
+
+def make_replay_response(text: str, finish_reason: str = 'STOP'):
+    """Build a minimal object that looks like a genai GenerateContentResponse"""
+    part = SimpleNamespace(text=text)
+    candidate = SimpleNamespace(
+        content=SimpleNamespace(parts=[part]),
+        finish_reason=finish_reason,
+    )
+    return SimpleNamespace(text=text, candidates=[candidate])
+
+
+@lru_cache(maxsize=200000)
+def _token_slot(token: str, dim: int):
+    """Bucket index and sign of a token (cached - vocabularies are small)"""
+    digest = hashlib.md5(token.encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'little') % dim, (1.0 if digest[4] & 1 else -1.0)
+
+
+def hashed_embedding(text: str, dim: int = STUB_EMBEDDING_DIM) -> np.ndarray:
+    """Deterministic bag-of-words embedding (feature hashing).
+
+    Texts sharing words get similar vectors, so retrieval over stub
+    embeddings still behaves like retrieval (not random noise).
+    """
+    slots = [_token_slot(token, dim) for token in _TOKEN_RE.findall((text or "").lower())]
+    if not slots:
+        vec = np.zeros(dim, dtype=np.float32)
+        vec[0] = 1.0
+        return vec
+    indices, signs = zip(*slots)
+    vec = np.bincount(indices, weights=signs, minlength=dim).astype(np.float32)
+    norm = np.linalg.norm(vec)
+    if norm == 0:
+        vec[0] = 1.0
+        return vec
+    return vec / norm
+
+
+def _stub_text(contents) -> str:
+    """Deterministic response shaped like what each RAG prompt expects"""
+    prompt = contents if isinstance(contents, str) else json.dumps(contents, default=str)
+    if 'Rewritten Query:' in prompt:
+        match = re.search(r'User Query:\s*(.*?)\n', prompt)
+        return match.group(1).strip() if match else 'academic research'
+    if 'Document Chunks:' in prompt:
+        count = len(re.findall(r'^\[\d+\] Title:', prompt, flags=re.MULTILINE))
+        return json.dumps(list(range(1, min(count, 10) + 1)))
+    return (
+        "The retrieved theses examine the topic from several perspectives [1]. "
+        "Field studies report measurable effects under local conditions [2], "
+        "while later work proposes methods to address the identified gaps [1][3]."
+    )
+
+
+def _response_text(response) -> str:
+    """Extract text from a genai response without raising"""
+    try:
+        return response.text or ""
+    except Exception:
+        text = ""
+        candidates = getattr(response, 'candidates', None) or []
+        if candidates and candidates[0].content and candidates[0].content.parts:
+            for part in candidates[0].content.parts:
+                if getattr(part, 'text', None):
+                    text += part.text
+        return text
+
+
+def _finish_reason(response) -> Optional[str]:
+    candidates = getattr(response, 'candidates', None) or []
+    if not candidates:
+        return None
+    reason = getattr(candidates[0], 'finish_reason', None)
+    return getattr(reason, 'name', None) or (str(reason) if reason is not None else None)
+
+
+class CassetteStore:
+    """One JSON file per recorded request, named by the request hash"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @staticmethod
+    def request_key(kind: str, model: str, payload) -> str:
+        """Stable hash of a request (the API key is intentionally excluded)"""
+        raw = json.dumps(
+            {'kind': kind, 'model': model, 'payload': payload},
+            sort_keys=True, default=str, ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, key: str, record: Dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class LLMTransport:
+    """Routes Gemini and HF calls to the live services or to cassettes"""
+
+    def __init__(
+        self,
+        mode: str = 'live',
+        cassette_dir: str = None,
+        latency_ms: float = 0.0,
+        latency_jitter_ms: float = 0.0,
+        stream_chunk_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        latency_scale: float = 1.0,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM transport mode {mode!r} (expected one of {MODES})")
+        self.mode = mode
+        self.store = CassetteStore(cassette_dir) if cassette_dir else None
+        if mode in ('record', 'replay') and self.store is None:
+            raise ValueError(f"LLM transport mode {mode!r} requires a cassette directory")
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.stream_chunk_ms = stream_chunk_ms
+        self.error_rate = error_rate
+        # Multiplier for stub latencies (0 = instant, e.g. while building an index)
+        self.latency_scale = latency_scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Reused clients (one per credential) instead of a new client per call
+        self._genai_clients = {}
+        self._hf_clients = {}
+
+    # ---------- clients ----------
+
+    def _genai_client(self, api_key: str):
+        with self._lock:
+            client = self._genai_clients.get(api_key)
+            if client is None:
+                import httpx
+                from google import genai
+                from google.genai import types
+                # One pooled, keep-alive HTTP client per key; the request timeout
+                # is a backstop - llm_client enforces the per-call deadlines
+                max_connections = int(_settings_value('LLM_MAX_CONNECTIONS', 32))
+                http_options = types.HttpOptions(
+                    timeout=int(_settings_value('LLM_HTTP_TIMEOUT_MS', 60000)),
+                    client_args={'limits': httpx.Limits(
+                        max_connections=max_connections,
+                        max_keepalive_connections=max_connections,
+                    )},
+                )
+                client = self._genai_clients[api_key] = genai.Client(api_key=api_key, http_options=http_options)
+            return client
+
+    def _hf_client(self, token: Optional[str]):
+        with self._lock:
+            client = self._hf_clients.get(token)
+            if client is None:
+                from huggingface_hub import InferenceClient
+                client = self._hf_clients[token] = InferenceClient(token=token if token else None)
+            return client
+
+    # ---------- replay helpers ----------
+
+    def _simulate_upstream(self, kind: str, key: str):
+        """Sleep for the configured latency and fail at the configured rate"""
+        with self._lock:
+            jitter = self._random.uniform(-self.latency_jitter_ms, self.latency_jitter_ms) if self.latency_jitter_ms else 0.0
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+        delay_ms = max(0.0, self.latency_ms + jitter)
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
+        if fail:
+            raise SimulatedUpstreamError(f"503 UNAVAILABLE: simulated {kind} failure (replay transport, key={key[:12]})")
+
+    def _replay(self, kind: str, key: str) -> Dict:
+        record = self.store.load(key)
+        if record is None:
+            raise CassetteMissError(
+                f"No cassette recorded for {kind} request {key[:12]} in {self.store.directory} "
+                f"(run once with LLM_TRANSPORT_MODE=record)"
+            )
+        self._simulate_upstream(kind, key)
+        return record
+
+    # ---------- stub helpers ----------
+
+    def _stub_latency(self, model: str) -> float:
+        if self.latency_ms:
+            return self.latency_ms
+        return STUB_MODEL_LATENCY_MS.get(model, STUB_DEFAULT_LATENCY_MS)
+
+    def _stub(self, kind: str, model: str, latency_ms: float):
+        """Sleep for the stub latency and fail at the configured rate"""
+        with self._lock:
+            jitter = self._random.uniform(-self.latency_jitter_ms, self.latency_jitter_ms) if self.latency_jitter_ms else 0.0
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+        delay_ms = max(0.0, latency_ms + jitter) * self.latency_scale
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
+        if fail:
+            raise SimulatedUpstreamError(f"503 UNAVAILABLE: simulated {kind} failure (stub transport, model={model})")
+
+    # ---------- public API ----------
+
+    def generate_content(self, api_key: str, model: str, contents, config: Dict = None):
+        """Equivalent of genai.Client(api_key).models.generate_content(...)"""
+        payload = {'contents': contents, 'config': config}
+        key = CassetteStore.request_key('generate', model, payload) if self.store else None
+
+        if self.mode == 'stub':
+            self._stub('generate', model, self._stub_latency(model))
+            return make_replay_response(_stub_text(contents))
+        if self.mode == 'replay':
+            record = self._replay('generate', key)
+            return make_replay_response(record['text'], record.get('finish_reason') or 'STOP')
+
+        response = self._genai_client(api_key).models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        if self.mode == 'record':
+            self.store.save(key, {
+                'kind': 'generate',
+                'model': model,
+                'text': _response_text(response),
+                'finish_reason': _finish_reason(response),
+                'recorded_at': time.time(),
+            })
+        return response
+
+    def generate_content_stream(self, api_key: str, model: str, contents, config: Dict = None) -> Iterator:
+        """Equivalent of genai.Client(api_key).models.generate_content_stream(...)"""
+        payload = {'contents': contents, 'config': config}
+        key = CassetteStore.request_key('generate_stream', model, payload) if self.store else None
+
+        if self.mode == 'stub':
+            self._stub('generate_stream', model, self.latency_ms or STUB_FIRST_TOKEN_MS)
+            chunk_ms = (self.stream_chunk_ms or STUB_STREAM_CHUNK_MS) * self.latency_scale
+            words = _stub_text(contents).split(' ')
+            for i in range(0, len(words), 4):
+                if i and chunk_ms:
+                    time.sleep(chunk_ms / 1000.0)
+                yield make_replay_response(' '.join(words[i:i + 4]) + ' ')
+            return
+        if self.mode == 'replay':
+            record = self._replay('generate_stream', key)
+            for text in record['chunks']:
+                if self.stream_chunk_ms:
+                    time.sleep(self.stream_chunk_ms / 1000.0)
+                yield make_replay_response(text)
+            return
+
+        stream = self._genai_client(api_key).models.generate_content_stream(
+            model=model, contents=contents, config=config
+        )
+        if self.mode != 'record':
+            yield from stream
+            return
+
+        chunks = []
+        for chunk in stream:
+            chunks.append(_response_text(chunk))
+            yield chunk
+        # Only complete streams are recorded
+        self.store.save(key, {
+            'kind': 'generate_stream',
+            'model': model,
+            'chunks': chunks,
+            'recorded_at': time.time(),
+        })
+
+    def feature_extraction(self, token: Optional[str], text: str, model: str) -> np.ndarray:
+        """Equivalent of InferenceClient(token).feature_extraction(text, model=...)"""
+        key = CassetteStore.request_key('embed', model, {'text': text}) if self.store else None
+
+        if self.mode == 'stub':
+            self._stub('embed', model, self.latency_ms or STUB_MODEL_LATENCY_MS['embed'])
+            return hashed_embedding(text)
+        if self.mode == 'replay':
+            record = self._replay('embed', key)
+            return np.array(record['embedding'], dtype=np.float32)
+
+        result = self._hf_client(token).feature_extraction(text, model=model)
+        if self.mode == 'record':
+            self.store.save(key, {
+                'kind': 'embed',
+                'model': model,
+                'embedding': np.array(result, dtype=np.float32).flatten().tolist(),
+                'recorded_at': time.time(),
+            })
+        return result
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def _settings_value(name, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return os.environ.get(name, default)
+
+
+def get_transport() -> LLMTransport:
+    """Get or create the transport singleton from Django settings"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = LLMTransport(
+                    mode=_settings_value('LLM_TRANSPORT_MODE', 'live'),
+                    cassette_dir=_settings_value('LLM_CASSETTE_DIR', None),
+                    latency_ms=float(_settings_value('LLM_REPLAY_LATENCY_MS', 0)),
+                    latency_jitter_ms=float(_settings_value('LLM_REPLAY_LATENCY_JITTER_MS', 0)),
+                    stream_chunk_ms=float(_settings_value('LLM_REPLAY_STREAM_CHUNK_MS', 0)),
+                    error_rate=float(_settings_value('LLM_REPLAY_ERROR_RATE', 0)),
+                    seed=int(_settings_value('LLM_REPLAY_SEED', 0)),
+                    latency_scale=float(_settings_value('LLM_STUB_LATENCY_SCALE', 1.0)),
+                )
+                print(f"[LLM] Transport mode: {_transport.mode}")
+    return _transport
+
+
+def configure_transport(**kwargs) -> LLMTransport:
+    """Replace the transport singleton (used by benchmarks and tests)"""
+    global _transport
+    with _transport_lock:
+        _transport = LLMTransport(**kwargs)
+    print(f"[LLM] Transport mode: {_transport.mode}")
+    return _transport
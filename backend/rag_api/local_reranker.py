@@ -0,0 +1,94 @@
+"""
+Local candidate reranker for LitPath AI search
+
+Scores the vector-search candidates on CPU in a few milliseconds, without
+any LLM call. RAGService.search runs it on every request: its order decides
+which candidates the Gemini reranker sees, and it is the final ranking
+whenever Gemini is unavailable, fails or misses the rerank deadline.
+
+Features per candidate chunk (each scaled to roughly [0, 1]):
+- vector:  cosine similarity recovered from the squared L2 distance
+- bm25:    Okapi BM25 of the query terms in the chunk text, with document
+           frequencies taken over the candidate set, divided by the best score
+- title:   fraction of query terms found in the thesis title
+- subject: fraction of query terms found in the subjects field
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it of on or that the their this
+to was were what which who with about into using based among between thesis study
+""".split())
+
+
+def tokenize(text) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(str(text or "").lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+class LocalReranker:
+    """Linear blend of vector, BM25, title and subject features"""
+
+    WEIGHTS = {"vector": 0.45, "bm25": 0.35, "title": 0.15, "subject": 0.05}
+
+    def __init__(self, weights: Dict[str, float] = None, k1: float = 1.2, b: float = 0.75):
+        self.weights = dict(weights or self.WEIGHTS)
+        self.k1 = k1
+        self.b = b
+
+    def features(self, query: str, candidates: List[Dict]) -> Dict[str, np.ndarray]:
+        """Per-candidate feature columns for the chunk dicts built in search()"""
+        n = len(candidates)
+        terms = list(dict.fromkeys(tokenize(query)))
+        distances = np.array([float(c.get("score", 2.0)) for c in candidates], dtype=np.float32)
+        result = {"vector": np.clip(1.0 - distances / 2.0, 0.0, 1.0)}
+        if not terms:
+            for name in ("bm25", "title", "subject"):
+                result[name] = np.zeros(n, dtype=np.float32)
+            return result
+
+        term_set = set(terms)
+        counts = []
+        lengths = np.zeros(n, dtype=np.float32)
+        for i, c in enumerate(candidates):
+            tokens = tokenize(c.get("chunk", ""))
+            lengths[i] = len(tokens)
+            counts.append(Counter(t for t in tokens if t in term_set))
+        tf = np.array([[cnt[t] for t in terms] for cnt in counts], dtype=np.float32)
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / max(float(lengths.mean()), 1.0))
+        bm25 = ((tf * (self.k1 + 1.0)) / (tf + norm[:, None]) * idf).sum(axis=1)
+        result["bm25"] = bm25 / bm25.max() if bm25.max() > 0 else bm25
+
+        def coverage(field):
+            values = []
+            for c in candidates:
+                words = set(tokenize((c.get("meta") or {}).get(field, "")))
+                values.append(len(term_set & words) / len(term_set))
+            return np.array(values, dtype=np.float32)
+
+        result["title"] = coverage("title")
+        result["subject"] = coverage("subjects")
+        return result
+
+    def score(self, query: str, candidates: List[Dict]) -> np.ndarray:
+        if not candidates:
+            return np.zeros(0, dtype=np.float32)
+        features = self.features(query, candidates)
+        return sum(self.weights.get(name, 0.0) * column for name, column in features.items())
+
+    def rank(self, query: str, candidates: List[Dict]) -> List[int]:
+        """Candidate indices, best first (ties keep vector-search order)"""
+        scores = self.score(query, candidates)
+        return [int(i) for i in np.argsort(-scores, kind="stable")]
+
+
+local_reranker = LocalReranker()
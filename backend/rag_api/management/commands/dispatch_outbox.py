@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from rag_api.models import OutboxMessage
+from rag_api.outbox import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox messages (e.g. the general_feedback copies of CSM feedback) that are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Queue messages that were given up on again before dispatching',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            requeued = OutboxMessage.objects.filter(status='failed').update(status='pending', attempts=0)
+            self.stdout.write(f'Re-queued {requeued} failed message(s)')
+        sent = outbox.dispatch()
+        remaining = dict(
+            OutboxMessage.objects.exclude(status='sent').values_list('status').annotate(n=Count('id'))
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sent {sent} message(s); {remaining.get('pending', 0)} pending, {remaining.get('failed', 0)} failed"
+            )
+        )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from rag_api.document_stats import document_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-document view / rating counters (document_stats) from material_views and feedback'
+
+    def handle(self, *args, **options):
+        files, drifted = document_stats.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt document_stats for {files} file(s); {drifted} had drifted')
+        )
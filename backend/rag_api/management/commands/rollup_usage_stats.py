@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from rag_api.usage_rollups import usage_rollups
+
+
+class Command(BaseCommand):
+    help = 'Roll up finished days of material views and citation copies into the daily dashboard tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='Drop the rollups and rebuild them from all raw rows (after re-tagging subjects)',
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            days = usage_rollups.backfill()
+        else:
+            days = usage_rollups.compact()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rolled up {days} day(s); rollups now complete before {usage_rollups.rolled_until()}'
+            )
+        )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from rag_api.material_catalog import material_catalog
+
+
+class Command(BaseCommand):
+    help = 'Sync the materials table with the thesis index and all_metadata.json (create, update, mark removed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--metadata-only',
+            action='store_true',
+            help='Use only all_metadata.json, without opening the thesis index',
+        )
+        parser.add_argument(
+            '--keep-removed',
+            action='store_true',
+            help='Do not mark materials whose thesis was removed',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would change without writing',
+        )
+
+    def handle(self, *args, **options):
+        rag = None
+        if not options['metadata_only']:
+            from rag_api.rag_service import RAGService
+            rag = RAGService.ensure_initialized()
+            if RAGService._index_thread is not None and RAGService._index_thread.is_alive():
+                self.stdout.write('Waiting for indexing to finish...')
+                RAGService._index_thread.join()
+        counts = material_catalog.sync(
+            material_catalog.documents(rag),
+            remove=not options['keep_removed'],
+            dry_run=options['dry_run'],
+        )
+        prefix = 'Would sync' if options['dry_run'] else 'Synced'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix} materials: {counts['created']} created, {counts['updated']} updated, "
+                f"{counts['removed']} removed, {counts['unchanged']} unchanged"
+            )
+        )
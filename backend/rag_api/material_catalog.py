@@ -0,0 +1,207 @@
+"""
+Material catalog sync for LitPath AI
+
+`materials` used to be filled in piecemeal: RAG/scripts/batch_extract_metadata.py
+saved one row per thesis (update_or_create), and a view of a file the catalog
+didn't know yet created a placeholder row with 'Unknown' title / author /
+school from whatever the client sent, patched later from the index.
+
+`sync()` makes `materials` match the thesis catalog in one pass instead:
+
+- the catalog is every thesis in the index (RAGService.get_all_documents_metadata),
+  with all_metadata.json (written by batch_extract_metadata.py) filling in
+  fields the index lacks and theses it doesn't have yet
+- it is diffed against `materials` (one read of the table), and the
+  differences are applied in chunks of `chunk_size` in one transaction:
+  bulk_create for new theses (DEFAULTS for the fields neither source
+  knows), bulk_update of only the fields the sources supply and changed
+  (a field they don't know keeps its value, curated or not), and
+  `removed_at` set on the materials whose thesis was removed
+- removed materials are never deleted: their citation copies and daily
+  rollups stay, reads of the catalog skip them (removed_at IS NULL), and a
+  thesis that comes back clears its removed_at. A material only counts as
+  removed when its file is in neither source and no longer in
+  RAG_THESES_FOLDER, so a partial index (an interrupted run) never marks
+  anything
+
+It runs in a background thread after each indexing run and when the RAG
+system starts with an index; `python manage.py sync_catalog` runs it by
+hand. Views and citation copies no longer create materials.
+
+Configured via Django settings (see settings.py):
+    RAG_THESES_FOLDER, CATALOG_SYNC_CHUNK_SIZE
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+
+
+
+# Values that mean "not known"
+UNKNOWN_TEXT = ('', 'Unknown', 'Unknown Title', 'Unknown Author', 'Unknown Institution', 'Unknown University')
+CATALOG_FIELDS = ['title', 'author', 'year', 'abstract', 'degree', 'subjects', 'school']
+# Column values of a new material for the fields neither source knows (an existing
+# material keeps its values for those)
+DEFAULTS = {'title': 'Unknown Title', 'author': 'Unknown Author', 'year': None, 'abstract': '',
+            'degree': 'Thesis', 'subjects': [], 'school': 'Unknown Institution'}
+
+
+def _parse_year(value) -> Optional[int]:
+    match = re.search(r'\d{4}', str(value or ''))
+    return int(match.group()) if match else None
+
+
+def _split_subjects(value) -> List[str]:
+    if isinstance(value, list):
+        return [str(s).strip() for s in value if str(s).strip()]
+    return [s.strip() for s in str(value or '').split(',') if s.strip()]
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class MaterialCatalog:
+    """Keeps `materials` in line with the thesis index"""
+
+    def __init__(self, theses_folder: str, chunk_size: int = 500):
+        self.theses_folder = theses_folder
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._running = False
+        self._queued = False
+        self._rag = None
+
+    # ---------- catalog ----------
+
+    @staticmethod
+    def fields_from_index(metadata: Dict) -> Dict:
+        """Material field values from RAGService metadata (placeholders dropped)"""
+        fields = {
+            'title': metadata.get('title'),
+            'author': metadata.get('author'),
+            'year': _parse_year(metadata.get('year')),
+            'abstract': metadata.get('abstract'),
+            'degree': metadata.get('degree'),
+            'subjects': _split_subjects(metadata.get('subjects')),
+            'school': metadata.get('school'),
+        }
+        # The index's stand-ins for a missing abstract / degree
+        if fields['abstract'] == 'No abstract available':
+            fields['abstract'] = None
+        if fields['degree'] == DEFAULTS['degree']:
+            fields['degree'] = None
+        return {name: value for name, value in fields.items()
+                if value and not (isinstance(value, str) and (value in UNKNOWN_TEXT or value.startswith('[Unknown')))}
+
+    def from_metadata_file(self, path: Optional[str] = None) -> Dict[str, Dict]:
+        """{file: field values} from all_metadata.json ({} if there is none)"""
+        from .rag_service import RAGService
+        path = path or os.path.join(self.theses_folder, 'all_metadata.json')
+        try:
+            with open(path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        # Same field names and capitalization as the index metadata
+        return {file: self.fields_from_index(RAGService._format_document_metadata(file, meta))
+                for file, meta in entries.items() if isinstance(meta, dict)}
+
+    def documents(self, rag=None) -> Dict[str, Dict]:
+        """{file: field values} of every thesis: the index (if given), filled in from all_metadata.json"""
+        catalog = self.from_metadata_file()
+        if rag is not None:
+            for file, metadata in rag.get_all_documents_metadata().items():
+                catalog[file] = {**catalog.get(file, {}), **self.fields_from_index(metadata)}
+        return catalog
+
+    # ---------- sync ----------
+
+    def _removed(self, file: str) -> bool:
+        return not os.path.exists(os.path.join(self.theses_folder, file))
+
+    def sync(self, documents: Dict[str, Dict], remove: bool = True, dry_run: bool = False) -> Dict[str, int]:
+        """Create, update and (with `remove`) mark removed materials so `materials` matches `documents`;
+        returns the number of materials created / updated / removed / unchanged"""
+        from django.utils import timezone
+        from .models import Material
+        wanted = {file: fields for file, fields in documents.items() if file}
+        with transaction.atomic():
+            existing = {m.file: m for m in Material.objects.only('id', 'file', 'removed_at', *CATALOG_FIELDS)}
+            created = [Material(file=file, **{**DEFAULTS, **fields})
+                       for file, fields in wanted.items() if file not in existing]
+            updated, updated_fields, unchanged, removed = [], set(), 0, []
+            for file, material in existing.items():
+                fields = wanted.get(file)
+                if fields is None:
+                    # An empty catalog means the sources are missing, not that every thesis was removed
+                    if remove and wanted and material.removed_at is None and self._removed(file):
+                        removed.append(material.id)
+                    continue
+                # Only what the sources know: a field they lack keeps its (possibly curated) value
+                changed = [name for name, value in fields.items() if getattr(material, name) != value]
+                if material.removed_at is not None:
+                    # Back in the catalog
+                    material.removed_at = None
+                    changed.append('removed_at')
+                for name in changed:
+                    if name in fields:
+                        setattr(material, name, fields[name])
+                if changed:
+                    updated.append(material)
+                    updated_fields.update(changed)
+                else:
+                    unchanged += 1
+            if not dry_run:
+                # ignore_conflicts: a sync of another process may have created the same theses
+                Material.objects.bulk_create(created, batch_size=self.chunk_size, ignore_conflicts=True)
+                if updated:
+                    Material.objects.bulk_update(updated, sorted(updated_fields), batch_size=self.chunk_size)
+                now = timezone.now()
+                for ids in _chunks(removed, self.chunk_size):
+                    Material.objects.filter(id__in=ids).update(removed_at=now)
+        counts = {'created': len(created), 'updated': len(updated), 'removed': len(removed), 'unchanged': unchanged}
+        if not dry_run and (created or updated or removed):
+            print(f"[CATALOG] Synced materials: {counts['created']} created, {counts['updated']} updated, "
+                  f"{counts['removed']} removed")
+        return counts
+
+    def sync_in_background(self, rag=None):
+        """Run sync() on a background thread; syncs requested during a run are merged into one more run"""
+        with self._lock:
+            self._queued = True
+            self._rag = rag or self._rag
+            if self._running:
+                return
+            self._running = True
+        threading.Thread(target=self._sync_in_background, name='catalog-sync', daemon=True).start()
+
+    def _sync_in_background(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._queued:
+                        self._running = False
+                        return
+                    self._queued = False
+                    rag = self._rag
+                try:
+                    self.sync(self.documents(rag))
+                except Exception as e:
+                    print(f"[CATALOG] Background sync failed: {e}")
+        finally:
+            connections.close_all()
+
+
+# Singleton instance for use across the application
+material_catalog = MaterialCatalog(
+    theses_folder=getattr(settings, 'RAG_THESES_FOLDER', os.path.join('RAG', 'theses')),
+    chunk_size=getattr(settings, 'CATALOG_SYNC_CHUNK_SIZE', 500),
+)
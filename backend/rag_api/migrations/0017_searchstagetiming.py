@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0016_citationcopy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchStageTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('request_id', models.CharField(db_index=True, max_length=64)),
+                ('stage', models.CharField(max_length=50)),
+                ('duration_ms', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'search_stage_timings',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['stage', 'created_at'], name='search_stag_stage_fae364_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0017_searchstagetiming'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelRoutingDecision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('request_id', models.CharField(db_index=True, max_length=64)),
+                ('tier', models.CharField(max_length=20)),
+                ('model', models.CharField(max_length=64)),
+                ('max_output_tokens', models.IntegerField()),
+                ('score', models.IntegerField()),
+                ('features', models.JSONField(default=dict)),
+                ('latency_ms', models.FloatField()),
+                ('first_token_ms', models.FloatField(blank=True, null=True)),
+                ('answer_chars', models.IntegerField(default=0)),
+                ('citations', models.IntegerField(default=0)),
+                ('finish_reason', models.CharField(blank=True, default='', max_length=32)),
+                ('truncated', models.BooleanField(default=False)),
+                ('error', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'model_routing_decisions',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['tier', 'created_at'], name='model_routi_tier_0bb49f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0018_modelroutingdecision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelroutingdecision',
+            name='prompt_tokens',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
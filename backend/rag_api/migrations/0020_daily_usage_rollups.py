@@ -0,0 +1,112 @@
+# Generated by Django 5.0.14 on 2026-10-19 07:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0019_modelroutingdecision_prompt_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CitationCopyDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('copies', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'citation_copy_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='MaterialViewDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('file', models.CharField(max_length=500)),
+                ('views', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'material_view_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('rolled_until', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'rollup_state',
+            },
+        ),
+        migrations.CreateModel(
+            name='SubjectCitationDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('subject', models.CharField(max_length=200)),
+                ('copies', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'subject_citation_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='SubjectViewDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('subject', models.CharField(max_length=200)),
+                ('views', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'subject_view_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageDaily',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('views', models.IntegerField(default=0)),
+                ('copies', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'usage_daily',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='citationcopy',
+            index=models.Index(fields=['copied_at'], name='rag_api_cit_copied__736200_idx'),
+        ),
+        migrations.AddField(
+            model_name='citationcopydaily',
+            name='document',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='citation_copy_days', to='rag_api.material'),
+        ),
+        migrations.AddIndex(
+            model_name='materialviewdaily',
+            index=models.Index(fields=['file', 'day'], name='material_vi_file_d1c8fa_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='materialviewdaily',
+            unique_together={('day', 'file')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='subjectcitationdaily',
+            unique_together={('day', 'subject')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='subjectviewdaily',
+            unique_together={('day', 'subject')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='citationcopydaily',
+            unique_together={('day', 'document')},
+        ),
+    ]
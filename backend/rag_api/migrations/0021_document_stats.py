@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-19 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0020_daily_usage_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentStats',
+            fields=[
+                ('file', models.CharField(max_length=500, primary_key=True, serialize=False)),
+                ('view_count', models.BigIntegerField(default=0)),
+                ('last_viewed_at', models.DateTimeField(blank=True, null=True)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('rating_sum', models.BigIntegerField(default=0)),
+                ('rating_sq_sum', models.BigIntegerField(default=0)),
+                ('rating_min', models.IntegerField(blank=True, null=True)),
+                ('rating_max', models.IntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'document_stats',
+                'indexes': [models.Index(fields=['-view_count'], name='document_st_view_co_19b7c4_idx'), models.Index(fields=['-rating_count'], name='document_st_rating__90be31_idx')],
+            },
+        ),
+    ]
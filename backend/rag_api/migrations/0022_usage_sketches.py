@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-19 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0021_document_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageSketchDaily',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('visitors', models.BinaryField()),
+                ('documents', models.BinaryField()),
+            ],
+            options={
+                'db_table': 'usage_sketch_daily',
+            },
+        ),
+    ]
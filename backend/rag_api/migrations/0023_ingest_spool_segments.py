@@ -0,0 +1,24 @@
+# Generated by Django 5.0.14 on 2026-10-19 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0022_usage_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestSpoolSegment',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('events', models.IntegerField(default=0)),
+                ('committed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'ingest_spool_segments',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-19 08:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0023_ingest_spool_segments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=50)),
+                ('idempotency_key', models.CharField(max_length=200, unique=True)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'db_table': 'outbox_messages',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='outbox_mess_status_f4b9f9_idx')],
+            },
+        ),
+    ]
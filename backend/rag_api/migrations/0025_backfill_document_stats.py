@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def backfill_document_stats(apps, schema_editor):
+    # 0021 created document_stats empty; fill it from material_views / feedback
+    # so search results and source ratings don't show 0 until a manual rebuild
+    from rag_api.document_stats import document_stats
+    document_stats.rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0024_outbox_messages'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_document_stats, migrations.RunPython.noop),
+    ]
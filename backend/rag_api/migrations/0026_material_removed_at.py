@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0025_backfill_document_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='removed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """outbox_receipts on the default database, which is also the general_feedback
+    sink's unless SUPABASE_* point elsewhere (see "CSM feedback copy" in README.md).
+    IF NOT EXISTS: earlier dispatchers created it themselves on connect."""
+
+    dependencies = [
+        ('rag_api', '0026_material_removed_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE TABLE IF NOT EXISTS outbox_receipts ("
+            "idempotency_key text PRIMARY KEY, "
+            "received_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP)",
+            "DROP TABLE IF EXISTS outbox_receipts",
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def backfill_usage_rollups(apps, schema_editor):
+    # 0020 created the rollups empty and compaction waited for a manual
+    # `rollup_usage_stats --backfill`; trending now reads subject_view_daily alone
+    from rag_api.usage_rollups import usage_rollups
+    usage_rollups.backfill(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0027_outbox_receipts'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_usage_rollups, migrations.RunPython.noop),
+    ]
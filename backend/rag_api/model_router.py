@@ -0,0 +1,169 @@
+"""
+Model tiering for LitPath AI overview generation
+
+Classifies each overview request from cheap local features - no LLM call,
+a few microseconds - and picks the Gemini model and output token budget:
+
+- fast:     one-line factual lookups over a few theses
+- standard: longer or multi-part questions, several sources
+- deep:     comparisons / syntheses across many theses, deep follow-ups
+
+Features: question length, comparison / synthesis wording, number of
+sub-questions, distinct theses among the relevant chunks and conversation
+depth. Each adds points to a complexity score; RouteDecision records the
+features and score, and log_outcome() stores the decision together with
+its latency and quality signals (truncation, citations, answer length) in
+model_routing_decisions (with the prompt size from prompt_builder) so the
+thresholds can be tuned from real traffic.
+
+Configured via Django settings (see settings.py):
+    LLM_ROUTER_ENABLED, LLM_ROUTER_STANDARD_SCORE, LLM_ROUTER_DEEP_SCORE,
+    LLM_ROUTER_{FAST,STANDARD,DEEP}_MODEL, LLM_ROUTER_{FAST,STANDARD,DEEP}_MAX_TOKENS
+"""
+
+import re
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+
+_COMPARISON_RE = re.compile(
+    r"\b(compar\w*|versus|vs\.?|differen\w*|contrast\w*|similarit\w*|relationship between|"
+    r"synthes\w*|review of|trends?|across|overall|summari[sz]\w*|pros and cons|advantages|"
+    r"disadvantages|how do .+ (?:relate|differ))\b",
+    re.IGNORECASE,
+)
+_CITATION_RE = re.compile(r"\[(\d+)\]")
+
+TIERS = ('fast', 'standard', 'deep')
+
+DEFAULT_TIER_MODELS = {
+    'fast': ('gemini-2.5-flash-lite', 768),
+    'standard': ('gemini-2.5-flash', 1536),
+    'deep': ('gemini-3-flash-preview', 2048),
+}
+
+
+@dataclass
+class RouteDecision:
+    """Chosen tier for one overview request"""
+    tier: str
+    model: str
+    max_output_tokens: int
+    score: int
+    features: Dict = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class ModelRouter:
+    """Rule-based complexity score -> model tier"""
+
+    def __init__(self, enabled: bool = True, standard_score: int = 2, deep_score: int = 4, tiers: Dict = None):
+        self.enabled = enabled
+        self.standard_score = standard_score
+        self.deep_score = deep_score
+        self.tiers = dict(tiers or DEFAULT_TIER_MODELS)
+
+    @staticmethod
+    def features(question: str, chunks: List[Dict] = None, conversation_history: List[Dict] = None) -> Dict:
+        question = question or ""
+        sources = {
+            (c.get('meta') or {}).get('pdf') or (c.get('meta') or {}).get('file')
+            for c in (chunks or [])
+        }
+        return {
+            'words': len(question.split()),
+            'comparison': bool(_COMPARISON_RE.search(question)),
+            'sub_questions': max(1, question.count('?')),
+            'sources': len(sources - {None}),
+            'turns': len(conversation_history or []),
+        }
+
+    @staticmethod
+    def score(features: Dict) -> int:
+        score = 0
+        score += (features['words'] > 18) + (features['words'] > 35)
+        score += 2 * features['comparison']
+        score += features['sub_questions'] > 1
+        score += (features['sources'] >= 4) + (features['sources'] >= 7)
+        score += features['turns'] >= 2
+        return int(score)
+
+    def route(self, question: str, chunks: List[Dict] = None, conversation_history: List[Dict] = None) -> RouteDecision:
+        features = self.features(question, chunks, conversation_history)
+        score = self.score(features)
+        if not self.enabled:
+            tier = 'deep'
+        elif score >= self.deep_score:
+            tier = 'deep'
+        elif score >= self.standard_score:
+            tier = 'standard'
+        else:
+            tier = 'fast'
+        model, max_tokens = self.tiers[tier]
+        return RouteDecision(tier, model, int(max_tokens), score, features)
+
+    @staticmethod
+    def outcome(answer: Optional[str], finish_reason=None) -> Dict:
+        """Quality signals of a generated answer"""
+        answer = answer or ""
+        reason = getattr(finish_reason, 'name', None) or (str(finish_reason) if finish_reason is not None else "")
+        return {
+            'answer_chars': len(answer),
+            'citations': len(set(_CITATION_RE.findall(answer))),
+            'finish_reason': reason[:32],
+            'truncated': 'MAX_TOKENS' in reason,
+        }
+
+    def log_outcome(self, decision: RouteDecision, request_id: Optional[str], latency_ms: float,
+                    answer: Optional[str] = None, finish_reason=None, first_token_ms: Optional[float] = None,
+                    error: Optional[str] = None, prompt_tokens: Optional[int] = None):
+        """Print and persist a routing decision with its outcome.
+
+        Never raises - logging must not break generation.
+        """
+        outcome = self.outcome(answer, finish_reason)
+        print(
+            f"[ROUTER] {decision.tier} ({decision.model}, {prompt_tokens or '?'} -> {decision.max_output_tokens} tokens) score={decision.score} "
+            f"{decision.features} -> {latency_ms:.0f}ms, {outcome['citations']} citations, "
+            f"finish={outcome['finish_reason'] or 'n/a'}{' ERROR' if error else ''} [Request ID: {request_id}]"
+        )
+        try:
+            from .models import ModelRoutingDecision
+            ModelRoutingDecision.objects.create(
+                request_id=request_id or "",
+                tier=decision.tier,
+                model=decision.model,
+                max_output_tokens=decision.max_output_tokens,
+                prompt_tokens=prompt_tokens,
+                score=decision.score,
+                features=decision.features,
+                latency_ms=round(latency_ms, 3),
+                first_token_ms=round(first_token_ms, 3) if first_token_ms is not None else None,
+                error=(error or "")[:200],
+                **outcome,
+            )
+        except Exception as e:
+            print(f"[ROUTER] Failed to persist routing decision for {request_id}: {e}")
+
+
+def _tier_settings():
+    return {
+        tier: (
+            getattr(settings, f'LLM_ROUTER_{tier.upper()}_MODEL', DEFAULT_TIER_MODELS[tier][0]),
+            getattr(settings, f'LLM_ROUTER_{tier.upper()}_MAX_TOKENS', DEFAULT_TIER_MODELS[tier][1]),
+        )
+        for tier in TIERS
+    }
+
+
+# Singleton instance for use across the application
+model_router = ModelRouter(
+    enabled=getattr(settings, 'LLM_ROUTER_ENABLED', True),
+    standard_score=getattr(settings, 'LLM_ROUTER_STANDARD_SCORE', 2),
+    deep_score=getattr(settings, 'LLM_ROUTER_DEEP_SCORE', 4),
+    tiers=_tier_settings(),
+)
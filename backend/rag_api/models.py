@@ -210,6 +210,53 @@ class ResearchHistory(models.Model):
         return f"{self.user_id}: {self.query[:50]}"
 
 
+class SearchStageTiming(models.Model):
+    """Per-request latency breakdown of the search pipeline (one row per stage)"""
+    request_id = models.CharField(max_length=64, db_index=True)
+    stage = models.CharField(max_length=50)
+    duration_ms = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'search_stage_timings'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['stage', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.request_id} {self.stage}: {self.duration_ms:.1f}ms"
+
+
+class ModelRoutingDecision(models.Model):
+    """Model tier chosen for an overview, with its latency and quality outcome"""
+    request_id = models.CharField(max_length=64, db_index=True)
+    tier = models.CharField(max_length=20)
+    model = models.CharField(max_length=64)
+    max_output_tokens = models.IntegerField()
+    prompt_tokens = models.IntegerField(null=True, blank=True)  # estimated, see prompt_builder
+    score = models.IntegerField()
+    features = models.JSONField(default=dict)
+    latency_ms = models.FloatField()
+    first_token_ms = models.FloatField(null=True, blank=True)  # streamed overviews only
+    answer_chars = models.IntegerField(default=0)
+    citations = models.IntegerField(default=0)  # distinct [n] sources cited
+    finish_reason = models.CharField(max_length=32, blank=True, default='')
+    truncated = models.BooleanField(default=False)  # hit max_output_tokens
+    error = models.CharField(max_length=200, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'model_routing_decisions'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tier', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.request_id} {self.tier} ({self.model}): {self.latency_ms:.0f}ms"
+
+
 class Feedback(models.Model):
     """System Admin feedback"""
     # --- UPDATED CHOICES ---
@@ -269,6 +316,8 @@ class Material(models.Model):
     )
     school = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the catalog sync when the thesis is removed; the row (and its citation copies) stays
+    removed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         db_table = 'materials'
@@ -468,4 +517,174 @@ class CitationCopy(models.Model):
     copied_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['-copied_at']
\ No newline at end of file
+        ordering = ['-copied_at']
+        indexes = [
+            models.Index(fields=['copied_at']),  # date-range filters and the rollups' raw tail
+        ]
+
+# ============= Daily usage rollups (maintained by usage_rollups.py) =============
+
+class UsageDaily(models.Model):
+    """Total views and citation copies per day (the trend widgets)"""
+    day = models.DateField(primary_key=True)
+    views = models.IntegerField(default=0)
+    copies = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'usage_daily'
+
+    def __str__(self):
+        return f"{self.day}: {self.views} views, {self.copies} copies"
+
+
+class MaterialViewDaily(models.Model):
+    """Views per file per day, rolled up from material_views"""
+    day = models.DateField()
+    file = models.CharField(max_length=500)
+    views = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'material_view_daily'
+        unique_together = [['day', 'file']]
+        indexes = [
+            models.Index(fields=['file', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.file}: {self.views} views"
+
+
+class SubjectViewDaily(models.Model):
+    """Views per subject per day, rolled up from material_views + materials.subjects"""
+    day = models.DateField()
+    subject = models.CharField(max_length=200)
+    views = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'subject_view_daily'
+        unique_together = [['day', 'subject']]
+
+    def __str__(self):
+        return f"{self.day} {self.subject}: {self.views} views"
+
+
+class CitationCopyDaily(models.Model):
+    """Citation copies per document per day"""
+    day = models.DateField()
+    document = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='citation_copy_days')
+    copies = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'citation_copy_daily'
+        unique_together = [['day', 'document']]
+
+    def __str__(self):
+        return f"{self.day} {self.document_id}: {self.copies} copies"
+
+
+class SubjectCitationDaily(models.Model):
+    """Citation copies per subject per day"""
+    day = models.DateField()
+    subject = models.CharField(max_length=200)
+    copies = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'subject_citation_daily'
+        unique_together = [['day', 'subject']]
+
+    def __str__(self):
+        return f"{self.day} {self.subject}: {self.copies} copies"
+
+
+class UsageSketchDaily(models.Model):
+    """HyperLogLog sketches (see hll.py) of one day's distinct visitors and viewed files"""
+    day = models.DateField(primary_key=True)
+    visitors = models.BinaryField()
+    documents = models.BinaryField()
+
+    class Meta:
+        db_table = 'usage_sketch_daily'
+
+    def __str__(self):
+        return f"{self.day} sketches"
+
+
+class RollupState(models.Model):
+    """High-water mark of the daily rollups: every day before rolled_until is complete"""
+    name = models.CharField(max_length=50, primary_key=True)
+    rolled_until = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'rollup_state'
+
+    def __str__(self):
+        return f"{self.name} rolled until {self.rolled_until}"
+
+
+class DocumentStats(models.Model):
+    """All-time engagement counters per file, kept up to date as views and ratings are recorded"""
+    file = models.CharField(max_length=500, primary_key=True)
+    view_count = models.BigIntegerField(default=0)
+    last_viewed_at = models.DateTimeField(null=True, blank=True)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.BigIntegerField(default=0)
+    rating_sq_sum = models.BigIntegerField(default=0)  # for the standard deviation
+    rating_min = models.IntegerField(null=True, blank=True)
+    rating_max = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'document_stats'
+        indexes = [
+            models.Index(fields=['-view_count']),
+            models.Index(fields=['-rating_count']),
+        ]
+
+    @property
+    def avg_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0.0
+
+    def __str__(self):
+        return f"{self.file}: {self.view_count} views, {self.rating_count} ratings"
+
+
+class IngestSpoolSegment(models.Model):
+    """Spool segments already written by the event ingester (makes replaying one a no-op)"""
+    name = models.CharField(max_length=100, primary_key=True)
+    events = models.IntegerField(default=0)
+    committed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'ingest_spool_segments'
+
+    def __str__(self):
+        return f"{self.name}: {self.events} events"
+
+
+class OutboxMessage(models.Model):
+    """A secondary write queued in the same transaction as the primary one, delivered by rag_api/outbox.py"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),  # gave up after OUTBOX_MAX_ATTEMPTS
+    ]
+
+    topic = models.CharField(max_length=50)
+    idempotency_key = models.CharField(max_length=200, unique=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        db_table = 'outbox_messages'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} {self.idempotency_key} ({self.status})"
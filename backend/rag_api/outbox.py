@@ -0,0 +1,308 @@
+"""
+Transactional outbox for secondary writes in LitPath AI
+
+A CSM feedback POST used to copy the feedback into the Supabase
+general_feedback table itself before answering: a fresh psycopg2.connect
+(TCP + TLS + auth), one INSERT, connection settings re-read from the
+environment on every call, and a slow or failing sink slowed or lost the
+write. Now the view saves the CSMFeedback and an outbox_messages row in one
+local transaction (`outbox.enqueue`), and a dispatcher thread delivers the
+messages once it commits:
+
+- due messages are claimed in batches of `batch_size` (FOR UPDATE SKIP
+  LOCKED, so every worker process can run a dispatcher) and leased for
+  `lease_seconds`; a dispatcher that dies mid-batch leaves them to the
+  next one when the lease runs out
+- a batch is written to its topic's sink in one transaction over a pooled
+  connection (rag_api/db_pool.py). If the sink rejects the batch, its
+  messages are retried one by one so a bad message only holds back itself
+- failed messages are retried with exponential backoff from
+  `retry_base_seconds` up to `retry_max_seconds`, and marked `failed`
+  after `max_attempts` (they stay in outbox_messages for inspection)
+- every message has an idempotency key (csm_feedback:<id>). The sink
+  records the keys it applied in outbox_receipts, in the same transaction
+  as the write, so a redelivered message (expired lease, crash between the
+  sink commit and marking it sent) is not written twice
+
+Sent messages are deleted after a day. The dispatcher starts with the first
+request a process serves (or its first enqueue), and its first pass delivers
+messages left over from before a restart; `python manage.py dispatch_outbox`
+does the same by hand. Migration 0027 creates outbox_receipts on the default
+database, which the sink uses unless SUPABASE_* point elsewhere; a separate
+sink database needs it created once with the SQL in README.md
+(GeneralFeedbackSink.RECEIPTS_DDL). The dispatcher only connects.
+
+Configured via Django settings (see settings.py):
+    OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL_SECONDS, OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_BASE_SECONDS, OUTBOX_RETRY_MAX_SECONDS,
+    SUPABASE_URL, SUPABASE_DB, SUPABASE_USER, SUPABASE_PASSWORD, SUPABASE_PORT
+"""
+
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .db_pool import ConnectionPool, PoolTimeout, get_pool
+
+
+class SinkUnavailable(Exception):
+    """The sink could not be reached - retry the whole batch later"""
+
+
+class GeneralFeedbackSink:
+    """Copies CSM feedback into the Supabase general_feedback table"""
+
+    COLUMNS = (
+        'user_id', 'session_id', 'consent_given', 'client_type', 'date', 'sex', 'age', 'region',
+        'category', 'litpath_rating', 'research_interests', 'missing_content', 'message_comment',
+    )
+    RECEIPTS_TABLE = 'outbox_receipts'
+
+    def __init__(self, host: Optional[str], database: Optional[str], user: Optional[str],
+                 password: Optional[str], port: Any = 5432):
+        self.host = host
+        self.database = database
+        self.user = user
+        self.password = password
+        self.port = port
+        self.configured = all([host, database, user, password])
+
+    # Migration 0027 creates it on the default database; a separately configured sink database
+    # needs it created once (see "CSM feedback copy" in README.md) - the dispatcher only connects
+    RECEIPTS_DDL = (
+        f"CREATE TABLE {RECEIPTS_TABLE} ("
+        "idempotency_key text PRIMARY KEY, received_at timestamptz NOT NULL DEFAULT now())"
+    )
+
+    @property
+    def pool(self) -> ConnectionPool:
+        from .pooled_postgresql.base import check_connection, reset_connection, close_connection
+        # One dispatcher thread per process: a single connection, kept between batches
+        return get_pool(('general_feedback', self.database), lambda: ConnectionPool(
+            self._connect, check_connection, reset_connection, close_connection,
+            name='general_feedback', min_size=0, max_size=1))
+
+    def _connect(self):
+        import psycopg2
+        return psycopg2.connect(host=self.host, dbname=self.database, user=self.user,
+                                password=self.password, port=self.port, connect_timeout=10)
+
+    def deliver(self, messages: List[Any]):
+        """Write the messages not applied before, and their receipts, in one transaction"""
+        import psycopg2
+        import psycopg2.errors
+        from psycopg2.extras import execute_values
+        try:
+            conn = self.pool.getconn()
+        except (psycopg2.OperationalError, PoolTimeout) as e:
+            raise SinkUnavailable(str(e)) from e
+        try:
+            with conn.cursor() as cursor:
+                applied = execute_values(
+                    cursor,
+                    f"INSERT INTO {self.RECEIPTS_TABLE} (idempotency_key) VALUES %s "
+                    "ON CONFLICT DO NOTHING RETURNING idempotency_key",
+                    [(m.idempotency_key,) for m in messages], fetch=True)
+                new = {key for (key,) in applied}
+                rows = [tuple(m.payload.get(column) for column in self.COLUMNS)
+                        for m in messages if m.idempotency_key in new]
+                if rows:
+                    execute_values(
+                        cursor, f"INSERT INTO general_feedback ({', '.join(self.COLUMNS)}) VALUES %s", rows)
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            raise SinkUnavailable(str(e)) from e
+        except psycopg2.errors.UndefinedTable as e:
+            # Not set up yet: retry the batch like an unreachable sink rather than failing each message
+            raise SinkUnavailable(f"{e} - create {self.RECEIPTS_TABLE} with GeneralFeedbackSink.RECEIPTS_DDL") from e
+        finally:
+            self.pool.putconn(conn)  # rolled back there if the transaction failed
+
+
+class OutboxDispatcher:
+    """Queues messages in the caller's transaction and delivers them to their sinks in the background"""
+
+    def __init__(self, batch_size: int = 100, poll_interval_seconds: float = 5.0, max_attempts: int = 10,
+                 retry_base_seconds: float = 5.0, retry_max_seconds: float = 3600.0,
+                 lease_seconds: float = 60.0):
+        self.batch_size = batch_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.lease_seconds = lease_seconds
+        self.sinks: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._dispatch_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pruned_at = 0.0
+
+    def register(self, topic: str, sink):
+        self.sinks[topic] = sink
+
+    def enqueue(self, topic: str, idempotency_key: str, payload: Dict[str, Any]):
+        """Queue a message in the current transaction; it is dispatched once that commits.
+        Returns None (nothing queued) when the topic's sink is not configured."""
+        from .models import OutboxMessage
+        sink = self.sinks.get(topic)
+        if sink is None or not getattr(sink, 'configured', True):
+            return None
+        message = OutboxMessage.objects.create(topic=topic, idempotency_key=idempotency_key, payload=payload)
+        transaction.on_commit(self._notify)
+        return message
+
+    # ---------- dispatcher thread ----------
+
+    def start(self):
+        """Start the dispatcher thread (if a sink is configured) and wake it up; its first
+        pass delivers whatever is due, including messages left from before a restart"""
+        if self._thread is None:
+            if not any(getattr(sink, 'configured', True) for sink in self.sinks.values()):
+                return
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='outbox-dispatch', daemon=True)
+                    self._thread.start()
+        self._wakeup.set()
+
+    def _notify(self):
+        self.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval_seconds)
+            self._wakeup.clear()
+            try:
+                self.dispatch()
+            except Exception as e:
+                print(f"[OUTBOX] Dispatch failed, messages stay queued: {e}")
+            finally:
+                connections.close_all()
+
+    def dispatch(self) -> int:
+        """Deliver due messages until none are left; returns the number sent"""
+        sent = 0
+        with self._dispatch_lock:
+            while True:
+                batch = self._claim()
+                if not batch:
+                    break
+                sent_now = self._deliver(batch)
+                sent += sent_now
+                if len(batch) < self.batch_size or not sent_now:
+                    break  # drained, or the sinks are failing - back off until the next poll
+            if time.time() - self._pruned_at > 3600:
+                self._prune()
+        return sent
+
+    def _claim(self) -> List[Any]:
+        from .models import OutboxMessage
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                OutboxMessage.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', next_attempt_at__lte=now)
+                .order_by('id')[:self.batch_size]
+            )
+            if batch:
+                OutboxMessage.objects.filter(pk__in=[m.pk for m in batch]).update(
+                    attempts=F('attempts') + 1, next_attempt_at=now + timedelta(seconds=self.lease_seconds))
+        for message in batch:
+            message.attempts += 1
+        return batch
+
+    def _deliver(self, batch: List[Any]) -> int:
+        by_topic = defaultdict(list)
+        for message in batch:
+            by_topic[message.topic].append(message)
+        sent = 0
+        for topic, messages in by_topic.items():
+            sink = self.sinks.get(topic)
+            if sink is None:
+                for message in messages:
+                    self._retry(message, f"No sink registered for topic '{topic}'")
+                continue
+            try:
+                sink.deliver(messages)
+            except SinkUnavailable as e:
+                for message in messages:
+                    self._retry(message, e)
+                continue
+            except Exception as e:
+                if len(messages) == 1:
+                    self._retry(messages[0], e)
+                    continue
+                # Rejected batch: deliver one by one so only the bad message is held back
+                for message in messages:
+                    try:
+                        sink.deliver([message])
+                    except Exception as e:
+                        self._retry(message, e)
+                    else:
+                        self._sent([message])
+                        sent += 1
+                continue
+            self._sent(messages)
+            sent += len(messages)
+        return sent
+
+    def _sent(self, messages: List[Any]):
+        from .models import OutboxMessage
+        OutboxMessage.objects.filter(pk__in=[m.pk for m in messages]).update(
+            status='sent', sent_at=timezone.now(), last_error='')
+
+    def _retry(self, message, error):
+        """Schedule the next attempt with exponential backoff, or give up after max_attempts"""
+        from .models import OutboxMessage
+        updates = {'last_error': str(error)[:1000]}
+        if message.attempts >= self.max_attempts:
+            updates['status'] = 'failed'
+            print(f"[OUTBOX] Giving up on {message.idempotency_key} after {message.attempts} attempts: {error}")
+        else:
+            delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (message.attempts - 1))
+            updates['next_attempt_at'] = timezone.now() + timedelta(seconds=delay)
+        OutboxMessage.objects.filter(pk=message.pk).update(**updates)
+
+    def _prune(self):
+        """Forget sent messages after a day"""
+        from .models import OutboxMessage
+        OutboxMessage.objects.filter(status='sent', sent_at__lt=timezone.now() - timedelta(days=1)).delete()
+        self._pruned_at = time.time()
+
+
+def start_on_first_request(sender, **kwargs):
+    """request_started receiver (connected in RagApiConfig.ready): starts the dispatcher once
+    the process serves requests - not at import, so management commands and a --preload
+    master don't run one. Test client requests (not a WSGI/ASGI handler) don't start it"""
+    from django.core.handlers.asgi import ASGIHandler
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.signals import request_started
+    if not issubclass(sender, (WSGIHandler, ASGIHandler)):
+        return
+    request_started.disconnect(dispatch_uid='outbox-start')
+    outbox.start()
+
+
+# Singleton instance for use across the application
+outbox = OutboxDispatcher(
+    batch_size=getattr(settings, 'OUTBOX_BATCH_SIZE', 100),
+    poll_interval_seconds=getattr(settings, 'OUTBOX_POLL_INTERVAL_SECONDS', 5),
+    max_attempts=getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 10),
+    retry_base_seconds=getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 5),
+    retry_max_seconds=getattr(settings, 'OUTBOX_RETRY_MAX_SECONDS', 3600),
+)
+outbox.register('general_feedback', GeneralFeedbackSink(
+    host=getattr(settings, 'SUPABASE_URL', None),
+    database=getattr(settings, 'SUPABASE_DB', None),
+    user=getattr(settings, 'SUPABASE_USER', None),
+    password=getattr(settings, 'SUPABASE_PASSWORD', None),
+    port=getattr(settings, 'SUPABASE_PORT', 5432),
+))
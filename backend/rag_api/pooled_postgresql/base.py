@@ -0,0 +1,96 @@
+"""
+PostgreSQL database backend with a process-wide connection pool
+
+ENGINE 'rag_api.pooled_postgresql', pool settings in OPTIONS['pool'] (the
+keyword arguments of rag_api.db_pool.ConnectionPool). Opening a connection
+checks one out of the pool and closing it hands it back, so with
+CONN_MAX_AGE=0 each request borrows a connection for its duration.
+Everything else is django.db.backends.postgresql.
+"""
+
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from django.utils.asyncio import async_unsafe
+
+from ..db_pool import ConnectionPool, PoolTimeout, close_pools, get_pool
+
+
+# conn.info.transaction_status values (the same in psycopg2 and psycopg 3)
+TRANSACTION_IDLE = 0
+TRANSACTION_UNKNOWN = 4
+
+
+def check_connection(conn) -> bool:
+    """Health check on checkout: the server still answers"""
+    if conn.closed:
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    if conn.info.transaction_status != TRANSACTION_IDLE:
+        conn.rollback()  # autocommit was off: don't hand out an open transaction
+    return True
+
+
+def reset_connection(conn) -> bool:
+    """Make a returned connection reusable: roll back whatever transaction it was left in"""
+    if conn.closed or conn.info.transaction_status == TRANSACTION_UNKNOWN:
+        return False
+    if conn.info.transaction_status != TRANSACTION_IDLE:
+        conn.rollback()
+    return True
+
+
+def close_connection(conn):
+    conn.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections to the test database would block DROP DATABASE
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    pooled = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._connection_pool = None
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def _get_pool(self, conn_params) -> ConnectionPool:
+        def connect():
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+        options = self.settings_dict['OPTIONS'].get('pool') or {}
+        return get_pool((self.alias, self.settings_dict['NAME']),
+                        lambda: ConnectionPool(connect, check_connection, reset_connection, close_connection,
+                                               name=self.alias, **options))
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self._get_pool(conn_params)
+        try:
+            connection = pool.getconn()
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e)) from e
+        # Set by the parent for the connections it opens; a reused one needs it too
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = (IsolationLevel(isolation_level) if isolation_level is not None
+                                else IsolationLevel.READ_COMMITTED)
+        self._connection_pool = pool
+        return connection
+
+    def _close(self):
+        if self.connection is None or self._connection_pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # Closed inside atomic(): Django keeps using this connection object until the
+            # block exits, so it must not go to another thread - really close it
+            self._connection_pool.putconn(self.connection, discard=self.in_atomic_block)
@@ -0,0 +1,258 @@
+"""
+Token-budgeted prompt builder for LitPath AI overview generation
+
+_generate_with_context and generate_overview_stream share this builder.
+Instead of pasting every selected chunk (up to 1500 characters each), it
+packs the retrieved context under a fixed token budget:
+
+1. Chunks are split into sentences; each sentence is scored by the share
+   of query terms it contains (local_reranker.tokenize), with a small
+   bonus for the chunk's rank.
+2. Near-duplicate sentences across chunks (token-set Jaccard above
+   `dedup_threshold`) are dropped - overlapping chunks and repeated
+   abstracts otherwise fill the prompt with the same text.
+3. Every source first gets its best sentence, then the remaining budget
+   is filled best-first. Kept sentences are printed in their original
+   order under the source's [n] citation.
+
+Conversation history gets its own reservation (`history_tokens`) so a
+long follow-up never squeezes out the sources; with a cached
+ConversationState (conversation_utils) the trimmed recent turns and the
+rolling summary come from the cache instead of the raw history. Token counts are
+estimated locally (about 4 characters per token) and returned in
+BuiltPrompt.stats for per-request reporting.
+
+Configured via Django settings (see settings.py):
+    LLM_PROMPT_CONTEXT_TOKENS, LLM_PROMPT_HISTORY_TOKENS, LLM_PROMPT_DEDUP_THRESHOLD
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from .local_reranker import tokenize
+
+
+CHARS_PER_TOKEN = 4.0
+MAX_SOURCES = 10
+MAX_SENTENCE_CHARS = 600  # unpunctuated text (tables, OCR) would otherwise be one huge "sentence"
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
+
+INSTRUCTIONS = """INSTRUCTIONS:
+
+1. Carefully evaluate whether the provided source content contains explicit information that answers the user's question.
+
+2. If the sources contain directly relevant information:
+- Answer strictly using only the provided source content.
+- Do NOT add outside knowledge.
+- Do NOT make assumptions or logical leaps beyond what is written.
+- Combine information across sources only when the connection is explicitly supported.
+- Write 2–4 clear academic paragraphs (adjust length based on complexity).
+- End every factual sentence with its citation in this format: [1] or [1] [2].
+- NEVER place citations in the middle of a sentence.
+- NEVER use combined citation format like [1, 2].
+
+3. If the sources do NOT contain sufficient information:
+- Begin with: "The available sources do not directly address your specific question about [topic]."
+- Clearly explain what the sources DO discuss.
+- Suggest how the user might refine their query.
+- Cite sources when describing their contents.
+- Do NOT generate information not present in the sources.
+
+4. If the answer is partially supported:
+- Clearly distinguish between supported and unsupported parts.
+- Explicitly state which aspects are not covered in the sources.
+
+5. Maintain an objective academic tone.
+
+If you are uncertain whether a claim is supported by the sources, do not include it.
+
+
+Answer:"""
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text or "") / CHARS_PER_TOKEN + 0.5)
+
+
+def split_sentences(text: str) -> List[str]:
+    text = " ".join((text or "").split())
+    return [s for s in _SENTENCE_RE.split(text) if s]
+
+
+def source_id(meta: Dict) -> str:
+    return meta.get('pdf', meta.get('file', '[Unknown]'))
+
+
+@dataclass
+class BuiltPrompt:
+    prompt: str
+    seen_pdfs: List[str]
+    stats: Dict = field(default_factory=dict)
+
+
+class PromptBuilder:
+    """Packs sources, history and instructions into one generation prompt"""
+
+    def __init__(self, context_tokens: int = 3750, history_tokens: int = 300, dedup_threshold: float = 0.8):
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self.dedup_threshold = dedup_threshold
+
+    # ---------- sources ----------
+
+    @staticmethod
+    def number_sources(chunks: List[Dict]):
+        """Citation numbers for the first MAX_SOURCES distinct theses"""
+        doc_infos, seen_pdfs, pdf_to_number = [], [], {}
+        for c in chunks:
+            meta = c['meta']
+            pdf_id = source_id(meta)
+            if pdf_id not in pdf_to_number:
+                seen_pdfs.append(pdf_id)
+                pdf_to_number[pdf_id] = len(seen_pdfs)
+                doc_infos.append(
+                    f"[{len(seen_pdfs)}] {meta.get('title','') or '[Unknown]'} "
+                    f"({meta.get('publication_year','') or 'N/A'}) "
+                    f"by {meta.get('author','') or '[Unknown]'}"
+                )
+            if len(doc_infos) >= MAX_SOURCES:
+                break
+        return doc_infos, seen_pdfs, pdf_to_number
+
+    def pack_context(self, chunks: List[Dict], question: str, pdf_to_number: Dict, budget: int):
+        """Best sentences of the cited chunks within `budget` tokens"""
+        terms = set(tokenize(question))
+        candidates = []  # (score, chunk_index, position, tokens, sentence, token_set)
+        for ci, c in enumerate(chunks):
+            if source_id(c['meta']) not in pdf_to_number:
+                continue
+            for pos, sentence in enumerate(split_sentences(c['chunk'])):
+                sentence = sentence[:MAX_SENTENCE_CHARS]
+                words = set(tokenize(sentence))
+                overlap = len(terms & words) / len(terms) if terms else 0.0
+                score = overlap + 0.05 / (1 + ci) - 0.001 * pos
+                candidates.append((score, ci, pos, estimate_tokens(sentence) + 1, sentence, words))
+
+        kept, kept_sets, skipped = {}, [], set()
+        stats = {'sentences': len(candidates), 'duplicates': 0, 'over_budget': 0}
+        used = 0
+
+        def take(item):
+            nonlocal used
+            score, ci, pos, tokens, sentence, words = item
+            if (ci, pos) in kept or (ci, pos) in skipped:
+                return
+            if words and any(len(words & other) / len(words | other) >= self.dedup_threshold for other in kept_sets):
+                stats['duplicates'] += 1
+                kept[(ci, pos)] = None  # seen, not printed
+                return
+            if used + tokens > budget:
+                stats['over_budget'] += 1
+                skipped.add((ci, pos))
+                return
+            kept[(ci, pos)] = sentence
+            kept_sets.append(words)
+            used += tokens
+
+        ranked = sorted(candidates, key=lambda item: -item[0])
+        # Pass 1: best sentence of every chunk, so every source keeps a voice
+        best_of_chunk = {}
+        for item in ranked:
+            best_of_chunk.setdefault(item[1], item)
+        for item in sorted(best_of_chunk.values(), key=lambda item: -item[0]):
+            take(item)
+        # Pass 2: fill the remaining budget best-first
+        for item in ranked:
+            take(item)
+
+        blocks = []
+        for ci, c in enumerate(chunks):
+            sentences = [kept[key] for key in sorted(k for k in kept if k[0] == ci) if kept[key]]
+            if sentences:
+                blocks.append(f"[{pdf_to_number[source_id(c['meta'])]}] " + " ".join(sentences))
+        stats['kept'] = sum(1 for s in kept.values() if s)
+        return "\n\n".join(blocks), used, stats
+
+    # ---------- history ----------
+
+    def history_context(self, conversation_history: Optional[List[Dict]], budget: int,
+                        conversation_state=None) -> str:
+        """Last three turns within `budget` tokens; with a cached ConversationState,
+        its rolling summary of older turns comes first and shares the budget"""
+        if conversation_state is not None:
+            turns, summary = list(conversation_state.recent), conversation_state.summary
+        else:
+            turns, summary = (conversation_history or [])[-3:], ""
+        if not turns:
+            return ""
+        summary_part = f"Earlier questions:\n{summary}\n---\n" if summary else ""
+        # Split the rest of the reservation evenly; each turn keeps its
+        # question and the start of its answer
+        per_turn_chars = int((budget * CHARS_PER_TOKEN - len(summary_part)) / len(turns))
+        history_parts = []
+        for turn in turns:
+            q = (turn.get('query', '') or '')[:200]
+            overview = turn.get('overview', '') or ''
+            limit = max(0, min(500, per_turn_chars - len(q) - 30))
+            a = overview[:limit]
+            if a and len(overview) > limit and not a.endswith("..."):
+                a += "..."
+            history_parts.append(f"User asked: {q}\nYou answered: {a}")
+        return (
+            "\n\nPREVIOUS CONVERSATION:\n"
+            + summary_part
+            + "\n---\n".join(history_parts)
+            + "\n\nThe user is now asking a follow-up question. Use the conversation context to understand references like 'it', 'this', 'that', 'compare', etc.\n"
+        )
+
+    @staticmethod
+    def relevance_warning(relevance_info: Optional[Dict]) -> str:
+        if not relevance_info or relevance_info.get('match_ratio', 1.0) >= 0.5:
+            return ""
+        missing = ', '.join(list(relevance_info.get('missing_keywords', set()))[:5])
+        matched = ', '.join(list(relevance_info.get('matched_keywords', set()))[:5])
+        return (
+            "\nRELEVANCE NOTE: The sources may not fully address the user's question.\n"
+            f"- Keywords from query found in sources: {matched if matched else 'few/none'}\n"
+            f"- Keywords from query NOT found in sources: {missing if missing else 'none'}\n"
+            "- If sources don't contain relevant information, clearly state this limitation.\n"
+        )
+
+    # ---------- prompt ----------
+
+    def build(self, chunks: List[Dict], question: str, conversation_history: Optional[List[Dict]] = None,
+              relevance_info: Optional[Dict] = None, conversation_state=None) -> BuiltPrompt:
+        doc_infos, seen_pdfs, pdf_to_number = self.number_sources(chunks)
+        history_context = self.history_context(conversation_history, self.history_tokens, conversation_state)
+        chunk_context, context_tokens, pack_stats = self.pack_context(
+            chunks, question, pdf_to_number, self.context_tokens
+        )
+        prompt = (
+            "You are an academic research assistant analyzing thesis documents.\n\n"
+            "AVAILABLE SOURCES:\n"
+            f"{chr(10).join(doc_infos)}\n\n"
+            "CONTEXT FROM SOURCES:\n"
+            f"{chunk_context}{history_context}{self.relevance_warning(relevance_info)}\n"
+            f"USER QUESTION: {question}\n\n"
+            f"{INSTRUCTIONS}"
+        )
+        stats = {
+            'prompt_tokens': estimate_tokens(prompt),
+            'context_tokens': context_tokens,
+            'history_tokens': estimate_tokens(history_context),
+            'sources': len(seen_pdfs),
+            **pack_stats,
+        }
+        return BuiltPrompt(prompt, seen_pdfs, stats)
+
+
+# Singleton instance for use across the application
+prompt_builder = PromptBuilder(
+    context_tokens=getattr(settings, 'LLM_PROMPT_CONTEXT_TOKENS', 3750),
+    history_tokens=getattr(settings, 'LLM_PROMPT_HISTORY_TOKENS', 300),
+    dedup_threshold=getattr(settings, 'LLM_PROMPT_DEDUP_THRESHOLD', 0.8),
+)
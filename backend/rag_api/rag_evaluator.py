@@ -20,7 +20,11 @@ import hashlib
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime
-from google import genai
+
+from django.conf import settings
+
+from .llm_transport import get_transport
+from .llm_client import get_llm_client
 
 
 @dataclass
@@ -72,20 +76,22 @@ class LLMJudge:
     def __init__(self, api_key: str = None, model: str = "gemini-2.5-flash"):
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
         self.model = model
-        self.client = None
         
-        if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
+        if not self.api_key and get_transport().mode in ('replay', 'stub'):
+            self.api_key = 'offline'
     
     def _call_llm(self, prompt: str, max_tokens: int = 512) -> str:
         """Call the LLM with a prompt, with retry logic for rate limits"""
-        if not self.client:
+        if not self.api_key:
             raise ValueError("No API key configured for LLM judge")
         
+        # Transient failures get the shared client's short jittered retries;
+        # quota exhaustion needs the longer waits below
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = self.client.models.generate_content(
+                response = get_llm_client().generate_content(
+                    self.api_key,
                     model=self.model,
                     contents=prompt,
                     config={
@@ -93,7 +99,8 @@ class LLMJudge:
                         "max_output_tokens": max_tokens,
                         "top_p": 0.9,
                         "thinking_config": {"thinking_budget": 0},
-                    }
+                    },
+                    deadline_ms=getattr(settings, 'LLM_JUDGE_DEADLINE_MS', 60000),
                 )
                 return response.text.strip()
             except Exception as e:
@@ -9,7 +9,6 @@ import json
 import gc
 import numpy as np
 import requests
-from google import genai
 import re
 import time
 import hashlib
@@ -18,10 +17,14 @@ from datetime import datetime
 from functools import lru_cache
 from PyPDF2 import PdfReader
 import chromadb
-from huggingface_hub import InferenceClient
 from django.conf import settings
 import sys
 
+from .llm_transport import get_transport, CassetteMissError, hashed_embedding
+from .vector_store import NumpyVectorStore, BinaryPrefilterIndex
+from .material_catalog import material_catalog
+
+
 def l2_normalize(vec):
     norm = np.linalg.norm(vec)
     if norm == 0:
@@ -29,27 +32,56 @@ def l2_normalize(vec):
     return vec / norm
 
 
+def mmr_select(query_emb, embeddings, k, lambda_mult=0.7):
+    """Maximal marginal relevance: indices of k rows balancing relevance to the
+    query against similarity to rows already picked.
+
+    Embeddings are L2-normalized, so dot products are cosine similarities.
+    Candidate-candidate similarities come from one matrix product; each of
+    the k greedy steps is a vectorized update of the running max similarity.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n = len(embeddings)
+    if n <= k:
+        return list(range(n))
+    relevance = embeddings @ np.asarray(query_emb, dtype=np.float32)
+    similarity = embeddings @ embeddings.T
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected = []
+    for _ in range(k):
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
+
+
 class HFInferenceEmbedder:
     """Lightweight embedder using huggingface_hub InferenceClient.
     Drop-in replacement for SentenceTransformer — no torch/model in memory.
-    Uses feature_extraction endpoint via the official HF SDK.
+    Uses feature_extraction endpoint via the official HF SDK, routed through
+    the LLM transport so embeddings can be recorded and replayed offline.
     """
     MODEL_ID = "sentence-transformers/all-mpnet-base-v2"
     MAX_RETRIES = 5
 
     def __init__(self, token=None):
         self.token = token or os.environ.get("HF_TOKEN", "")
-        self.client = InferenceClient(token=self.token if self.token else None)
 
     def _embed_single(self, text):
         """Embed a single text with retry logic."""
         last_error = None
         for attempt in range(self.MAX_RETRIES):
             try:
-                result = self.client.feature_extraction(
-                    text, model=self.MODEL_ID
+                result = get_transport().feature_extraction(
+                    self.token, text, model=self.MODEL_ID
                 )
                 return np.array(result, dtype=np.float32).flatten()
+            except CassetteMissError:
+                raise
             except Exception as e:
                 last_error = e
                 err_str = str(e)
@@ -85,9 +117,30 @@ class HFInferenceEmbedder:
             return np.array(all_embeddings, dtype=np.float32)
         return all_embeddings
 
+
+class HashingEmbedder:
+    """Deterministic local embedder (feature hashing, no network, no model).
+    Same encode() signature as HFInferenceEmbedder. Used to build and
+    benchmark large synthetic indexes offline (RAG_EMBEDDER=hash) - the
+    vectors are NOT compatible with an index built by the HF embedder.
+    """
+    DIM = 768
+
+    def encode(self, texts, batch_size=8, show_progress_bar=False, convert_to_numpy=True):
+        all_embeddings = [hashed_embedding(text, self.DIM) for text in texts]
+        if convert_to_numpy:
+            return np.array(all_embeddings, dtype=np.float32).reshape(len(all_embeddings), self.DIM)
+        return all_embeddings
+
 # Import conversation manager
 
 from .conversation_utils import conversation_manager
+from .latency_metrics import latency_tracker
+from .local_reranker import local_reranker
+from .llm_client import get_llm_client
+from .model_router import model_router
+from .prompt_builder import prompt_builder
+from .extractive_summary import extractive_summarizer
 
 
 
@@ -194,6 +247,8 @@ class RAGService:
     _initialized = False
     _indexing_in_progress = False
     _index_thread = None
+    # One vector per thesis (title/abstract + chunk centroid) for document-first search
+    document_collection = None
     # Bump this version to force a full re-index on next deploy
     INDEX_VERSION = "v2-hf-api"
     
@@ -228,29 +283,64 @@ class RAGService:
         cls._initialized = True
         instance = cls()
         print("[RAG] Initializing RAG system...")
-        hf_token = getattr(settings, 'HF_TOKEN', '') or os.environ.get('HF_TOKEN', '')
-        instance.embedder = HFInferenceEmbedder(token=hf_token)
-        print("[RAG] Using HF Inference API for embeddings (all-mpnet-base-v2)")
+        if getattr(settings, 'RAG_EMBEDDER', 'hf') == 'hash':
+            instance.embedder = HashingEmbedder()
+            print("[RAG] Using local hashing embedder (offline / scale testing only)")
+        else:
+            hf_token = getattr(settings, 'HF_TOKEN', '') or os.environ.get('HF_TOKEN', '')
+            instance.embedder = HFInferenceEmbedder(token=hf_token)
+            print("[RAG] Using HF Inference API for embeddings (all-mpnet-base-v2)")
 
         # Try to open ChromaDB; if the file is corrupt (e.g. Git LFS pointer),
         # wipe the directory and start fresh.
         import shutil
+        vector_backend = getattr(settings, 'RAG_VECTOR_BACKEND', 'chroma')
         chroma_path = settings.RAG_CHROMADB_PATH
-        try:
-            instance.chroma_client = chromadb.PersistentClient(path=chroma_path)
-            instance.collection = instance.chroma_client.get_or_create_collection("thesis_chunks")
-        except Exception as e:
-            print(f"[RAG] ChromaDB open failed ({e}), wiping corrupt data and recreating...")
+        if vector_backend == 'numpy':
+            # Append-only memory-mapped store - no corruption recovery needed
+            chroma_path = settings.RAG_VECTOR_STORE_PATH
             instance.chroma_client = None
-            instance.collection = None
-            if os.path.exists(chroma_path):
-                shutil.rmtree(chroma_path, ignore_errors=True)
-            os.makedirs(chroma_path, exist_ok=True)
-            instance.chroma_client = chromadb.PersistentClient(path=chroma_path)
-            instance.collection = instance.chroma_client.get_or_create_collection("thesis_chunks")
-            print("[RAG] ChromaDB recreated successfully.")
+            instance.collection = NumpyVectorStore(
+                chroma_path,
+                dtype=settings.RAG_VECTOR_DTYPE,
+                quantization=settings.RAG_VECTOR_QUANTIZATION,
+                reduced_dims=settings.RAG_VECTOR_REDUCED_DIMS,
+                rescore_factor=settings.RAG_VECTOR_RESCORE_FACTOR,
+            )
+            print(f"[RAG] Using NumPy vector store at {chroma_path} ({settings.RAG_VECTOR_DTYPE})")
+            instance.document_collection = NumpyVectorStore(os.path.join(chroma_path, 'documents'))
+            if instance.collection.needs_compression():
+                instance.collection.build_compression()
+                print(f"[RAG] Built compressed index (quantization={settings.RAG_VECTOR_QUANTIZATION}, dims={settings.RAG_VECTOR_REDUCED_DIMS or 'all'})")
+            if getattr(settings, 'RAG_RETRIEVAL_MODE', 'vector') == 'binary':
+                instance.collection = BinaryPrefilterIndex(
+                    instance.collection,
+                    shortlist=settings.RAG_BINARY_SHORTLIST,
+                    query_bits=settings.RAG_BINARY_QUERY_BITS,
+                )
+                print(f"[RAG] Retrieval mode: binary prefilter (shortlist {settings.RAG_BINARY_SHORTLIST}) + exact re-rank")
+        else:
+            if getattr(settings, 'RAG_RETRIEVAL_MODE', 'vector') == 'binary':
+                print("[RAG] RAG_RETRIEVAL_MODE=binary needs RAG_VECTOR_BACKEND=numpy; using Chroma vector search")
+            try:
+                instance.chroma_client = chromadb.PersistentClient(path=chroma_path)
+                instance.collection = instance.chroma_client.get_or_create_collection("thesis_chunks")
+            except Exception as e:
+                print(f"[RAG] ChromaDB open failed ({e}), wiping corrupt data and recreating...")
+                instance.chroma_client = None
+                instance.collection = None
+                if os.path.exists(chroma_path):
+                    shutil.rmtree(chroma_path, ignore_errors=True)
+                os.makedirs(chroma_path, exist_ok=True)
+                instance.chroma_client = chromadb.PersistentClient(path=chroma_path)
+                instance.collection = instance.chroma_client.get_or_create_collection("thesis_chunks")
+                print("[RAG] ChromaDB recreated successfully.")
+            instance.document_collection = instance.chroma_client.get_or_create_collection("thesis_documents")
 
         instance.api_key = settings.GEMINI_API_KEY
+        if not instance.api_key and get_transport().mode in ('replay', 'stub'):
+            # Cassettes / stubs stand in for Gemini when running offline - no key needed
+            instance.api_key = 'offline'
 
         # ---- Version-based re-index check ----
         version_file = os.path.join(chroma_path, '.index_version')
@@ -263,11 +353,17 @@ class RAGService:
         if needs_full_reindex:
             print(f"[RAG] Index version mismatch (stored={stored_version!r}, current={cls.INDEX_VERSION!r}), will re-index")
             # Wipe existing data so we start fresh
-            try:
-                instance.chroma_client.delete_collection("thesis_chunks")
-            except Exception:
-                pass
-            instance.collection = instance.chroma_client.get_or_create_collection("thesis_chunks")
+            if vector_backend == 'numpy':
+                instance.collection.reset()
+                instance.document_collection.reset()
+            else:
+                for name in ("thesis_chunks", "thesis_documents"):
+                    try:
+                        instance.chroma_client.delete_collection(name)
+                    except Exception:
+                        pass
+                instance.collection = instance.chroma_client.get_or_create_collection("thesis_chunks")
+                instance.document_collection = instance.chroma_client.get_or_create_collection("thesis_documents")
             # Also remove old indexed_files.json so all files get re-indexed
             old_idx = os.path.join(settings.RAG_THESES_FOLDER, 'indexed_files.json')
             if os.path.exists(old_idx):
@@ -294,6 +390,8 @@ class RAGService:
                         print(f"[RAG] Background indexing error: {e}")
                     finally:
                         cls._indexing_in_progress = False
+                    # Bring `materials` in line with the new index
+                    material_catalog.sync_in_background(instance)
                 cls._index_thread = threading.Thread(target=_bg_index, daemon=True)
                 cls._index_thread.start()
             else:
@@ -304,6 +402,12 @@ class RAGService:
                 with open(version_file, 'w') as vf:
                     vf.write(cls.INDEX_VERSION)
             print(f"[RAG] Ready! Total chunks: {existing_chunks}")
+            material_catalog.sync_in_background(instance)
+            if instance.document_collection.count() == 0:
+                # Index built before the document index existed - backfill it;
+                # search uses chunk-only retrieval until this finishes
+                print("[RAG] Document index empty, building it in the background...")
+                threading.Thread(target=instance.build_document_index, daemon=True).start()
 
 
     def embed_chunks(self, chunks):
@@ -311,6 +415,82 @@ class RAGService:
         raw_embeds = np.array(self.embedder.encode(chunks, show_progress_bar=False, convert_to_numpy=True))
         return np.array([l2_normalize(e) for e in raw_embeds])
     
+    def document_embedding(self, meta, chunk_embeddings):
+        """One vector per thesis: its title + abstract blended with the centroid
+        of its chunk vectors (RAG_DOCUMENT_TITLE_WEIGHT sets the blend)"""
+        centroid = l2_normalize(np.asarray(chunk_embeddings, dtype=np.float32).mean(axis=0))
+        text = f"{meta.get('title', '')}. {meta.get('abstract', '')}".strip(" .")
+        if not text:
+            return centroid
+        weight = getattr(settings, 'RAG_DOCUMENT_TITLE_WEIGHT', 0.5)
+        head = l2_normalize(self.embedder.encode([text[:2000]], convert_to_numpy=True)[0])
+        return l2_normalize(weight * head + (1 - weight) * centroid).astype(np.float32)
+
+    def index_document(self, meta, chunk_embeddings):
+        """Add (or replace) a thesis in the document index"""
+        if self.document_collection is None:
+            return
+        file_name = meta.get("file", "")
+        doc_meta = {k: v for k, v in meta.items() if k != "chunk_idx"}
+        self.document_collection.delete(ids=[file_name])
+        self.document_collection.add(
+            embeddings=self.document_embedding(doc_meta, chunk_embeddings)[None, :],
+            documents=[doc_meta.get("title", "")],
+            metadatas=[doc_meta],
+            ids=[file_name]
+        )
+
+    def build_document_index(self, batch_size=5000):
+        """Backfill the document index from the chunk index (no chunk re-embedding)"""
+        if self.document_collection is None:
+            return 0
+        sums, counts, metas = {}, {}, {}
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            if not len(batch["ids"]):
+                break
+            for emb, meta in zip(batch["embeddings"], batch["metadatas"]):
+                file_name = meta.get("file", meta.get("pdf", ""))
+                if not file_name:
+                    continue
+                sums[file_name] = sums.get(file_name, 0) + np.asarray(emb, dtype=np.float32)
+                counts[file_name] = counts.get(file_name, 0) + 1
+                metas.setdefault(file_name, meta)
+            offset += len(batch["ids"])
+
+        for file_name, total in sums.items():
+            try:
+                self.index_document(metas[file_name], (total / counts[file_name])[None, :])
+            except Exception as e:
+                print(f"[RAG] Failed to index document {file_name}: {e}")
+        print(f"[RAG] Document index built: {self.document_collection.count()} theses")
+        return len(sums)
+
+    def _top_documents(self, query_emb, where_clause, year_range_filter, request_id=None):
+        """Files of the closest theses in the document index (stage one of search)"""
+        top_k = getattr(settings, 'RAG_DOCUMENT_TOP_K', 20)
+        results = self.document_collection.query(
+            query_embeddings=[query_emb],
+            # Over-fetch when the year range can only be applied afterwards
+            n_results=top_k * 3 if year_range_filter else top_k,
+            where=where_clause,
+            include=["metadatas", "distances"]
+        )
+        files = []
+        for meta in results["metadatas"][0]:
+            if year_range_filter:
+                try:
+                    doc_year = int(meta.get("publication_year", "0"))
+                    if not (year_range_filter[0] <= doc_year <= year_range_filter[1]):
+                        continue
+                except (ValueError, TypeError):
+                    pass
+            files.append(meta.get("file", meta.get("pdf", "")))
+        files = [f for f in files if f][:top_k]
+        print(f"[RAG-DEBUG] Request ID {request_id}: Document-first retrieval picked {len(files)} theses.")
+        return files
+
     def sentence_chunking(self, text, chunk_size=500):
         """Split text into overlapping chunks"""
         sentences = text.split('. ')
@@ -409,11 +589,12 @@ class RAGService:
 
                 ids = [f"{os.path.basename(txt_path)}_chunk_{i}" for i in range(len(chunks))]
                 self.collection.add(
-                    embeddings=[list(map(float, emb)) for emb in chunk_embeddings],
+                    embeddings=chunk_embeddings.astype(np.float32),
                     documents=chunks,
                     metadatas=chunk_metadatas,
                     ids=ids
                 )
+                self.index_document(chunk_metadatas[0], chunk_embeddings)
 
                 indexed_files[txt_path] = mtime
                 # Save progress after each file so partial indexing survives restarts
@@ -432,6 +613,10 @@ class RAGService:
         with open(indexed_path, "w", encoding="utf-8") as f:
             json.dump(indexed_files, f)
 
+        if to_index and hasattr(self.collection, "build_compression"):
+            # Re-learn the PCA / int8 parameters from the updated corpus
+            self.collection.build_compression()
+
         print(f"[RAG] Indexing complete. Total chunks: {self.collection.count()}")
     
     def extract_and_chunk_pdfs(self, pdf_folder, chunk_size=500):
@@ -513,7 +698,7 @@ class RAGService:
 
             ids = [f"{os.path.basename(txt_path)}_chunk_{i}" for i in range(len(chunks))]
             self.collection.add(
-                embeddings=[list(map(float, emb)) for emb in chunk_embeddings],
+                embeddings=chunk_embeddings.astype(np.float32),
                 documents=chunks,
                 metadatas=chunk_metadatas,
                 ids=ids
@@ -573,7 +758,7 @@ class RAGService:
             
             ids = [f"{os.path.basename(txt_path)}_chunk_{i}" for i in range(len(chunks))]
             self.collection.add(
-                embeddings=[list(map(float, emb)) for emb in chunk_embeddings],
+                embeddings=chunk_embeddings.astype(np.float32),
                 documents=chunks,
                 metadatas=chunk_metadatas,
                 ids=ids
@@ -598,7 +783,6 @@ class RAGService:
         rewritten_question = None
         if self.api_key:
             try:
-                client = genai.Client(api_key=self.api_key)
                 rewrite_prompt = (
                     "You are an academic search query rewriter.\n\n"
                     "Task:\n"
@@ -614,16 +798,20 @@ class RAGService:
                     "Rewritten Query:"
                 )
                 print(f"[RAG-DEBUG] Request ID {request_id}: Sending query rewrite prompt to LLM.")
-                response = client.models.generate_content(
-                    model="gemini-2.5-flash-lite",
-                    contents=rewrite_prompt,
-                    config={
-                        "temperature": 0.2,
-                        "max_output_tokens": 128,
-                        "top_p": 0.8,
-                        "thinking_config": {"thinking_budget": 0},
-                    }
-                )
+                with latency_tracker.span('rewrite', request_id):
+                    response = get_llm_client().generate_content(
+                        self.api_key,
+                        model="gemini-2.5-flash-lite",
+                        contents=rewrite_prompt,
+                        config={
+                            "temperature": 0.2,
+                            "max_output_tokens": 128,
+                            "top_p": 0.8,
+                            "thinking_config": {"thinking_budget": 0},
+                        },
+                        deadline_ms=getattr(settings, 'LLM_REWRITE_DEADLINE_MS', 2000),
+                        hedge=True,
+                    )
                 if hasattr(response, "text") and response.text.strip():
                     rewritten_question = response.text.strip()
                     print(f"[RAG] LLM query rewrite: '{question}' -> '{rewritten_question}' [Request ID: {request_id}]")
@@ -635,7 +823,8 @@ class RAGService:
 
         # Step 2: Use rewritten query directly (no expansion)
         print(f"[RAG-DEBUG] Request ID {request_id}: Embedding query.")
-        query_emb = l2_normalize(self.embedder.encode([rewritten_question], convert_to_numpy=True)[0]).tolist()
+        with latency_tracker.span('embed', request_id):
+            query_emb = l2_normalize(self.embedder.encode([rewritten_question], convert_to_numpy=True)[0]).tolist()
 
         # Build ChromaDB where clause for year filters
         # Note: publication_year is stored as string, so we use $in with explicit year list for ranges
@@ -664,17 +853,35 @@ class RAGService:
             except (ValueError, TypeError) as e:
                 print(f"[RAG] Warning: Invalid year range values: {year_start} - {year_end}, error: {e}")
 
+        # Document-first: pick the closest theses, then search chunks only within them,
+        # so one long thesis cannot fill every candidate slot
+        chunk_where = where_clause
+        chunks_per_document = None
+        if getattr(settings, 'RAG_DOCUMENT_FIRST', True) and self.document_collection is not None \
+                and self.document_collection.count() > 0:
+            with latency_tracker.span('document_query', request_id):
+                top_files = self._top_documents(query_emb, where_clause, year_range_filter, request_id)
+            if top_files:
+                file_filter = {"file": {"$in": top_files}}
+                chunk_where = {"$and": [where_clause, file_filter]} if where_clause else file_filter
+                chunks_per_document = getattr(settings, 'RAG_CHUNKS_PER_DOCUMENT', 2)
+
         # Query with database-level year filtering
+        use_mmr = getattr(settings, 'RAG_MMR_ENABLED', False)
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if use_mmr else [])
         print(f"[RAG-DEBUG] Request ID {request_id}: Querying ChromaDB.")
-        results = self.collection.query(
-            query_embeddings=[query_emb],
-            n_results=top_n,
-            where=where_clause,
-            include=["documents", "metadatas", "distances"]
-        )
+        with latency_tracker.span('chroma_query', request_id):
+            results = self.collection.query(
+                query_embeddings=[query_emb],
+                n_results=top_n,
+                where=chunk_where,
+                include=include
+            )
 
         # Collect candidate chunks (vector search)
         candidate_chunks = []
+        candidate_embeddings = []  # parallel to candidate_chunks, MMR only
+        per_document = {}
         print(f"[RAG-DEBUG] Request ID {request_id}: Filtering candidate chunks.")
         for i in range(len(results["documents"][0])):
             meta = results["metadatas"][0][i]
@@ -691,19 +898,45 @@ class RAGService:
                         pass  # Include documents with invalid/unknown years
                 
                 # Subject filter removed - causes false negatives with auto-extraction
+                if chunks_per_document:
+                    # Keep the best few chunks per thesis for the reranker
+                    if per_document.get(file_name, 0) >= chunks_per_document:
+                        continue
+                    per_document[file_name] = per_document.get(file_name, 0) + 1
                 candidate_chunks.append({
                     "chunk": results["documents"][0][i],
                     "meta": meta,
                     "score": score
                 })
+                if use_mmr:
+                    candidate_embeddings.append(results["embeddings"][0][i])
+
+        if use_mmr and candidate_chunks:
+            # Diversify before the rerank cut: near-duplicate chunks (overlapping
+            # windows, the same thesis) would otherwise take several of the slots
+            picked = mmr_select(
+                query_emb, candidate_embeddings,
+                k=getattr(settings, 'RAG_MMR_K', 10),
+                lambda_mult=getattr(settings, 'RAG_MMR_LAMBDA', 0.7),
+            )
+            candidate_chunks = [candidate_chunks[i] for i in picked]
+            print(f"[RAG-DEBUG] Request ID {request_id}: MMR kept {len(candidate_chunks)} candidates.")
+
+        # === Local reranker: always runs (CPU, a few ms) ===
+        # Its order picks what Gemini sees and is the answer whenever Gemini is
+        # unavailable, fails, or misses the rerank deadline
+        with latency_tracker.span('local_rerank', request_id):
+            local_order = local_reranker.rank(rewritten_question, candidate_chunks)
+        candidate_chunks = [candidate_chunks[i] for i in local_order]
 
         # === Reranker step using Gemini 2.5 Flash for fast semantic selection ===
         # Limit rerank candidates and chunk size to fit LLM context window
         max_rerank_candidates = min(rerank_top_k, 15)  # hard cap for LLM context
         max_chunk_chars = 500  # give reranker enough context per chunk
         rerank_candidates = candidate_chunks[:max_rerank_candidates]
-        selected_indices = []
+        selected_indices = None  # None = no usable LLM ranking, use the local order
         debug_prompt = None
+        rerank_deadline_ms = getattr(settings, 'RAG_RERANK_DEADLINE_MS', 3000)
         if rerank_candidates and self.api_key:
             try:
                 debug_prompt = (
@@ -731,17 +964,21 @@ class RAGService:
                 rerank_start = time.time()
                 print(f"[RAG-DEBUG] Request ID {request_id}: Reranker prompt sent to Gemini 2.5 Flash.")
                 print(f"[RAG-DEBUG] Request ID {request_id}: Reranker user content preview: {user_content[:200]} ...")
-                client = genai.Client(api_key=self.api_key)
-                gemini_response = client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=f"{debug_prompt}\n\n{user_content}",
-                    config={
-                        "temperature": 0.0,
-                        "max_output_tokens": 128,
-                        "top_p": 0.8,
-                        "thinking_config": {"thinking_budget": 0},
-                    }
-                )
+                with latency_tracker.span('rerank', request_id):
+                    # A call that misses the deadline finishes in the background and is discarded
+                    gemini_response = get_llm_client().generate_content(
+                        self.api_key,
+                        model="gemini-2.5-flash",
+                        contents=f"{debug_prompt}\n\n{user_content}",
+                        config={
+                            "temperature": 0.0,
+                            "max_output_tokens": 128,
+                            "top_p": 0.8,
+                            "thinking_config": {"thinking_budget": 0},
+                        },
+                        deadline_ms=rerank_deadline_ms,
+                        hedge=True,
+                    )
                 rerank_elapsed = time.time() - rerank_start
                 import ast
                 content = gemini_response.text.strip() if hasattr(gemini_response, "text") and gemini_response.text else ""
@@ -752,12 +989,13 @@ class RAGService:
                     try:
                         selected_indices = ast.literal_eval(match.group(0))
                         if not isinstance(selected_indices, list):
-                            selected_indices = []
-                        # Only keep valid integer indices
-                        selected_indices = [i for i in selected_indices if isinstance(i, int)]
+                            selected_indices = None
+                        else:
+                            # Only keep valid integer indices
+                            selected_indices = [i for i in selected_indices if isinstance(i, int)]
                     except Exception as parse_e:
                         print(f"[RAG] Failed to parse Gemini reranker indices: {parse_e}")
-                        selected_indices = []
+                        selected_indices = None
                 else:
                     # Try to extract all numbers in brackets as fallback
                     numbers = re.findall(r'\[(.*?)\]', content)
@@ -767,19 +1005,18 @@ class RAGService:
                             selected_indices = [int(n.strip()) for n in nums if n.strip().isdigit()]
                         except Exception as fallback_e:
                             print(f"[RAG] Fallback parse failed: {fallback_e}")
-                            selected_indices = []
-                    else:
-                        selected_indices = []
+                            selected_indices = None
+            except TimeoutError:
+                print(f"[RAG] Gemini reranker missed the {rerank_deadline_ms / 1000.0:.1f}s deadline, using local ranking [Request ID: {request_id}]")
+                selected_indices = None
             except Exception as e:
                 print(f"[RAG] Gemini reranker failed: {e}")
-                selected_indices = []
-        else:
-            selected_indices = []
+                selected_indices = None
 
         # Select chunks based on LLM indices (1-based) with robust error handling
         selected_chunks = []
         try:
-            for idx in selected_indices:
+            for idx in selected_indices or []:
                 if isinstance(idx, int) and 1 <= idx <= len(rerank_candidates):
                     selected_chunks.append(rerank_candidates[idx-1])
                 else:
@@ -789,14 +1026,14 @@ class RAGService:
             print(f"[RAG] Exception during LLM index selection: {e}\n{traceback.format_exc()}")
             selected_chunks = []
 
-        # Only fallback to top-by-distance if there was an error (not when LLM returns [])
+        # Only fall back to the local ranking when the LLM gave no usable answer (not when it returns [])
         if not selected_chunks:
             if selected_indices == []:
                 # LLM returned [] (no chunks deemed relevant) — show no results, no fallback
                 pass  # selected_chunks remains empty
             else:
-                # LLM error or parse failure — fallback to top by distance
-                print("[RAG] Reranker fallback: LLM error or parse failure — using top by distance")
+                # No API key, LLM error / timeout or parse failure — use the local reranker order
+                print("[RAG] Reranker fallback: using local reranker order")
                 selected_chunks = rerank_candidates[:10]
 
         # Prepare documents and top_chunks for output
@@ -808,7 +1045,8 @@ class RAGService:
         all_files = list(set(c["meta"].get("file", c["meta"].get("pdf", "")) for c in selected_chunks if c["meta"].get("file") or c["meta"].get("pdf")))
         
         # Get view counts and ratings for all documents
-        doc_stats = self.get_document_stats(all_files)
+        with latency_tracker.span('doc_stats', request_id):
+            doc_stats = self.get_document_stats(all_files)
         
         for c in selected_chunks:
             meta = c["meta"]
@@ -872,49 +1110,15 @@ class RAGService:
         """
         if not file_names:
             return {}
-            
-        from django.db import connection
-        from collections import defaultdict
         
-        # Default stats for all files
-        stats = {f: {'view_count': 0, 'avg_rating': 0.0} for f in file_names}
+        from .document_stats import document_stats
         
         try:
-            # Use Django's database connection
-            with connection.cursor() as cursor:
-                # Get view counts
-                placeholders = ','.join(['%s'] * len(file_names))
-                cursor.execute(f"""
-                    SELECT 
-                        mv.file,
-                        COUNT(DISTINCT mv.id) as view_count
-                    FROM material_views mv
-                    WHERE mv.file IN ({placeholders})
-                    GROUP BY mv.file
-                """, file_names)
-                
-                for row in cursor.fetchall():
-                    if row[0] in stats:
-                        stats[row[0]]['view_count'] = int(row[1])
-                
-                # Get average ratings
-                cursor.execute(f"""
-                    SELECT 
-                        f.document_file,
-                        COALESCE(AVG(f.rating), 0) as avg_rating
-                    FROM feedback f
-                    WHERE f.document_file IN ({placeholders}) AND f.rating IS NOT NULL
-                    GROUP BY f.document_file
-                """, file_names)
-                
-                for row in cursor.fetchall():
-                    if row[0] in stats:
-                        stats[row[0]]['avg_rating'] = round(float(row[1]), 2) if row[1] else 0.0
-                        
+            # One primary-key batch on document_stats
+            return document_stats.summary(file_names)
         except Exception as e:
             print(f"[RAG] Error fetching document stats: {e}")
-        
-        return stats
+            return {f: {'view_count': 0, 'avg_rating': 0.0} for f in file_names}
     
     def get_available_filters(self):
         """Get available subjects and years from the database for filtering UI"""
@@ -949,138 +1153,84 @@ class RAGService:
             print(f"[RAG] Error getting filters: {e}")
             return {"subjects": [], "years": []}
     
-    def generate_overview(self, top_chunks, question, distance_threshold, conversation_history=None, relevance_info=None):
+    def generate_overview(self, top_chunks, question, distance_threshold, conversation_history=None, relevance_info=None, request_id=None,
+                          conversation_state=None):
         """Always generate AI overview using context-aware method with conversation context and improved prompt."""
         # Filter relevant chunks by distance threshold if available
         relevant_chunks = [c for c in top_chunks if c.get("score", 0) < distance_threshold] if top_chunks and "score" in top_chunks[0] else top_chunks
         if not relevant_chunks:
             return "No relevant information found for your query."
         # Use the context-aware overview method for all cases
-        return self._generate_with_context(relevant_chunks, question, conversation_history, relevance_info)
+        return self._generate_with_context(relevant_chunks, question, conversation_history, relevance_info, request_id,
+                                           conversation_state)
     
-    def _generate_with_context(self, top_chunks, question, conversation_history=None, relevance_info=None):
+    def extractive_overview(self, top_chunks, question, distance_threshold):
+        """Cited extractive summary of the relevant chunks (no LLM call), or None.
+
+        Returned with the search results as an instant preview, and used as
+        the overview when Gemini is rate-limited or times out.
+        """
+        relevant_chunks = [c for c in top_chunks if c.get("score", 0) < distance_threshold] if top_chunks and "score" in top_chunks[0] else top_chunks
+        if not relevant_chunks:
+            return None
+        summary = extractive_summarizer.summarize(relevant_chunks, question)
+        if not summary:
+            return None
+        return {"text": summary["text"], "sentences": summary["sentences"], "method": "extractive"}
+
+    def _degraded_overview(self, top_chunks, question, error_str):
+        """Extractive fallback text for rate-limit / timeout errors, or None"""
+        if 'rate' in error_str or '429' in error_str or 'quota' in error_str or 'resource' in error_str:
+            note = "The AI overview is unavailable right now because of high demand."
+        elif 'timeout' in error_str or 'timed out' in error_str:
+            note = "The AI overview took longer than expected."
+        else:
+            return None
+        summary = extractive_summarizer.summarize(top_chunks, question)
+        if not summary:
+            return None
+        print(f"[RAG] Serving extractive overview ({len(summary['sentences'])} sentences) after: {error_str[:80]}")
+        return f"{note} Here are the most relevant passages from the sources:\n\n{summary['text']}"
+
+    def _generate_with_context(self, top_chunks, question, conversation_history=None, relevance_info=None, request_id=None,
+                               conversation_state=None):
         """Generate AI overview with conversation context for follow-up questions"""
         if not top_chunks:
             return 'No results found for your query.'
         
-        # Build document metadata summary
-        doc_infos = []
-        seen_pdfs = []
-        pdf_to_number = {}
-        
-        for c in top_chunks:
-            meta = c['meta']
-            pdf_id = meta.get('pdf', meta.get('file', '[Unknown]'))
-            if pdf_id not in seen_pdfs:
-                seen_pdfs.append(pdf_id)
-                pdf_to_number[pdf_id] = len(seen_pdfs)
-                doc_infos.append(
-                    f"[{len(seen_pdfs)}] {meta.get('title','') or '[Unknown]'} "
-                    f"({meta.get('publication_year','') or 'N/A'}) "
-                    f"by {meta.get('author','') or '[Unknown]'}"
-                )
-            if len(doc_infos) >= 10:
-                break
-        
-        # Build chunk context with citations
-        chunk_context = "\n\n".join([
-            f"[{pdf_to_number[c['meta'].get('pdf', c['meta'].get('file', '[Unknown]'))]}] "
-            f"{c['chunk'][:1500]}"  # Limit chunk size for speed
-            for c in top_chunks if c['meta'].get('pdf', c['meta'].get('file', '[Unknown]')) in pdf_to_number
-        ])
-        
-        # Build conversation history context (if any)
-        history_context = ""
-        if conversation_history and len(conversation_history) > 0:
-            history_parts = []
-            for i, turn in enumerate(conversation_history[-3:], 1):  # Last 3 turns max
-                q = turn.get('query', '')
-                # Truncate previous answers to save tokens
-                a = turn.get('overview', '')[:500]
-                if a and len(turn.get('overview', '')) > 500:
-                    a += "..."
-                history_parts.append(f"User asked: {q}\nYou answered: {a}")
-            
-            history_context = (
-                "\n\nPREVIOUS CONVERSATION:\n"
-                + "\n---\n".join(history_parts)
-                + "\n\nThe user is now asking a follow-up question. Use the conversation context to understand references like 'it', 'this', 'that', 'compare', etc.\n"
-            )
-        
-        # Add relevance warning if content might not fully answer the question
-        relevance_warning = ""
-        if relevance_info and relevance_info.get('match_ratio', 1.0) < 0.5:
-            missing = ', '.join(list(relevance_info.get('missing_keywords', set()))[:5])
-            matched = ', '.join(list(relevance_info.get('matched_keywords', set()))[:5])
-            relevance_warning = f"""
-            RELEVANCE NOTE: The sources may not fully address the user's question.
-            - Keywords from query found in sources: {matched if matched else 'few/none'}
-            - Keywords from query NOT found in sources: {missing if missing else 'none'}
-            - If sources don't contain relevant information, clearly state this limitation.
-            """
-        
-        # Construct the full prompt
-        prompt = f"""You are an academic research assistant analyzing thesis documents.
-
-        AVAILABLE SOURCES:
-        {chr(10).join(doc_infos)}
-
-        CONTEXT FROM SOURCES:
-        {chunk_context}{history_context}{relevance_warning}
-        USER QUESTION: {question}
-
-        INSTRUCTIONS:
-
-        1. Carefully evaluate whether the provided source content contains explicit information that answers the user's question.
-
-        2. If the sources contain directly relevant information:
-        - Answer strictly using only the provided source content.
-        - Do NOT add outside knowledge.
-        - Do NOT make assumptions or logical leaps beyond what is written.
-        - Combine information across sources only when the connection is explicitly supported.
-        - Write 2–4 clear academic paragraphs (adjust length based on complexity).
-        - End every factual sentence with its citation in this format: [1] or [1] [2].
-        - NEVER place citations in the middle of a sentence.
-        - NEVER use combined citation format like [1, 2].
-
-        3. If the sources do NOT contain sufficient information:
-        - Begin with: "The available sources do not directly address your specific question about [topic]."
-        - Clearly explain what the sources DO discuss.
-        - Suggest how the user might refine their query.
-        - Cite sources when describing their contents.
-        - Do NOT generate information not present in the sources.
-
-        4. If the answer is partially supported:
-        - Clearly distinguish between supported and unsupported parts.
-        - Explicitly state which aspects are not covered in the sources.
-
-        5. Maintain an objective academic tone.
-
-        If you are uncertain whether a claim is supported by the sources, do not include it.
-
-
-        Answer:"""
+        # Sources, history and instructions packed under the prompt token budget
+        built = prompt_builder.build(top_chunks, question, conversation_history, relevance_info, conversation_state)
+        prompt, seen_pdfs = built.prompt, built.seen_pdfs
         
         # Call Gemini API
-        client = genai.Client(api_key=self.api_key)
-        
         print(f"DEBUG: Generating with conversation context ({len(conversation_history or [])} previous turns)")
-        print(f"DEBUG: Prompt length: {len(prompt)} characters")
+        print(f"[RAG] Prompt tokens: {built.stats} [Request ID: {request_id}]")
         
+        # Pick the model tier and output budget from the query, sources and conversation depth
+        route = model_router.route(question, top_chunks, conversation_history)
+        generation_start = time.perf_counter()
         try:
-            response = client.models.generate_content(
-                model="gemini-3-flash-preview",
+            response = get_llm_client().generate_content(
+                self.api_key,
+                model=route.model,
                 contents=prompt,
                 config={
                     "temperature": 0.3,
-                    "max_output_tokens": 2048,
+                    "max_output_tokens": route.max_output_tokens,
                     "top_p": 0.9,
                     "thinking_config": {"thinking_budget": 0},
-                }
+                },
+                deadline_ms=getattr(settings, 'LLM_GENERATION_DEADLINE_MS', 45000),
             )
         except Exception as e:
             print(f"FAILED. Error details: {e}")
+            model_router.log_outcome(route, request_id, (time.perf_counter() - generation_start) * 1000, error=str(e),
+                                     prompt_tokens=built.stats['prompt_tokens'])
             error_str = str(e).lower()
+            # Degraded mode: answer from the sources themselves instead of failing
+            degraded = self._degraded_overview(top_chunks, question, error_str)
+            if degraded:
+                return degraded
             if 'rate' in error_str or '429' in error_str or 'quota' in error_str or 'resource' in error_str:
                 raise Exception("We're experiencing high demand right now. Please try again in a moment, "
                                 "or contact us at library@stii.dost.gov.ph if the issue persists.")
@@ -1112,127 +1262,58 @@ class RAGService:
         
         print(f"DEBUG: Response length: {len(raw_answer)} characters")
         
+        model_router.log_outcome(route, request_id, (time.perf_counter() - generation_start) * 1000, raw_answer, finish_reason,
+                                 prompt_tokens=built.stats['prompt_tokens'])
+        
         # Post-process answer (reference rearrangement logic)
         answer = self._process_answer_references(raw_answer, seen_pdfs, top_chunks)
         
         return answer
     
-    def generate_overview_stream(self, top_chunks, question, distance_threshold, conversation_history=None, relevance_info=None):
-        """Stream AI overview token-by-token using Gemini streaming API. Yields (event, data) tuples."""
+    def generate_overview_stream(self, top_chunks, question, distance_threshold, conversation_history=None, relevance_info=None, request_id=None,
+                                 conversation_state=None):
+        """Stream AI overview token-by-token using Gemini streaming API. Yields (event, data) tuples.
+
+        If request_id is given, time-to-first-token and total generation time
+        are recorded as latency spans for that request.
+        """
         # Filter relevant chunks
         relevant_chunks = [c for c in top_chunks if c.get("score", 0) < distance_threshold] if top_chunks and "score" in top_chunks[0] else top_chunks
         if not relevant_chunks:
             yield ("done", "No relevant information found for your query.")
             return
 
-        # Build the same prompt as _generate_with_context
-        doc_infos = []
-        seen_pdfs = []
-        pdf_to_number = {}
-        for c in relevant_chunks:
-            meta = c['meta']
-            pdf_id = meta.get('pdf', meta.get('file', '[Unknown]'))
-            if pdf_id not in seen_pdfs:
-                seen_pdfs.append(pdf_id)
-                pdf_to_number[pdf_id] = len(seen_pdfs)
-                doc_infos.append(
-                    f"[{len(seen_pdfs)}] {meta.get('title','') or '[Unknown]'} "
-                    f"({meta.get('publication_year','') or 'N/A'}) "
-                    f"by {meta.get('author','') or '[Unknown]'}"
-                )
-            if len(doc_infos) >= 10:
-                break
-
-        chunk_context = "\n\n".join([
-            f"[{pdf_to_number[c['meta'].get('pdf', c['meta'].get('file', '[Unknown]'))]}] "
-            f"{c['chunk'][:1500]}"
-            for c in relevant_chunks if c['meta'].get('pdf', c['meta'].get('file', '[Unknown]')) in pdf_to_number
-        ])
-
-        history_context = ""
-        if conversation_history and len(conversation_history) > 0:
-            history_parts = []
-            for i, turn in enumerate(conversation_history[-3:], 1):
-                q = turn.get('query', '')
-                a = turn.get('overview', '')[:500]
-                if a and len(turn.get('overview', '')) > 500:
-                    a += "..."
-                history_parts.append(f"User asked: {q}\nYou answered: {a}")
-            history_context = (
-                "\n\nPREVIOUS CONVERSATION:\n"
-                + "\n---\n".join(history_parts)
-                + "\n\nThe user is now asking a follow-up question. Use the conversation context to understand references like 'it', 'this', 'that', 'compare', etc.\n"
-            )
-
-        relevance_warning = ""
-        if relevance_info and relevance_info.get('match_ratio', 1.0) < 0.5:
-            missing = ', '.join(list(relevance_info.get('missing_keywords', set()))[:5])
-            matched = ', '.join(list(relevance_info.get('matched_keywords', set()))[:5])
-            relevance_warning = f"""
-            RELEVANCE NOTE: The sources may not fully address the user's question.
-            - Keywords from query found in sources: {matched if matched else 'few/none'}
-            - Keywords from query NOT found in sources: {missing if missing else 'none'}
-            - If sources don't contain relevant information, clearly state this limitation.
-            """
-
-        prompt = f"""You are an academic research assistant analyzing thesis documents.
-
-        AVAILABLE SOURCES:
-        {chr(10).join(doc_infos)}
-
-        CONTEXT FROM SOURCES:
-        {chunk_context}{history_context}{relevance_warning}
-        USER QUESTION: {question}
-
-        INSTRUCTIONS:
-
-        1. Carefully evaluate whether the provided source content contains explicit information that answers the user's question.
-
-        2. If the sources contain directly relevant information:
-        - Answer strictly using only the provided source content.
-        - Do NOT add outside knowledge.
-        - Do NOT make assumptions or logical leaps beyond what is written.
-        - Combine information across sources only when the connection is explicitly supported.
-        - Write 2–4 clear academic paragraphs (adjust length based on complexity).
-        - End every factual sentence with its citation in this format: [1] or [1] [2].
-        - NEVER place citations in the middle of a sentence.
-        - NEVER use combined citation format like [1, 2].
-
-        3. If the sources do NOT contain sufficient information:
-        - Begin with: "The available sources do not directly address your specific question about [topic]."
-        - Clearly explain what the sources DO discuss.
-        - Suggest how the user might refine their query.
-        - Cite sources when describing their contents.
-        - Do NOT generate information not present in the sources.
+        built = prompt_builder.build(relevant_chunks, question, conversation_history, relevance_info, conversation_state)
+        prompt, seen_pdfs = built.prompt, built.seen_pdfs
 
-        4. If the answer is partially supported:
-        - Clearly distinguish between supported and unsupported parts.
-        - Explicitly state which aspects are not covered in the sources.
-
-        5. Maintain an objective academic tone.
-
-        If you are uncertain whether a claim is supported by the sources, do not include it.
-
-
-        Answer:"""
-
-        client = genai.Client(api_key=self.api_key)
-        print(f"DEBUG: Streaming generation with {len(conversation_history or [])} previous turns, prompt length: {len(prompt)}")
+        print(f"DEBUG: Streaming generation with {len(conversation_history or [])} previous turns")
+        print(f"[RAG] Prompt tokens: {built.stats} [Request ID: {request_id}]")
 
+        route = model_router.route(question, relevant_chunks, conversation_history)
+        generation_start = time.perf_counter()
+        first_token_recorded = False
+        first_token_ms = None
+        finish_reason = None
         try:
             raw_answer = ""
-            response_stream = client.models.generate_content_stream(
-                model="gemini-3-flash-preview",
+            response_stream = get_llm_client().generate_content_stream(
+                self.api_key,
+                model=route.model,
                 contents=prompt,
                 config={
                     "temperature": 0.3,
-                    "max_output_tokens": 2048,
+                    "max_output_tokens": route.max_output_tokens,
                     "top_p": 0.9,
                     "thinking_config": {"thinking_budget": 0},
-                }
+                },
+                first_token_deadline_ms=getattr(settings, 'LLM_FIRST_TOKEN_DEADLINE_MS', 15000),
+                deadline_ms=getattr(settings, 'LLM_GENERATION_DEADLINE_MS', 45000),
             )
             for chunk in response_stream:
                 text = ""
+                candidates = getattr(chunk, 'candidates', None)
+                if candidates and getattr(candidates[0], 'finish_reason', None):
+                    finish_reason = candidates[0].finish_reason
                 try:
                     text = chunk.text or ""
                 except Exception:
@@ -1241,17 +1322,33 @@ class RAGService:
                             if hasattr(part, 'text'):
                                 text += part.text
                 if text:
+                    if not first_token_recorded:
+                        first_token_recorded = True
+                        first_token_ms = (time.perf_counter() - generation_start) * 1000
+                        latency_tracker.record('generation_first_token', first_token_ms, request_id)
                     raw_answer += text
                     yield ("chunk", text)
 
             # Post-process the full answer for reference rearrangement
             final_answer = self._process_answer_references(raw_answer.strip(), seen_pdfs, relevant_chunks)
+            generation_ms = (time.perf_counter() - generation_start) * 1000
+            latency_tracker.record('generation_total', generation_ms, request_id)
+            model_router.log_outcome(route, request_id, generation_ms, raw_answer, finish_reason, first_token_ms,
+                                     prompt_tokens=built.stats['prompt_tokens'])
             yield ("done", final_answer)
 
         except Exception as e:
             print(f"STREAMING FAILED: {e}")
+            model_router.log_outcome(route, request_id, (time.perf_counter() - generation_start) * 1000,
+                                     first_token_ms=first_token_ms, error=str(e),
+                                     prompt_tokens=built.stats['prompt_tokens'])
             # Never expose raw error details to users
             error_str = str(e).lower()
+            # Degraded mode: the final text replaces any partial stream
+            degraded = self._degraded_overview(relevant_chunks, question, error_str)
+            if degraded:
+                yield ("done", degraded)
+                return
             if 'rate' in error_str or '429' in error_str or 'quota' in error_str or 'resource' in error_str:
                 user_msg = ("We're experiencing high demand right now. Please try again in a moment, "
                             "or contact us at library@stii.dost.gov.ph if the issue persists.")
@@ -1547,51 +1644,91 @@ class RAGService:
         Returns:
             dict: Document metadata including title, author, year, etc., or None if not found
         """
+        metadata = self.get_documents_metadata([file_path]).get(file_path)
+        if metadata is None:
+            print(f"No metadata found for {file_path}")
+        return metadata
+
+    def get_documents_metadata(self, file_paths):
+        """
+        Batch version of get_document_metadata: {file: metadata} for the files found.
+
+        One get by id on the document index (one entry per thesis); files it
+        doesn't have yet (document index still being backfilled) are looked
+        up in the chunk index with a single $in query.
+        """
+        files = list(dict.fromkeys(f for f in file_paths if f))
+        found = {}
+        if not files:
+            return found
         try:
-            # Query ChromaDB for chunks from this specific file
-            results = self.collection.get(
-                where={"file": file_path},
-                limit=1,  # We only need one chunk to get the metadata
-                include=["metadatas"]
-            )
-            
-            if results and results["metadatas"] and len(results["metadatas"]) > 0:
-                meta = results["metadatas"][0]
-                
-                # Format metadata with proper capitalization
-                author = format_metadata_capitalization(
-                    meta.get("author", "[Unknown Author]"), 
-                    field_type='author'
-                )
-                title = format_metadata_capitalization(
-                    meta.get("title", "[Unknown Title]"),
-                    field_type='title'
-                )
-                university = format_metadata_capitalization(
-                    meta.get("university", "Unknown University"),
-                    field_type='university'
-                )
-                degree = format_metadata_capitalization(
-                    meta.get("degree", "Thesis"),
-                    field_type='degree'
-                )
-                
-                return {
-                    "title": title,
-                    "author": author,
-                    "year": meta.get("publication_year", "N/A"),
-                    "abstract": meta.get("abstract", "No abstract available"),
-                    "file": file_path,
-                    "degree": degree,
-                    "subjects": meta.get("subjects", ""),
-                    "school": university,
-                    "university": university,
-                    "call_no": meta.get("call_no", "")
-                }
-            else:
-                print(f"No metadata found for {file_path}")
-                return None
-                
+            if self.document_collection is not None and self.document_collection.count():
+                results = self.document_collection.get(ids=files, include=["metadatas"])
+                for meta in results.get("metadatas") or []:
+                    if meta and meta.get("file") in files:
+                        found.setdefault(meta["file"], meta)
+            missing = [f for f in files if f not in found]
+            if missing:
+                results = self.collection.get(where={"file": {"$in": missing}}, include=["metadatas"])
+                for meta in results.get("metadatas") or []:
+                    if meta and meta.get("file") in missing:
+                        found.setdefault(meta["file"], meta)
         except Exception as e:
-            print(f"Error getting metadata for {file_path}: {str(e)}")
-            return None
+            print(f"Error getting metadata for {len(files)} files: {str(e)}")
+        return {file_path: self._format_document_metadata(file_path, meta) for file_path, meta in found.items()}
+
+    def get_all_documents_metadata(self, batch_size=5000):
+        """
+        {file: metadata} for every thesis in the index, paged like build_document_index.
+
+        Reads the document index (one entry per thesis); while that is still
+        being backfilled, the theses are collected from the chunk index.
+        """
+        source = self.document_collection
+        if source is None or not source.count():
+            source = self.collection
+        found = {}
+        offset = 0
+        while True:
+            batch = source.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not len(batch["ids"]):
+                break
+            for meta in batch["metadatas"]:
+                file_name = (meta or {}).get("file", (meta or {}).get("pdf", ""))
+                if file_name:
+                    found.setdefault(file_name, meta)
+            offset += len(batch["ids"])
+        return {file_path: self._format_document_metadata(file_path, meta) for file_path, meta in found.items()}
+
+    @staticmethod
+    def _format_document_metadata(file_path, meta):
+        # Format metadata with proper capitalization
+        author = format_metadata_capitalization(
+            meta.get("author", "[Unknown Author]"), 
+            field_type='author'
+        )
+        title = format_metadata_capitalization(
+            meta.get("title", "[Unknown Title]"),
+            field_type='title'
+        )
+        university = format_metadata_capitalization(
+            meta.get("university", "Unknown University"),
+            field_type='university'
+        )
+        degree = format_metadata_capitalization(
+            meta.get("degree", "Thesis"),
+            field_type='degree'
+        )
+        
+        return {
+            "title": title,
+            "author": author,
+            "year": meta.get("publication_year", "N/A"),
+            "abstract": meta.get("abstract", "No abstract available"),
+            "file": file_path,
+            "degree": degree,
+            "subjects": meta.get("subjects", ""),
+            "school": university,
+            "university": university,
+            "call_no": meta.get("call_no", "")
+        }
@@ -16,6 +16,14 @@ Usage:
     
     python rag_api/run_accuracy_benchmark.py
 
+    Offline / reproducible runs (no network, no Gemini/HF quota):
+    python rag_api/run_accuracy_benchmark.py --record   # once, with API keys
+    python rag_api/run_accuracy_benchmark.py --replay   # any time after
+
+    Compressed vector search (int8 / PCA first stage + exact re-scoring):
+    python rag_api/run_accuracy_benchmark.py --compression
+    python rag_api/run_accuracy_benchmark.py --compression --compression-configs int8,pca128+int8 --k 10
+
 Author: LitPath AI Team
 Date: December 2025
 """
@@ -23,16 +31,25 @@ Date: December 2025
 import os
 import sys
 import json
+import time
+import shutil
+import argparse
+import tempfile
 from datetime import datetime
 
+import numpy as np
+
 # Django setup
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'litpath_backend.settings')
 
 import django
 django.setup()
 
-from rag_api.rag_service import RAGService
+from django.conf import settings
+from rag_api.rag_service import RAGService, l2_normalize
 from rag_api.accuracy_metrics import AccuracyMetrics
+from rag_api.llm_transport import configure_transport
+from rag_api.vector_store import NumpyVectorStore
 
 # ============= TEST QUERIES WITH EXPECTED RELEVANT DOCUMENTS =============
 # 
@@ -451,7 +468,172 @@ def run_benchmark(
     return output
 
 
+def parse_compression_config(name):
+    """'int8', 'pca256', 'pca128+int8' -> (quantization, reduced_dims)"""
+    quantization, dims = "none", 0
+    for part in name.split("+"):
+        part = part.strip().lower()
+        if part == "int8":
+            quantization = "int8"
+        elif part.startswith("pca"):
+            dims = int(part[3:])
+        elif part not in ("", "float32"):
+            raise ValueError(f"Unknown compression option {part!r}")
+    return quantization, dims
+
+
+def run_compression_benchmark(
+    test_queries: list = None,
+    configs=("int8", "pca256", "pca256+int8", "pca128+int8", "pca64+int8"),
+    k: int = 10,
+    rescore_factor: int = 4,
+    repeats: int = 5,
+):
+    """
+    Compare compressed first-stage search against exact float32 search.
+
+    The active index is copied into a scratch NumpyVectorStore; each
+    configuration fits its PCA / int8 parameters on those vectors and answers
+    the test queries with a shortlist re-scored on the float vectors.
+    Reports, per configuration:
+      - recall@k against exact float32 search (chunk ids)
+      - relevant-document recall@k (labeled queries) next to the exact value
+      - bytes scanned by stage one vs the float32 matrix
+      - query latency p50/p95 (vector search only, no LLM calls)
+    """
+    if test_queries is None:
+        test_queries = TEST_QUERIES
+
+    print("=" * 70)
+    print("LitPath AI - Compressed Vector Search Benchmark")
+    print("=" * 70)
+
+    RAGService.initialize()
+    rag = RAGService()
+    if RAGService._index_thread is not None:
+        RAGService._index_thread.join()
+
+    queries = [t["query"] for t in test_queries]
+    embeddings = np.array([l2_normalize(e) for e in rag.embedder.encode(queries, convert_to_numpy=True)], dtype=np.float32)
+
+    workdir = tempfile.mkdtemp(prefix="litpath_compression_")
+    try:
+        base = NumpyVectorStore(workdir)
+        offset = 0
+        while True:
+            batch = rag.collection.get(include=["embeddings", "documents", "metadatas"], limit=5000, offset=offset)
+            if not len(batch["ids"]):
+                break
+            base.add(batch["embeddings"], batch["documents"], batch["metadatas"], batch["ids"])
+            offset += len(batch["ids"])
+        chunk_count = base.count()
+        print(f"Chunks: {chunk_count}, dim: {base.dim}, queries: {len(queries)}, k: {k}")
+
+        def measure(store):
+            durations, ids, docs = [], [], []
+            for emb in embeddings:
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    res = store.query(query_embeddings=[emb], n_results=k, include=["metadatas"])
+                    durations.append((time.perf_counter() - start) * 1000)
+                ids.append(res["ids"][0])
+                docs.append([m.get("file") for m in res["metadatas"][0]])
+            return durations, ids, docs
+
+        def doc_recall(docs):
+            recalls = [
+                len(set(found) & set(t["relevant_docs"])) / len(t["relevant_docs"])
+                for found, t in zip(docs, test_queries) if t.get("relevant_docs")
+            ]
+            return round(float(np.mean(recalls)), 4) if recalls else None
+
+        float_bytes = base.count() * base.dim * 4 + base.count() * 4
+        exact_ms, exact_ids, exact_docs = measure(base)
+        rows = [{
+            "config": "float32",
+            "recall_at_k": 1.0,
+            "relevant_doc_recall_at_k": doc_recall(exact_docs),
+            "stage_one_bytes": float_bytes,
+            "memory_ratio": 1.0,
+            "latency_p50_ms": round(float(np.percentile(exact_ms, 50)), 3),
+            "latency_p95_ms": round(float(np.percentile(exact_ms, 95)), 3),
+        }]
+
+        for name in configs:
+            quantization, dims = parse_compression_config(name)
+            store = NumpyVectorStore(workdir, quantization=quantization, reduced_dims=dims, rescore_factor=rescore_factor)
+            start = time.perf_counter()
+            store.build_compression()
+            build_ms = (time.perf_counter() - start) * 1000
+            durations, ids, docs = measure(store)
+            recall = [len(set(got) & set(exact)) / max(1, len(exact)) for got, exact in zip(ids, exact_ids)]
+            rows.append({
+                "config": name,
+                "recall_at_k": round(float(np.mean(recall)), 4),
+                "relevant_doc_recall_at_k": doc_recall(docs),
+                "stage_one_bytes": store.compressed_bytes(),
+                "memory_ratio": round(store.compressed_bytes() / float_bytes, 4),
+                "latency_p50_ms": round(float(np.percentile(durations, 50)), 3),
+                "latency_p95_ms": round(float(np.percentile(durations, 95)), 3),
+                "build_ms": round(build_ms, 1),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'config':<14}{'recall@' + str(k):>10}{'doc recall':>12}{'memory':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    print("-" * 66)
+    for r in rows:
+        doc = r["relevant_doc_recall_at_k"]
+        print(f"{r['config']:<14}{r['recall_at_k']:>10}{doc if doc is not None else 'N/A':>12}"
+              f"{r['memory_ratio']:>9.1%}{r['latency_p50_ms']:>10}{r['latency_p95_ms']:>10}")
+
+    output = {
+        "benchmark_date": datetime.now().isoformat(),
+        "config": {"k": k, "rescore_factor": rescore_factor, "queries": len(queries), "chunks": chunk_count},
+        "results": rows,
+    }
+    output_path = os.path.join(
+        os.path.dirname(__file__),
+        f"compression_benchmark_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults saved to: {output_path}")
+    return output
+
+
 if __name__ == "__main__":
-    # Run benchmark with keyword-based hallucination detection (faster)
-    # Set use_nli=True for more accurate but slower detection
-    results = run_benchmark(use_nli=False, verbose=True)
+    parser = argparse.ArgumentParser(description="LitPath AI accuracy benchmark")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", action="store_true", help="Call Gemini/HF and record responses to cassettes")
+    mode.add_argument("--replay", action="store_true", help="Serve Gemini/HF responses from cassettes (offline)")
+    parser.add_argument("--cassette-dir", default=settings.LLM_CASSETTE_DIR, help="Cassette directory")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated upstream latency in replay mode")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Simulated upstream error rate in replay mode")
+    parser.add_argument("--nli", action="store_true", help="Use NLI hallucination detection (slower)")
+    parser.add_argument("--compression", action="store_true",
+                        help="Benchmark int8 / PCA compressed vector search instead of the full pipeline")
+    parser.add_argument("--compression-configs", default="int8,pca256,pca256+int8,pca128+int8,pca64+int8",
+                        help="Comma-separated configs: int8, pcaN, pcaN+int8")
+    parser.add_argument("--k", type=int, default=10, help="Results per query for the compression benchmark")
+    parser.add_argument("--rescore-factor", type=int, default=4, help="Shortlist size = factor x k")
+    args = parser.parse_args()
+
+    if args.record or args.replay:
+        configure_transport(
+            mode="record" if args.record else "replay",
+            cassette_dir=args.cassette_dir,
+            latency_ms=args.latency_ms,
+            error_rate=args.error_rate,
+        )
+
+    if args.compression:
+        run_compression_benchmark(
+            configs=[c for c in args.compression_configs.split(",") if c.strip()],
+            k=args.k,
+            rescore_factor=args.rescore_factor,
+        )
+    else:
+        # Run benchmark with keyword-based hallucination detection (faster)
+        # Use --nli for more accurate but slower detection
+        results = run_benchmark(use_nli=args.nli, verbose=True)
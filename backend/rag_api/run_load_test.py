@@ -0,0 +1,361 @@
+"""
+Load Test / Latency Benchmark for LitPath AI
+============================================
+
+Drives the search, streaming search, filters and dashboard endpoints at
+increasing concurrency and reports, per endpoint and concurrency level:
+- Requests per second
+- Latency p50 / p95 / p99
+- Time-to-first-token (streaming search only)
+- Error rate
+
+By default requests run in-process through Django's test client and Gemini /
+HF calls are served by the stub transport (rag_api/llm_transport.py) with
+realistic per-model latency, so no network or API quota is needed. Use
+--base-url to load-test a running server instead (start it with
+LLM_TRANSPORT_MODE=stub to keep upstream services out of the picture).
+
+Results are written as JSON so runs can be compared over time (--baseline).
+
+Usage:
+    cd backend
+    python rag_api/run_load_test.py --concurrency 1,4,16 --requests 50
+    python rag_api/run_load_test.py --endpoints search,search_stream --error-rate 0.02
+    python rag_api/run_load_test.py --base-url http://localhost:8000 --concurrency 8
+    python rag_api/run_load_test.py --baseline load_test_results_20251201_120000.json
+
+Note: dashboard endpoints query the configured database, so point
+DATABASE_URL at a disposable copy when load-testing them.
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import threading
+import contextlib
+import urllib.request
+import urllib.error
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Django setup
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'litpath_backend.settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.test import Client
+from rag_api.llm_transport import configure_transport
+
+
+# Queries rotated across requests (mix of topic, subject and year-filtered searches)
+LOAD_TEST_QUERIES = [
+    "rice genotypes salt stress tolerance salinity",
+    "effects of climate change on crop yield in the Philippines",
+    "machine learning for disease detection in plants",
+    "aquaculture feed formulation for tilapia",
+    "biology thesis about mangrove ecosystems",
+    "theses from 2018 to 2022 about renewable energy",
+    "coconut pest management strategies",
+    "soil microbial diversity in upland farms",
+]
+
+# name -> (method, path, streaming)
+ENDPOINTS = {
+    'search': ('POST', '/api/search/', False),
+    'search_stream': ('POST', '/api/search/stream/', True),
+    'filters': ('GET', '/api/filters/', False),
+    'dashboard_kpi': ('GET', '/api/dashboard/kpi/', False),
+    'dashboard_top_theses': ('GET', '/api/dashboard/top-theses/', False),
+    'dashboard_trending_topics': ('GET', '/api/dashboard/trending-topics/', False),
+    'dashboard_usage_by_category': ('GET', '/api/dashboard/usage-by-category/', False),
+    'dashboard_monthly_trends': ('GET', '/api/dashboard/monthly-trends/', False),
+    'dashboard_daily_trends': ('GET', '/api/dashboard/daily-trends/', False),
+    'dashboard_citation_stats': ('GET', '/api/dashboard/citation-stats/', False),
+    'dashboard_least_browsed': ('GET', '/api/dashboard/least-browsed/', False),
+    'dashboard_dormant_count': ('GET', '/api/dashboard/dormant-count/', False),
+}
+
+
+def percentile(values, q):
+    """Percentile in milliseconds rounded for the report (None when empty)"""
+    if not values:
+        return None
+    return round(float(np.percentile(values, q)), 2)
+
+
+def _first_token_from_sse(lines, started):
+    """Consume an SSE stream; return (ttft_ms, error) after reading it fully"""
+    ttft_ms = None
+    error = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        for part in line.split('\n'):
+            if not part.startswith('data: '):
+                continue
+            try:
+                event = json.loads(part[6:])
+            except ValueError:
+                continue
+            if event.get('type') == 'chunk' and ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            elif event.get('type') == 'error':
+                error = event.get('content') or 'stream error'
+    return ttft_ms, error
+
+
+class InProcessRunner:
+    """Sends requests through Django's test client (one client per thread)"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            host = next((h for h in settings.ALLOWED_HOSTS if h and '*' not in h), 'localhost').lstrip('.')
+            self._local.client = Client(HTTP_HOST=host, raise_request_exception=False)
+        return self._local.client
+
+    def send(self, method, path, body, streaming):
+        client = self._client()
+        started = time.perf_counter()
+        if method == 'POST':
+            response = client.post(path, data=json.dumps(body), content_type='application/json')
+        else:
+            response = client.get(path)
+
+        ttft_ms = None
+        error = None
+        if response.status_code >= 400:
+            error = f"HTTP {response.status_code}"
+        if getattr(response, 'streaming', False):
+            ttft_ms, stream_error = _first_token_from_sse(response.streaming_content, started)
+            error = error or stream_error
+        elif streaming:
+            # Streaming endpoint answered with plain JSON (e.g. still indexing)
+            error = error or "no stream"
+        else:
+            _ = response.content
+        return (time.perf_counter() - started) * 1000, ttft_ms, error
+
+
+class HTTPRunner:
+    """Sends requests to a running server over HTTP"""
+
+    def __init__(self, base_url, timeout=300):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def send(self, method, path, body, streaming):
+        data = json.dumps(body).encode('utf-8') if method == 'POST' else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method,
+            headers={'Content-Type': 'application/json'}
+        )
+        started = time.perf_counter()
+        ttft_ms = None
+        error = None
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                if streaming and 'text/event-stream' in response.headers.get('Content-Type', ''):
+                    ttft_ms, error = _first_token_from_sse(response, started)
+                else:
+                    response.read()
+                    if streaming:
+                        error = "no stream"
+        except urllib.error.HTTPError as e:
+            error = f"HTTP {e.code}"
+        except Exception as e:
+            error = str(e)
+        return (time.perf_counter() - started) * 1000, ttft_ms, error
+
+
+def run_level(runner, endpoint, concurrency, total_requests):
+    """Run `total_requests` requests against one endpoint with N workers"""
+    method, path, streaming = ENDPOINTS[endpoint]
+    latencies, ttfts, errors = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            body = {'question': LOAD_TEST_QUERIES[i % len(LOAD_TEST_QUERIES)]}
+            try:
+                latency_ms, ttft_ms, error = runner.send(method, path, body, streaming)
+            except Exception as e:
+                latency_ms, ttft_ms, error = None, None, str(e)
+            with lock:
+                if latency_ms is not None:
+                    latencies.append(latency_ms)
+                if ttft_ms is not None:
+                    ttfts.append(ttft_ms)
+                if error:
+                    errors.append(error)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall_seconds = time.perf_counter() - started
+
+    result = {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'wall_seconds': round(wall_seconds, 3),
+        'requests_per_second': round(total_requests / wall_seconds, 2) if wall_seconds else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'mean': round(float(np.mean(latencies)), 2) if latencies else None,
+        },
+        'error_rate': round(len(errors) / total_requests, 4) if total_requests else 0.0,
+        'sample_errors': sorted(set(errors))[:5],
+    }
+    if streaming:
+        result['ttft_ms'] = {
+            'p50': percentile(ttfts, 50),
+            'p95': percentile(ttfts, 95),
+            'p99': percentile(ttfts, 99),
+        }
+    return result
+
+
+def prepare_workdir(workdir):
+    """Point RAG at a scratch index + theses copy.
+
+    Stub embeddings must not end up in the production index, and indexing
+    rewrites indexed_files.json inside the theses folder, so both live in
+    the scratch directory.
+    """
+    theses_dir = os.path.join(workdir, 'theses')
+    os.makedirs(theses_dir, exist_ok=True)
+    for name in os.listdir(settings.RAG_THESES_FOLDER):
+        src = os.path.join(settings.RAG_THESES_FOLDER, name)
+        dst = os.path.join(theses_dir, name)
+        if name.endswith('.txt') and not os.path.exists(dst):
+            shutil.copy2(src, dst)
+    settings.RAG_THESES_FOLDER = theses_dir
+    settings.RAG_CHROMADB_PATH = os.path.join(workdir, 'chromadb')
+
+
+def warm_up_index():
+    """Initialize RAG in-process and wait for any background indexing"""
+    from rag_api.rag_service import RAGService
+    RAGService.ensure_initialized()
+    while RAGService.is_indexing():
+        print("[LOAD] Waiting for background indexing to finish...", file=sys.stderr)
+        time.sleep(5)
+
+
+def compare_with_baseline(results, baseline_path):
+    """Print p95 / rps deltas against a previous results file"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['endpoint'], r['concurrency']): r for r in baseline.get('results', [])}
+    print(f"\nComparison with {baseline_path}:")
+    for r in results:
+        old = previous.get((r['endpoint'], r['concurrency']))
+        if not old or not old['latency_ms']['p95'] or not r['latency_ms']['p95']:
+            continue
+        p95_delta = (r['latency_ms']['p95'] - old['latency_ms']['p95']) / old['latency_ms']['p95'] * 100
+        rps_delta = ((r['requests_per_second'] or 0) - (old['requests_per_second'] or 0))
+        print(f"  {r['endpoint']:<28} c={r['concurrency']:<4} p95 {p95_delta:+6.1f}%   rps {rps_delta:+.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LitPath AI load test / latency benchmark")
+    parser.add_argument("--endpoints", default="search,search_stream,filters,dashboard_kpi,dashboard_top_theses,dashboard_trending_topics",
+                        help=f"Comma-separated endpoints ({', '.join(ENDPOINTS)}) or 'all'")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per endpoint per concurrency level")
+    parser.add_argument("--base-url", help="Load-test a running server instead of running in-process")
+    parser.add_argument("--live", action="store_true", help="In-process: call real Gemini/HF instead of stubs")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for stub upstream latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stub upstream error rate")
+    parser.add_argument("--workdir", help="Scratch dir for the stub index and theses copy (default: <RAG_CHROMADB_PATH>_loadtest)")
+    parser.add_argument("--output", help="Results file (default: load_test_results_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show application logs during the run")
+    args = parser.parse_args()
+
+    endpoints = list(ENDPOINTS) if args.endpoints == 'all' else [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+
+    if args.base_url:
+        runner = HTTPRunner(args.base_url)
+        mode = 'http'
+    else:
+        runner = InProcessRunner()
+        mode = 'live' if args.live else 'stub'
+        if not args.live:
+            prepare_workdir(args.workdir or f"{settings.RAG_CHROMADB_PATH}_loadtest")
+            configure_transport(mode='stub', latency_scale=0.0)
+            warm_up_index()
+            configure_transport(mode='stub', latency_scale=args.latency_scale, error_rate=args.error_rate)
+        else:
+            warm_up_index()
+
+    print("=" * 70)
+    print("LitPath AI - Load Test")
+    print("=" * 70)
+    print(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Mode: {mode}  Endpoints: {', '.join(endpoints)}  Concurrency: {levels}  Requests/level: {args.requests}")
+    print("=" * 70)
+
+    results = []
+    for endpoint in endpoints:
+        for concurrency in levels:
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with quiet:
+                result = run_level(runner, endpoint, concurrency, args.requests)
+            results.append(result)
+            ttft = result.get('ttft_ms', {}).get('p50')
+            print(
+                f"{endpoint:<28} c={concurrency:<4} rps={result['requests_per_second']:<8} "
+                f"p50={result['latency_ms']['p50']}ms p95={result['latency_ms']['p95']}ms "
+                f"p99={result['latency_ms']['p99']}ms err={result['error_rate']:.1%}"
+                + (f" ttft_p50={ttft}ms" if ttft is not None else "")
+            )
+
+    output = args.output or f"load_test_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'config': {
+                'mode': mode,
+                'base_url': args.base_url,
+                'endpoints': endpoints,
+                'concurrency': levels,
+                'requests_per_level': args.requests,
+                'latency_scale': args.latency_scale,
+                'error_rate': args.error_rate,
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f"\nResults saved to: {output}")
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+    return results
+
+
+if __name__ == "__main__":
+    main()
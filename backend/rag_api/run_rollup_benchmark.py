@@ -0,0 +1,241 @@
+"""
+Dashboard Rollup Benchmark for LitPath AI
+=========================================
+
+Fills material_views / citation copies with synthetic traffic and compares
+the dashboard's usage queries answered the old way (GROUP BY / COUNT over
+the raw rows) with the daily rollups of usage_rollups.py (rollup days + raw
+tail):
+- views per day       (daily / weekly / monthly trends)
+- accessed documents and unique visitors (dashboard_kpi): exact distinct
+  counts vs merged daily HyperLogLog sketches, with the relative error
+- copies per day + top cited (citation stats / trends)
+- trending subjects (PostgreSQL only: the old double unnest join vs one
+  subject_view_daily range query)
+
+for a 30-day and a 365-day range, plus the time of the one-off backfill.
+Today's traffic is left un-rolled so the tail path is exercised.
+
+WRITES SYNTHETIC ROWS: run it against a scratch database
+(e.g. DB_NAME=litpath_bench). It refuses to start when material_views is
+not empty, and deletes what it inserted afterwards unless --keep is given.
+
+Usage:
+    cd backend
+    DB_HOST=localhost DB_NAME=litpath_bench python rag_api/run_rollup_benchmark.py --rows 10000000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Django setup
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'litpath_backend.settings')
+
+import django
+django.setup()
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from rag_api.models import (
+    Material, MaterialView, CitationCopy,
+    RollupState, UsageDaily, MaterialViewDaily, SubjectViewDaily, CitationCopyDaily, SubjectCitationDaily,
+    UsageSketchDaily,
+)
+from rag_api.hll import HyperLogLog
+from rag_api.usage_rollups import usage_rollups, TOP_CITED_FIELDS
+
+
+SUBJECTS = ["Agriculture", "Rice", "Aquaculture", "Climate Change", "Nutrition", "Public Health",
+            "Engineering", "Computer Science", "Education", "Marine Biology", "Forestry", "Economics"]
+
+
+def timed(fn, repeats=3):
+    """Run fn `repeats` times; return (last result, median duration in ms)"""
+    durations = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return result, round(float(np.median(durations)), 2)
+
+
+def populate(rows, days, files, seed, batch_size=50000):
+    """Synthetic materials, views (Zipf-ish popularity) and 1 citation copy per 50 views"""
+    rng = np.random.default_rng(seed)
+    Material.objects.bulk_create([
+        Material(file=f"bench_{i}.txt", title=f"Benchmark thesis {i}", author="Bench", year=2000 + i % 25,
+                 subjects=list(rng.choice(SUBJECTS, size=2, replace=False)))
+        for i in range(files)
+    ], batch_size=1000)
+    ids = dict(Material.objects.filter(file__startswith="bench_").values_list('file', 'id'))
+
+    now = timezone.now()
+    weights = 1.0 / np.arange(1, files + 1) ** 0.8
+    weights /= weights.sum()
+    copies = rows // 50
+    with connection.cursor() as cursor:
+        for offset in range(0, rows + copies, batch_size):
+            n = min(batch_size, rows + copies - offset)
+            picked = rng.choice(files, size=n, p=weights)
+            seconds = rng.integers(0, days * 86400, size=n)
+            values = [
+                (f"bench_{f}.txt", f"u{int(s) % 5000}", f"s{int(s) % 20000}", now - timedelta(seconds=int(s)))
+                for f, s in zip(picked, seconds)
+            ]
+            with transaction.atomic():
+                if offset < rows:
+                    views = values[:min(n, rows - offset)]
+                    cursor.executemany(
+                        f"INSERT INTO {MaterialView._meta.db_table} (file, user_id, session_id, viewed_at) "
+                        "VALUES (%s, %s, %s, %s)", views)
+                    values = values[len(views):]
+                if values:
+                    cursor.executemany(
+                        f"INSERT INTO {CitationCopy._meta.db_table} (document_id, user_id, session_id, citation_style, copied_at) "
+                        "VALUES (%s, %s, %s, 'APA', %s)",
+                        [(ids[f], u, s, t) for f, u, s, t in values])
+            if (offset // batch_size) % 20 == 0:
+                print(f"[ROLLUP] inserted {min(offset + n, rows + copies):,} / {rows + copies:,} rows")
+
+
+# The queries the dashboard ran before the rollups
+def raw_views_by_day(lo, hi):
+    rows = (MaterialView.objects.filter(viewed_at__range=[lo, hi])
+            .annotate(day=TruncDate('viewed_at')).values_list('day').annotate(n=Count('id')))
+    return dict(rows)
+
+
+def raw_accessed_files(lo, hi):
+    return MaterialView.objects.filter(viewed_at__range=[lo, hi]).values('file').distinct().count()
+
+
+def raw_unique_visitors(lo, hi):
+    return MaterialView.objects.filter(viewed_at__range=[lo, hi]).values('user_id', 'session_id').distinct().count()
+
+
+def raw_citations(lo, hi):
+    total = CitationCopy.objects.filter(copied_at__range=[lo, hi]).count()
+    top = list(CitationCopy.objects.filter(copied_at__range=[lo, hi])
+               .values(*TOP_CITED_FIELDS).annotate(copies=Count('id')).order_by('-copies')[:5])
+    return total, top
+
+
+def raw_trending(lo, hi):
+    """The old dashboard_trending_topics: one unnest join per period, growth in Python"""
+    prev_lo = lo - timedelta(days=(hi - lo).days)
+    periods = []
+    with connection.cursor() as cursor:
+        for a, b in [(lo, hi), (prev_lo, lo - timedelta(microseconds=1))]:
+            cursor.execute("""
+                SELECT unnest(m.subjects) as keyword, COUNT(DISTINCT mv.id) as views
+                FROM materials m
+                JOIN material_views mv ON m.file = mv.file
+                WHERE mv.viewed_at BETWEEN %s AND %s
+                GROUP BY keyword
+            """, [a, b])
+            periods.append(dict(cursor.fetchall()))
+    current, prev = periods
+    trending = sorted(
+        ((s, ((v - prev[s]) / prev[s] * 100) if prev.get(s) else 100.0) for s, v in current.items() if v >= 3),
+        key=lambda item: -item[1])
+    return [s for s, _ in trending[:7]]
+
+
+def rollup_trending(lo, hi):
+    prev_lo = lo - timedelta(days=(hi - lo).days)
+    return [r['subject'] for r in usage_rollups.trending_subjects(prev_lo.date(), lo.date(), hi.date())]
+
+
+def rollup_citations(lo, hi):
+    return sum(usage_rollups.copies_by_day(lo, hi).values()), usage_rollups.top_cited(lo, hi, limit=5)
+
+
+def measure(range_days, repeats):
+    today = timezone.localdate()
+    lo = timezone.make_aware(datetime.combine(today - timedelta(days=range_days), datetime.min.time()))
+    hi = timezone.make_aware(datetime.combine(today, datetime.max.time()))
+    result = {}
+    for name, raw_fn, rollup_fn in [
+        ('views_by_day', raw_views_by_day, usage_rollups.views_by_day),
+        ('accessed_documents', raw_accessed_files, usage_rollups.accessed_files),
+        ('unique_visitors', raw_unique_visitors, usage_rollups.unique_visitors),
+        ('citations', raw_citations, rollup_citations),
+    ] + ([('trending', raw_trending, rollup_trending)] if connection.vendor == 'postgresql' else []):
+        raw, raw_ms = timed(lambda: raw_fn(lo, hi), repeats)
+        rolled, rollup_ms = timed(lambda: rollup_fn(lo, hi), repeats)
+        if name == 'citations':
+            raw, rolled = raw[0], rolled[0]  # top-5 ties may order differently
+        if name == 'trending':
+            raw, rolled = set(raw), set(rolled)
+        result[name] = {'raw_ms': raw_ms, 'rollup_ms': rollup_ms,
+                        'speedup': round(raw_ms / max(rollup_ms, 1e-3), 1), 'match': raw == rolled}
+        if name in ('accessed_documents', 'unique_visitors'):
+            # Sketch estimates: "match" = within 3 standard errors
+            error = (rolled - raw) / max(raw, 1)
+            result[name].update(exact=raw, estimate=rolled, error_pct=round(error * 100, 2),
+                                match=abs(error) <= 3 * HyperLogLog.relative_error())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LitPath AI dashboard rollup benchmark (scratch database only)")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Synthetic material_views rows")
+    parser.add_argument("--days", type=int, default=1095, help="Spread the views over this many days")
+    parser.add_argument("--files", type=int, default=5000, help="Synthetic materials")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic rows afterwards")
+    parser.add_argument("--output", help="Results file (default: rollup_benchmark_results_<timestamp>.json)")
+    args = parser.parse_args()
+
+    if MaterialView.objects.exists():
+        sys.exit("material_views is not empty - run this benchmark against a scratch database")
+
+    print("=" * 70)
+    print("LitPath AI - Dashboard Rollup Benchmark")
+    print("=" * 70)
+    try:
+        start = time.perf_counter()
+        populate(args.rows, args.days, args.files, args.seed)
+        populate_s = time.perf_counter() - start
+
+        # Roll up everything except today, which stays in the raw tail
+        _, backfill_ms = timed(usage_rollups.backfill, repeats=1)
+        results = {'rows': args.rows, 'days': args.days, 'files': args.files, 'vendor': connection.vendor,
+                   'populate_s': round(populate_s, 1), 'backfill_ms': backfill_ms, 'ranges': {}}
+        for range_days in (30, 365):
+            results['ranges'][range_days] = measure(range_days, args.repeats)
+            print(f"\nrange={range_days}d")
+            for name, r in results['ranges'][range_days].items():
+                error = f" error={r['error_pct']}%" if 'error_pct' in r else ''
+                print(f"  {name:<20} raw={r['raw_ms']}ms rollup={r['rollup_ms']}ms x{r['speedup']} match={r['match']}{error}")
+        print(f"\nbackfill={backfill_ms / 1000:.1f}s")
+    finally:
+        if not args.keep:
+            # material_views was empty, so every rollup row is synthetic
+            for model in (RollupState, UsageDaily, MaterialViewDaily, SubjectViewDaily, CitationCopyDaily, SubjectCitationDaily,
+                          UsageSketchDaily):
+                model.objects.all().delete()
+            CitationCopy.objects.filter(document__file__startswith="bench_").delete()
+            MaterialView.objects.filter(file__startswith="bench_").delete()
+            Material.objects.filter(file__startswith="bench_").delete()
+
+    output = args.output or f"rollup_benchmark_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'results': results}, f, indent=2)
+    print(f"\nResults saved to: {output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
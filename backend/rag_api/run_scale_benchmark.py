@@ -0,0 +1,287 @@
+"""
+Scale Benchmark for LitPath AI
+==============================
+
+Builds synthetic thesis indexes at several sizes (RAG/scripts/
+generate_synthetic_theses.py + the deterministic HashingEmbedder, fully
+offline) and measures how the index-wide operations behave as the corpus
+grows:
+- Index build time
+- get_available_filters / get_health_status (full metadata scans)
+- Vector query latency: unfiltered, exact-year filter, year-range filter
+- The same measurements for each vector backend (Chroma HNSW vs the
+  memory-mapped NumPy exact-search store in float32 / float16 vs the
+  binary sign-bit prefilter + exact re-rank), with recall@30 against
+  exact search and on-disk size
+- RAGService.search with a year range wide enough to use the post-filter
+
+Corpora and indexes are cached under --workdir, so re-running a size only
+re-measures it. Results are written as JSON.
+
+Usage:
+    cd backend
+    python rag_api/run_scale_benchmark.py --sizes 10000,100000
+    python rag_api/run_scale_benchmark.py --sizes 1000000 --workdir /data/litpath_scale --queries 200
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+# Django setup
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'litpath_backend.settings')
+
+import django
+django.setup()
+
+import chromadb
+from django.conf import settings
+from rag_api.rag_service import RAGService, HashingEmbedder, l2_normalize
+from rag_api.vector_store import NumpyVectorStore, BinaryPrefilterIndex
+from rag_api.llm_transport import configure_transport
+from generate_synthetic_theses import generate_corpus, SUBJECT_VOCABULARY
+
+
+def timed(fn, repeats=1):
+    """Run fn `repeats` times; return (last result, list of durations in ms)"""
+    durations = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return result, durations
+
+
+def summarize(durations):
+    return {
+        'p50': round(float(np.percentile(durations, 50)), 2),
+        'p95': round(float(np.percentile(durations, 95)), 2),
+        'p99': round(float(np.percentile(durations, 99)), 2),
+        'mean': round(float(np.mean(durations)), 2),
+    }
+
+
+def benchmark_queries(n, seed=7):
+    """Topic queries drawn from the generator's subject vocabularies"""
+    rng = np.random.default_rng(seed)
+    subjects = list(SUBJECT_VOCABULARY)
+    queries = []
+    for _ in range(n):
+        subject = subjects[rng.integers(len(subjects))]
+        vocab = SUBJECT_VOCABULARY[subject][1]
+        a, b = rng.choice(len(vocab), size=2, replace=False)
+        queries.append(f"{vocab[a]} and {vocab[b]} in {subject.lower()}")
+    return queries
+
+
+def prepare_size(workdir, size, seed):
+    """Generate (or reuse) the corpus and Chroma index for one size"""
+    corpus_dir = os.path.join(workdir, f"corpus_{size}")
+    chroma_dir = os.path.join(workdir, f"chroma_{size}")
+    manifest_path = os.path.join(corpus_dir, "synthetic_manifest.json")
+
+    if not os.path.exists(manifest_path):
+        print(f"[SCALE] Generating corpus of ~{size} chunks in {corpus_dir}")
+        generate_corpus(corpus_dir, target_chunks=size, seed=seed)
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    rag = RAGService()
+    rag.embedder = HashingEmbedder()
+    # Rewrite/rerank go to the stub transport with zero latency, so search()
+    # timings cover only local work
+    configure_transport(mode='stub', latency_scale=0.0)
+    rag.api_key = 'offline'
+    rag.chroma_client = chromadb.PersistentClient(path=chroma_dir)
+    rag.collection = rag.chroma_client.get_or_create_collection("thesis_chunks")
+    RAGService._initialized = True
+    settings.RAG_THESES_FOLDER = corpus_dir
+
+    build_ms = None
+    if rag.collection.count() == 0:
+        print(f"[SCALE] Building index for {manifest['documents']} theses")
+        _, durations = timed(lambda: rag.index_txt_files_directly(corpus_dir))
+        build_ms = durations[0]
+    return rag, manifest, build_ms
+
+
+def copy_to_numpy_store(collection, path, dtype, batch_size=5000):
+    """Build a NumpyVectorStore from the Chroma index (no re-embedding)"""
+    store = NumpyVectorStore(path, dtype=dtype)
+    if store.count() == collection.count():
+        return store, None
+    store.reset()
+    start = time.perf_counter()
+    offset = 0
+    while True:
+        batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        store.add(batch["embeddings"], batch["documents"], batch["metadatas"], batch["ids"])
+        offset += len(batch["ids"])
+    return store, (time.perf_counter() - start) * 1000
+
+
+def directory_size_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return round(total / (1024 * 1024), 1)
+
+
+def measure_backend(rag, collection, embeddings, queries, recent, top_n, exact_ids=None):
+    """Time the index-wide operations against one `collection` backend"""
+    rag.collection = collection
+    result = {}
+
+    _, durations = timed(rag.get_available_filters, repeats=3)
+    result['get_available_filters_ms'] = summarize(durations)
+    _, durations = timed(rag.get_health_status, repeats=3)
+    result['get_health_status_ms'] = summarize(durations)
+
+    filters = {
+        'unfiltered': None,
+        'year_eq': {"publication_year": {"$eq": recent[-1]}},
+        'year_range': {"publication_year": {"$in": recent}},
+    }
+    returned_ids = []
+    for name, where in filters.items():
+        durations = []
+        for emb in embeddings:
+            res, d = timed(lambda: collection.query(
+                query_embeddings=[emb], n_results=top_n, where=where,
+                include=["documents", "metadatas", "distances"]
+            ))
+            durations += d
+            if where is None:
+                returned_ids.append(res["ids"][0])
+        result[f'query_{name}_ms'] = summarize(durations)
+
+    if isinstance(collection, BinaryPrefilterIndex):
+        # Stage one alone: popcount Hamming over every row
+        durations = []
+        for emb in embeddings:
+            _, d = timed(lambda: collection.candidates(np.asarray(emb, dtype=np.float32)))
+            durations += d
+        result['binary_candidates_ms'] = summarize(durations)
+
+    if exact_ids is not None:
+        # recall@k against exact (brute-force float32) search
+        recalls = [len(set(got) & set(exact)) / max(1, len(exact)) for got, exact in zip(returned_ids, exact_ids)]
+        result[f'recall_at_{top_n}'] = round(float(np.mean(recalls)), 4)
+
+    # Range wider than 50 years -> search() falls back to post-query filtering
+    durations = []
+    kept = []
+    for q in queries:
+        (top_chunks, _, _), d = timed(lambda: rag.search(q, year_start=1960, year_end=int(recent[-1])))
+        durations += d
+        kept.append(len(top_chunks))
+    result['search_year_postfilter_ms'] = summarize(durations)
+    result['search_year_postfilter_avg_results'] = round(float(np.mean(kept)), 2)
+    return result, returned_ids
+
+
+def run_size(workdir, size, n_queries, seed, backends, top_n=30, binary_shortlist=300):
+    rag, manifest, build_ms = prepare_size(workdir, size, seed)
+    chroma_collection = rag.collection
+    queries = benchmark_queries(n_queries, seed)
+    embeddings = [l2_normalize(e).tolist() for e in rag.embedder.encode(queries)]
+    years = sorted({t['publication_year'] for t in manifest['theses']})
+    recent = years[-5:]
+
+    result = {
+        'target_chunks': size,
+        'chunks': chroma_collection.count(),
+        'documents': manifest['documents'],
+        'backends': {},
+    }
+
+    stores = {}
+    for backend in backends:
+        if backend == 'chroma':
+            stores[backend] = (chroma_collection, build_ms, os.path.join(workdir, f"chroma_{size}"))
+        else:
+            dtype = 'float16' if backend == 'numpy16' else 'float32'
+            path = os.path.join(workdir, f"{backend}_{size}")
+            store, copy_ms = copy_to_numpy_store(chroma_collection, path, dtype)
+            if backend.startswith('binary'):
+                # binary: Hamming on sign bits; binary4: 4-bit asymmetric query planes
+                query_bits = int(backend[len('binary'):] or 0)
+                store = BinaryPrefilterIndex(store, shortlist=binary_shortlist, query_bits=query_bits)
+                start = time.perf_counter()
+                store.build()
+                copy_ms = (copy_ms or 0) + (time.perf_counter() - start) * 1000
+            stores[backend] = (store, copy_ms, path)
+
+    # Exact float32 search is the ground truth for recall
+    exact_ids = None
+    if 'numpy' in stores:
+        exact = stores['numpy'][0].query(query_embeddings=embeddings, n_results=top_n, include=[])
+        exact_ids = exact["ids"]
+
+    for backend, (collection, build, path) in stores.items():
+        measured, _ = measure_backend(rag, collection, embeddings, queries, recent, top_n, exact_ids)
+        # chroma: embed + index the corpus; numpy: copy vectors from the chroma index
+        measured['chroma_build_ms' if backend == 'chroma' else 'load_from_chroma_ms'] = round(build, 1) if build is not None else None
+        measured['disk_mb'] = directory_size_mb(path)
+        result['backends'][backend] = measured
+    rag.collection = chroma_collection
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LitPath AI scale benchmark on synthetic corpora")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated target chunk counts")
+    parser.add_argument("--workdir", default=os.path.join(settings.BASE_DIR.parent, 'RAG', 'scale_benchmark'),
+                        help="Where corpora and indexes are generated / cached")
+    parser.add_argument("--queries", type=int, default=50, help="Queries per measurement")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backends", default="chroma,numpy,numpy16,binary,binary4",
+                        help="Vector backends to compare: chroma, numpy (float32), numpy16 (float16), "
+                             "binary (sign-bit Hamming prefilter + exact re-rank), "
+                             "binary4 (same codes, 4-bit asymmetric query)")
+    parser.add_argument("--binary-shortlist", type=int, default=300,
+                        help="Candidates the binary prefilter passes to exact re-ranking")
+    parser.add_argument("--output", help="Results file (default: scale_benchmark_results_<timestamp>.json)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    print("=" * 70)
+    print("LitPath AI - Scale Benchmark")
+    print("=" * 70)
+
+    results = []
+    for size in sizes:
+        result = run_size(args.workdir, size, args.queries, args.seed, backends, binary_shortlist=args.binary_shortlist)
+        results.append(result)
+        print(f"\nchunks={result['chunks']} documents={result['documents']}")
+        for backend, r in result['backends'].items():
+            recall = r.get('recall_at_30')
+            print(
+                f"  {backend:<8} filters={r['get_available_filters_ms']['p50']}ms "
+                f"health={r['get_health_status_ms']['p50']}ms "
+                f"query p50={r['query_unfiltered_ms']['p50']}ms p95={r['query_unfiltered_ms']['p95']}ms "
+                f"year_eq p50={r['query_year_eq_ms']['p50']}ms "
+                f"search(postfilter) p50={r['search_year_postfilter_ms']['p50']}ms "
+                f"disk={r['disk_mb']}MB" + (f" recall@30={recall}" if recall is not None else "")
+                + (f" stage1 p50={r['binary_candidates_ms']['p50']}ms" if 'binary_candidates_ms' in r else "")
+            )
+
+    output = args.output or f"scale_benchmark_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'results': results}, f, indent=2)
+    print(f"\nResults saved to: {output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
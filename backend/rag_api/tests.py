@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
@@ -40,6 +40,1020 @@ class SearchAPITestCase(APITestCase):
         self.assertIn('related_questions', response.data)
 
 
+
+class LatencyTrackerTestCase(SimpleTestCase):
+    """Test the search pipeline latency instrumentation"""
+    
+    def setUp(self):
+        from .latency_metrics import LatencyTracker
+        self.tracker = LatencyTracker()
+    
+    def test_span_records_stage_for_request(self):
+        """Test that spans are tagged with the request_id"""
+        with self.tracker.span('embed', 'req-1'):
+            pass
+        self.tracker.record('rerank', 120.0, 'req-1')
+        
+        stages = self.tracker.pop_request('req-1')
+        self.assertEqual(set(stages), {'embed', 'rerank'})
+        self.assertEqual(stages['rerank'], 120.0)
+        self.assertEqual(self.tracker.pop_request('req-1'), {})
+    
+    def test_prometheus_output(self):
+        """Test that histograms render in Prometheus text format"""
+        self.tracker.record('embed', 30.0)
+        self.tracker.record('embed', 3000.0)
+        text = self.tracker.render_prometheus()
+        
+        self.assertIn('# TYPE litpath_search_stage_duration_seconds histogram', text)
+        self.assertIn('litpath_search_stage_duration_seconds_bucket{stage="embed",le="0.05"} 1', text)
+        self.assertIn('litpath_search_stage_duration_seconds_bucket{stage="embed",le="+Inf"} 2', text)
+        self.assertIn('litpath_search_stage_duration_seconds_count{stage="embed"} 2', text)
+
+class LLMTransportTestCase(SimpleTestCase):
+    """Test offline record/replay of Gemini and HF calls"""
+    
+    def setUp(self):
+        import tempfile
+        from .llm_transport import LLMTransport, CassetteStore
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = CassetteStore(self.tmpdir.name)
+        self.transport = LLMTransport(mode='replay', cassette_dir=self.tmpdir.name)
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_replay_serves_recorded_responses(self):
+        """Test that recorded generate/stream/embed responses replay offline"""
+        config = {'temperature': 0.1}
+        self.store.save(
+            self.store.request_key('generate', 'gemini-2.5-flash', {'contents': 'q', 'config': config}),
+            {'text': 'rewritten query', 'finish_reason': 'STOP'}
+        )
+        self.store.save(
+            self.store.request_key('generate_stream', 'gemini-2.5-flash', {'contents': 'q', 'config': None}),
+            {'chunks': ['Hello ', 'world']}
+        )
+        self.store.save(
+            self.store.request_key('embed', 'bge', {'text': 'q'}),
+            {'embedding': [0.5, 0.25]}
+        )
+        
+        response = self.transport.generate_content('key', 'gemini-2.5-flash', 'q', config)
+        self.assertEqual(response.text, 'rewritten query')
+        self.assertEqual(response.candidates[0].finish_reason, 'STOP')
+        
+        chunks = self.transport.generate_content_stream('key', 'gemini-2.5-flash', 'q')
+        self.assertEqual(''.join(chunk.text for chunk in chunks), 'Hello world')
+        
+        self.assertEqual(self.transport.feature_extraction(None, 'q', model='bge').tolist(), [0.5, 0.25])
+    
+    def test_replay_miss_and_simulated_errors(self):
+        """Test that unrecorded requests fail loudly and error_rate is honoured"""
+        from .llm_transport import LLMTransport, CassetteMissError, SimulatedUpstreamError
+        with self.assertRaises(CassetteMissError):
+            self.transport.generate_content('key', 'gemini-2.5-flash', 'never recorded')
+        
+        self.store.save(self.store.request_key('embed', 'bge', {'text': 'q'}), {'embedding': [1.0]})
+        flaky = LLMTransport(mode='replay', cassette_dir=self.tmpdir.name, error_rate=1.0)
+        with self.assertRaises(SimulatedUpstreamError):
+            flaky.feature_extraction(None, 'q', model='bge')
+    
+    def test_stub_mode_shapes_responses_for_pipeline(self):
+        """Test that stub mode answers rewrite/rerank prompts and embeds deterministically"""
+        from .llm_transport import LLMTransport
+        stub = LLMTransport(mode='stub', latency_scale=0.0)
+        
+        rewrite = stub.generate_content('key', 'gemini-2.5-flash-lite', "User Query: rice yield\n\nRewritten Query:")
+        self.assertEqual(rewrite.text, 'rice yield')
+        rerank = stub.generate_content('key', 'gemini-2.5-flash', "Document Chunks:\n[1] Title: A\n[2] Title: B")
+        self.assertEqual(rerank.text, '[1, 2]')
+        
+        first = stub.feature_extraction(None, 'rice yield', model='bge')
+        self.assertEqual(first.tolist(), stub.feature_extraction(None, 'rice yield', model='bge').tolist())
+        self.assertAlmostEqual(float((first ** 2).sum()), 1.0, places=5)
+
+    def test_llm_client_deadline_hedge_and_retry(self):
+        """Test that the shared LLM client enforces deadlines, hedges slow calls and retries errors"""
+        import time
+        from .llm_client import LLMClient, LLMDeadlineExceeded
+        from .llm_transport import make_replay_response, SimulatedUpstreamError
+
+        class ScriptedTransport:
+            """Each call pops a (delay_s, outcome) step; an exception outcome is raised"""
+            def __init__(self, steps):
+                self.steps = list(steps)
+                self.calls = 0
+            def generate_content(self, api_key, model, contents, config=None):
+                self.calls += 1
+                delay, outcome = self.steps.pop(0)
+                time.sleep(delay)
+                if isinstance(outcome, Exception):
+                    raise outcome
+                return make_replay_response(outcome)
+
+        transport = ScriptedTransport([(0.5, 'late')])
+        client = LLMClient(transport=transport)
+        with self.assertRaises(LLMDeadlineExceeded):
+            client.generate_content('key', 'm', 'q', deadline_ms=100)
+
+        # Once p95 is known, a slow primary is overtaken by the hedge
+        transport = ScriptedTransport([(0.0, 'warm')] * 5 + [(0.5, 'primary'), (0.0, 'hedge')])
+        client = LLMClient(transport=transport, hedge_min_samples=5)
+        for _ in range(5):
+            client.generate_content('key', 'm', 'q')
+        response = client.generate_content('key', 'm', 'q', deadline_ms=400, hedge=True)
+        self.assertEqual(response.text, 'hedge')
+        self.assertEqual(client.stats()['m']['hedges'], 1)
+
+        # A transient error is retried; once the budget is spent, errors surface
+        transport = ScriptedTransport([(0.0, SimulatedUpstreamError('503')), (0.0, 'ok')])
+        client = LLMClient(transport=transport, backoff_ms=1)
+        self.assertEqual(client.generate_content('key', 'm', 'q').text, 'ok')
+        client.budget._tokens = 0.0
+        transport.steps = [(0.0, SimulatedUpstreamError('503')), (0.0, 'unused')]
+        with self.assertRaises(SimulatedUpstreamError):
+            client.generate_content('key', 'm', 'q')
+
+class SyntheticCorpusTestCase(SimpleTestCase):
+    """Test the synthetic thesis generator and the local hashing embedder"""
+    
+    def test_generated_front_matter_is_parseable(self):
+        """Test that extract_thesis_metadata recovers the generated metadata"""
+        import os
+        import tempfile
+        from .rag_service import extract_thesis_metadata
+        from generate_synthetic_theses import generate_corpus
+        
+        with tempfile.TemporaryDirectory() as out_dir:
+            summary = generate_corpus(out_dir, docs=20, seed=3, median_words=1500)
+            self.assertEqual(summary['documents'], 20)
+            for entry in summary['theses']:
+                with open(os.path.join(out_dir, entry['file']), encoding='utf-8') as f:
+                    meta = extract_thesis_metadata(f.read())
+                self.assertEqual(meta['title'], entry['title'])
+                self.assertEqual(meta['author'], entry['author'])
+                self.assertEqual(meta['publication_year'], entry['publication_year'])
+                self.assertEqual(meta['main_subject'], entry['subject'])
+                self.assertTrue(meta['abstract'])
+    
+    def test_hashing_embedder_is_deterministic_and_topical(self):
+        """Test that the hashing embedder is stable and ranks shared words higher"""
+        from .rag_service import HashingEmbedder
+        embedder = HashingEmbedder()
+        vecs = embedder.encode(["rice crop yield", "rice crop yield irrigation", "coral reef fish"])
+        
+        self.assertEqual(vecs.shape, (3, HashingEmbedder.DIM))
+        self.assertTrue((vecs[0] == embedder.encode(["rice crop yield"])[0]).all())
+        self.assertGreater(vecs[0] @ vecs[1], vecs[0] @ vecs[2])
+
+class NumpyVectorStoreTestCase(SimpleTestCase):
+    """Test the memory-mapped exact-search vector store"""
+    
+    def setUp(self):
+        import tempfile
+        import numpy as np
+        from .vector_store import NumpyVectorStore
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.vectors = np.random.default_rng(0).normal(size=(40, 8)).astype(np.float32)
+        self.store = NumpyVectorStore(self.tmpdir.name)
+        self.store.add(
+            embeddings=self.vectors,
+            documents=[f"chunk {i}" for i in range(40)],
+            metadatas=[{
+                "file": f"thesis_{i // 10}.txt",
+                "publication_year": str(2010 + i // 10),
+                "subjects": "Agriculture, Rice" if i < 20 else "Physics",
+                "chunk_idx": i % 10,
+            } for i in range(40)],
+            ids=[f"thesis_{i // 10}.txt_chunk_{i % 10}" for i in range(40)],
+        )
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_query_matches_brute_force_l2(self):
+        """Test that top-k and distances match exact squared L2 search"""
+        import numpy as np
+        query = self.vectors[7] + 0.05
+        result = self.store.query(query_embeddings=[query], n_results=5)
+        
+        expected = np.argsort(((self.vectors - query) ** 2).sum(axis=1))[:5]
+        self.assertEqual(result["ids"][0], [f"thesis_{i // 10}.txt_chunk_{i % 10}" for i in expected])
+        self.assertEqual(result["documents"][0][0], "chunk 7")
+        self.assertEqual(result["metadatas"][0][0]["chunk_idx"], 7)
+        self.assertAlmostEqual(result["distances"][0][0], float(((self.vectors[7] - query) ** 2).sum()), places=4)
+    
+    def test_prefilter_and_reopen(self):
+        """Test year/subject prefilters and that data survives reopening"""
+        from .vector_store import NumpyVectorStore
+        query = self.vectors[0]
+        by_year = self.store.query([query], n_results=40, where={"publication_year": {"$in": ["2012", "2013"]}})
+        self.assertEqual({m["publication_year"] for m in by_year["metadatas"][0]}, {"2012", "2013"})
+        
+        by_subject = self.store.query([query], n_results=40, where={"subjects": {"$contains": "rice"}})
+        self.assertEqual(len(by_subject["ids"][0]), 20)
+        
+        self.store.delete(ids=["thesis_0.txt_chunk_0"])
+        reopened = NumpyVectorStore(self.tmpdir.name)
+        self.assertEqual(reopened.count(), 39)
+        self.assertEqual(reopened.get(where={"file": "thesis_3.txt"}, limit=1)["documents"], ["chunk 30"])
+
+    def test_compressed_first_stage_rescored_exactly(self):
+        """Test int8 + PCA shortlist search returns exact distances and survives reopening"""
+        import os
+        import numpy as np
+        from .vector_store import NumpyVectorStore
+        rng = np.random.default_rng(1)
+        # Low-rank data so 8 principal components keep the neighbourhoods
+        vectors = (rng.normal(size=(600, 8)) @ rng.normal(size=(8, 32))).astype(np.float32)
+        path = os.path.join(self.tmpdir.name, "compressed")
+        store = NumpyVectorStore(path, quantization="int8", reduced_dims=8, rescore_factor=2)
+        meta = [{"file": f"t{i // 20}.txt", "chunk_idx": i % 20} for i in range(600)]
+        store.add(vectors[:500], [f"c{i}" for i in range(500)], meta[:500], [f"id{i}" for i in range(500)])
+        self.assertTrue(store.needs_compression())
+        store.build_compression()
+        store.add(vectors[500:], [f"c{i}" for i in range(500, 600)], meta[500:], [f"id{i}" for i in range(500, 600)])
+
+        query = vectors[550] + 0.01
+        exact = np.sort(((vectors - query) ** 2).sum(axis=1))[:5]
+        for s in (store, NumpyVectorStore(path, quantization="int8", reduced_dims=8, rescore_factor=2)):
+            self.assertFalse(s.needs_compression())
+            result = s.query([query], n_results=5, include=["distances"])
+            self.assertEqual(result["ids"][0][0], "id550")
+            np.testing.assert_allclose(result["distances"][0], exact, rtol=1e-4, atol=1e-4)
+        self.assertEqual(store.compressed_bytes(), 600 * (8 + 4))
+
+    def test_binary_prefilter_reranks_exactly(self):
+        """Test sign-bit prefilter + exact re-rank, lazy encoding of new rows and reopening"""
+        import os
+        import numpy as np
+        from .vector_store import NumpyVectorStore, BinaryPrefilterIndex
+        rng = np.random.default_rng(2)
+        vectors = rng.normal(size=(400, 64)).astype(np.float32)
+        path = os.path.join(self.tmpdir.name, "binary")
+        meta = [{"file": f"t{i // 20}.txt", "chunk_idx": i % 20} for i in range(400)]
+        index = BinaryPrefilterIndex(NumpyVectorStore(path), shortlist=40, query_bits=0)
+        index.add(vectors[:300], [f"c{i}" for i in range(300)], meta[:300], [f"id{i}" for i in range(300)])
+        index.query([vectors[0]], n_results=1)
+        index.add(vectors[300:], [f"c{i}" for i in range(300, 400)], meta[300:], [f"id{i}" for i in range(300, 400)])
+
+        query = vectors[350] + 0.01
+        for bits in (0, 4):
+            reopened = BinaryPrefilterIndex(NumpyVectorStore(path), shortlist=40, query_bits=bits)
+            for idx in (index, reopened):
+                self.assertEqual(len(idx.candidates(query)), 40)
+                result = idx.query([query], n_results=3, include=["distances"])
+                self.assertEqual(result["ids"][0][0], "id350")
+                self.assertAlmostEqual(result["distances"][0][0], float(((vectors[350] - query) ** 2).sum()), places=4)
+        self.assertEqual(index.binary_bytes(), 400 * 8)
+
+    def test_document_index_backfill_and_top_documents(self):
+        """Test one vector per thesis is built from the chunks and queried first"""
+        import os
+        from .rag_service import RAGService, HashingEmbedder
+        from .vector_store import NumpyVectorStore
+        rag = RAGService()
+        saved = {k: rag.__dict__.get(k) for k in ("collection", "document_collection", "embedder")}
+        try:
+            rag.collection = self.store
+            rag.document_collection = NumpyVectorStore(os.path.join(self.tmpdir.name, "documents"))
+            rag.embedder = HashingEmbedder()
+            self.assertEqual(rag.build_document_index(), 4)
+            self.assertEqual(rag.document_collection.count(), 4)
+            # Rebuilding replaces entries (deleted ids can be re-added)
+            rag.build_document_index()
+            self.assertEqual(rag.document_collection.count(), 4)
+
+            query = self.vectors[30:40].mean(axis=0)
+            self.assertEqual(rag._top_documents(query, None, None)[0], "thesis_3.txt")
+            self.assertEqual(rag._top_documents(query, {"publication_year": {"$eq": "2011"}}, None), ["thesis_1.txt"])
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    rag.__dict__.pop(key, None)
+                else:
+                    setattr(rag, key, value)
+
+class CandidateSelectionTestCase(SimpleTestCase):
+    """Test candidate diversification / ranking ahead of the LLM reranker"""
+    
+    def test_mmr_skips_near_duplicates(self):
+        """Test MMR prefers a distinct relevant chunk over a near-duplicate"""
+        import numpy as np
+        from .rag_service import mmr_select, l2_normalize
+        query = l2_normalize(np.array([1.0, 0.0, 0.3]))
+        embeddings = np.array([l2_normalize(np.array(v)) for v in (
+            [1.0, 0.0, 0.0],    # most relevant
+            [1.0, 0.01, 0.0],   # near-duplicate of 0
+            [0.8, 0.0, 0.6],    # relevant, different direction
+            [0.0, -1.0, 0.0],   # irrelevant
+        )])
+        self.assertEqual(mmr_select(query, embeddings, k=2, lambda_mult=0.5), [0, 2])
+        self.assertEqual(mmr_select(query, embeddings, k=2, lambda_mult=1.0), [0, 1])
+        self.assertEqual(mmr_select(query, embeddings, k=10), [0, 1, 2, 3])
+
+    def test_local_reranker_blends_lexical_and_vector_features(self):
+        """Test title/term matches can outrank a slightly closer vector hit"""
+        from .local_reranker import LocalReranker
+        candidates = [
+            {"chunk": "Groundwater recharge in upland farms.", "score": 0.80,
+             "meta": {"title": "Upland Hydrology", "subjects": "Hydrology"}},
+            {"chunk": "Salinity reduced rice tiller counts; salt tolerant rice lines recovered.", "score": 0.85,
+             "meta": {"title": "Salt Tolerance of Rice Genotypes", "subjects": "Agriculture, Rice"}},
+            {"chunk": "Unrelated survey of coral reefs.", "score": 1.40,
+             "meta": {"title": "Reef Fish", "subjects": "Marine Biology"}},
+        ]
+        reranker = LocalReranker()
+        self.assertEqual(reranker.rank("rice salt tolerance", candidates), [1, 0, 2])
+        # Without query terms only the vector distance counts
+        self.assertEqual(reranker.rank("the of", candidates), [0, 1, 2])
+
+class GenerationPlanningTestCase(SimpleTestCase):
+    """Test overview model tiering and prompt packing"""
+
+    def test_route_by_complexity_sources_and_depth(self):
+        """Test simple lookups go to the fast tier and comparisons over many theses to deep"""
+        from .model_router import ModelRouter
+        router = ModelRouter()
+        chunks = lambda n: [{"meta": {"file": f"t{i}.txt"}} for i in range(n)]
+
+        simple = router.route("rice yield in Nueva Ecija", chunks(2))
+        self.assertEqual((simple.tier, simple.model, simple.max_output_tokens), ('fast', 'gemini-2.5-flash-lite', 768))
+        self.assertEqual(router.route("rice yield in Nueva Ecija", chunks(5), [{}, {}]).tier, 'standard')
+        deep = router.route("Compare the irrigation methods used across these studies", chunks(8))
+        self.assertEqual(deep.tier, 'deep')
+        self.assertTrue(deep.features['comparison'])
+        self.assertEqual(ModelRouter(enabled=False).route("rice", chunks(1)).tier, 'deep')
+
+        outcome = router.outcome("Yields rose [1] while costs fell [2][1].", 'MAX_TOKENS')
+        self.assertEqual((outcome['citations'], outcome['truncated']), (2, True))
+
+    def test_prompt_builder_packs_ranked_unique_sentences_under_budget(self):
+        """Test the prompt keeps query-relevant sentences, drops repeats and respects the budget"""
+        from .prompt_builder import PromptBuilder
+        filler = " ".join(f"Appendix table {i} lists equipment code {i * 7919}." for i in range(10, 50))
+        chunks = [
+            {"chunk": f"Salinity reduced rice yield by 20 percent. {filler}",
+             "meta": {"file": "a.txt", "title": "Rice Salinity", "publication_year": "2020", "author": "A"}},
+            {"chunk": "Salinity reduced rice yield by 20 percent. Tolerant rice lines recovered after flushing.",
+             "meta": {"file": "b.txt", "title": "Rice Lines", "publication_year": "2021", "author": "B"}},
+        ]
+        history = [{"query": "rice", "overview": "x" * 5000}] * 5
+        built = PromptBuilder(context_tokens=60, history_tokens=50).build(chunks, "rice salinity yield", history)
+
+        self.assertEqual(built.seen_pdfs, ["a.txt", "b.txt"])
+        self.assertEqual(built.prompt.count("Salinity reduced rice yield"), 1)
+        self.assertIn("[2] Tolerant rice lines recovered", built.prompt)
+        self.assertNotIn("table 49", built.prompt)
+        self.assertEqual(built.stats['duplicates'], 1)
+        self.assertLessEqual(built.stats['context_tokens'], 60)
+        self.assertLess(built.stats['history_tokens'], 120)
+
+    def test_extractive_overview_cites_sources_and_serves_degraded_mode(self):
+        """Test the extractive summary cites prompt numbers, skips repeats and replaces a rate-limited overview"""
+        from . import rag_service
+        from .extractive_summary import ExtractiveSummarizer
+        chunks = [
+            {"chunk": "Salinity reduced rice yield by 20 percent in coastal fields. The study ran from 2015 to 2017.",
+             "meta": {"file": "a.txt", "title": "Rice Salinity"}, "score": 0.4},
+            {"chunk": "Salinity reduced rice yield by 20 percent in coastal fields. "
+                      "Tolerant rice lines recovered their yield after freshwater flushing.",
+             "meta": {"file": "b.txt", "title": "Rice Lines"}, "score": 0.6},
+            {"chunk": "Unrelated thesis sentence about basketball training schedules for students.",
+             "meta": {"file": "c.txt", "title": "Sports"}, "score": 1.9},
+        ]
+        summary = ExtractiveSummarizer(max_sentences=3).summarize(chunks[:2], "rice yield salinity")
+        self.assertEqual(summary["text"].count("Salinity reduced rice yield"), 1)
+        self.assertIn("Tolerant rice lines recovered their yield after freshwater flushing. [2]", summary["text"])
+        self.assertEqual({s["source"] for s in summary["sentences"]}, {1, 2})
+
+        class RateLimitedClient:
+            def generate_content(self, *args, **kwargs):
+                raise Exception("429 RESOURCE_EXHAUSTED")
+
+        rag = rag_service.RAGService()
+        self.assertNotIn("basketball", rag.extractive_overview(chunks, "rice yield", 1.5)["text"])
+        original, saved_key = rag_service.get_llm_client, rag.__dict__.get("api_key")
+        rag_service.get_llm_client, rag.api_key = RateLimitedClient, "offline"
+        try:
+            overview = rag.generate_overview(chunks, "rice yield salinity", 1.5)
+        finally:
+            rag_service.get_llm_client, rag.api_key = original, saved_key
+        self.assertIn("high demand", overview)
+        self.assertIn("[1]", overview)
+
+class ConversationStateCacheTestCase(SimpleTestCase):
+    """Test the per-session conversation state used by follow-up turns"""
+
+    def test_sync_folds_only_new_turns_and_keeps_summary_bounded(self):
+        """Test follow-ups reuse cached entities and older turns roll into a capped summary"""
+        from .conversation_utils import ConversationStateCache, conversation_manager, SUMMARY_MAX_CHARS
+        cache = ConversationStateCache()
+        history = [{"query": f"yield of IR{i} at PhilRice?", "overview": f"IR{i} reached {i} tons/ha at UPLB."}
+                   for i in range(1, 13)]
+
+        state = cache.sync("s1", history[:2])
+        self.assertEqual((state.turns, cache.misses), (2, 1))
+        calls = []
+        original = conversation_manager.turn_entities
+        conversation_manager.turn_entities = lambda turn: calls.append(turn) or original(turn)
+        try:
+            state = cache.sync("s1", history[:3])
+        finally:
+            conversation_manager.turn_entities = original
+        self.assertEqual((len(calls), state.turns, cache.hits), (1, 3, 1))
+        self.assertEqual(conversation_manager.resolve_pronouns("what about its cost?", history[:3], state),
+                         conversation_manager.resolve_pronouns("what about its cost?", history[:3]))
+
+        state = cache.sync("s1", history)
+        self.assertEqual(len(state.recent), 3)
+        self.assertIn("IR12", state.entities)
+        self.assertLessEqual(len(state.summary), SUMMARY_MAX_CHARS)
+        self.assertIn("IR9", state.summary)
+        # Another process (or an evicted session) rebuilds the same state from the history
+        self.assertEqual(ConversationStateCache().sync("s1", history).summary, state.summary)
+
+class UsageRollupPlanTestCase(SimpleTestCase):
+    """Test how dashboard ranges split into rolled-up days and the raw tail"""
+
+    def test_plan_uses_whole_rolled_days_and_reads_edges_raw(self):
+        """Test whole days before the watermark come from rollups, everything else from raw rows"""
+        from datetime import date, timedelta
+        from .usage_rollups import UsageRollups, day_start
+        from .views import parse_date_range
+        plan = UsageRollups().plan
+        lo, hi = parse_date_range('2026-01-01', '2026-01-31')
+        end = day_start(date(2026, 2, 1))
+
+        self.assertEqual(plan(lo, hi, None), (None, [(lo, end)]))
+        self.assertEqual(plan(lo, hi, date(2026, 1, 1)), (None, [(lo, end)]))
+        self.assertEqual(plan(lo, hi, date(2026, 1, 20)),
+                         ((date(2026, 1, 1), date(2026, 1, 19)), [(day_start(date(2026, 1, 20)), end)]))
+        self.assertEqual(plan(lo, hi, date(2026, 3, 1)), ((date(2026, 1, 1), date(2026, 1, 31)), []))
+        # A range starting mid-day reads that day raw
+        noon = lo + timedelta(hours=12)
+        self.assertEqual(plan(noon, hi, date(2026, 3, 1)),
+                         ((date(2026, 1, 2), date(2026, 1, 31)), [(noon, day_start(date(2026, 1, 2)))]))
+
+
+class HyperLogLogTestCase(SimpleTestCase):
+    """Test the distinct-count sketches behind the dashboard's unique counts"""
+
+    def test_merged_daily_sketches_estimate_union_within_error_bound(self):
+        """Test that merging per-day sketches estimates the distinct union and survives a round trip"""
+        from .hll import HyperLogLog
+        days = []
+        for day in range(10):
+            sketch = HyperLogLog()
+            sketch.add(f"visitor-{i}" for i in range(day * 3000, day * 3000 + 5000))  # overlapping days
+            days.append(HyperLogLog.from_bytes(sketch.to_bytes()))
+        merged = HyperLogLog()
+        for sketch in days:
+            merged.merge(sketch)
+        exact = 9 * 3000 + 5000
+        self.assertLess(abs(merged.count() - exact) / exact, 3 * HyperLogLog.relative_error())
+
+        small = HyperLogLog()
+        small.add(["a", "b", "b", "c"])
+        self.assertEqual(small.count(), 3)
+        self.assertLess(len(small.to_bytes()), 100)
+        with self.assertRaises(ValueError):
+            small.merge(HyperLogLog(precision=10))
+
+
+class UsageRollupsTestCase(TestCase):
+    """Test daily rollups + raw tail against the raw material_views / citation counts"""
+
+    def test_compacted_rollups_plus_tail_match_raw_counts(self):
+        """Test compaction, the tail of un-rolled rows, the subject rollup and trending"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Material, MaterialView, CitationCopy, SubjectViewDaily
+        from .usage_rollups import UsageRollups
+        from .views import parse_date_range
+        rice = Material.objects.create(file="rice.txt", title="Rice", author="A", subjects=["Rice", "Agriculture"])
+        fish = Material.objects.create(file="fish.txt", title="Fish", author="B", subjects=["Aquaculture"])
+        now = timezone.now()
+        for days_ago, material in [(3, rice), (3, rice), (3, fish), (1, rice), (0, fish)]:
+            view = MaterialView.objects.create(file=material.file)
+            MaterialView.objects.filter(pk=view.pk).update(viewed_at=now - timedelta(days=days_ago))
+            copy = CitationCopy.objects.create(document=material, citation_style="APA")
+            CitationCopy.objects.filter(pk=copy.pk).update(copied_at=now - timedelta(days=days_ago))
+
+        rollups = UsageRollups(settle_minutes=0, auto_compact=False)
+        self.assertEqual(rollups.backfill(), 3)
+        lo, hi = parse_date_range((now - timedelta(days=7)).date().isoformat(), now.date().isoformat())
+        views = rollups.views_by_day(lo, hi)
+        self.assertEqual(views[(now - timedelta(days=3)).date()], 3)
+        self.assertEqual(views[now.date()], 1)  # today: raw tail
+        self.assertEqual(sum(rollups.copies_by_day(lo, hi).values()), 5)
+        self.assertEqual(rollups.accessed_files(lo, hi), 2)
+        self.assertEqual(rollups.accessed_files(lo, hi, exact=True), 2)
+        self.assertEqual(rollups.unique_visitors(lo, hi), rollups.unique_visitors(lo, hi, exact=True))
+        self.assertEqual([(r['document__file'], r['copies']) for r in rollups.top_cited(lo, hi)],
+                         [("rice.txt", 3), ("fish.txt", 2)])
+        self.assertEqual(SubjectViewDaily.objects.get(day=(now - timedelta(days=3)).date(), subject="Rice").views, 2)
+        # The backfill also fills today's subject rows, kept current by record_events from then on
+        self.assertEqual(SubjectViewDaily.objects.get(day=timezone.localdate(now), subject="Aquaculture").views, 1)
+        # Compaction is idempotent and stops at the watermark
+        self.assertEqual(rollups.compact(end=timezone.localdate(now)), 0)
+
+        # Trending: last 2 days vs the 2 days before, from subject_view_daily alone
+        today = timezone.localdate(now)
+        for _ in range(2):
+            view = MaterialView.objects.create(file=fish.file)
+            rollups.record_events([(view.viewed_at, view.file, None, None)], [])
+        trending = rollups.trending_subjects(today - timedelta(days=3), today - timedelta(days=1), today, min_views=1)
+        self.assertEqual([(t['subject'], t['current_views'], t['prev_views'], t['growth']) for t in trending],
+                         [("Aquaculture", 3, 1, 200.0), ("Agriculture", 1, 2, -50.0), ("Rice", 1, 2, -50.0)])
+
+    def test_trending_ranks_by_growth_then_views(self):
+        """Test the SQL growth formula, the minimum view count, the tie-breaks and the limit"""
+        from datetime import date
+        from .models import SubjectViewDaily
+        from .usage_rollups import UsageRollups
+        previous, current = date(2026, 3, 1), date(2026, 3, 2)
+        for subject, now_views, before in [('Rice', 6, 3), ('Fish', 3, 0), ('Corn', 9, 2), ('Soil', 3, 0),
+                                           ('Tea', 1, 3)]:
+            SubjectViewDaily.objects.create(day=current, subject=subject, views=now_views)
+            if before:
+                SubjectViewDaily.objects.create(day=previous, subject=subject, views=before)
+        SubjectViewDaily.objects.create(day=date(2026, 2, 28), subject='Fish', views=50)  # outside both periods
+        trending = UsageRollups().trending_subjects
+        self.assertEqual([(t['subject'], t['growth']) for t in trending(previous, current, current, min_views=1)],
+                         [('Corn', 350.0), ('Rice', 100.0), ('Fish', 100.0), ('Soil', 100.0), ('Tea', -66.7)])
+        self.assertEqual([t['subject'] for t in trending(previous, current, current, limit=3)],
+                         ['Corn', 'Rice', 'Fish'])
+        self.assertEqual(trending(previous, current, current, min_views=6),
+                         [{'subject': 'Corn', 'current_views': 9, 'prev_views': 2, 'growth': 350.0},
+                          {'subject': 'Rice', 'current_views': 6, 'prev_views': 3, 'growth': 100.0}])
+
+
+class DocumentStatsTestCase(APITestCase):
+    """Test the incremental document_stats counters against the raw tables"""
+
+    def test_counters_follow_views_and_ratings_and_rebuild_reconciles(self):
+        """Test view / rating / edit / delete updates, the endpoints reading them and the rebuild"""
+        from .models import DocumentStats, Feedback, Material, MaterialView
+        from .document_stats import document_stats
+        from .usage_rollups import usage_rollups
+        from .views import parse_date_range
+        from .event_ingest import event_ingest
+        for file, title in (('rice.txt', 'Rice'), ('fish.txt', 'Fish')):
+            Material.objects.create(file=file, title=title, author='Santos')  # synced from the index
+        enabled, event_ingest.enabled = event_ingest.enabled, False  # synchronous view tracking
+        try:
+            for _ in range(3):
+                self.client.post(reverse('track_material_view'), {'file': 'rice.txt'}, format='json')
+            self.client.post(reverse('track_material_view'), {'file': 'fish.txt'}, format='json')
+        finally:
+            event_ingest.enabled = enabled
+        ids = [self.client.post(reverse('feedback'), {'user_id': 'u', 'document_file': 'rice.txt', 'rating': r},
+                                format='json').data['id'] for r in (5, 3, 4)]
+        self.client.patch(reverse('feedback-detail', args=[ids[0]]), {'rating': 2}, format='json')
+        self.client.delete(reverse('feedback-detail', args=[ids[1]]))
+
+        rice = DocumentStats.objects.get(file='rice.txt')
+        self.assertEqual((rice.view_count, rice.rating_count, rice.rating_sum, rice.rating_min, rice.rating_max),
+                         (3, 2, 6, 2, 4))
+        self.assertEqual(document_stats.summary(['rice.txt', 'none.txt']),
+                         {'rice.txt': {'view_count': 3, 'avg_rating': 3.0}, 'none.txt': {'view_count': 0, 'avg_rating': 0.0}})
+        lo, hi = parse_date_range(None, None)
+        self.assertEqual(usage_rollups.views_by_file(lo, hi), {'rice.txt': 3, 'fish.txt': 1})
+        sources = self.client.get(reverse('get_source_ratings')).data['sources']
+        self.assertEqual([(s['file'], s['avg_rating'], s['stddev_rating']) for s in sources],
+                         [('rice.txt', 3.0, 1.41)])
+
+        # Rows written behind the API's back are picked up by the rebuild
+        MaterialView.objects.create(file='fish.txt')
+        Feedback.objects.filter(pk=ids[2]).delete()
+        self.assertEqual(document_stats.rebuild(), (2, 2))
+        fish, rice = DocumentStats.objects.order_by('file')
+        self.assertEqual((fish.view_count, rice.rating_count, rice.rating_max), (2, 1, 2))
+        self.assertEqual(document_stats.rebuild(), (2, 0))
+
+        # Migration 0025: every table is read through the historical models
+        from django.db import connection
+        from django.db.migrations.loader import MigrationLoader
+        state_apps = MigrationLoader(connection).project_state(('rag_api', '0025_backfill_document_stats')).apps
+        requested = []
+
+        class HistoricalApps:
+            def get_model(self, app_label, name):
+                requested.append(name)
+                return state_apps.get_model(app_label, name)
+
+        self.assertEqual(document_stats.rebuild(HistoricalApps()), (2, 0))
+        self.assertEqual(sorted(set(requested)), ['DocumentStats', 'Feedback', 'MaterialView'])
+
+class EventIngestTestCase(TestCase):
+    """Test the write-behind spool for views and citation copies"""
+
+    def setUp(self):
+        import tempfile
+        from .event_ingest import EventIngestBuffer
+        self.tmpdir = tempfile.TemporaryDirectory()
+        # Long interval and batch: the test flushes explicitly
+        self.buffer = EventIngestBuffer(self.tmpdir.name, batch_size=10000, flush_interval_ms=3600 * 1000)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_spooled_events_are_written_once_in_a_batch(self):
+        """Test batch writes, event times, dropped copies and crash recovery"""
+        import json
+        import os
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import CitationCopy, DocumentStats, Material, MaterialView
+        earlier = timezone.now() - timedelta(hours=2)
+        Material.objects.create(file='rice.txt', title='Rice', author='Santos')
+        self.buffer.accept('view', file='rice.txt', user_id='u1', session_id='s1')
+        self.buffer.accept('view', file='rice.txt', user_id='u2', session_id='s2', at=earlier.isoformat())
+        self.buffer.accept('copy', file='rice.txt', user_id='u1', session_id='s1', style='APA')
+        self.buffer.accept('copy', file='ghost.txt', user_id='u1', session_id='s1', style='APA')
+        # Left behind by a process that died (pid beyond any real one), last line cut short
+        with open(os.path.join(self.tmpdir.name, '99999999-1-000001.active'), 'w') as f:
+            f.write(json.dumps({'k': 'view', 'file': 'fish.txt', 'at': timezone.now().isoformat()}) + '\n{"k": "vi')
+        self.assertEqual(MaterialView.objects.count(), 0)
+
+        self.assertEqual(self.buffer.flush(), 4)
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+        self.assertEqual(list(Material.objects.values_list('file', flat=True)), ['rice.txt'])  # views don't add any
+        self.assertEqual(MaterialView.objects.filter(file='rice.txt').order_by('viewed_at').first().viewed_at, earlier)
+        self.assertEqual(CitationCopy.objects.get().document.file, 'rice.txt')
+        self.assertEqual(self.buffer.dropped_events, 1)
+        self.assertEqual(dict(DocumentStats.objects.values_list('file', 'view_count')), {'rice.txt': 2, 'fish.txt': 1})
+
+        # A segment that committed before a crash could delete it is not written again
+        with open(os.path.join(self.tmpdir.name, '99999999-1-000001.sealed'), 'w') as f:
+            f.write(json.dumps({'k': 'view', 'file': 'fish.txt', 'at': timezone.now().isoformat()}) + '\n')
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(MaterialView.objects.filter(file='fish.txt').count(), 1)
+
+    def test_late_events_update_rolled_up_days_and_unknown_copies_404(self):
+        """Test that events of rolled-up days reach the rollups in the flush, and copies need a material"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import (Material, MaterialViewDaily, RollupState, SubjectViewDaily, UsageDaily,
+                             UsageSketchDaily)
+        from .event_ingest import event_ingest
+        from .usage_rollups import STATE_NAME
+        now = timezone.now()
+        yesterday = timezone.localdate(now - timedelta(days=1))
+        Material.objects.create(file='rice.txt', title='Rice', author='Santos', subjects=['Rice'])
+        RollupState.objects.create(name=STATE_NAME, rolled_until=timezone.localdate(now))
+        UsageDaily.objects.create(day=yesterday, views=2)
+        self.buffer.accept('view', file='rice.txt', user_id='u1', at=(now - timedelta(days=1)).isoformat())
+        self.buffer.accept('copy', file='rice.txt', style='APA', at=(now - timedelta(days=1)).isoformat())
+        self.buffer.accept('view', file='rice.txt', user_id='u1')  # today: read from the raw rows
+
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(UsageDaily.objects.values_list('day', 'views', 'copies').get(), (yesterday, 3, 1))
+        self.assertEqual(MaterialViewDaily.objects.get(day=yesterday, file='rice.txt').views, 1)
+        self.assertEqual(SubjectViewDaily.objects.get(day=yesterday, subject='Rice').views, 1)
+        self.assertEqual(SubjectViewDaily.objects.get(day=timezone.localdate(now), subject='Rice').views, 1)
+        self.assertTrue(UsageSketchDaily.objects.filter(day=yesterday).exists())
+
+        Material.objects.create(file='gone.txt', title='Gone', author='Cruz', removed_at=now)
+        enabled, event_ingest.enabled = event_ingest.enabled, True
+        try:
+            for file in ('ghost.txt', 'gone.txt'):  # unknown, removed from the catalog
+                response = self.client.post('/api/track-citation/', {'file': file, 'citation_style': 'APA'},
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 404)
+        finally:
+            event_ingest.enabled = enabled
+
+
+class DashboardBundleTestCase(SimpleTestCase):
+    """Test concurrent widget computation and the ETag-keyed bundle cache"""
+
+    def test_bundle_caches_by_version_and_honours_if_none_match(self):
+        """Test that widgets run concurrently, failures are isolated and new data changes the ETag"""
+        import threading
+        from .dashboard_bundle import DashboardBundler
+        bundler = DashboardBundler(ttl_seconds=60, workers=4)
+        calls, threads = [], set()
+
+        def widget(value):
+            def task():
+                calls.append(value)
+                threads.add(threading.current_thread().name)
+                return {'value': value}
+            return task
+
+        def broken():
+            raise RuntimeError("boom")
+
+        key = {'widgets': ['a', 'b'], 'params': {'a': {'from': '2025-01-01'}}}
+        tasks = {'a': widget(1), 'b': widget(2)}
+        etag, payload = bundler.bundle(key, ('1',), tasks)
+        self.assertEqual(payload, {'widgets': {'a': {'value': 1}, 'b': {'value': 2}}, 'errors': {}})
+        self.assertTrue(all(name.startswith('dashboard-bundle') for name in threads))
+
+        # Same data version: served from the cache, or 304 when the client has it
+        self.assertEqual(bundler.bundle(key, ('1',), tasks), (etag, payload))
+        self.assertEqual(bundler.bundle(key, ('1',), tasks, if_none_match=f'"x", {etag}'), (etag, None))
+        self.assertEqual(len(calls), 2)
+
+        # A new event changes the version and the ETag
+        new_etag, _ = bundler.bundle(key, ('2',), tasks, if_none_match=etag)
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(len(calls), 4)
+
+        # A failing widget is reported on its own; the result is not cached and has no ETag
+        failed_etag, payload = bundler.bundle(key, ('3',), {'a': widget(1), 'b': broken})
+        self.assertEqual((payload['widgets'], payload['errors']), ({'a': {'value': 1}}, {'b': 'boom'}))
+        self.assertIsNone(failed_etag)
+        self.assertIsNone(bundler.get(bundler.etag(key, ('3',))))
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    """Test connection reuse, health checks, recycling and limits of the DB pool"""
+
+    class FakeConnection:
+        def __init__(self):
+            self.alive, self.in_transaction, self.closed, self.pings, self.rollbacks = True, False, False, 0, 0
+
+    def make_pool(self, **options):
+        from .db_pool import ConnectionPool
+        opened = []
+
+        def connect():
+            opened.append(self.FakeConnection())
+            return opened[-1]
+
+        def check(conn):
+            conn.pings += 1
+            return conn.alive
+
+        def reset(conn):
+            if conn.in_transaction:
+                conn.rollbacks += 1
+                conn.in_transaction = False
+            return conn.alive
+
+        def close(conn):
+            conn.closed = True
+
+        pool = ConnectionPool(connect, check, reset, close, name='test', **options)
+        pool._start = lambda: None  # maintenance is run explicitly
+        return pool, opened
+
+    def test_reuses_healthy_connections_and_replaces_broken_ones(self):
+        """Test reuse, ping after idle, rollback on return and discarding dead connections"""
+        pool, opened = self.make_pool(min_size=0, max_size=2, check_after=0)
+        conn = pool.getconn()
+        conn.in_transaction = True
+        pool.putconn(conn)
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual((len(opened), conn.pings), (1, 1))
+
+        # Dies while idle: the checkout ping catches it and a new connection is opened
+        pool.putconn(conn)
+        conn.alive = False
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['in_use'], stats['utilization']), (1, 1, 0.5))
+        self.assertEqual((stats['opened'], stats['health_check_failures']), (2, 1))
+
+        # Not pinged when it was returned moments ago
+        pool.check_after = 60
+        pool.putconn(replacement)
+        pool.getconn()
+        self.assertEqual(replacement.pings, 0)
+
+    def test_waits_for_a_free_connection_then_times_out(self):
+        """Test that a full pool blocks until a connection comes back, and gives up after the timeout"""
+        import threading
+        from .db_pool import PoolTimeout
+        pool, opened = self.make_pool(min_size=0, max_size=1, timeout=0.2)
+        held = pool.getconn()
+        threading.Timer(0.05, pool.putconn, [held]).start()
+        self.assertIs(pool.getconn(), held)
+        self.assertEqual(pool.stats()['waits'], 1)
+        self.assertGreater(pool.stats()['wait_ms']['max'], 30)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual((pool.stats()['timeouts'], pool.stats()['peak_utilization'], len(opened)), (1, 1.0, 1))
+
+    def test_maintenance_keeps_min_size_and_recycles_idle_connections(self):
+        """Test warm-up to min_size, idle recycling down to min_size and max_lifetime"""
+        import time
+        pool, opened = self.make_pool(min_size=1, max_size=3, max_idle=0.05, max_lifetime=0)
+        pool.maintain()
+        self.assertEqual(pool.stats()['idle'], 1)
+        conns = [pool.getconn() for _ in range(3)]
+        self.assertEqual(len(opened), 3)
+        for conn in conns:
+            pool.putconn(conn)
+        time.sleep(0.1)
+        pool.maintain()
+        self.assertEqual((pool.stats()['size'], pool.stats()['recycled']), (1, 2))
+
+        pool.max_lifetime = 0.05
+        pool.maintain()  # the survivor is past max_lifetime: replaced to keep min_size
+        self.assertEqual((pool.stats()['size'], len(opened)), (1, 4))
+        self.assertEqual(sum(conn.closed for conn in opened), 3)
+
+class OutboxTestCase(APITestCase):
+    """Test the transactional outbox behind the general_feedback copy of CSM feedback"""
+
+    class FakeSink:
+        configured = True
+
+        def __init__(self):
+            self.batches, self.fail = [], None
+
+        def deliver(self, messages):
+            if self.fail:
+                raise self.fail(f"{len(messages)} message(s) refused")
+            if any(m.payload.get('bad') for m in messages):
+                raise ValueError("bad row")
+            self.batches.append([m.idempotency_key for m in messages])
+
+    def setUp(self):
+        from .outbox import OutboxDispatcher
+        self.sink = self.FakeSink()
+        self.dispatcher = OutboxDispatcher(batch_size=2, max_attempts=2, retry_base_seconds=60)
+        self.dispatcher.register('general_feedback', self.sink)
+
+    def test_feedback_post_queues_the_copy_in_its_transaction(self):
+        """Test that the CSM POST writes the outbox row with the feedback and delivers it after commit"""
+        from .models import OutboxMessage
+        from .outbox import outbox
+        original = outbox.sinks['general_feedback']
+        outbox.sinks['general_feedback'] = self.sink
+        try:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                response = self.client.post('/api/csm-feedback/', {
+                    'user_id': 'u1', 'consent_given': True, 'client_type': 'Citizen', 'date': '2025-03-01',
+                    'sex': 'Female', 'age': '21-25', 'region': 'NCR', 'category': 'Student', 'litpath_rating': 5,
+                }, format='json')
+        finally:
+            outbox.sinks['general_feedback'] = original
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(callbacks), 1)  # wakes the dispatcher only once the feedback is committed
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.idempotency_key, f"csm_feedback:{response.data['id']}")
+        self.assertEqual((message.payload['date'], message.payload['litpath_rating']), ('2025-03-01', 5))
+        self.assertEqual(self.sink.batches, [])  # nothing was written during the request
+
+    def test_batches_retries_and_isolates_bad_messages(self):
+        """Test batched delivery, backoff while the sink is down, and a bad message held back alone"""
+        from django.utils import timezone
+        from .models import OutboxMessage
+        for i in range(3):
+            self.dispatcher.enqueue('general_feedback', f"k{i}", {'i': i})
+        self.dispatcher.enqueue('general_feedback', 'bad', {'bad': True})
+
+        # Sink down: every message is rescheduled, none is lost
+        from .outbox import SinkUnavailable
+        self.sink.fail = SinkUnavailable
+        self.assertEqual(self.dispatcher.dispatch(), 0)
+        # (stops after the first failed batch instead of hammering the sink)
+        self.assertEqual(OutboxMessage.objects.filter(attempts=1, next_attempt_at__gt=timezone.now()).count(), 2)
+
+        # Back up, retries due: batches of two; the bad one is isolated and finally given up on
+        self.sink.fail = None
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.dispatcher.dispatch(), 3)
+        self.assertEqual(self.sink.batches, [['k0', 'k1'], ['k2']])
+        OutboxMessage.objects.filter(status='pending').update(next_attempt_at=timezone.now())
+        self.assertEqual(self.dispatcher.dispatch(), 0)
+        bad = OutboxMessage.objects.get(idempotency_key='bad')
+        self.assertEqual((bad.status, bad.attempts, bad.last_error), ('failed', 2, 'bad row'))
+        self.assertEqual(OutboxMessage.objects.filter(status='sent').count(), 3)
+
+        # Unconfigured sink: nothing is queued
+        self.sink.configured = False
+        self.assertIsNone(self.dispatcher.enqueue('general_feedback', 'k9', {}))
+
+    def test_dispatcher_starts_with_the_first_served_request(self):
+        """Test that the first WSGI request starts the dispatcher once, and test client requests don't"""
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.core.signals import request_started
+        from django.test.client import ClientHandler
+        from . import outbox as outbox_module
+        started = []
+        original = outbox_module.outbox.start
+        outbox_module.outbox.start = lambda: started.append(True)
+        try:
+            request_started.send(sender=ClientHandler)
+            self.assertEqual(started, [])
+            request_started.send(sender=WSGIHandler)
+            request_started.send(sender=WSGIHandler)
+            self.assertEqual(started, [True])
+        finally:
+            outbox_module.outbox.start = original
+            request_started.connect(outbox_module.start_on_first_request, dispatch_uid='outbox-start')
+
+
+class MaterialCatalogTestCase(TestCase):
+    """Test batch metadata lookups and the sync of `materials` with the thesis catalog"""
+
+    def test_batch_lookup_uses_one_call_per_index(self):
+        """Test that many files resolve with one document-index get plus one chunk-index get"""
+        import tempfile
+        import numpy as np
+        from .rag_service import RAGService
+        from .vector_store import NumpyVectorStore
+        with tempfile.TemporaryDirectory() as tmpdir:
+            chunks = NumpyVectorStore(tmpdir + '/chunks')
+            documents = NumpyVectorStore(tmpdir + '/documents')
+            metas = [{"file": f"t{i}.txt", "title": f"title {i}", "author": "dela cruz, juan",
+                      "publication_year": "2019", "chunk_idx": 0} for i in range(4)]
+            chunks.add(embeddings=np.eye(4, dtype=np.float32), documents=["c"] * 4, metadatas=metas,
+                       ids=[f"t{i}.txt_chunk_0" for i in range(4)])
+            # t2 / t3 are not in the document index yet
+            documents.add(embeddings=np.eye(4, dtype=np.float32)[:2], documents=["d"] * 2, metadatas=metas[:2],
+                          ids=["t0.txt", "t1.txt"])
+            calls = []
+            for store in (chunks, documents):
+                store.get = (lambda get: lambda **kw: calls.append(kw) or get(**kw))(store.get)
+            rag = object.__new__(RAGService)
+            rag.collection, rag.document_collection = chunks, documents
+
+            found = rag.get_documents_metadata(["t0.txt", "t1.txt", "t2.txt", "missing.txt"])
+        self.assertEqual(set(found), {"t0.txt", "t1.txt", "t2.txt"})
+        self.assertEqual(found["t2.txt"]["year"], "2019")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[1]["where"], {"file": {"$in": ["t2.txt", "missing.txt"]}})
+
+    def test_sync_diffs_the_catalog_against_materials(self):
+        """Test created / updated / unchanged / removed materials, dry runs and the removal guard"""
+        import json
+        import os
+        import tempfile
+        from .material_catalog import MaterialCatalog
+        from .models import CitationCopy, Material
+
+        class FakeRag:
+            def get_all_documents_metadata(self):
+                return {f: {'title': f'Real {f}', 'author': 'Santos', 'year': '2021', 'abstract': 'About rice.',
+                            'degree': 'Master of Science', 'subjects': 'Rice, Agriculture', 'school': 'UPLB'}
+                        for f in ('new.txt', 'old.txt', 'same.txt')}
+
+        with tempfile.TemporaryDirectory() as folder:
+            # all_metadata.json fills in what the index lacks, and theses it hasn't indexed yet
+            with open(os.path.join(folder, 'all_metadata.json'), 'w', encoding='utf-8') as f:
+                json.dump({'new.txt': {'title': 'json title', 'call_no': 'x'},
+                           'curated.txt': {'title': 'Curated Thesis'},
+                           'later.txt': {'title': 'LATER THESIS', 'author': 'REYES, ANA', 'publication_year': '2019',
+                                         'university': 'uplb', 'subjects': ['Fish']}}, f)
+            open(os.path.join(folder, 'unindexed.txt'), 'w').close()
+            Material.objects.create(file='old.txt', title='Unknown', author='Unknown', degree='Thesis', school='Unknown')
+            Material.objects.create(file='same.txt', title='Real same.txt', author='Santos', year=2021,
+                                    abstract='About rice.', degree='Master of Science',
+                                    subjects=['Rice', 'Agriculture'], school='UPLB')
+            # Fields the sources don't know keep their curated values
+            Material.objects.create(file='curated.txt', title='Draft title', author='Lim, Rosa', year=2018,
+                                    abstract='Curated abstract.', degree='PhD', subjects=['Soil'], school='CLSU')
+            removed = Material.objects.create(file='removed.txt', title='Gone', author='Cruz')
+            Material.objects.create(file='unindexed.txt', title='Still on disk', author='Cruz')
+            CitationCopy.objects.create(document=removed, citation_style='APA')
+            catalog = MaterialCatalog(folder, chunk_size=2)
+            documents = catalog.documents(FakeRag())
+
+            expected = {'created': 2, 'updated': 2, 'removed': 1, 'unchanged': 1}
+            self.assertEqual(catalog.sync(documents, dry_run=True), expected)
+            self.assertEqual(Material.objects.count(), 5)
+            self.assertEqual(catalog.sync(documents), expected)
+            self.assertEqual(sorted(Material.objects.filter(removed_at__isnull=True).values_list('file', flat=True)),
+                             ['curated.txt', 'later.txt', 'new.txt', 'old.txt', 'same.txt', 'unindexed.txt'])
+            # Removed, not deleted: its citation copies stay
+            removed.refresh_from_db()
+            self.assertIsNotNone(removed.removed_at)
+            self.assertEqual(CitationCopy.objects.filter(document=removed).count(), 1)
+            old = Material.objects.get(file='old.txt')
+            self.assertEqual((old.title, old.year, old.degree, old.subjects, old.school),
+                             ('Real old.txt', 2021, 'Master of Science', ['Rice', 'Agriculture'], 'UPLB'))
+            later = Material.objects.get(file='later.txt')
+            self.assertEqual((later.title, later.author, later.year, later.subjects, later.abstract),
+                             ('Later Thesis', 'Reyes, Ana', 2019, ['Fish'], ''))
+            self.assertEqual(Material.objects.get(file='new.txt').title, 'Real new.txt')
+            curated = Material.objects.get(file='curated.txt')
+            self.assertEqual((curated.title, curated.author, curated.year, curated.abstract, curated.degree,
+                              curated.subjects, curated.school),
+                             ('Curated Thesis', 'Lim, Rosa', 2018, 'Curated abstract.', 'PhD', ['Soil'], 'CLSU'))
+
+            self.assertEqual(catalog.sync(documents), {'created': 0, 'updated': 0, 'removed': 0, 'unchanged': 5})
+            # Missing sources are not a catalog without theses
+            self.assertEqual(catalog.sync({})['removed'], 0)
+            self.assertEqual(Material.objects.filter(removed_at__isnull=True).count(), 6)
+
+            # A thesis that comes back is restored
+            documents['removed.txt'] = {'title': 'Gone'}
+            self.assertEqual(catalog.sync(documents)['updated'], 1)
+            removed.refresh_from_db()
+            self.assertIsNone(removed.removed_at)
+
+
 # Example model tests (when you add models)
 # class DocumentCacheModelTest(TestCase):
 #     def test_create_document_cache(self):
@@ -11,7 +11,8 @@ from . views import (
     dashboard_usage_by_category, dashboard_age_distribution, 
     dashboard_monthly_trends, dashboard_weekly_trends, dashboard_daily_trends,
     track_citation_copy, dashboard_citation_stats, dashboard_citation_monthly, dashboard_citation_weekly, dashboard_citation_daily,
-    dashboard_least_browsed, dashboard_dormant_count
+    dashboard_least_browsed, dashboard_dormant_count, dashboard_stage_latency, dashboard_bundle,
+    metrics_view
 )
 from . admin_views import admin_login_view, admin_users_view, admin_user_delete_view
 from . auth_views import (
@@ -41,6 +42,8 @@ urlpatterns = [
     path('search/stream', StreamingSearchView.as_view(), name='search-stream-no-slash'),
     path('filters/', FiltersView.as_view(), name='filters'),
     path('filters', FiltersView.as_view(), name='filters-no-slash'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('metrics', metrics_view, name='metrics-no-slash'),
     
     # Bookmarks
     path('bookmarks/', bookmarks_view, name='bookmarks'),
@@ -141,6 +144,10 @@ urlpatterns = [
     path('dashboard/least-browsed', dashboard_least_browsed, name='dashboard-least-browsed-no-slash'),
     path('dashboard/dormant-count/', dashboard_dormant_count, name='dashboard-dormant-count'),
     path('dashboard/dormant-count', dashboard_dormant_count, name='dashboard-dormant-count-no-slash'),
+    path('dashboard/stage-latency/', dashboard_stage_latency, name='dashboard-stage-latency'),
+    path('dashboard/stage-latency', dashboard_stage_latency, name='dashboard-stage-latency-no-slash'),
+    path('dashboard/bundle/', dashboard_bundle, name='dashboard-bundle'),
+    path('dashboard/bundle', dashboard_bundle, name='dashboard-bundle-no-slash'),
 ]
 
 
@@ -0,0 +1,560 @@
+"""
+Daily usage rollups for the LitPath AI admin dashboard
+
+The trend, citation and KPI widgets used to COUNT the raw material_views /
+citation copy rows on every load, so their cost grew with all traffic ever
+recorded. Finished days are now rolled up into small per-day tables:
+
+- usage_daily              total views and citation copies per day
+- material_view_daily      views per file per day
+- subject_view_daily       views per subject per day (materials.subjects)
+- citation_copy_daily      citation copies per document per day
+- subject_citation_daily   citation copies per subject per day
+- usage_sketch_daily       HyperLogLog sketches of the day's distinct visitors
+                           (user_id, session_id) and viewed files
+
+rollup_state holds the high-water mark `rolled_until`: every day before it
+is complete in the rollups. A dashboard range is answered from the rollups
+for its whole days before the mark, plus the raw rows of the
+not-yet-rolled-up tail (normally just today) and of any partial days at the
+edges of the range - so results always match the raw queries.
+
+Unique visitors and accessed documents are distinct counts, which do not
+add up across days; they merge the daily sketches of the range (plus a
+sketch of the raw tail) instead, within the error bound documented in
+hll.py (1.6% standard error). exact=True answers them from the raw rows /
+per-file rollup instead, for audits.
+
+subject_view_daily is also kept current as views arrive: every view written
+(track_material_view, the write-behind ingester) is added to its day's
+subject rows by record_events, and compaction later recomputes the day from
+the raw rows. dashboard_trending_topics therefore reads both periods from
+subject_view_daily alone and computes the growth in the same SQL statement
+(trending_subjects), so its cost depends on days x subjects, not on the
+size of material_views.
+
+Compaction recomputes whole days from the raw rows (idempotent) once they
+are over plus `settle_minutes` for in-flight writes. It runs:
+- in the background after a view / citation copy is recorded, at most once
+  per day per process, once the rollups have been backfilled
+- from `python manage.py rollup_usage_stats` (cron)
+
+Migration 0028 runs the initial backfill; `rollup_usage_stats --backfill`
+re-runs it. Events flushed late by the write-behind ingester
+(event_ingest.py) into a day that is already rolled up are added to all of
+that day's rollups in the same transaction (record_events).
+
+Subjects are taken from materials.subjects at compaction time; re-run the
+backfill after re-tagging materials.
+
+Configured via Django settings (see settings.py):
+    ROLLUP_AUTO_COMPACT, ROLLUP_SETTLE_MINUTES
+"""
+
+import threading
+from collections import defaultdict
+from datetime import datetime, date, time as dtime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .document_stats import _model
+from .hll import HyperLogLog
+
+
+STATE_NAME = 'daily_usage'
+BATCH_DAYS = 31  # days recomputed per transaction
+IN_CHUNK = 500   # ids per IN (...) lookup
+TOP_CITED_FIELDS = ('document__file', 'document__title', 'document__author', 'document__year')
+
+
+def day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, dtime.min))
+
+
+def visitor_key(user_id: Optional[str], session_id: Optional[str]) -> str:
+    """Sketch item for a visitor: the (user_id, session_id) pair the exact count distincts on"""
+    return f"{user_id or ''}\x1f{session_id or ''}"
+
+
+def _chunks(items: List, size: int = IN_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class UsageRollups:
+    """Maintains and reads the daily rollup tables"""
+
+    def __init__(self, settle_minutes: int = 10, auto_compact: bool = True):
+        self.settle_minutes = settle_minutes
+        self.auto_compact = auto_compact
+        self._lock = threading.Lock()
+        self._compacting = False
+        self._known_until = None  # watermark last seen by this process
+
+    # ---------- watermark ----------
+
+    def rolled_until(self) -> Optional[date]:
+        """First day not covered by the rollups (None before the first backfill)"""
+        from .models import RollupState
+        return RollupState.objects.filter(name=STATE_NAME).values_list('rolled_until', flat=True).first()
+
+    def settled_day(self) -> date:
+        """Days before this one are over (with the settle margin) and can be rolled up"""
+        return timezone.localdate(timezone.now() - timedelta(minutes=self.settle_minutes))
+
+    def plan(self, from_dt: datetime, to_dt: datetime, until: Optional[date]):
+        """Split [from_dt, to_dt] into a rolled-up day range and raw [lo, hi) ranges"""
+        to_excl = to_dt + timedelta(microseconds=1)
+        first_full = timezone.localdate(from_dt)
+        if day_start(first_full) < from_dt:
+            first_full += timedelta(days=1)
+        last_full = timezone.localdate(to_excl) - timedelta(days=1)
+        if until is not None:
+            last_full = min(last_full, until - timedelta(days=1))
+        if until is None or last_full < first_full:
+            return None, [(from_dt, to_excl)]
+        raw = []
+        if from_dt < day_start(first_full):
+            raw.append((from_dt, day_start(first_full)))
+        tail_start = day_start(last_full + timedelta(days=1))
+        if tail_start < to_excl:
+            raw.append((tail_start, to_excl))
+        return (first_full, last_full), raw
+
+    # ---------- compaction ----------
+
+    def _first_raw_day(self, apps=None) -> Optional[date]:
+        MaterialView, CitationCopy = _model('MaterialView', apps), _model('CitationCopy', apps)
+        firsts = [
+            MaterialView.objects.order_by('viewed_at').values_list('viewed_at', flat=True).first(),
+            CitationCopy.objects.order_by('copied_at').values_list('copied_at', flat=True).first(),
+        ]
+        firsts = [timezone.localdate(f) for f in firsts if f]
+        return min(firsts) if firsts else None
+
+    def _rebuild(self, start: date, end: date, apps=None) -> Tuple[int, int]:
+        """Recompute all rollups for days in [start, end); returns (views, copies) rolled up"""
+        (Material, MaterialView, CitationCopy, UsageDaily, MaterialViewDaily, SubjectViewDaily, CitationCopyDaily,
+         SubjectCitationDaily, UsageSketchDaily) = (_model(name, apps) for name in (
+            'Material', 'MaterialView', 'CitationCopy', 'UsageDaily', 'MaterialViewDaily', 'SubjectViewDaily',
+            'CitationCopyDaily', 'SubjectCitationDaily', 'UsageSketchDaily'))
+        for model in (UsageDaily, MaterialViewDaily, SubjectViewDaily, CitationCopyDaily, SubjectCitationDaily,
+                      UsageSketchDaily):
+            model.objects.filter(day__gte=start, day__lt=end).delete()
+        lo, hi = day_start(start), day_start(end)
+
+        view_rows = list(
+            MaterialView.objects.filter(viewed_at__gte=lo, viewed_at__lt=hi)
+            .annotate(day=TruncDate('viewed_at'))
+            .values_list('day', 'file')
+            .annotate(views=Count('id'))
+        )
+        visitor_rows = (
+            MaterialView.objects.filter(viewed_at__gte=lo, viewed_at__lt=hi)
+            .annotate(day=TruncDate('viewed_at'))
+            .values_list('day', 'user_id', 'session_id')
+            .distinct()
+        )
+        copy_rows = list(
+            CitationCopy.objects.filter(copied_at__gte=lo, copied_at__lt=hi)
+            .annotate(day=TruncDate('copied_at'))
+            .values_list('day', 'document_id')
+            .annotate(copies=Count('id'))
+        )
+
+        subjects_by_id = {}
+        for ids in _chunks(sorted({d for _, d, _ in copy_rows})):
+            subjects_by_id.update(Material.objects.filter(id__in=ids).values_list('id', 'subjects'))
+
+        totals = defaultdict(lambda: [0, 0])
+        subject_views, subject_copies = self._subject_views(view_rows, apps), defaultdict(int)
+        for day, file, views in view_rows:
+            totals[day][0] += views
+        for day, document_id, copies in copy_rows:
+            totals[day][1] += copies
+            for subject in {s[:200] for s in subjects_by_id.get(document_id) or []}:
+                subject_copies[(day, subject)] += copies
+
+        UsageDaily.objects.bulk_create(
+            [UsageDaily(day=d, views=v, copies=c) for d, (v, c) in totals.items()], batch_size=1000)
+        MaterialViewDaily.objects.bulk_create(
+            [MaterialViewDaily(day=d, file=f, views=v) for d, f, v in view_rows], batch_size=1000)
+        SubjectViewDaily.objects.bulk_create(
+            [SubjectViewDaily(day=d, subject=s, views=v) for (d, s), v in subject_views.items()], batch_size=1000)
+        CitationCopyDaily.objects.bulk_create(
+            [CitationCopyDaily(day=d, document_id=i, copies=c) for d, i, c in copy_rows], batch_size=1000)
+        SubjectCitationDaily.objects.bulk_create(
+            [SubjectCitationDaily(day=d, subject=s, copies=c) for (d, s), c in subject_copies.items()], batch_size=1000)
+
+        visitors, documents = defaultdict(list), defaultdict(list)
+        for day, user_id, session_id in visitor_rows.iterator():
+            visitors[day].append(visitor_key(user_id, session_id))
+        for day, file, _ in view_rows:
+            documents[day].append(file)
+        sketches = []
+        for day in documents:
+            visitor_sketch, document_sketch = HyperLogLog(), HyperLogLog()
+            visitor_sketch.add(visitors[day])
+            document_sketch.add(documents[day])
+            sketches.append(UsageSketchDaily(day=day, visitors=visitor_sketch.to_bytes(),
+                                             documents=document_sketch.to_bytes()))
+        UsageSketchDaily.objects.bulk_create(sketches, batch_size=500)
+        return sum(v for _, _, v in view_rows), sum(c for _, _, c in copy_rows)
+
+    @staticmethod
+    def _subject_views(view_rows: List[Tuple], apps=None) -> Dict[Tuple, int]:
+        """{(day, subject): views} from (day, file, views) rows, by materials.subjects"""
+        Material = _model('Material', apps)
+        subjects_by_file = {}
+        for files in _chunks(sorted({f for _, f, _ in view_rows})):
+            subjects_by_file.update(Material.objects.filter(file__in=files).values_list('file', 'subjects'))
+        subject_views = defaultdict(int)
+        for day, file, views in view_rows:
+            for subject in {s[:200] for s in subjects_by_file.get(file) or []}:
+                subject_views[(day, subject)] += views
+        return subject_views
+
+    def _rebuild_subject_tail(self, apps=None):
+        """Recompute subject_view_daily for the days after the watermark (kept current by
+        record_events from then on)"""
+        MaterialView, RollupState, SubjectViewDaily = (
+            _model(name, apps) for name in ('MaterialView', 'RollupState', 'SubjectViewDaily'))
+        with transaction.atomic():
+            until = (RollupState.objects.select_for_update().filter(name=STATE_NAME)
+                     .values_list('rolled_until', flat=True).first())
+            if until is None:
+                return
+            SubjectViewDaily.objects.filter(day__gte=until).delete()
+            view_rows = list(
+                MaterialView.objects.filter(viewed_at__gte=day_start(until))
+                .annotate(day=TruncDate('viewed_at')).values_list('day', 'file').annotate(views=Count('id'))
+            )
+            subject_views = self._subject_views(view_rows, apps)
+            SubjectViewDaily.objects.bulk_create(
+                [SubjectViewDaily(day=d, subject=s, views=v) for (d, s), v in subject_views.items()], batch_size=1000)
+
+    def compact(self, end: Optional[date] = None, apps=None) -> int:
+        """Roll up the days from the watermark (or the first raw row) up to `end`
+        (default: settled_day()), BATCH_DAYS per transaction. Returns days rolled up."""
+        RollupState = _model('RollupState', apps)
+        end = end or self.settled_day()
+        first_day = self._first_raw_day(apps) or end
+        total_days = total_views = total_copies = 0
+        while True:
+            with transaction.atomic():
+                # The locked state row serialises concurrent compactions
+                state, _ = RollupState.objects.select_for_update().get_or_create(
+                    name=STATE_NAME, defaults={'rolled_until': first_day}
+                )
+                start = state.rolled_until
+                if start >= end:
+                    break
+                batch_end = min(end, start + timedelta(days=BATCH_DAYS))
+                views, copies = self._rebuild(start, batch_end, apps)
+                state.rolled_until = batch_end
+                state.save(update_fields=['rolled_until', 'updated_at'])
+            total_days += (batch_end - start).days
+            total_views += views
+            total_copies += copies
+        self._known_until = start
+        if total_days:
+            print(f"[ROLLUP] Rolled up {total_days} day(s) through {end - timedelta(days=1)}: "
+                  f"{total_views} views, {total_copies} citation copies")
+        return total_days
+
+    def backfill(self, apps=None) -> int:
+        """Drop all rollups and rebuild them from the raw tables (migrations pass their
+        `apps` registry: 0028 runs the initial backfill)"""
+        RollupState = _model('RollupState', apps)
+        with transaction.atomic():
+            # Dashboards read the raw tables until the rebuild has advanced the watermark
+            RollupState.objects.filter(name=STATE_NAME).delete()
+            for name in ('UsageDaily', 'MaterialViewDaily', 'SubjectViewDaily', 'CitationCopyDaily',
+                         'SubjectCitationDaily', 'UsageSketchDaily'):
+                _model(name, apps).objects.all().delete()
+        days = self.compact(apps=apps)
+        self._rebuild_subject_tail(apps)
+        return days
+
+    def maybe_compact(self):
+        """After an ingest: roll up finished days in a background thread, at most once per day per process"""
+        if not self.auto_compact or self._known_until == self.settled_day():
+            return
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            if self.rolled_until() is None:
+                # Never backfilled: dashboards keep reading the raw tables
+                print("[ROLLUP] Rollups not initialised - run `python manage.py rollup_usage_stats --backfill`")
+                self._known_until = self.settled_day()
+            else:
+                self.compact()
+        except Exception as e:
+            print(f"[ROLLUP] Background compaction failed: {e}")
+        finally:
+            self._compacting = False
+            connections.close_all()
+
+    # ---------- new events ----------
+
+    def record_events(self, views: List[Tuple], copies: List[Tuple]) -> int:
+        """Add written events to the rollups; call inside the transaction that writes their
+        raw rows. Views of any day go to subject_view_daily; events of days that are already
+        rolled up go to every rollup. Other counts of later days are read from the raw tail.
+
+        `views` are (at, file, user_id, session_id), `copies` (at, document_id). Spooled
+        events keep the time they were accepted, so a segment flushed after compaction
+        passed its day (a crash, a stalled flusher) would otherwise be missing from the
+        dashboard until the next backfill. Returns the number of late events added.
+        """
+        from .models import (
+            Material, RollupState, UsageDaily, MaterialViewDaily, SubjectViewDaily, CitationCopyDaily,
+            SubjectCitationDaily, UsageSketchDaily,
+        )
+        if not views and not copies:
+            return 0
+        # Compaction holds this row while it rolls days up: late events either wait for it
+        # (and see the new watermark) or commit first (and compaction reads their raw rows)
+        until = (RollupState.objects.select_for_update().filter(name=STATE_NAME)
+                 .values_list('rolled_until', flat=True).first())
+        if until is None:
+            return 0
+        current = defaultdict(int)
+        for at, file, _, _ in views:
+            if timezone.localdate(at) >= until:
+                current[(timezone.localdate(at), file)] += 1
+        if current:
+            self._increment(SubjectViewDaily, 'views', ('day', 'subject'),
+                            self._subject_views([(d, f, n) for (d, f), n in current.items()]))
+        views = [(timezone.localdate(at), file, user_id, session_id) for at, file, user_id, session_id in views
+                 if timezone.localdate(at) < until]
+        copies = [(timezone.localdate(at), document_id) for at, document_id in copies
+                  if timezone.localdate(at) < until]
+        if not views and not copies:
+            return 0
+
+        subjects_by_file = dict(Material.objects.filter(file__in={f for _, f, _, _ in views})
+                                .values_list('file', 'subjects')) if views else {}
+        subjects_by_id = dict(Material.objects.filter(id__in={d for _, d in copies})
+                              .values_list('id', 'subjects')) if copies else {}
+        day_views, day_copies = defaultdict(int), defaultdict(int)
+        file_views, subject_views = defaultdict(int), defaultdict(int)
+        document_copies, subject_copies = defaultdict(int), defaultdict(int)
+        visitors, documents = defaultdict(list), defaultdict(list)
+        for day, file, user_id, session_id in views:
+            day_views[(day,)] += 1
+            file_views[(day, file)] += 1
+            for subject in {s[:200] for s in subjects_by_file.get(file) or []}:
+                subject_views[(day, subject)] += 1
+            visitors[day].append(visitor_key(user_id, session_id))
+            documents[day].append(file)
+        for day, document_id in copies:
+            day_copies[(day,)] += 1
+            document_copies[(day, document_id)] += 1
+            for subject in {s[:200] for s in subjects_by_id.get(document_id) or []}:
+                subject_copies[(day, subject)] += 1
+
+        self._increment(UsageDaily, 'views', ('day',), day_views)
+        self._increment(UsageDaily, 'copies', ('day',), day_copies)
+        self._increment(MaterialViewDaily, 'views', ('day', 'file'), file_views)
+        self._increment(SubjectViewDaily, 'views', ('day', 'subject'), subject_views)
+        self._increment(CitationCopyDaily, 'copies', ('day', 'document_id'), document_copies)
+        self._increment(SubjectCitationDaily, 'copies', ('day', 'subject'), subject_copies)
+        for day in visitors:
+            row = UsageSketchDaily.objects.filter(day=day).first()
+            visitor_sketch = HyperLogLog.from_bytes(row.visitors) if row else HyperLogLog()
+            document_sketch = HyperLogLog.from_bytes(row.documents) if row else HyperLogLog()
+            visitor_sketch.add(visitors[day])
+            document_sketch.add(documents[day])
+            UsageSketchDaily.objects.update_or_create(day=day, defaults={
+                'visitors': visitor_sketch.to_bytes(), 'documents': document_sketch.to_bytes()})
+        print(f"[ROLLUP] Added {len(views)} late views and {len(copies)} late citation copies to the rollups")
+        return len(views) + len(copies)
+
+    @staticmethod
+    def _increment(model, field: str, keys: Tuple[str, ...], counts: Dict[Tuple, int]):
+        """Add counts to rollup rows, creating missing ones (the state row lock keeps this race-free)"""
+        for key, n in counts.items():
+            lookup = dict(zip(keys, key))
+            if not model.objects.filter(**lookup).update(**{field: F(field) + n}):
+                model.objects.create(**lookup, **{field: n})
+
+    # ---------- reads (rollups + raw tail) ----------
+
+    def views_by_day(self, from_dt: datetime, to_dt: datetime) -> Dict[date, int]:
+        from .models import MaterialView, UsageDaily
+        days, raw = self.plan(from_dt, to_dt, self.rolled_until())
+        counts = defaultdict(int)
+        if days:
+            for day, n in UsageDaily.objects.filter(day__range=days, views__gt=0).values_list('day', 'views'):
+                counts[day] += n
+        for lo, hi in raw:
+            rows = (MaterialView.objects.filter(viewed_at__gte=lo, viewed_at__lt=hi)
+                    .annotate(day=TruncDate('viewed_at')).values_list('day').annotate(n=Count('id')))
+            for day, n in rows:
+                counts[day] += n
+        return dict(counts)
+
+    def copies_by_day(self, from_dt: datetime, to_dt: datetime) -> Dict[date, int]:
+        from .models import CitationCopy, UsageDaily
+        days, raw = self.plan(from_dt, to_dt, self.rolled_until())
+        counts = defaultdict(int)
+        if days:
+            for day, n in UsageDaily.objects.filter(day__range=days, copies__gt=0).values_list('day', 'copies'):
+                counts[day] += n
+        for lo, hi in raw:
+            rows = (CitationCopy.objects.filter(copied_at__gte=lo, copied_at__lt=hi)
+                    .annotate(day=TruncDate('copied_at')).values_list('day').annotate(n=Count('id')))
+            for day, n in rows:
+                counts[day] += n
+        return dict(counts)
+
+    def _merged_sketch(self, field: str, days, raw, raw_items) -> Optional[HyperLogLog]:
+        """Merge of the rolled-up days' `field` sketches and a sketch of the raw ranges
+        (None when days rolled up before the sketches existed lack one - re-run the backfill)"""
+        from .models import UsageDaily, UsageSketchDaily
+        sketch = HyperLogLog()
+        if days:
+            rows = list(UsageSketchDaily.objects.filter(day__range=days).values_list(field, flat=True))
+            if len(rows) < UsageDaily.objects.filter(day__range=days, views__gt=0).count():
+                return None
+            for data in rows:
+                sketch.merge(HyperLogLog.from_bytes(data))
+        for lo, hi in raw:
+            sketch.add(raw_items(lo, hi))
+        return sketch
+
+    def unique_visitors(self, from_dt: datetime, to_dt: datetime, exact: bool = False) -> int:
+        """Distinct (user_id, session_id) pairs with a view in the range (HyperLogLog estimate unless exact)"""
+        from .models import MaterialView
+        if exact:
+            return (MaterialView.objects.filter(viewed_at__range=[from_dt, to_dt])
+                    .values('user_id', 'session_id').distinct().count())
+        days, raw = self.plan(from_dt, to_dt, self.rolled_until())
+
+        def raw_items(lo, hi):
+            pairs = (MaterialView.objects.filter(viewed_at__gte=lo, viewed_at__lt=hi)
+                     .values_list('user_id', 'session_id').distinct())
+            return (visitor_key(u, s) for u, s in pairs.iterator())
+
+        sketch = self._merged_sketch('visitors', days, raw, raw_items)
+        return sketch.count() if sketch is not None else self.unique_visitors(from_dt, to_dt, exact=True)
+
+    def accessed_files(self, from_dt: datetime, to_dt: datetime, exact: bool = False) -> int:
+        """Number of distinct files viewed in the range (HyperLogLog estimate unless exact)"""
+        from .models import MaterialView, MaterialViewDaily
+        days, raw = self.plan(from_dt, to_dt, self.rolled_until())
+        if not exact:
+            def raw_items(lo, hi):
+                return (MaterialView.objects.filter(viewed_at__gte=lo, viewed_at__lt=hi)
+                        .values_list('file', flat=True).distinct().iterator())
+
+            sketch = self._merged_sketch('documents', days, raw, raw_items)
+            if sketch is not None:
+                return sketch.count()
+        files = set()
+        if days:
+            files.update(MaterialViewDaily.objects.filter(day__range=days).values_list('file', flat=True).distinct())
+        for lo, hi in raw:
+            files.update(MaterialView.objects.filter(viewed_at__gte=lo, viewed_at__lt=hi)
+                         .values_list('file', flat=True).distinct())
+        return len(files)
+
+    def views_by_file(self, from_dt: datetime, to_dt: datetime) -> Dict[str, int]:
+        """Views per file in the range (most browsed)"""
+        from .models import MaterialView, MaterialViewDaily
+        days, raw = self.plan(from_dt, to_dt, self.rolled_until())
+        counts = defaultdict(int)
+        if days:
+            rows = (MaterialViewDaily.objects.filter(day__range=days)
+                    .values_list('file').annotate(n=Sum('views')).order_by())
+            for file, n in rows:
+                counts[file] += n
+        for lo, hi in raw:
+            rows = (MaterialView.objects.filter(viewed_at__gte=lo, viewed_at__lt=hi)
+                    .values_list('file').annotate(n=Count('id')).order_by())
+            for file, n in rows:
+                counts[file] += n
+        return dict(counts)
+
+    def top_cited(self, from_dt: datetime, to_dt: datetime, limit: int = 5) -> List[Dict]:
+        """Most copied documents in the range, shaped like the CitationCopy values() query"""
+        from .models import CitationCopy, CitationCopyDaily
+        days, raw = self.plan(from_dt, to_dt, self.rolled_until())
+        merged = {}
+
+        def add(rows):
+            for row in rows:
+                key = row['document__file']
+                if key in merged:
+                    merged[key]['copies'] += row['copies']
+                else:
+                    merged[key] = dict(row)
+
+        if days:
+            add(CitationCopyDaily.objects.filter(day__range=days)
+                .values(*TOP_CITED_FIELDS).annotate(copies=Sum('copies')).order_by())
+        for lo, hi in raw:
+            add(CitationCopy.objects.filter(copied_at__gte=lo, copied_at__lt=hi)
+                .values(*TOP_CITED_FIELDS).annotate(copies=Count('id')).order_by())
+        return sorted(merged.values(), key=lambda row: -row['copies'])[:limit]
+
+    def trending_subjects(self, prev_from: date, from_day: date, to_day: date,
+                          min_views: int = 3, limit: int = 7) -> List[Dict]:
+        """Subjects with the highest view growth of [from_day, to_day] over [prev_from, from_day).
+
+        One statement over subject_view_daily, which record_events keeps current
+        (no raw tail): a range scan on its (day, subject) key, both periods
+        split with FILTER, and the growth computed in SQL. Subjects need
+        `min_views` in the current period; growth is 100% when the previous
+        period had no views; ties go to more current views, then the name.
+        """
+        from django.db import connection
+        from .models import SubjectViewDaily
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                WITH periods AS (
+                    SELECT
+                        subject,
+                        COALESCE(SUM(views) FILTER (WHERE day >= %(from_day)s), 0) AS current_views,
+                        COALESCE(SUM(views) FILTER (WHERE day < %(from_day)s), 0) AS prev_views
+                    FROM {SubjectViewDaily._meta.db_table}
+                    WHERE day BETWEEN %(prev_from)s AND %(to_day)s
+                    GROUP BY subject
+                )
+                SELECT
+                    subject,
+                    current_views,
+                    prev_views,
+                    CASE WHEN prev_views = 0 THEN 100.0
+                         ELSE ROUND((current_views - prev_views) * 100.0 / prev_views, 1)
+                    END AS growth
+                FROM periods
+                WHERE current_views >= %(min_views)s
+                ORDER BY growth DESC, current_views DESC, subject
+                LIMIT %(limit)s
+            """, {
+                'prev_from': prev_from, 'from_day': from_day, 'to_day': to_day,
+                'min_views': min_views, 'limit': limit,
+            })
+            return [
+                {'subject': subject, 'current_views': int(current), 'prev_views': int(prev), 'growth': float(growth)}
+                for subject, current, prev, growth in cursor.fetchall()
+            ]
+
+
+# Singleton instance for use across the application
+usage_rollups = UsageRollups(
+    settle_minutes=getattr(settings, 'ROLLUP_SETTLE_MINUTES', 10),
+    auto_compact=getattr(settings, 'ROLLUP_AUTO_COMPACT', True),
+)
@@ -0,0 +1,234 @@
+"""
+Compressed first-stage scoring for the NumPy vector store
+
+Two optional, independently configurable stages learned from the corpus:
+
+- PCAReducer: principal components of the stored chunk vectors, ordered by
+  explained variance. Keeping the first `dims` components is a
+  Matryoshka-style truncation - any prefix is a valid lower-dimensional
+  embedding, so one fit serves every target size.
+- ScalarQuantizer: per-dimension int8 codes over the (reduced) vectors,
+  with the range clipped at the 0.1/99.9 percentiles so a few outliers do
+  not waste the 256 levels.
+
+BinarySignCodes is the coarsest stage: one bit per (mean-centred)
+dimension, packed into uint64 words and compared with popcount Hamming
+distance - 96 bytes per 768-d chunk, no floating point in stage one. An
+asymmetric variant keeps a few bits of the query (bit-planes) and scores
+with popcount(code & plane), which tracks the float dot product much more
+closely for sparse or skewed embeddings at a few extra popcounts per word.
+
+VectorCompressor combines the first two. Stage one ranks rows on the compressed
+codes (asymmetric: the query stays in float32 and the exact row norms are
+used, only the dot product is approximated); NumpyVectorStore then
+re-scores the shortlist exactly against the memory-mapped float vectors, so
+returned distances are unchanged and only the candidate ordering is
+approximate.
+"""
+
+import numpy as np
+
+
+class PCAReducer:
+    """Mean-centred projection onto the top principal components"""
+
+    def __init__(self, mean=None, components=None):
+        self.mean = mean
+        self.components = components  # (dims, dim), rows ordered by variance
+
+    @property
+    def dims(self):
+        return 0 if self.components is None else self.components.shape[0]
+
+    def fit(self, sample: np.ndarray, dims: int) -> "PCAReducer":
+        sample = np.asarray(sample, dtype=np.float64)
+        self.mean = sample.mean(axis=0)
+        centred = sample - self.mean
+        # Eigen-decomposition of the dim x dim covariance: cheaper than an SVD
+        # of the sample when the sample has more rows than dimensions
+        cov = centred.T @ centred / max(1, len(sample) - 1)
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        order = np.argsort(eigvals)[::-1][:dims]
+        self.components = eigvecs[:, order].T.astype(np.float32)
+        self.mean = self.mean.astype(np.float32)
+        self.explained_variance_ratio = float(eigvals[order].sum() / max(eigvals.sum(), 1e-12))
+        return self
+
+    def transform(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        return (x - self.mean) @ self.components.T
+
+
+class ScalarQuantizer:
+    """Per-dimension affine int8 quantization: x ~= (code + 128) * scale + low"""
+
+    def __init__(self, low=None, scale=None):
+        self.low = low
+        self.scale = scale
+
+    def fit(self, sample: np.ndarray) -> "ScalarQuantizer":
+        sample = np.asarray(sample, dtype=np.float32)
+        low = np.percentile(sample, 0.1, axis=0).astype(np.float32)
+        high = np.percentile(sample, 99.9, axis=0).astype(np.float32)
+        self.low = low
+        self.scale = np.maximum((high - low) / 255.0, 1e-8).astype(np.float32)
+        return self
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        levels = np.rint((np.asarray(x, dtype=np.float32) - self.low) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) + 128.0) * self.scale + self.low
+
+
+class VectorCompressor:
+    """Optional PCA reduction followed by optional int8 quantization.
+
+    `encode` maps float vectors to stage-one codes (int8 or float32);
+    `approx_distances` scores a query against a block of codes without
+    decoding the block.
+    """
+
+    def __init__(self, quantization="none", dims=0):
+        if quantization not in ("none", "int8"):
+            raise ValueError(f"Unsupported quantization {quantization!r}")
+        self.quantization = quantization
+        self.dims = int(dims or 0)
+        self.reducer = None
+        self.quantizer = None
+
+    @property
+    def enabled(self):
+        return self.quantization != "none" or self.dims > 0
+
+    @property
+    def code_dtype(self):
+        return np.dtype(np.int8 if self.quantization == "int8" else np.float32)
+
+    def code_dim(self, dim):
+        return self.dims if self.dims and self.dims < dim else dim
+
+    def fit(self, sample: np.ndarray) -> "VectorCompressor":
+        sample = np.asarray(sample, dtype=np.float32)
+        if self.dims and self.dims < sample.shape[1]:
+            self.reducer = PCAReducer().fit(sample, self.dims)
+            sample = self.reducer.transform(sample)
+        if self.quantization == "int8":
+            self.quantizer = ScalarQuantizer().fit(sample)
+        return self
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        if self.reducer is not None:
+            x = self.reducer.transform(x)
+        return x.astype(np.float32) if self.quantizer is None else self.quantizer.encode(x)
+
+    def prepare_query(self, query: np.ndarray):
+        """Fold projection and dequantization into the query, so that
+        q.x ~= codes @ weights + bias for every row"""
+        q = np.asarray(query, dtype=np.float32)
+        weights, bias = q, 0.0
+        if self.reducer is not None:
+            # x ~= mean + components.T @ x_p  =>  q.x ~= q.mean + (components @ q).x_p
+            weights = self.reducer.components @ q
+            bias = float(q @ self.reducer.mean)
+        if self.quantizer is not None:
+            bias += float(weights @ (128.0 * self.quantizer.scale + self.quantizer.low))
+            weights = weights * self.quantizer.scale
+        return weights.astype(np.float32), bias, float(q @ q)
+
+    def approx_distances(self, codes, norms, prepared) -> np.ndarray:
+        """Approximate squared L2 from exact row norms and approximate dots"""
+        weights, bias, q_norm = prepared
+        dots = codes.astype(np.float32, copy=False) @ weights + bias
+        return norms + q_norm - 2.0 * dots
+
+    # ---------- persistence ----------
+
+    def save(self, path):
+        arrays = {"quantization": np.array(self.quantization), "dims": np.array(self.dims)}
+        if self.reducer is not None:
+            arrays.update(pca_mean=self.reducer.mean, pca_components=self.reducer.components)
+        if self.quantizer is not None:
+            arrays.update(sq_low=self.quantizer.low, sq_scale=self.quantizer.scale)
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path) -> "VectorCompressor":
+        with np.load(path) as data:
+            compressor = cls(str(data["quantization"]), int(data["dims"]))
+            if "pca_components" in data:
+                compressor.reducer = PCAReducer(data["pca_mean"], data["pca_components"])
+            if "sq_scale" in data:
+                compressor.quantizer = ScalarQuantizer(data["sq_low"], data["sq_scale"])
+        return compressor
+
+
+class BinarySignCodes:
+    """Packed sign bits of mean-centred vectors, scored by Hamming distance.
+
+    Codes are kept word-major (words, rows) in memory so the popcount runs
+    over one contiguous uint64 column per word.
+    """
+
+    def __init__(self, mean=None):
+        self.mean = mean
+
+    def fit(self, sample: np.ndarray) -> "BinarySignCodes":
+        # Centring makes each bit split the corpus roughly in half
+        self.mean = np.asarray(sample, dtype=np.float32).mean(axis=0)
+        return self
+
+    @staticmethod
+    def words(dim):
+        return (dim + 63) // 64
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        """(n, dim) floats -> (n, words) uint64 codes"""
+        bits = np.asarray(x, dtype=np.float32) > self.mean
+        pad = self.words(bits.shape[1]) * 64 - bits.shape[1]
+        if pad:
+            bits = np.pad(bits, ((0, 0), (0, pad)))
+        return np.ascontiguousarray(np.packbits(bits, axis=1)).view(np.uint64)
+
+    @staticmethod
+    def hamming(codes_by_word: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+        """Hamming distance of one query code to word-major codes (words, n)"""
+        distances = np.bitwise_count(codes_by_word[0] ^ query_code[0]).astype(np.uint16)
+        for word in range(1, len(query_code)):
+            distances += np.bitwise_count(codes_by_word[word] ^ query_code[word])
+        return distances
+
+    def asymmetric_scores(self, codes_by_word: np.ndarray, popcounts: np.ndarray,
+                          query: np.ndarray, bits: int) -> np.ndarray:
+        """Lower is closer: -(q . bits) with q quantized to `bits` bit-planes.
+
+        q ~= low + delta * sum_k 2^k plane_k, so q . b ~= low * popcount(b)
+        + delta * sum_k 2^k popcount(b & plane_k).
+        """
+        query = np.asarray(query, dtype=np.float32)
+        low = float(query.min())
+        delta = (float(query.max()) - low) / (2 ** bits - 1) or 1.0
+        levels = np.rint((query - low) / delta).astype(np.uint8)
+        pad = len(codes_by_word) * 64 - len(levels)
+        if pad:
+            levels = np.pad(levels, (0, pad))
+        weighted = np.zeros(codes_by_word.shape[1], dtype=np.float32)
+        for k in range(bits):
+            plane = np.packbits((levels >> k) & 1).view(np.uint64)
+            counts = np.zeros(codes_by_word.shape[1], dtype=np.uint16)
+            for word in np.flatnonzero(plane):
+                counts += np.bitwise_count(codes_by_word[word] & plane[word])
+            weighted += float(2 ** k) * counts
+        return -(low * popcounts + delta * weighted)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, mean=self.mean)
+
+    @classmethod
+    def load(cls, path) -> "BinarySignCodes":
+        with np.load(path) as data:
+            return cls(data["mean"])
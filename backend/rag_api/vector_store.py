@@ -0,0 +1,743 @@
+"""
+Vector store backends for LitPath AI
+
+RAGService talks to its chunk index through `RAGService.collection`, using the
+subset of the Chroma Collection API below (VectorStore). Two backends exist:
+
+- chroma: chromadb.PersistentClient collection (HNSW + SQLite metadata)
+- numpy:  NumpyVectorStore - exact search over a memory-mapped contiguous
+          float32/float16 matrix. One matrix-vector product plus argpartition
+          top-k; year/subject/file filters are evaluated on per-document
+          metadata columns before scoring. At our corpus size this is faster
+          than HNSW + SQLite, and the append-only files need no corruption
+          recovery (the header row count is the commit point).
+          Optionally ranks on PCA-reduced and/or int8-quantized codes first
+          and re-scores the shortlist exactly (see vector_compression.py).
+
+BinaryPrefilterIndex wraps a NumpyVectorStore as a two-stage retriever:
+popcount Hamming distance over packed sign bits picks a few hundred
+candidates, which are re-scored exactly on the float vectors.
+
+Selected with RAG_VECTOR_BACKEND and RAG_RETRIEVAL_MODE (settings.py).
+"""
+
+import os
+import json
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from .vector_compression import VectorCompressor, BinarySignCodes
+
+
+class VectorStore:
+    """Interface RAGService expects from `collection` (Chroma-compatible)"""
+
+    def add(self, embeddings, documents, metadatas, ids):
+        raise NotImplementedError
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        raise NotImplementedError
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def delete(self, ids=None, where=None):
+        raise NotImplementedError
+
+
+def _year_value(value) -> int:
+    try:
+        return int(str(value)[:4])
+    except (TypeError, ValueError):
+        return 0
+
+
+def _split_subjects(value) -> List[str]:
+    if isinstance(value, list):
+        return [str(s).strip().lower() for s in value if str(s).strip()]
+    return [s.strip().lower() for s in str(value or "").split(",") if s.strip()]
+
+
+def _match_value(value, condition) -> bool:
+    """Evaluate one Chroma-style condition against a metadata value"""
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$eq" and not value == operand:
+            return False
+        if op == "$ne" and not value != operand:
+            return False
+        if op == "$in" and value not in operand:
+            return False
+        if op == "$nin" and value in operand:
+            return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            try:
+                a, b = float(value), float(operand)
+            except (TypeError, ValueError):
+                return False
+            if (op == "$gt" and not a > b) or (op == "$gte" and not a >= b) or \
+               (op == "$lt" and not a < b) or (op == "$lte" and not a <= b):
+                return False
+        if op == "$contains":
+            # Extension: membership in a comma-separated list (e.g. subjects)
+            if str(operand).strip().lower() not in _split_subjects(value):
+                return False
+    return True
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact-search vector store on memory-mapped NumPy arrays.
+
+    Files in `path`:
+        header.json     dim, dtype, committed row count and file sizes
+        vectors.bin     row-major vectors (float32 or float16)
+        norms.bin       float32 squared norm per row (for L2 distances)
+        rows.bin        int32 pairs (metadata index, chunk_idx) per row
+        ids.txt         one id per line
+        documents.bin   utf-8 chunk texts, concatenated
+        doc_offsets.bin int64 start offset of each row's text
+        metadatas.jsonl distinct metadata dicts (chunk_idx removed) - chunks
+                        of the same thesis share one entry
+        deleted.bin     int64 row numbers of deleted rows
+        compression.npz fitted PCA / int8 parameters (compression only)
+        codes.bin       per-row stage-one codes       (compression only)
+
+    Filters support the Chroma operators RAGService uses ($eq, $ne, $in,
+    $nin, $gt/$gte/$lt/$lte, $and, $or) plus $contains for comma-separated
+    fields such as subjects; they are evaluated per distinct metadata entry
+    (i.e. per thesis), then broadcast to rows.
+
+    Distances are squared L2, the same as Chroma's default space, so the
+    distance thresholds used by RAGService keep their meaning.
+
+    With `quantization='int8'` and/or `reduced_dims > 0`, queries rank all
+    candidates on the compressed codes, keep `rescore_factor * n_results`
+    (at least MIN_SHORTLIST) and re-score those exactly on the float vectors.
+    The compressor is learned from the stored vectors by build_compression()
+    (RAGService calls it after indexing); rows added later are encoded with
+    the fitted parameters. Until it has been built, queries are exact.
+    """
+
+    # float16 rows are upcast in cache-sized blocks (no BLAS for float16):
+    # half the memory, but several times slower per query than float32
+    QUERY_BLOCK_ROWS = 4096
+    MIN_SHORTLIST = 100
+    COMPRESSION_FILES = ("compression.npz", "codes.bin")
+
+    def __init__(self, path: str, dtype: str = "float32", quantization: str = "none",
+                 reduced_dims: int = 0, rescore_factor: int = 4):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype {dtype!r}")
+        self.path = path
+        self.compression = VectorCompressor(quantization, reduced_dims)
+        self.rescore_factor = max(1, int(rescore_factor))
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._header_path = os.path.join(path, "header.json")
+        if os.path.exists(self._header_path):
+            with open(self._header_path, "r", encoding="utf-8") as f:
+                header = json.load(f)
+            self.dim = header["dim"]
+            self.dtype = np.dtype(header["dtype"])
+            self._count = header["count"]
+            self._sizes = header["sizes"]
+        else:
+            self.dim = None
+            self.dtype = np.dtype(dtype)
+            self._count = 0
+            self._sizes = {}
+        self._load()
+
+    # ---------- persistence ----------
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _truncate(self, name, size):
+        """Drop bytes written after the last committed header (crash recovery)"""
+        path = self._file(name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    def _load(self):
+        n = self._count
+        if self.dim:
+            self._truncate("vectors.bin", n * self.dim * self.dtype.itemsize)
+        self._truncate("norms.bin", n * 4)
+        self._truncate("rows.bin", n * 8)
+        self._truncate("doc_offsets.bin", n * 8)
+        for name in ("ids.txt", "documents.bin", "metadatas.jsonl", "deleted.bin"):
+            self._truncate(name, self._sizes.get(name, 0))
+
+        def read(name, dtype, shape=None):
+            path = self._file(name)
+            if not os.path.exists(path) or n == 0:
+                return np.zeros(0 if shape is None else (0,) + shape, dtype=dtype)
+            data = np.fromfile(path, dtype=dtype)
+            return data if shape is None else data.reshape((-1,) + shape)
+
+        self._norms = read("norms.bin", np.float32)
+        rows = read("rows.bin", np.int32, (2,))
+        self._meta_index = rows[:, 0].copy() if len(rows) else np.zeros(0, dtype=np.int32)
+        self._chunk_idx = rows[:, 1].copy() if len(rows) else np.zeros(0, dtype=np.int32)
+        self._doc_offsets = read("doc_offsets.bin", np.int64)
+
+        self._ids = []
+        if os.path.exists(self._file("ids.txt")):
+            with open(self._file("ids.txt"), "r", encoding="utf-8") as f:
+                self._ids = f.read().split("\n")[:n]
+
+        self._metas = []
+        self._meta_keys = {}
+        if os.path.exists(self._file("metadatas.jsonl")):
+            with open(self._file("metadatas.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    meta = json.loads(line)
+                    self._meta_keys[json.dumps(meta, sort_keys=True)] = len(self._metas)
+                    self._metas.append(meta)
+        self._meta_years = np.array([_year_value(m.get("publication_year")) for m in self._metas], dtype=np.int32)
+        self._mask_cache = {}
+
+        self._alive = np.ones(n, dtype=bool)
+        if os.path.exists(self._file("deleted.bin")):
+            deleted = np.fromfile(self._file("deleted.bin"), dtype=np.int64)
+            self._alive[deleted[deleted < n]] = False
+        # Deleted ids can be re-added (like Chroma), so only live rows are addressable
+        self._id_to_row = {id_: row for row, id_ in enumerate(self._ids) if self._alive[row]}
+
+        self._docs_size = self._sizes.get("documents.bin", 0)
+        self._vectors = None
+        self._load_compression()
+
+    def _load_compression(self):
+        """Load fitted compression parameters matching the configured ones"""
+        self._compressor = None
+        self._codes = None
+        self._coded_rows = 0
+        path = self._file("compression.npz")
+        if not self.compression.enabled or not self.dim or not os.path.exists(path):
+            return
+        compressor = VectorCompressor.load(path)
+        if (compressor.quantization, compressor.dims) != (self.compression.quantization, self.compression.dims):
+            return  # fitted for another configuration - rebuild on demand
+        row_bytes = compressor.code_dim(self.dim) * compressor.code_dtype.itemsize
+        coded = min(self._count, os.path.getsize(self._file("codes.bin")) // row_bytes
+                    if os.path.exists(self._file("codes.bin")) else 0)
+        self._truncate("codes.bin", coded * row_bytes)
+        self._coded_rows = coded
+        self._compressor = compressor
+        if self._coded_rows < self._count:
+            # Crash between the vector and code appends - encode the gap
+            self._append_codes(self._matrix()[self._coded_rows:self._count])
+
+    def _append_codes(self, vectors):
+        codes = self._compressor.encode(vectors)
+        with open(self._file("codes.bin"), "ab") as f:
+            f.write(codes.tobytes())
+        self._coded_rows += len(codes)
+
+    def _code_matrix(self):
+        """Memory-mapped stage-one codes"""
+        if self._codes is None or self._codes.shape[0] != self._coded_rows:
+            self._codes = np.memmap(self._file("codes.bin"), dtype=self._compressor.code_dtype, mode="r",
+                                    shape=(self._coded_rows, self._compressor.code_dim(self.dim)))
+        return self._codes
+
+    def build_compression(self, sample_size: int = 50000, seed: int = 0):
+        """Fit PCA / int8 parameters on a sample of the stored vectors and
+        (re-)encode every row. No-op when compression is not configured."""
+        if not self.compression.enabled:
+            return None
+        with self._lock:
+            alive = np.flatnonzero(self._alive[:self._count])
+            if len(alive) == 0:
+                return None
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(alive, size=min(sample_size, len(alive)), replace=False))
+            matrix = self._matrix()
+            compressor = VectorCompressor(self.compression.quantization, self.compression.dims)
+            compressor.fit(np.asarray(matrix[sample_rows], dtype=np.float32))
+
+            for name in self.COMPRESSION_FILES:
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._compressor = compressor
+            self._codes = None
+            self._coded_rows = 0
+            for start in range(0, self._count, self.QUERY_BLOCK_ROWS):
+                self._append_codes(np.asarray(matrix[start:start + self.QUERY_BLOCK_ROWS], dtype=np.float32))
+            # Parameters are written last: codes without them are ignored on load
+            tmp = self._file("compression.npz.tmp")
+            compressor.save(tmp)
+            os.replace(tmp, self._file("compression.npz"))
+            return compressor
+
+    def needs_compression(self) -> bool:
+        """Compression is configured but not (yet) fitted for the stored rows"""
+        return self.compression.enabled and self._count > 0 and self._compressor is None
+
+    def compressed_bytes(self) -> int:
+        """Bytes scanned by stage one - codes plus row norms (0 when uncompressed)"""
+        if self._compressor is None:
+            return 0
+        return self._coded_rows * (self._compressor.code_dim(self.dim) * self._compressor.code_dtype.itemsize + 4)
+
+    def _commit(self):
+        """Atomically publish the new row count and file sizes"""
+        self._sizes = {
+            name: os.path.getsize(self._file(name))
+            for name in ("ids.txt", "documents.bin", "metadatas.jsonl", "deleted.bin")
+            if os.path.exists(self._file(name))
+        }
+        tmp = f"{self._header_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "count": self._count, "sizes": self._sizes}, f)
+        os.replace(tmp, self._header_path)
+
+    def _matrix(self):
+        """Memory-mapped vector matrix (remapped after appends)"""
+        if self._count == 0:
+            return np.zeros((0, self.dim or 0), dtype=self.dtype)
+        if self._vectors is None or self._vectors.shape[0] != self._count:
+            self._vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r",
+                                      shape=(self._count, self.dim))
+        return self._vectors
+
+    def reset(self):
+        """Delete all data (used on index version changes)"""
+        with self._lock:
+            for name in ("header.json", "vectors.bin", "norms.bin", "rows.bin", "ids.txt",
+                         "documents.bin", "doc_offsets.bin", "metadatas.jsonl", "deleted.bin") + self.COMPRESSION_FILES:
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self.dim = None
+            self._count = 0
+            self._sizes = {}
+            self._load()
+
+    # ---------- writes ----------
+
+    def add(self, embeddings, documents, metadatas, ids):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or not (len(vectors) == len(documents) == len(metadatas) == len(ids)):
+            raise ValueError("embeddings, documents, metadatas and ids must have the same length")
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+
+            # Like Chroma's add(): existing (and repeated) ids are ignored
+            keep, seen = [], set()
+            for i, id_ in enumerate(ids):
+                if id_ not in self._id_to_row and id_ not in seen:
+                    seen.add(id_)
+                    keep.append(i)
+            if not keep:
+                return
+            vectors = vectors[keep]
+
+            meta_rows = []
+            chunk_rows = []
+            new_metas = []
+            for i in keep:
+                meta = dict(metadatas[i] or {})
+                chunk_idx = meta.pop("chunk_idx", -1)
+                key = json.dumps(meta, sort_keys=True)
+                index = self._meta_keys.get(key)
+                if index is None:
+                    index = self._meta_keys[key] = len(self._metas)
+                    self._metas.append(meta)
+                    new_metas.append(meta)
+                meta_rows.append(index)
+                chunk_rows.append(int(chunk_idx) if str(chunk_idx).lstrip("-").isdigit() else -1)
+
+            encoded = [(documents[i] or "").encode("utf-8") for i in keep]
+            offsets = np.cumsum([0] + [len(b) for b in encoded[:-1]], dtype=np.int64) + self._docs_size
+            rows = np.stack([np.array(meta_rows, dtype=np.int32), np.array(chunk_rows, dtype=np.int32)], axis=1)
+            norms = np.einsum("ij,ij->i", vectors, vectors).astype(np.float32)
+
+            with open(self._file("vectors.bin"), "ab") as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+            with open(self._file("norms.bin"), "ab") as f:
+                f.write(norms.tobytes())
+            with open(self._file("rows.bin"), "ab") as f:
+                f.write(rows.tobytes())
+            with open(self._file("doc_offsets.bin"), "ab") as f:
+                f.write(offsets.tobytes())
+            with open(self._file("documents.bin"), "ab") as f:
+                f.write(b"".join(encoded))
+            with open(self._file("ids.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{ids[i]}\n" for i in keep))
+            if new_metas:
+                with open(self._file("metadatas.jsonl"), "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in new_metas))
+            if self._compressor is not None and self._coded_rows == self._count:
+                self._append_codes(vectors)
+
+            for i in keep:
+                self._id_to_row[ids[i]] = len(self._ids)
+                self._ids.append(ids[i])
+            self._norms = np.concatenate([self._norms, norms])
+            self._meta_index = np.concatenate([self._meta_index, rows[:, 0]])
+            self._chunk_idx = np.concatenate([self._chunk_idx, rows[:, 1]])
+            self._doc_offsets = np.concatenate([self._doc_offsets, offsets])
+            self._alive = np.concatenate([self._alive, np.ones(len(keep), dtype=bool)])
+            self._meta_years = np.array([_year_value(m.get("publication_year")) for m in self._metas], dtype=np.int32)
+            self._mask_cache = {}
+            self._docs_size += sum(len(b) for b in encoded)
+            self._count += len(keep)
+            self._commit()
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            rows = self._select_rows(ids=ids, where=where)
+            if len(rows) == 0:
+                return
+            self._alive[rows] = False
+            for row in rows:
+                self._id_to_row.pop(self._ids[row], None)
+            with open(self._file("deleted.bin"), "ab") as f:
+                f.write(rows.astype(np.int64).tobytes())
+            self._commit()
+
+    # ---------- filtering ----------
+
+    def _meta_mask(self, where) -> np.ndarray:
+        """Boolean mask over distinct metadata entries for a Chroma `where`"""
+        if "$and" in where:
+            mask = np.ones(len(self._metas), dtype=bool)
+            for clause in where["$and"]:
+                mask &= self._meta_mask(clause)
+            return mask
+        if "$or" in where:
+            mask = np.zeros(len(self._metas), dtype=bool)
+            for clause in where["$or"]:
+                mask |= self._meta_mask(clause)
+            return mask
+
+        mask = np.ones(len(self._metas), dtype=bool)
+        for field, condition in where.items():
+            if field == "publication_year" and isinstance(condition, dict) and set(condition) <= {"$gte", "$lte", "$gt", "$lt"}:
+                # Numeric year range on the precomputed year column
+                years = self._meta_years
+                for op, value in condition.items():
+                    value = _year_value(value)
+                    mask &= {"$gte": years >= value, "$lte": years <= value,
+                             "$gt": years > value, "$lt": years < value}[op]
+                continue
+            mask &= np.fromiter(
+                (_match_value(m.get(field), condition) for m in self._metas),
+                dtype=bool, count=len(self._metas)
+            )
+        return mask
+
+    def _row_mask(self, where) -> np.ndarray:
+        """Rows matching `where` - evaluated once per thesis, then gathered"""
+        alive = self._alive[:self._count]
+        if not where:
+            return alive.copy()
+        key = json.dumps(where, sort_keys=True, default=str)
+        meta_mask = self._mask_cache.get(key)
+        if meta_mask is None:
+            if len(self._mask_cache) >= 256:
+                self._mask_cache.clear()
+            meta_mask = self._mask_cache[key] = self._meta_mask(where)
+        return alive & meta_mask[self._meta_index[:self._count]]
+
+    def _select_rows(self, ids=None, where=None) -> np.ndarray:
+        mask = self._row_mask(where)
+        if ids is not None:
+            id_mask = np.zeros(self._count, dtype=bool)
+            id_mask[[self._id_to_row[i] for i in ids if i in self._id_to_row]] = True
+            mask &= id_mask
+        return np.flatnonzero(mask)
+
+    # ---------- reads ----------
+
+    def _documents(self, rows) -> List[str]:
+        docs = []
+        with open(self._file("documents.bin"), "rb") as f:
+            for row in rows:
+                start = int(self._doc_offsets[row])
+                end = int(self._doc_offsets[row + 1]) if row + 1 < self._count else self._docs_size
+                f.seek(start)
+                docs.append(f.read(end - start).decode("utf-8"))
+        return docs
+
+    def _metadata(self, row) -> Dict:
+        meta = dict(self._metas[self._meta_index[row]])
+        if self._chunk_idx[row] >= 0:
+            meta["chunk_idx"] = int(self._chunk_idx[row])
+        return meta
+
+    def _payload(self, rows, include) -> Dict:
+        result = {"ids": [self._ids[r] for r in rows]}
+        if "documents" in include:
+            result["documents"] = self._documents(rows)
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadata(r) for r in rows]
+        if "embeddings" in include:
+            matrix = self._matrix()
+            result["embeddings"] = np.asarray(matrix[np.asarray(rows, dtype=np.int64)], dtype=np.float32) if len(rows) else np.zeros((0, self.dim or 0), dtype=np.float32)
+        return result
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._alive[:self._count].sum())
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        with self._lock:
+            rows = self._select_rows(ids=ids, where=where)
+            if offset:
+                rows = rows[offset:]
+            if limit is not None:
+                rows = rows[:limit]
+            return self._payload(rows, include)
+
+    def _scores(self, query, candidates) -> np.ndarray:
+        """Squared L2 distance of query to the candidate rows (or all rows)"""
+        matrix = self._matrix()
+        q = query.astype(np.float32)
+        if candidates is None:
+            if self.dtype == np.float32:
+                dots = matrix @ q
+            else:
+                # float16 has no BLAS path - upcast block by block
+                dots = np.concatenate([
+                    matrix[i:i + self.QUERY_BLOCK_ROWS].astype(np.float32) @ q
+                    for i in range(0, self._count, self.QUERY_BLOCK_ROWS)
+                ]) if self._count else np.zeros(0, dtype=np.float32)
+            norms = self._norms[:self._count]
+        else:
+            dots = matrix[candidates].astype(np.float32, copy=False) @ q
+            norms = self._norms[candidates]
+        return np.maximum(norms + float(q @ q) - 2.0 * dots, 0.0)
+
+    def _approx_scores(self, query, candidates) -> np.ndarray:
+        """Stage one: approximate distances on the compressed codes"""
+        codes = self._code_matrix()
+        prepared = self._compressor.prepare_query(query)
+        if candidates is None:
+            # int8 codes are upcast block by block, like float16 vectors
+            return np.concatenate([
+                self._compressor.approx_distances(codes[i:i + self.QUERY_BLOCK_ROWS],
+                                                  self._norms[i:i + self.QUERY_BLOCK_ROWS], prepared)
+                for i in range(0, self._count, self.QUERY_BLOCK_ROWS)
+            ])
+        return self._compressor.approx_distances(codes[candidates], self._norms[candidates], prepared)
+
+    @staticmethod
+    def _top_k(scores, k):
+        top = np.argpartition(scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        return top[np.argsort(scores[top], kind="stable")]
+
+    def _search(self, query, candidates, n_results):
+        """Return (rows, exact distances) of the n_results nearest rows"""
+        n_candidates = self._count if candidates is None else len(candidates)
+        k = min(n_results, n_candidates)
+        shortlist_size = max(k * self.rescore_factor, self.MIN_SHORTLIST)
+        if self._compressor is not None and self._coded_rows == self._count and shortlist_size < n_candidates:
+            approx = self._approx_scores(query, candidates)
+            shortlist = self._top_k(approx, shortlist_size)
+            rows = np.sort(shortlist if candidates is None else candidates[shortlist])
+            # Stage two: exact float distances over the shortlist only
+            scores = self._scores(query, rows)
+            top = self._top_k(scores, k)
+            return rows[top], scores[top]
+        scores = self._scores(query, candidates)
+        top = self._top_k(scores, k)
+        return (top if candidates is None else candidates[top]), scores[top]
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        return self._run_query(query_embeddings, n_results, where, include, self._search)
+
+    def _run_query(self, query_embeddings, n_results, where, include, search):
+        """Chroma-shaped query results, with `search(q, candidates, k)` picking the rows"""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if "embeddings" in include:
+            out["embeddings"] = []
+        with self._lock:
+            if where:
+                candidates = np.flatnonzero(self._row_mask(where))
+            elif not self._alive[:self._count].all():
+                candidates = np.flatnonzero(self._alive[:self._count])
+            else:
+                candidates = None
+            for q in queries:
+                if self._count == 0 or (candidates is not None and len(candidates) == 0):
+                    rows, dist = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+                else:
+                    rows, dist = search(q, candidates, n_results)
+                payload = self._payload(rows, include)
+                out["ids"].append(payload["ids"])
+                out["documents"].append(payload.get("documents", []))
+                out["metadatas"].append(payload.get("metadatas", []))
+                out["distances"].append([float(d) for d in dist])
+                if "embeddings" in include:
+                    out["embeddings"].append(payload["embeddings"])
+        return out
+
+
+
+class BinaryPrefilterIndex(VectorStore):
+    """Two-stage retriever over a NumpyVectorStore.
+
+    Stage one: Hamming distance between packed sign-bit codes (popcount on
+    uint64 words) over every candidate row, keeping the `shortlist` closest.
+    With `query_bits > 0` the query is not binarized but split into that
+    many bit-planes (asymmetric scoring, see BinarySignCodes).
+    Stage two: exact squared L2 on the store's float vectors for those rows
+    only. Filters, deletes and payloads are the wrapped store's; writes go
+    to the store and new rows are encoded lazily on the next query.
+
+    Files (next to the store's):
+        binary.npz        mean the sign bits are taken against
+        binary_codes.bin  uint64 codes, row-major
+    """
+
+    FILES = ("binary.npz", "binary_codes.bin")
+
+    def __init__(self, store: NumpyVectorStore, shortlist: int = 300, query_bits: int = 4):
+        self.store = store
+        self.shortlist = max(1, int(shortlist))
+        self.query_bits = int(query_bits)
+        self._lock = store._lock
+        self._encoder = None
+        self._codes = None  # (words, rows) uint64
+        self._popcounts = np.zeros(0, dtype=np.float32)
+        self._load()
+
+    def _file(self, name):
+        return self.store._file(name)
+
+    def _load(self):
+        self._encoder = None
+        self._codes = None
+        self._popcounts = np.zeros(0, dtype=np.float32)
+        if not self.store.dim or not os.path.exists(self._file("binary.npz")):
+            return
+        words = BinarySignCodes.words(self.store.dim)
+        coded = 0
+        if os.path.exists(self._file("binary_codes.bin")):
+            coded = min(self.store._count, os.path.getsize(self._file("binary_codes.bin")) // (words * 8))
+        self.store._truncate("binary_codes.bin", coded * words * 8)
+        codes = np.fromfile(self._file("binary_codes.bin"), dtype=np.uint64) if coded else np.zeros(0, dtype=np.uint64)
+        self._codes = np.ascontiguousarray(codes.reshape(-1, words).T)
+        self._popcounts = self._count_bits(self._codes)
+        self._encoder = BinarySignCodes.load(self._file("binary.npz"))
+
+    @staticmethod
+    def _count_bits(codes_by_word):
+        counts = np.zeros(codes_by_word.shape[1], dtype=np.float32)
+        for word in codes_by_word:
+            counts += np.bitwise_count(word)
+        return counts
+
+    def _append(self, vectors):
+        codes = self._encoder.encode(vectors)
+        with open(self._file("binary_codes.bin"), "ab") as f:
+            f.write(codes.tobytes())
+        self._codes = np.concatenate([self._codes, codes.T], axis=1)
+        self._popcounts = np.concatenate([self._popcounts, self._count_bits(codes.T)])
+
+    def build(self, sample_size: int = 50000, seed: int = 0):
+        """Fit the centring mean on a sample of the stored vectors and encode every row"""
+        with self._lock:
+            store = self.store
+            for name in self.FILES:
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._encoder = None
+            self._codes = None
+            self._popcounts = np.zeros(0, dtype=np.float32)
+            alive = np.flatnonzero(store._alive[:store._count])
+            if len(alive) == 0:
+                return
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(alive, size=min(sample_size, len(alive)), replace=False))
+            matrix = store._matrix()
+            self._encoder = BinarySignCodes().fit(np.asarray(matrix[sample_rows], dtype=np.float32))
+            self._codes = np.zeros((BinarySignCodes.words(store.dim), 0), dtype=np.uint64)
+            for start in range(0, store._count, store.QUERY_BLOCK_ROWS):
+                self._append(np.asarray(matrix[start:start + store.QUERY_BLOCK_ROWS], dtype=np.float32))
+            tmp = self._file("binary.npz.tmp")
+            self._encoder.save(tmp)
+            os.replace(tmp, self._file("binary.npz"))
+
+    def _sync(self):
+        """Encode rows appended to the store since the last query"""
+        if self._encoder is None:
+            if self.store._count:
+                self.build()
+        elif self._codes.shape[1] < self.store._count:
+            self._append(np.asarray(self.store._matrix()[self._codes.shape[1]:self.store._count], dtype=np.float32))
+
+    def candidates(self, query, candidates=None) -> np.ndarray:
+        """Stage one: sorted row numbers of the `shortlist` nearest codes"""
+        codes = self._codes if candidates is None else self._codes[:, candidates]
+        if self.query_bits > 0:
+            popcounts = self._popcounts if candidates is None else self._popcounts[candidates]
+            distances = self._encoder.asymmetric_scores(codes, popcounts, query, self.query_bits)
+        else:
+            distances = BinarySignCodes.hamming(codes, self._encoder.encode(query[None, :])[0])
+        if self.shortlist < len(distances):
+            top = np.argpartition(distances, self.shortlist - 1)[:self.shortlist]
+        else:
+            top = np.arange(len(distances))
+        return np.sort(top if candidates is None else candidates[top])
+
+    def _search(self, query, candidates, n_results):
+        n_candidates = self.store._count if candidates is None else len(candidates)
+        if self._encoder is None or n_candidates <= max(self.shortlist, n_results):
+            return self.store._search(query, candidates, n_results)
+        rows = self.candidates(query, candidates)
+        # Stage two: exact distances on the float vectors
+        scores = self.store._scores(query, rows)
+        top = self.store._top_k(scores, min(n_results, len(rows)))
+        return rows[top], scores[top]
+
+    def binary_bytes(self) -> int:
+        return 0 if self._codes is None else self._codes.nbytes
+
+    # ---------- VectorStore interface ----------
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        with self._lock:
+            self._sync()
+            return self.store._run_query(query_embeddings, n_results, where, include, self._search)
+
+    def add(self, embeddings, documents, metadatas, ids):
+        self.store.add(embeddings, documents, metadatas, ids)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        return self.store.get(ids=ids, where=where, limit=limit, offset=offset, include=include)
+
+    def count(self) -> int:
+        return self.store.count()
+
+    def delete(self, ids=None, where=None):
+        self.store.delete(ids=ids, where=where)
+
+    def reset(self):
+        with self._lock:
+            self.store.reset()
+            for name in self.FILES:
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._load()
+
+    def build_compression(self, *args, **kwargs):
+        """Called by RAGService after indexing: refit the store's codes and ours"""
+        self.store.build_compression(*args, **kwargs)
+        self.build()
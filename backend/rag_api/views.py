@@ -2,8 +2,15 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view
-from django.http import StreamingHttpResponse
+from django.http import StreamingHttpResponse, HttpResponse
 from .rag_service import RAGService
+from .latency_metrics import latency_tracker, llm_latency_tracker, STAGES
+from .usage_rollups import usage_rollups
+from .document_stats import document_stats
+from .dashboard_bundle import dashboard_bundler, data_version
+from .event_ingest import event_ingest
+from .db_pool import pool_stats, pool_wait_tracker
+from .outbox import outbox, GeneralFeedbackSink
 from .serializers import CSMFeedbackSerializer
 from .models import CSMFeedback, CitationCopy, Material, MaterialView, ResearchHistory
 from .models_password_reset import PasswordResetToken
@@ -11,7 +18,7 @@ import secrets
 from django.db.models import Count, Avg, Q, Sum
 from django.db.models import Max
 from django.db.models.functions import TruncMonth, TruncDate
-from django.db import connection
+from django.db import connection, transaction
 import dateutil.parser
 import time
 from django.utils import timezone
@@ -20,18 +27,9 @@ from calendar import month_name
 from django.contrib.auth import get_user_model
 from django.core.mail import send_mail
 from django.conf import settings
-import psycopg2
-from psycopg2.extras import RealDictCursor
 
 User = get_user_model()
 
-# Supabase configuration
-SUPABASE_URL = settings.DATABASES['default']['HOST'] if hasattr(settings.DATABASES['default'], 'HOST') else None
-SUPABASE_DB = settings.DATABASES['default']['NAME'] if hasattr(settings.DATABASES['default'], 'NAME') else None
-SUPABASE_USER = settings.DATABASES['default']['USER'] if hasattr(settings.DATABASES['default'], 'USER') else None
-SUPABASE_PASSWORD = settings.DATABASES['default']['PASSWORD'] if hasattr(settings.DATABASES['default'], 'PASSWORD') else None
-SUPABASE_PORT = settings.DATABASES['default']['PORT'] if hasattr(settings.DATABASES['default'], 'PORT') else 5432
-
 
 # Parses date strings from the frontend
 def parse_date_range(from_date, to_date):
@@ -52,82 +50,6 @@ def parse_date_range(from_date, to_date):
     return from_datetime, to_datetime
 
 
-def insert_to_supabase_general_feedback(data):
-    """
-    Insert feedback data into Supabase general_feedback table.
-    Returns True on success, False on failure.
-    """
-    try:
-        # Get Supabase connection settings from Django settings
-        # Check if SUPABASE_URL env var is set for external Supabase
-        import os
-        supabase_url = os.environ.get('SUPABASE_URL')
-        supabase_db = os.environ.get('SUPABASE_DB')
-        supabase_user = os.environ.get('SUPABASE_USER')
-        supabase_password = os.environ.get('SUPABASE_PASSWORD')
-        supabase_port = os.environ.get('SUPABASE_PORT', '5432')
-        
-        # If not set via env, use local DB settings
-        if not supabase_url:
-            if hasattr(settings.DATABASES['default'], 'HOST'):
-                supabase_url = settings.DATABASES['default']['HOST']
-            else:
-                return False
-        if not supabase_db:
-            supabase_db = settings.DATABASES['default']['NAME'] if hasattr(settings.DATABASES['default'], 'NAME') else None
-        if not supabase_user:
-            supabase_user = settings.DATABASES['default']['USER'] if hasattr(settings.DATABASES['default'], 'USER') else None
-        if not supabase_password:
-            supabase_password = settings.DATABASES['default']['PASSWORD'] if hasattr(settings.DATABASES['default'], 'PASSWORD') else None
-        if not supabase_port:
-            supabase_port = str(settings.DATABASES['default']['PORT']) if hasattr(settings.DATABASES['default'], 'PORT') else '5432'
-        
-        if not all([supabase_url, supabase_db, supabase_user, supabase_password]):
-            print("Supabase configuration incomplete")
-            return False
-        
-        conn = psycopg2.connect(
-            host=supabase_url,
-            database=supabase_db,
-            user=supabase_user,
-            password=supabase_password,
-            port=supabase_port
-        )
-        
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO general_feedback (
-                user_id, session_id, consent_given, client_type, 
-                date, sex, age, region, category, litpath_rating,
-                research_interests, missing_content, message_comment
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
-        """, (
-            data.get('user_id'),
-            data.get('session_id'),
-            data.get('consent_given'),
-            data.get('client_type'),
-            data.get('date'),
-            data.get('sex'),
-            data.get('age'),
-            data.get('region'),
-            data.get('category'),
-            data.get('litpath_rating'),
-            data.get('research_interests'),
-            data.get('missing_content'),
-            data.get('message_comment')
-        ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        return True
-        
-    except Exception as e:
-        print(f"Error inserting to Supabase general_feedback: {e}")
-        return False
-
 # ============= Filters View =============
 class FiltersView(APIView):
     """
@@ -203,6 +125,8 @@ class HealthCheckView(APIView):
                     "pdf_files": len(pdf_files),
                     "rag_initialized": False
                 }
+            # Connection pool size, utilization and checkout waits (empty without DB_POOL)
+            health_data["database_pool"] = pool_stats()
             
             return Response(health_data, status=status.HTTP_200_OK)
         except Exception as e:
@@ -211,6 +135,18 @@ class HealthCheckView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+# ============= Metrics View =============
+def metrics_view(request):
+    """
+    GET /api/metrics/
+    Exposes in-process search stage, per-model LLM latency and DB pool wait histograms in Prometheus text format
+    """
+    return HttpResponse(
+        latency_tracker.render_prometheus() + llm_latency_tracker.render_prometheus()
+        + pool_wait_tracker.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
 # ============= Search View =============
 class SearchView(APIView):
     """
@@ -259,9 +195,9 @@ class SearchView(APIView):
                     "total_results": 0,
                 }, status=status.HTTP_200_OK)
 
-            available_filters = rag.get_available_filters()
-            
-            parsed = extract_filters_from_query(question, available_filters.get("subjects", []))
+            with latency_tracker.span('query_parse', request_id):
+                available_filters = rag.get_available_filters()
+                parsed = extract_filters_from_query(question, available_filters.get("subjects", []))
             
             if not subjects and parsed.get("subjects"):
                 subjects = parsed["subjects"]
@@ -288,9 +224,10 @@ class SearchView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Resolve pronouns in query using conversation history
-            from .conversation_utils import conversation_manager
-            enhanced_question = conversation_manager.resolve_pronouns(question, conversation_history)
+            # Resolve pronouns in query using the cached conversation state (only new turns are parsed)
+            from .conversation_utils import conversation_manager, conversation_cache
+            conversation_state = conversation_cache.sync(request.data.get('session_id'), conversation_history)
+            enhanced_question = conversation_manager.resolve_pronouns(question, conversation_history, conversation_state)
             
             # Search for relevant chunks with filters
             search_start = time.time()
@@ -359,6 +296,14 @@ class SearchView(APIView):
                     except Exception as e:
                         print(f"Error recording search time: {e}")
                 
+                # Instant extractive preview: shown until the streamed Gemini overview arrives
+                overview_preview = None
+                if not no_results and getattr(settings, 'RAG_EXTRACTIVE_PREVIEW', True):
+                    with latency_tracker.span('extractive_preview', request_id):
+                        overview_preview = rag.extractive_overview(top_chunks, question, distance_threshold)
+                
+                latency_tracker.persist(request_id)
+                
                 # Serialize search context so streaming endpoint can reuse it (avoids duplicate search)
                 _search_context = {
                     "top_chunks": [
@@ -375,12 +320,15 @@ class SearchView(APIView):
                     "suggestions": suggestions if suggestions else None,
                     "overview": None,
                     "overview_ready": False,
+                    "overview_preview": overview_preview,
                     "_search_context": _search_context,
                 }, status=status.HTTP_200_OK)
             
             # Generate overview (overview_only=True)
             generate_start = time.time()
-            overview = rag.generate_overview(top_chunks, question, distance_threshold, conversation_history)
+            with latency_tracker.span('generation_total', request_id):
+                overview = rag.generate_overview(top_chunks, question, distance_threshold, conversation_history,
+                                                 request_id=request_id, conversation_state=conversation_state)
             generate_time = time.time() - generate_start
             print(f"[RAG] AI generation took {generate_time:.2f}s")
             
@@ -436,6 +384,7 @@ class SearchView(APIView):
             if rag_evaluation:
                 response_data["rag_evaluation"] = rag_evaluation
             
+            latency_tracker.persist(request_id)
             return Response(response_data, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -471,6 +420,9 @@ class StreamingSearchView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            from .conversation_utils import conversation_manager, conversation_cache
+            conversation_state = conversation_cache.sync(request.data.get('session_id'), conversation_history)
+            
             rag = RAGService.ensure_initialized()
 
             if RAGService.is_indexing():
@@ -494,8 +446,9 @@ class StreamingSearchView(APIView):
                 year_end = filters.get("year_end")
                 
                 from .query_parser import extract_filters_from_query
-                available_filters = rag.get_available_filters()
-                parsed = extract_filters_from_query(question, available_filters.get("subjects", []))
+                with latency_tracker.span('query_parse', request_id):
+                    available_filters = rag.get_available_filters()
+                    parsed = extract_filters_from_query(question, available_filters.get("subjects", []))
                 
                 if not subjects and parsed.get("subjects"):
                     subjects = parsed["subjects"]
@@ -506,8 +459,7 @@ class StreamingSearchView(APIView):
                         year_start = parsed.get("year_start")
                         year_end = parsed.get("year_end")
                 
-                from .conversation_utils import conversation_manager
-                enhanced_question = conversation_manager.resolve_pronouns(question, conversation_history)
+                enhanced_question = conversation_manager.resolve_pronouns(question, conversation_history, conversation_state)
                 
                 top_chunks, documents, distance_threshold = rag.search(
                     enhanced_question,
@@ -522,13 +474,16 @@ class StreamingSearchView(APIView):
                 """Generator that yields SSE events from Gemini streaming."""
                 try:
                     for event_type, data in rag.generate_overview_stream(
-                        top_chunks, question, distance_threshold, conversation_history
+                        top_chunks, question, distance_threshold, conversation_history,
+                        request_id=request_id, conversation_state=conversation_state
                     ):
                         payload = json_mod.dumps({"type": event_type, "content": data})
                         yield f"data: {payload}\n\n"
                 except Exception as e:
                     error_payload = json_mod.dumps({"type": "error", "content": str(e)})
                     yield f"data: {error_payload}\n\n"
+                finally:
+                    latency_tracker.persist(request_id)
             
             response = StreamingHttpResponse(
                 event_stream(),
@@ -702,7 +657,9 @@ def feedback_view(request):
     elif request.method == 'POST':
         serializer = FeedbackSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                feedback = serializer.save()
+                document_stats.record_rating(feedback.document_file, feedback.rating)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -730,7 +687,11 @@ def feedback_detail(request, pk):
         # Partial=True is critical for updating just the status
         serializer = FeedbackSerializer(feedback, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            before = (feedback.document_file, feedback.rating)
+            with transaction.atomic():
+                feedback = serializer.save()
+                if (feedback.document_file, feedback.rating) != before:
+                    document_stats.refresh_ratings([before[0], feedback.document_file])
             return Response(serializer.data)
         
         # Print errors to your terminal for easier debugging
@@ -739,7 +700,10 @@ def feedback_detail(request, pk):
 
     # DELETE: Remove it
     elif request.method == 'DELETE':
-        feedback.delete()
+        with transaction.atomic():
+            feedback.delete()
+            if feedback.rating is not None:
+                document_stats.refresh_ratings([feedback.document_file])
         return Response(status=status.HTTP_204_NO_CONTENT)
     
 
@@ -765,11 +729,12 @@ def csm_feedback_view(request):
     elif request.method == 'POST':
         serializer = CSMFeedbackSerializer(data=request.data)
         if serializer.is_valid():
-            # Save to Django database first
-            serializer.save()
-            
-            # Also insert into Supabase general_feedback table
-            insert_to_supabase_general_feedback(request.data)
+            # The copy for the Supabase general_feedback table is queued in the same
+            # transaction and written by the outbox dispatcher after the response
+            with transaction.atomic():
+                feedback = serializer.save()
+                outbox.enqueue('general_feedback', f"csm_feedback:{feedback.pk}",
+                               {column: serializer.data.get(column) for column in GeneralFeedbackSink.COLUMNS})
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -822,32 +787,30 @@ def track_material_view(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if event_ingest.enabled:
+            # Spooled locally and written in batches by the ingester
+            event_ingest.accept('view', file=file, user_id=user_id, session_id=session_id)
+            return Response(
+                {"success": True, "message": "View tracked successfully"},
+                status=status.HTTP_202_ACCEPTED
+            )
+        
         # Create a new MaterialView record
-        from .models import MaterialView, Material
+        # (`materials` itself is kept in line with the index by material_catalog)
+        from .models import MaterialView
         from django.utils import timezone
         
-        # First, ensure the material exists in the materials table
-        # (we'll create it if viewing for the first time)
-        material, created = Material.objects.get_or_create(
-            file=file,
-            defaults={
-                'title': request.data.get('title', 'Unknown'),
-                'author': request.data.get('author', 'Unknown'),
-                'year': request.data.get('year'),
-                'abstract': request.data.get('abstract', ''),
-                'degree': request.data.get('degree', 'Thesis'),
-                'subjects': request.data.get('subjects', []),
-                'school': request.data.get('school', 'Unknown')
-            }
-        )
-        
         # Track the view
-        MaterialView.objects.create(
-            file=file,
-            user_id=user_id,
-            session_id=session_id,
-            viewed_at=timezone.now()
-        )
+        with transaction.atomic():
+            view = MaterialView.objects.create(
+                file=file,
+                user_id=user_id,
+                session_id=session_id,
+                viewed_at=timezone.now()
+            )
+            document_stats.record_view(file, view.viewed_at)
+            usage_rollups.record_events([(view.viewed_at, file, user_id, session_id)], [])
+        usage_rollups.maybe_compact()
         
         return Response(
             {"success": True, "message": "View tracked successfully"},
@@ -866,92 +829,39 @@ def get_most_browsed(request):
         limit = int(request.GET.get('limit', 10))
         from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
 
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    m.id,
-                    m.file,
-                    m.title,
-                    m.author,
-                    m.year,
-                    m.abstract,
-                    m.degree,
-                    m.subjects,
-                    m.school,
-                    COUNT(DISTINCT mv.id) as view_count,
-                    COALESCE(AVG(f.rating), 0) as avg_rating,
-                    COUNT(DISTINCT f.id) as rating_count
-                FROM materials m
-                LEFT JOIN material_views mv ON m.file = mv.file AND mv.viewed_at BETWEEN %s AND %s
-                LEFT JOIN feedback f ON m.file = f.document_file
-                GROUP BY m.id, m.file, m.title, m.author, m.year, m.abstract, m.degree, m.subjects, m.school
-                HAVING COUNT(DISTINCT mv.id) > 0
-                ORDER BY view_count DESC, avg_rating DESC
-                LIMIT %s
-            """, [from_date, to_date, limit])
-            
-            columns = [col[0] for col in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        # Enrich with actual metadata from RAG if title/author are "Unknown"
-        from .rag_service import RAGService
-        
-        # Ensure RAG is initialized for metadata enrichment
-        try:
-            RAGService.ensure_initialized()
-        except Exception as e:
-            print(f"[RAG] Could not initialize RAG for metadata enrichment: {e}")
+        # Views in the range from the daily rollups; ratings are all-time, from document_stats
+        views = usage_rollups.views_by_file(from_date, to_date)
+        ranked = sorted(views.items(), key=lambda item: -item[1])
+        if limit > 0 and ranked:
+            # Keep every file tied with the last one, the rating breaks the tie
+            cutoff = ranked[min(limit, len(ranked)) - 1][1]
+            candidates = [f for f, n in ranked if n >= cutoff]
+        else:
+            candidates = []
+        stats = document_stats.lookup(candidates)
+        results = []
+        for row in Material.objects.filter(file__in=candidates, removed_at__isnull=True).values(
+                'file', 'title', 'author', 'year', 'abstract', 'degree', 'subjects', 'school'):
+            file_stats = stats.get(row['file'])
+            row['view_count'] = views[row['file']]
+            row['avg_rating'] = file_stats.avg_rating if file_stats else 0.0
+            row['rating_count'] = file_stats.rating_count if file_stats else 0
+            results.append(row)
+        results.sort(key=lambda row: (-row['view_count'], -row['avg_rating']))
+        results = results[:limit]
         
+        # `materials` is synced from the index (material_catalog), so this is a pure read
         materials_data = []
         for row in results:
-            title = row['title']
-            author = row['author']
-            year = row['year']
-            abstract = row['abstract']
-            degree = row['degree']
-            school = row['school']
-            
-            # If metadata is missing, try to get it from the RAG system
-            if (not title or title == 'Unknown') or (not author or author == 'Unknown') or (not year or year == 'Unknown') or (not school or school in ('Unknown Institution', 'Unknown', '')):
-                try:
-                    if RAGService._initialized and not RAGService.is_indexing():
-                        rag = RAGService()
-                        # Search for the document in the RAG system by file name
-                        doc_metadata = rag.get_document_metadata(row['file'])
-                        if doc_metadata:
-                            if not title or title == 'Unknown':
-                                title = doc_metadata.get('title', title)
-                            if not author or author == 'Unknown':
-                                author = doc_metadata.get('author', author)
-                            if not year or year == 'Unknown':
-                                year = doc_metadata.get('year', year)
-                            if not abstract:
-                                abstract = doc_metadata.get('abstract', abstract)
-                            if not degree or degree == 'Thesis':
-                                degree = doc_metadata.get('degree', degree)
-                            if not school or school in ('Unknown Institution', 'Unknown', ''):
-                                school = doc_metadata.get('school', school)
-                            # Persist the enriched metadata back to the DB
-                            try:
-                                Material.objects.filter(file=row['file']).update(
-                                    title=title, author=author, year=year,
-                                    abstract=abstract or '', degree=degree or '',
-                                    school=school or ''
-                                )
-                            except Exception:
-                                pass
-                except Exception as e:
-                    print(f"Error fetching metadata for {row['file']}: {e}")
-            
             materials_data.append({
                 'file': row['file'],
-                'title': title or 'Unknown Title',
-                'author': author or 'Unknown Author',
-                'year': year,
-                'abstract': abstract or 'No abstract available.',
-                'degree': degree or 'Thesis',
+                'title': row['title'] or 'Unknown Title',
+                'author': row['author'] or 'Unknown Author',
+                'year': row['year'],
+                'abstract': row['abstract'] or 'No abstract available.',
+                'degree': row['degree'] or 'Thesis',
                 'subjects': row['subjects'] if isinstance(row['subjects'], list) else [],
-                'school': school or 'Unknown Institution',
+                'school': row['school'] or 'Unknown Institution',
                 'view_count': int(row['view_count']),
                 'avg_rating': round(float(row['avg_rating']), 2) if row['avg_rating'] else 0.0,
                 'rating_count': int(row['rating_count'])
@@ -985,68 +895,45 @@ def get_source_ratings(request):
     - order_by: 'avg_rating', 'rating_count', 'file' (default: 'avg_rating')
     """
     try:
-        from django.db import connection
-        from django.db.models import Avg, Count
+        from django.db.models import F, FloatField, ExpressionWrapper
+        from django.db.models.functions import NullIf
+        from .models import DocumentStats
         
         limit = int(request.GET.get('limit', 20))
         min_ratings = int(request.GET.get('min_ratings', 1))
         order_by = request.GET.get('order_by', 'avg_rating')
         
-        # Map order_by to SQL column
+        # Map order_by to document_stats ordering
         order_map = {
-            'avg_rating': 'avg_rating DESC',
-            'rating_count': 'rating_count DESC',
-            'file': 'm.file ASC'
+            'avg_rating': [F('avg').desc(nulls_last=True), 'file'],
+            'rating_count': ['-rating_count', 'file'],
+            'file': ['file']
         }
-        order_sql = order_map.get(order_by, 'avg_rating DESC')
-        
-        with connection.cursor() as cursor:
-            cursor.execute(f"""
-                SELECT 
-                    m.file,
-                    m.title,
-                    m.author,
-                    m.year,
-                    COUNT(DISTINCT f.id) as rating_count,
-                    COALESCE(AVG(f.rating), 0) as avg_rating,
-                    COALESCE(MIN(f.rating), 0) as min_rating,
-                    COALESCE(MAX(f.rating), 0) as max_rating,
-                    COALESCE(STDDEV(f.rating), 0) as stddev_rating
-                FROM materials m
-                LEFT JOIN feedback f ON m.file = f.document_file
-                GROUP BY m.file, m.title, m.author, m.year
-                HAVING COUNT(DISTINCT f.id) >= %s
-                ORDER BY {order_sql}
-                LIMIT %s
-            """, [min_ratings, limit])
-            
-            columns = [col[0] for col in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        order = order_map.get(order_by, order_map['avg_rating'])
         
-        # Enrich with metadata and format response
-        from .rag_service import RAGService
+        ranked = list(
+            DocumentStats.objects
+            .filter(rating_count__gte=min_ratings,
+                    file__in=Material.objects.filter(removed_at__isnull=True).values('file'))
+            .annotate(avg=ExpressionWrapper(F('rating_sum') * 1.0 / NullIf(F('rating_count'), 0),
+                                            output_field=FloatField()))
+            .order_by(*order)[:limit]
+        )
+        materials = {
+            m['file']: m for m in Material.objects.filter(file__in=[r.file for r in ranked])
+            .values('file', 'title', 'author', 'year')
+        }
+        results = [
+            {**materials[r.file], **document_stats.rating_summary(r)}
+            for r in ranked if r.file in materials
+        ]
         
         sources_data = []
         for row in results:
-            title = row['title']
-            author = row['author']
-            
-            # Try to get metadata from RAG if missing
-            if not title or not author:
-                try:
-                    if RAGService._initialized:
-                        rag = RAGService()
-                        doc_metadata = rag.get_document_metadata(row['file'])
-                        if doc_metadata:
-                            title = doc_metadata.get('title', title)
-                            author = doc_metadata.get('author', author)
-                except Exception as e:
-                    print(f"Error fetching metadata for {row['file']}: {e}")
-            
             sources_data.append({
                 'file': row['file'],
-                'title': title or 'Unknown Title',
-                'author': author or 'Unknown Author',
+                'title': row['title'] or 'Unknown Title',
+                'author': row['author'] or 'Unknown Author',
                 'year': row['year'],
                 'rating_count': int(row['rating_count']),
                 'avg_rating': round(float(row['avg_rating']), 2) if row['avg_rating'] else 0.0,
@@ -1164,7 +1051,6 @@ def get_sources_stats(request):
     """
     try:
         import json
-        from django.db import connection
         
         files_param = request.GET.get('files')
         if not files_param:
@@ -1186,38 +1072,7 @@ def get_sources_stats(request):
         if not files:
             return Response({"stats": {}}, status=status.HTTP_200_OK)
         
-        # Default stats for all files
-        stats = {f: {'view_count': 0, 'avg_rating': 0.0} for f in files}
-        
-        with connection.cursor() as cursor:
-            # Get view counts
-            placeholders = ','.join(['%s'] * len(files))
-            cursor.execute(f"""
-                SELECT 
-                    mv.file,
-                    COUNT(DISTINCT mv.id) as view_count
-                FROM material_views mv
-                WHERE mv.file IN ({placeholders})
-                GROUP BY mv.file
-            """, files)
-            
-            for row in cursor.fetchall():
-                if row[0] in stats:
-                    stats[row[0]]['view_count'] = int(row[1])
-            
-            # Get average ratings
-            cursor.execute(f"""
-                SELECT 
-                    f.document_file,
-                    COALESCE(AVG(f.rating), 0) as avg_rating
-                FROM feedback f
-                WHERE f.document_file IN ({placeholders}) AND f.rating IS NOT NULL
-                GROUP BY f.document_file
-            """, files)
-            
-            for row in cursor.fetchall():
-                if row[0] in stats:
-                    stats[row[0]]['avg_rating'] = round(float(row[1]), 2) if row[1] else 0.0
+        stats = document_stats.summary(files)
         
         return Response({"stats": stats}, status=status.HTTP_200_OK)
         
@@ -1378,11 +1233,13 @@ class RAGEvaluationView(APIView):
 @api_view(['GET'])
 def dashboard_kpi(request):
     from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
+    # Distinct counts merge the daily HyperLogLog sketches (~1.6% error); ?exact=true counts the raw rows
+    exact = request.GET.get('exact', '').lower() == 'true'
 
-    total_docs = Material.objects.count()
-    unique_visitors = MaterialView.objects.filter(viewed_at__range=[from_date, to_date]).values('user_id', 'session_id').distinct().count()
+    total_docs = Material.objects.filter(removed_at__isnull=True).count()
+    unique_visitors = usage_rollups.unique_visitors(from_date, to_date, exact=exact)
     total_searches = ResearchHistory.objects.filter(created_at__range=[from_date, to_date]).count()
-    accessed_docs = MaterialView.objects.filter(viewed_at__range=[from_date, to_date]).values('file').distinct().count()
+    accessed_docs = usage_rollups.accessed_files(from_date, to_date, exact=exact)
     utilization = (accessed_docs / total_docs * 100) if total_docs else 0
 
     # Average response time (FIXED: Exclude 0s from old unrecorded data)
@@ -1398,9 +1255,47 @@ def dashboard_kpi(request):
         'totalSearches': total_searches,
         'accessedDocuments': accessed_docs,
         'utilizationPercent': round(utilization, 1),
-        'avgResponseTime': round(avg_response_time, 0)
+        'avgResponseTime': round(avg_response_time, 0),
+        'exactCounts': exact
     })
 
+# Search Stage Latency Percentiles
+@api_view(['GET'])
+def dashboard_stage_latency(request):
+    """
+    GET /api/dashboard/stage-latency/
+    Returns p50/p95/p99 latency per search pipeline stage within the date range.
+    """
+    from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT
+                stage,
+                COUNT(*) as samples,
+                AVG(duration_ms) as avg_ms,
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms) as p50_ms,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) as p95_ms,
+                percentile_cont(0.99) WITHIN GROUP (ORDER BY duration_ms) as p99_ms
+            FROM search_stage_timings
+            WHERE created_at BETWEEN %s AND %s
+            GROUP BY stage
+        """, [from_date, to_date])
+        rows = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    data = []
+    for stage in STAGES + sorted(set(rows) - set(STAGES)):
+        samples, avg_ms, p50, p95, p99 = rows.get(stage, (0, None, None, None, None))
+        data.append({
+            'stage': stage,
+            'samples': samples,
+            'avg_ms': round(float(avg_ms), 1) if avg_ms is not None else None,
+            'p50_ms': round(float(p50), 1) if p50 is not None else None,
+            'p95_ms': round(float(p95), 1) if p95 is not None else None,
+            'p99_ms': round(float(p99), 1) if p99 is not None else None,
+        })
+    return Response(data)
+
 # Failed Queries Count
 @api_view(['GET'])
 def dashboard_failed_queries_count(request):
@@ -1427,59 +1322,13 @@ def dashboard_trending_topics(request):
     from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
     period_length = (to_date - from_date).days
     prev_from = from_date - timedelta(days=period_length)
-    prev_to = from_date - timedelta(days=1)
-
-    # Current period views per subject
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                unnest(m.subjects) as keyword,
-                COUNT(DISTINCT mv.id) as views
-            FROM materials m
-            JOIN material_views mv ON m.file = mv.file
-            WHERE mv.viewed_at BETWEEN %s AND %s
-              AND m.subjects IS NOT NULL
-              AND array_length(m.subjects, 1) > 0
-            GROUP BY keyword
-        """, [from_date, to_date])
-        current_rows = cursor.fetchall()
-        current_dict = {row[0]: row[1] for row in current_rows}
-
-        # Previous period views per subject
-        cursor.execute("""
-            SELECT 
-                unnest(m.subjects) as keyword,
-                COUNT(DISTINCT mv.id) as views
-            FROM materials m
-            JOIN material_views mv ON m.file = mv.file
-            WHERE mv.viewed_at BETWEEN %s AND %s
-              AND m.subjects IS NOT NULL
-              AND array_length(m.subjects, 1) > 0
-            GROUP BY keyword
-        """, [prev_from, prev_to])
-        prev_rows = cursor.fetchall()
-        prev_dict = {row[0]: row[1] for row in prev_rows}
-
-    # Compute growth, filter subjects with at least 3 views in current period
-    trending = []
-    for subject, current_views in current_dict.items():
-        if current_views < 3:
-            continue
-        prev_views = prev_dict.get(subject, 0)
-        if prev_views == 0:
-            growth = 100.0  # treat as 100% growth
-        else:
-            growth = ((current_views - prev_views) / prev_views) * 100
-        trending.append({
-            'subject': subject,
-            'current_views': current_views,
-            'prev_views': prev_views,
-            'growth': round(growth, 1)
-        })
 
-    # Sort by growth descending, take top 7
-    trending.sort(key=lambda x: x['growth'], reverse=True)
-    return Response(trending[:7])
+    # Both periods and the growth in one query over the subject-by-day rollup;
+    # subjects need at least 3 views in the current period, growth is 100% when
+    # the previous period had none, top 7 by growth
+    trending = usage_rollups.trending_subjects(prev_from.date(), from_date.date(), to_date.date(),
+                                               min_views=3, limit=7)
+    return Response(trending)
 
 # ============= Endpoint 3 – Top 7 Most Viewed Theses =============
 
@@ -1613,25 +1462,10 @@ def dashboard_monthly_trends(request):
     """
     from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                EXTRACT(YEAR FROM viewed_at) as year,
-                EXTRACT(MONTH FROM viewed_at) as month,
-                COUNT(DISTINCT id) as views
-            FROM material_views
-            WHERE viewed_at BETWEEN %s AND %s
-            GROUP BY EXTRACT(YEAR FROM viewed_at), EXTRACT(MONTH FROM viewed_at)
-            ORDER BY year, month
-        """, [from_date, to_date])
-        rows = cursor.fetchall()
-
-    # Build a dict of (year, month) -> views
+    # Build a dict of (year, month) -> views from the daily rollups (+ raw tail)
     views_dict = {}
-    for row in rows:
-        year = int(row[0])
-        month = int(row[1])
-        views_dict[(year, month)] = row[2]
+    for day, views in usage_rollups.views_by_day(from_date, to_date).items():
+        views_dict[(day.year, day.month)] = views_dict.get((day.year, day.month), 0) + views
 
     # Generate all months from from_date to to_date
     start_month = from_date.replace(day=1)
@@ -1668,19 +1502,8 @@ def dashboard_weekly_trends(request):
 
     # FIX: Fetch daily counts instead of using PostgreSQL's date_trunc('week') 
     # to avoid the Monday-start vs Sunday-start mismatch.
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                viewed_at::date as day,
-                COUNT(DISTINCT id) as views
-            FROM material_views
-            WHERE viewed_at BETWEEN %s AND %s
-            GROUP BY day
-        """, [from_date, to_date])
-        rows = cursor.fetchall()
-
-    # Dictionary of {datetime.date: views}
-    daily_counts = {row[0]: row[1] for row in rows}
+    # Dictionary of {datetime.date: views}, from the daily rollups (+ raw tail)
+    daily_counts = usage_rollups.views_by_day(from_date, to_date)
 
     # Generate all weeks in the range (Sunday to Saturday)
     current = from_date.date()
@@ -1719,19 +1542,7 @@ def dashboard_daily_trends(request):
     """
     from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                viewed_at::date as day,
-                COUNT(DISTINCT id) as views
-            FROM material_views
-            WHERE viewed_at BETWEEN %s AND %s
-            GROUP BY day
-            ORDER BY day
-        """, [from_date, to_date])
-        rows = cursor.fetchall()
-
-    counts = {row[0]: row[1] for row in rows}
+    counts = usage_rollups.views_by_day(from_date, to_date)
 
     # Generate all days
     current = from_date.date()
@@ -1760,7 +1571,14 @@ def track_citation_copy(request):
         if not file or not citation_style:
             return Response({"error": "file and citation_style required"}, status=400)
 
-        material = Material.objects.filter(file=file).first()
+        if event_ingest.enabled:
+            # Spooled locally and written in batches by the ingester
+            if not Material.objects.filter(file=file, removed_at__isnull=True).exists():
+                return Response({"error": "Material not found"}, status=404)
+            event_ingest.accept('copy', file=file, user_id=user_id, session_id=session_id, style=citation_style)
+            return Response({"success": True}, status=202)
+
+        material = Material.objects.filter(file=file, removed_at__isnull=True).first()
         if not material:
             return Response({"error": "Material not found"}, status=404)
 
@@ -1770,6 +1588,7 @@ def track_citation_copy(request):
             session_id=session_id,
             citation_style=citation_style
         )
+        usage_rollups.maybe_compact()
         return Response({"success": True}, status=201)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
@@ -1784,22 +1603,14 @@ def dashboard_citation_stats(request):
     """
     from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
 
-    total_copies = CitationCopy.objects.filter(
-        copied_at__range=[from_date, to_date]
-    ).count()
+    total_copies = sum(usage_rollups.copies_by_day(from_date, to_date).values())
 
     # Top 5 cited theses
-    top_cited = (
-        CitationCopy.objects
-        .filter(copied_at__range=[from_date, to_date])
-        .values('document__file', 'document__title', 'document__author', 'document__year')
-        .annotate(copies=Count('id'))
-        .order_by('-copies')[:5]
-    )
+    top_cited = usage_rollups.top_cited(from_date, to_date, limit=5)
 
     return Response({
         'total_copies': total_copies,
-        'top_cited': list(top_cited)
+        'top_cited': top_cited
     })
 
 
@@ -1812,21 +1623,11 @@ def dashboard_citation_monthly(request):
     """
     from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
 
-    # Aggregate by month
-    monthly = (
-        CitationCopy.objects
-        .filter(copied_at__range=[from_date, to_date])
-        .annotate(month=TruncMonth('copied_at'))
-        .values('month')
-        .annotate(copies=Count('id'))
-        .order_by('month')
-    )
-
-    # Build dict of month -> copies
+    # Build dict of month -> copies from the daily rollups (+ raw tail)
     copies_dict = {}
-    for item in monthly:
-        month_key = item['month'].strftime('%Y-%m')
-        copies_dict[month_key] = item['copies']
+    for day, copies in usage_rollups.copies_by_day(from_date, to_date).items():
+        month_key = day.strftime('%Y-%m')
+        copies_dict[month_key] = copies_dict.get(month_key, 0) + copies
 
     # Generate all months in range
     current = from_date.replace(day=1)
@@ -1853,13 +1654,8 @@ def dashboard_citation_weekly(request):
     """Returns citation counts grouped by week (Sunday to Saturday)."""
     from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
     
-    # Get daily aggregates using Django ORM
-    daily_aggs = CitationCopy.objects.filter(copied_at__range=[from_date, to_date])\
-        .annotate(day=TruncDate('copied_at'))\
-        .values('day')\
-        .annotate(copies=Count('id'))
-        
-    daily_counts = {item['day']: item['copies'] for item in daily_aggs if item['day']}
+    # Daily counts from the rollups (+ raw tail)
+    daily_counts = usage_rollups.copies_by_day(from_date, to_date)
 
     # Generate all weeks (Sunday to Saturday)
     current = from_date.date()
@@ -1890,12 +1686,7 @@ def dashboard_citation_daily(request):
     """Returns citation counts grouped by individual days."""
     from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
     
-    daily_aggs = CitationCopy.objects.filter(copied_at__range=[from_date, to_date])\
-        .annotate(day=TruncDate('copied_at'))\
-        .values('day')\
-        .annotate(copies=Count('id'))
-        
-    counts = {item['day']: item['copies'] for item in daily_aggs if item['day']}
+    counts = usage_rollups.copies_by_day(from_date, to_date)
 
     current = from_date.date()
     results = []
@@ -1991,4 +1782,96 @@ def dashboard_dormant_count(request):
             WHERE mv.id IS NULL
         """)
         count = cursor.fetchone()[0]
-    return Response({'count': count})
\ No newline at end of file
+    return Response({'count': count})
+
+
+# ============= Dashboard Bundle =============
+
+# Widget name -> the endpoint computing it (name = the endpoint's URL segment)
+DASHBOARD_WIDGETS = {
+    'kpi': dashboard_kpi,
+    'top-theses': get_most_browsed,
+    'failed-queries-count': dashboard_failed_queries_count,
+    'trending-topics': dashboard_trending_topics,
+    'usage-by-category': dashboard_usage_by_category,
+    'age-distribution': dashboard_age_distribution,
+    'monthly-trends': dashboard_monthly_trends,
+    'weekly-trends': dashboard_weekly_trends,
+    'daily-trends': dashboard_daily_trends,
+    'citation-stats': dashboard_citation_stats,
+    'citation-monthly': dashboard_citation_monthly,
+    'citation-weekly': dashboard_citation_weekly,
+    'citation-daily': dashboard_citation_daily,
+    'top-search-queries': dashboard_top_search_queries,
+    'least-browsed': dashboard_least_browsed,
+    'dormant-count': dashboard_dormant_count,
+    'stage-latency': dashboard_stage_latency,
+}
+
+
+def _widget_task(view, request, params):
+    """Call a dashboard endpoint in-process with its own GET parameters"""
+    from django.http import HttpRequest, QueryDict
+
+    def task():
+        sub = HttpRequest()
+        sub.method = 'GET'
+        sub.path = request.path
+        sub.META = request.META.copy()
+        sub.GET = QueryDict(mutable=True)
+        sub.GET.update(params)
+        if hasattr(request._request, 'user'):
+            sub.user = request._request.user
+        response = view(sub)
+        if response.status_code >= 400:
+            raise RuntimeError(response.data.get('error', response.status_code)
+                               if isinstance(response.data, dict) else response.status_code)
+        return response.data
+    return task
+
+
+@api_view(['GET'])
+def dashboard_bundle(request):
+    """
+    GET /api/dashboard/bundle/?widgets=kpi,daily-trends,top-theses&from=YYYY-MM-DD&to=YYYY-MM-DD
+    Returns several dashboard widgets in one response, each identical to its endpoint.
+    
+    Query Parameters:
+    - widgets: comma-separated widget names (default: all)
+    - from, to: date range shared by every widget
+    - <widget>.<param>: extra parameter for one widget (e.g. top-theses.limit=5)
+    
+    Sends an ETag; a request with a matching If-None-Match gets 304 Not Modified.
+    """
+    names = [w.strip() for w in request.GET.get('widgets', '').split(',') if w.strip()] or list(DASHBOARD_WIDGETS)
+    unknown = [w for w in names if w not in DASHBOARD_WIDGETS]
+    if unknown:
+        return Response(
+            {"error": f"Unknown widgets: {', '.join(unknown)}", "available": list(DASHBOARD_WIDGETS)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Resolve the range once, so "last 30 days" is keyed by the actual dates
+    from_date, to_date = parse_date_range(request.GET.get('from'), request.GET.get('to'))
+    shared = {'from': from_date.date().isoformat(), 'to': to_date.date().isoformat()}
+    widget_params = {name: dict(shared) for name in names}
+    for param, value in request.GET.items():
+        name, _, key = param.partition('.')
+        if key and name in widget_params:
+            widget_params[name][key] = value
+
+    key = {'widgets': sorted(names), 'params': widget_params}
+    tasks = {name: _widget_task(DASHBOARD_WIDGETS[name], request, widget_params[name]) for name in names}
+    etag, payload = dashboard_bundler.bundle(key, data_version(), tasks,
+                                             if_none_match=request.META.get('HTTP_IF_NONE_MATCH'))
+    if payload is None:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response({**shared, **payload})
+    if etag is None:
+        # A widget failed: the client must not keep this copy
+        response['Cache-Control'] = 'no-store'
+    else:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -841,7 +841,7 @@ const handleSearch = async (query = searchQuery, forceNew = false) => {
             }
             
             const data = await response.json();
-            const { documents, related_questions, suggestions, _search_context } = data;
+            const { documents, related_questions, suggestions, _search_context, overview_preview } = data;
             
             // Store search context for potential follow-ups
             if (_search_context) {
@@ -855,9 +855,10 @@ const handleSearch = async (query = searchQuery, forceNew = false) => {
             // ---------------------------------------------------------
             // STEP 4: UPDATE UI (Immediate Feedback)
             // ---------------------------------------------------------
+            // The extractive preview (if any) is shown until the streamed overview replaces it
             const initialResult = {
                 query: query,
-                overview: 'Generating overview...',
+                overview: overview_preview?.text || 'Generating overview...',
                 sources: formattedSources,
                 relatedQuestions: related_questions || [],
                 isLoadingSummary: true,